@@ -0,0 +1,88 @@
+"""
+Límite del cuerpo de las peticiones con archivos, aplicado mientras se reciben.
+
+FastAPI parsea el multipart completo (a un archivo temporal) antes de llamar
+al handler, así que el límite de `spool_upload` solo acota la copia. Este
+middleware ASGI corta antes:
+
+- Content-Length declarado mayor que el límite → 413 sin leer el cuerpo.
+- Cuerpo sin Content-Length (chunked) → se cuentan los bytes recibidos y se
+  responde 413 en cuanto lo superan (el handler aún no empezó a responder).
+
+Límite: max_upload_size_mb por archivo (× 20 en /batch) + margen del multipart.
+"""
+import json
+
+from config import settings
+
+_MB = 1024 * 1024
+# Cabeceras de las partes y campos de formulario del multipart
+_MULTIPART_OVERHEAD_BYTES = _MB
+_MAX_BATCH_FILES = 20
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+def _limit_for(path: str) -> int:
+    files = _MAX_BATCH_FILES if path.startswith("/batch") else 1
+    return settings.max_upload_size_mb * _MB * files + _MULTIPART_OVERHEAD_BYTES
+
+
+class UploadSizeLimitMiddleware:
+    """Responde 413 a las peticiones POST cuyo cuerpo supera el límite de subida."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        limit = _limit_for(scope["path"])
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await _reject(send, limit)
+            return
+
+        received = 0
+        exceeded = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            # FastAPI convierte el fallo al leer el cuerpo en un 400: se reemplaza por el 413
+            nonlocal rejected
+            if not exceeded:
+                await send(message)
+            elif not rejected and message["type"] == "http.response.start":
+                rejected = True
+                await _reject(send, limit)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _BodyTooLarge:
+            if not rejected:
+                rejected = True
+                await _reject(send, limit)
+
+
+async def _reject(send, limit: int) -> None:
+    body = json.dumps({"detail": f"La petición excede el tamaño máximo de subida ({limit // _MB}MB)"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -177,6 +177,8 @@ class HealthCheckResponse(BaseModel):
     version: str
     timestamp: datetime
     llm_provider: str
+    result_cache: Optional[Dict[str, Any]] = None
+    understanding_cache: Optional[Dict[str, Any]] = None
 
 
 class ErrorResponse(BaseModel):
@@ -228,3 +230,17 @@ class ProformaResponse(BaseModel):
     total_estimado: str = Field(default='', description="Total estimado en soles (texto)")
     analisis_viabilidad: str = Field(default='', description="Análisis de viabilidad operativa")
     condiciones: List[str] = Field(default_factory=list, description="Condiciones y supuestos del presupuesto")
+
+
+class FullAnalysisResponse(BaseModel):
+    """
+    Respuesta de /analyze-full: las tres respuestas existentes bajo un solo
+    contrato. Para Mayores cada sección es el dict crudo del LLM.
+    """
+    analisis_tdr: Union[TDRAnalysisResponse, Dict[str, Any]]
+    direccionamiento: Union[DireccionamientoAnalysisResponse, Dict[str, Any]]
+    proforma: Union[ProformaResponse, Dict[str, Any]]
+    secciones_reintentadas: List[str] = Field(
+        default_factory=list,
+        description="Secciones que no pasaron la validación en la llamada combinada y se generaron por separado"
+    )
@@ -2,14 +2,19 @@
 Endpoint optimizado para procesamiento por lotes (batch).
 Diseñado para el scraper que envía 3-10 documentos cada 40 minutos.
 """
-from fastapi import APIRouter, File, UploadFile, HTTPException, Depends
-from typing import List
+from fastapi import APIRouter, File, UploadFile, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Literal, Tuple, Union
 import asyncio
+import json
 import logging
+import time
 from datetime import datetime
 
 from app.models.schemas import TDRAnalysisResponse, ErrorResponse
 from app.services.analyzer_service import TDRAnalyzerService
+from app.services.document_spool import SpooledDocument, UploadTooLarge, spool_upload
+from app.services.llm import rate_limiter, token_estimator, gemini_documents, llm_priority, PRIORITY_BATCH
 from app.middleware import require_auth, AuthContext
 from config import settings
 
@@ -19,33 +24,8 @@ logger = logging.getLogger(__name__)
 analyzer_service = TDRAnalyzerService()
 
 
-@router.post(
-    "/analyze-tdrs",
-    response_model=List[dict],
-    summary="Analiza múltiples TDRs en paralelo (optimizado para scraper)"
-)
-async def analyze_batch_tdrs(
-    files: List[UploadFile] = File(..., description="Lista de archivos PDF"),
-    auth: AuthContext = Depends(require_auth),
-):
-    """
-    **Endpoint optimizado para procesamiento por lotes.**
-
-    Ideal para el scraper que envía 3-10 documentos cada 40 minutos.
-
-    **Optimizaciones:**
-    - Procesamiento asíncrono en paralelo
-    - Límite de 3 requests concurrentes (configurable)
-    - No bloquea si un PDF falla
-
-    **Volumen soportado:**
-    - 36 rondas/día × 10 docs = 360 docs/día
-    - 24% del límite Free Tier de Gemini (1,500 req/día)
-
-    **Respuesta:**
-    - Array de resultados (algunos pueden ser errores)
-    """
-
+def _validar_lote(files: List[UploadFile]) -> None:
+    """Validaciones comunes de los endpoints de lote (403/400)."""
     if not settings.enable_batch_processing:
         raise HTTPException(
             status_code=403,
@@ -59,8 +39,6 @@ async def analyze_batch_tdrs(
             detail=f"Máximo 20 archivos por lote. Recibidos: {len(files)}"
         )
 
-    logger.info(f"📦 Procesando lote de {len(files)} TDRs")
-
     # Validar que todos sean PDFs
     for file in files:
         if not file.filename.endswith('.pdf'):
@@ -69,58 +47,148 @@ async def analyze_batch_tdrs(
                 detail=f"Archivo inválido: {file.filename} (solo PDFs)"
             )
 
-    # Función para procesar un PDF
-    async def process_single_pdf(file: UploadFile, index: int):
-        try:
-            logger.info(f"  [{index+1}/{len(files)}] Procesando: {file.filename}")
 
-            # Leer PDF
-            pdf_bytes = await file.read()
+# Documento del lote ya recibido, o el rechazo por tamaño (se informa como error del archivo)
+DocumentoLote = Tuple[str, Union[SpooledDocument, UploadTooLarge]]
 
-            # Validar tamaño
-            file_size_mb = len(pdf_bytes) / (1024 * 1024)
-            if file_size_mb > settings.max_file_size_mb:
-                return {
-                    "filename": file.filename,
-                    "status": "error",
-                    "error": f"Archivo muy grande ({file_size_mb:.2f}MB)"
-                }
 
-            # Analizar
-            result = await analyzer_service.analyze_tdr_document(pdf_bytes)
+async def _recibir_lote(files: List[UploadFile]) -> List[DocumentoLote]:
+    """
+    Recibe los archivos por bloques a disco (SHA-256 al vuelo). Un archivo
+    que supera max_file_size_mb se corta al pasar el límite, sin leerlo entero.
+    """
+    documentos: List[DocumentoLote] = []
+    try:
+        for file in files:
+            try:
+                documentos.append((file.filename, await spool_upload(file, settings.max_file_size_mb * 1024 * 1024)))
+            except UploadTooLarge as e:
+                documentos.append((file.filename, e))
+    except BaseException:
+        _cerrar_lote(documentos)
+        raise
+    return documentos
 
-            logger.info(f"  ✅ [{index+1}/{len(files)}] Completado: {file.filename} (Score: {result.score_compatibilidad}/10)")
 
-            return {
-                "filename": file.filename,
-                "status": "success",
-                "analysis": result.model_dump()
-            }
+def _cerrar_lote(documentos: List[DocumentoLote]) -> None:
+    """Borra los archivos temporales del lote (también los de tareas canceladas antes de empezar)."""
+    for _, documento in documentos:
+        if isinstance(documento, SpooledDocument):
+            documento.close()
+
+
+async def _procesar_documento(
+    filename: str,
+    documento: Union[SpooledDocument, UploadTooLarge],
+    index: int,
+    total: int,
+) -> dict:
+    """
+    Analiza un documento del lote. Nunca lanza: los errores se devuelven
+    como resultado con status="error" para no abortar el lote.
+
+    Los bytes se materializan aquí (dentro del semáforo): los documentos que
+    esperan turno siguen en su archivo temporal.
+    """
+    start = time.perf_counter()
+    try:
+        logger.info(f"  [{index+1}/{total}] Procesando: {filename}")
 
-        except Exception as e:
-            logger.error(f"  ❌ [{index+1}/{len(files)}] Error en {file.filename}: {str(e)}")
+        # Validar tamaño (rechazado al recibirlo)
+        if isinstance(documento, UploadTooLarge):
+            file_size_mb = documento.size / (1024 * 1024)
             return {
-                "filename": file.filename,
+                "index": index,
+                "filename": filename,
                 "status": "error",
-                "error": str(e)
+                "error": f"Archivo muy grande ({file_size_mb:.2f}MB)",
+                "elapsed_seconds": round(time.perf_counter() - start, 3),
             }
 
-    # Procesar en paralelo con límite de concurrencia
+        with documento:
+            pdf_bytes = documento.read()
+
+        # Analizar (prioridad de lote: las peticiones interactivas pasan antes en el rate limiter)
+        with llm_priority(PRIORITY_BATCH):
+            envelope = await analyzer_service.analyze_tdr_document(pdf_bytes)
+
+        logger.info(f"  ✅ [{index+1}/{total}] Completado: {filename}")
+
+        return {
+            "index": index,
+            "filename": filename,
+            "status": "success",
+            "analysis": envelope.data(),
+            "token_usage": envelope.token_usage,
+            "metrics": envelope.metrics(),
+            "elapsed_seconds": round(time.perf_counter() - start, 3),
+        }
+
+    except Exception as e:
+        logger.error(f"  ❌ [{index+1}/{total}] Error en {filename}: {str(e)}")
+        return {
+            "index": index,
+            "filename": filename,
+            "status": "error",
+            "error": str(e),
+            "elapsed_seconds": round(time.perf_counter() - start, 3),
+        }
+
+
+def _crear_tareas(documentos: List[DocumentoLote]) -> List[asyncio.Task]:
+    """Crea una tarea por documento, limitadas por max_concurrent_requests."""
     semaphore = asyncio.Semaphore(settings.max_concurrent_requests)
+    total = len(documentos)
 
-    async def process_with_limit(file: UploadFile, index: int):
+    async def process_with_limit(filename: str, documento, index: int):
         async with semaphore:
-            return await process_single_pdf(file, index)
+            return await _procesar_documento(filename, documento, index, total)
+
+    return [
+        asyncio.create_task(process_with_limit(filename, documento, idx))
+        for idx, (filename, documento) in enumerate(documentos)
+    ]
+
+
+@router.post(
+    "/analyze-tdrs",
+    response_model=List[dict],
+    summary="Analiza múltiples TDRs en paralelo (optimizado para scraper)"
+)
+async def analyze_batch_tdrs(
+    files: List[UploadFile] = File(..., description="Lista de archivos PDF"),
+    auth: AuthContext = Depends(require_auth),
+):
+    """
+    **Endpoint optimizado para procesamiento por lotes.**
+
+    Ideal para el scraper que envía 3-10 documentos cada 40 minutos.
+
+    **Optimizaciones:**
+    - Procesamiento asíncrono en paralelo
+    - Límite de 3 requests concurrentes (configurable)
+    - No bloquea si un PDF falla
+
+    **Volumen soportado:**
+    - 36 rondas/día × 10 docs = 360 docs/día
+    - 24% del límite Free Tier de Gemini (1,500 req/día)
+
+    **Respuesta:**
+    - Array de resultados (algunos pueden ser errores)
+    """
+    _validar_lote(files)
+
+    logger.info(f"📦 Procesando lote de {len(files)} TDRs")
+
+    documentos = await _recibir_lote(files)
 
     # Ejecutar todos en paralelo (con límite)
     start_time = datetime.now()
 
-    tasks = [
-        process_with_limit(file, idx)
-        for idx, file in enumerate(files)
-    ]
-
-    results = await asyncio.gather(*tasks)
+    try:
+        results = await asyncio.gather(*_crear_tareas(documentos))
+    finally:
+        _cerrar_lote(documentos)
 
     elapsed = (datetime.now() - start_time).total_seconds()
 
@@ -133,6 +201,77 @@ async def analyze_batch_tdrs(
     return results
 
 
+def _formatear_evento(payload: dict, formato: str, evento: str = "result") -> str:
+    """Serializa un evento como línea NDJSON o como evento SSE."""
+    data = json.dumps(payload, ensure_ascii=False, default=str)
+    if formato == "sse":
+        return f"event: {evento}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+@router.post(
+    "/analyze-tdrs/stream",
+    summary="Analiza múltiples TDRs y emite cada resultado apenas termina (NDJSON/SSE)"
+)
+async def analyze_batch_tdrs_stream(
+    files: List[UploadFile] = File(..., description="Lista de archivos PDF"),
+    formato: Literal["ndjson", "sse"] = Query("ndjson", description="ndjson (una línea JSON por archivo) o sse"),
+    auth: AuthContext = Depends(require_auth),
+):
+    """
+    **Variante en streaming de `/batch/analyze-tdrs`.**
+
+    Emite un evento por archivo en orden de finalización (no de envío), para
+    que el scraper persista resultados incrementalmente: el primer resultado
+    llega cuando termina el documento más rápido, no el más lento.
+
+    **Cada evento incluye:** `index` (posición en el lote), `filename`, `status`,
+    `analysis` o `error`, `token_usage` y `elapsed_seconds`.
+
+    Al final se emite un evento de resumen (`"type": "summary"`; en SSE `event: done`).
+    """
+    _validar_lote(files)
+
+    logger.info(f"📦 Procesando lote de {len(files)} TDRs (streaming {formato})")
+
+    # Recibir antes de iniciar la respuesta: los UploadFile no deben usarse
+    # una vez que el handler retornó el StreamingResponse.
+    documentos = await _recibir_lote(files)
+
+    async def event_stream():
+        start = time.perf_counter()
+        tasks = _crear_tareas(documentos)
+        success_count = 0
+        try:
+            for siguiente in asyncio.as_completed(tasks):
+                result = await siguiente
+                if result["status"] == "success":
+                    success_count += 1
+                yield _formatear_evento(result, formato)
+
+            elapsed = time.perf_counter() - start
+            logger.info(f"📊 Lote (streaming) completado: {success_count}/{len(tasks)} exitosos en {elapsed:.2f}s")
+            yield _formatear_evento({
+                "type": "summary",
+                "total": len(tasks),
+                "success": success_count,
+                "errors": len(tasks) - success_count,
+                "elapsed_seconds": round(elapsed, 3),
+            }, formato, evento="done")
+        finally:
+            # Cliente desconectado: no seguir gastando cuota del LLM
+            for task in tasks:
+                task.cancel()
+            _cerrar_lote(documentos)
+
+    media_type = "text/event-stream" if formato == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        event_stream(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/stats", summary="Estadísticas de procesamiento por lotes")
 async def get_batch_stats():
     """
@@ -145,10 +284,19 @@ async def get_batch_stats():
         "llm_provider": settings.default_llm_provider,
         "limits": {
             "gemini_free_tier": {
-                "requests_per_day": 1500,
-                "requests_per_minute": 15,
+                "requests_per_day": settings.gemini_rpd,
+                "requests_per_minute": settings.gemini_rpm,
+                "tokens_per_minute": settings.gemini_tpm,
                 "context_tokens": 1_000_000
             },
+            "rate_limiter": {
+                "enabled": settings.llm_rate_limit_enabled,
+                "providers": rate_limiter.stats(),
+            },
+            # Estimación local de tokens vs prompt_tokens reales (calibración)
+            "token_estimator": token_estimator.stats(),
+            # Documentos multimodales subidos a la Files API / cachés de contexto de Gemini
+            "gemini_documents": gemini_documents.stats(),
             "estimated_daily_usage": {
                 "rounds_per_day": 36,
                 "docs_per_round_max": 10,
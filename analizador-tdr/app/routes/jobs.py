@@ -0,0 +1,118 @@
+"""
+Endpoints de la cola de trabajos asíncrona.
+
+POST /jobs guarda el documento y devuelve un id de inmediato (202);
+GET /jobs/{id} devuelve el estado (queued, running, done, error) y el resultado.
+Evita mantener conexiones abiertas 30s+ durante los análisis multimodales.
+"""
+from fastapi import APIRouter, File, Form, UploadFile, HTTPException, Depends
+from fastapi.responses import JSONResponse
+from typing import Literal
+from datetime import datetime
+import logging
+
+from app.services.job_queue import job_queue
+from app.routes.uploads import leer_documento
+from app.middleware import require_auth, AuthContext
+from config import settings
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+logger = logging.getLogger(__name__)
+
+
+@router.post("", summary="Encola un documento para análisis asíncrono")
+async def submit_job(
+    file: UploadFile = File(..., description="Archivo del TDR (PDF, DOCX, DOC)"),
+    job_type: Literal["tdr", "direccionamiento", "proforma"] = Form("tdr"),
+    llm_provider: str = Form(None),
+    tipo_contrato: str = Form("menores"),
+    company_name: str = Form(""),
+    company_copy: str = Form(""),
+    auth: AuthContext = Depends(require_auth),
+):
+    """
+    **Encola un análisis y devuelve su id.**
+
+    **Parámetros:**
+    - `file`: Archivo del TDR (PDF, DOCX, DOC)
+    - `job_type`: "tdr" (por defecto), "direccionamiento" o "proforma"
+    - `llm_provider`: (Opcional) "gemini", "openai", "anthropic"
+    - `tipo_contrato`: "menores" (≤8 UIT) o "mayores" (>8 UIT)
+    - `company_name` / `company_copy`: requeridos para "proforma" (copy de 20+ caracteres)
+
+    **Respuesta (202):**
+    - {success: true, data: {job_id, status: "queued"}}
+    """
+    ext = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+    if ext not in ('pdf', 'docx', 'doc'):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Formato no soportado: .{ext}. Use PDF, DOCX o DOC"
+        )
+
+    if llm_provider and llm_provider not in ["gemini", "openai", "anthropic"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Proveedor LLM no válido: {llm_provider}"
+        )
+
+    if job_type == "proforma" and not company_name:
+        raise HTTPException(
+            status_code=400,
+            detail="company_name es requerido para trabajos de proforma"
+        )
+
+    # Misma validación que /generate-proforma: no encolar una proforma sin copy
+    if job_type == "proforma" and (not company_copy or len(company_copy.strip()) < 20):
+        raise HTTPException(
+            status_code=400,
+            detail="El campo company_copy es obligatorio (mínimo 20 caracteres)"
+        )
+
+    # Comprime si excede el límite; 413 si no es posible
+    document = await leer_documento(file, settings.max_file_size_mb)
+
+    job_id = await job_queue.submit(
+        job_type=job_type,
+        filename=file.filename,
+        document=document,
+        params={
+            "llm_provider": llm_provider,
+            "tipo_contrato": tipo_contrato or "menores",
+            "company_name": company_name,
+            "company_copy": company_copy,
+        },
+    )
+
+    return JSONResponse(
+        status_code=202,
+        content={
+            "success": True,
+            "data": {"job_id": job_id, "status": "queued", "job_type": job_type},
+            "timestamp": datetime.now().isoformat(),
+            "filename": file.filename,
+        },
+    )
+
+
+@router.get("/{job_id}", summary="Consulta el estado y resultado de un trabajo")
+async def get_job(
+    job_id: str,
+    auth: AuthContext = Depends(require_auth),
+):
+    """
+    **Devuelve el estado de un trabajo.**
+
+    - `status`: queued | running | done | error
+    - `result`: análisis (solo si status = done)
+    - `error`: mensaje (solo si status = error)
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo no encontrado: {job_id}")
+
+    return {
+        "success": True,
+        "data": job,
+        "timestamp": datetime.now().isoformat(),
+    }
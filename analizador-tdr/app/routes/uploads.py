@@ -0,0 +1,44 @@
+"""
+Lectura de documentos subidos, compartida por main.py y los routers.
+"""
+from fastapi import HTTPException, UploadFile
+
+from config import settings
+from app.services.document_spool import SpooledDocument, UploadTooLarge, spool_upload
+from app.services.pdf_compressor import comprimir_documento
+
+_MB = 1024 * 1024
+
+
+async def recibir_documento(file: UploadFile) -> SpooledDocument:
+    """
+    Recibe el archivo por bloques (SHA-256 al vuelo, a disco si es grande).
+
+    Lanza 413 en cuanto supera max_upload_size_mb, sin terminar de leerlo.
+    """
+    try:
+        return await spool_upload(file, settings.max_upload_size_mb * _MB)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+async def leer_documento(file: UploadFile, limite_mb: float) -> bytes:
+    """
+    Lee el archivo subido y lo comprime si excede el límite del servicio.
+
+    Lanza 413 si el archivo supera max_upload_size_mb o no puede reducirse
+    al tamaño permitido.
+    """
+    with await recibir_documento(file) as documento:
+        pdf_bytes = documento.read()
+
+    if documento.size > limite_mb * _MB:
+        comprimido = await comprimir_documento(pdf_bytes, limite_mb)
+        if comprimido is None:
+            raise HTTPException(
+                status_code=413,
+                detail=f"El archivo excede el tamaño máximo permitido ({settings.max_file_size_mb}MB) y no pudo comprimirse"
+            )
+        pdf_bytes = comprimido
+
+    return pdf_bytes
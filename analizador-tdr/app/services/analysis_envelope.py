@@ -0,0 +1,125 @@
+"""
+Sobre (envelope) de resultado por petición.
+
+Cada pipeline de TDRAnalyzerService devuelve un AnalysisEnvelope propio en
+lugar de escribir en atributos compartidos del servicio (que es un singleton):
+con varias peticiones concurrentes, un atributo como `last_token_usage`
+reportaba los tokens de otra petición.
+
+El sobre transporta:
+- result:       análisis validado (modelo Pydantic) o dict crudo (Mayores)
+- token_usage:  tokens consumidos por *esta* petición (suma de todas sus llamadas al LLM)
+- timings:      segundos por etapa (probe, extract, rag, llm, validate, cache)
+- path:         ruta tomada (multimodal, native, hybrid, docx, fallback)
+- cache_status: hit, miss, disabled o bypass (pipeline sin caché)
+- understanding_status: hit/miss de la etapa compartida de comprensión del
+  documento (sondeo, texto, RAG) — ver document_understanding
+- context_tokens: tokens estimados del contexto de texto enviado al LLM
+  (a comparar con token_usage["prompt_tokens"], que incluye además el prompt)
+- first_event_seconds: en peticiones con streaming (SSE), segundos hasta el
+  primer campo emitido (la latencia que percibe el usuario)
+- multimodal_pages: páginas enviadas al LLM multimodal vs páginas del PDF
+  (selección de páginas informativas, o páginas escaneadas transcritas en la
+  ruta híbrida)
+- answered_by:  proveedor secundario (hedging) que respondió alguna llamada,
+  o None si todas las respondió el proveedor pedido
+"""
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+import time
+
+from app.services.llm.resilience import ANSWERED_BY_KEY
+
+# Rutas del pipeline
+PATH_MULTIMODAL = "multimodal"
+PATH_NATIVE = "native"
+PATH_HYBRID = "hybrid"       # documento mixto: páginas nativas por texto + escaneadas transcritas
+PATH_DOCX = "docx"
+PATH_FALLBACK = "fallback"   # texto nativo vacío → reintento multimodal
+
+# Estado de la caché de resultados
+CACHE_HIT = "hit"
+CACHE_MISS = "miss"
+CACHE_DISABLED = "disabled"
+CACHE_BYPASS = "bypass"
+
+TOKEN_KEYS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+
+@dataclass
+class AnalysisEnvelope:
+    """Resultado de un pipeline + métricas de la petición que lo produjo."""
+    result: Any = None
+    token_usage: Dict[str, int] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+    path: Optional[str] = None
+    cache_status: str = CACHE_BYPASS
+    understanding_status: str = CACHE_BYPASS
+    context_tokens: int = 0
+    elapsed_seconds: float = 0.0
+    first_event_seconds: Optional[float] = None
+    multimodal_pages: Optional[Dict[str, int]] = None
+    answered_by: Optional[str] = None
+    _started: float = field(default_factory=time.perf_counter, repr=False)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Mide una etapa: `with envelope.stage("llm"): ...` (acumula si se repite)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_timing(name, time.perf_counter() - start)
+
+    def add_timing(self, name: str, seconds: float) -> None:
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def consume_token_usage(self, payload: Dict) -> Dict:
+        """
+        Extrae `_token_usage` del dict del LLM y lo acumula en el sobre.
+
+        Acumula (no sobrescribe): si hubo fallback multimodal, se facturan
+        ambas llamadas. También retira la marca del proveedor secundario que
+        respondió (hedging) y la registra en `answered_by`.
+        """
+        usage = payload.pop("_token_usage", None) if isinstance(payload, dict) else None
+        answered_by = payload.pop(ANSWERED_BY_KEY, None) if isinstance(payload, dict) else None
+        if answered_by:
+            self.answered_by = answered_by
+        for key in TOKEN_KEYS:
+            if usage and key in usage:
+                self.token_usage[key] = self.token_usage.get(key, 0) + (usage.get(key) or 0)
+        return payload
+
+    def mark_first_event(self) -> None:
+        """Registra el primer campo emitido al cliente (solo la primera vez)."""
+        if self.first_event_seconds is None:
+            self.first_event_seconds = time.perf_counter() - self._started
+
+    def finish(self) -> "AnalysisEnvelope":
+        """Fija el tiempo total (reloj de pared) de la petición."""
+        self.elapsed_seconds = time.perf_counter() - self._started
+        return self
+
+    def data(self) -> Any:
+        """Resultado serializable (model_dump para modelos Pydantic)."""
+        return self.result.model_dump() if hasattr(self.result, "model_dump") else self.result
+
+    def metrics(self) -> Dict[str, Any]:
+        """Métricas de la petición para la respuesta HTTP y los logs."""
+        metrics = {
+            "path": self.path,
+            "cache": self.cache_status,
+            "understanding": self.understanding_status,
+            "context_tokens_estimated": self.context_tokens,
+            "timings_ms": {name: round(seconds * 1000, 1) for name, seconds in self.timings.items()},
+            "total_ms": round(self.elapsed_seconds * 1000, 1),
+        }
+        if self.first_event_seconds is not None:
+            metrics["first_event_ms"] = round(self.first_event_seconds * 1000, 1)
+        if self.multimodal_pages is not None:
+            metrics["multimodal_pages"] = self.multimodal_pages
+        if self.answered_by is not None:
+            metrics["answered_by"] = self.answered_by
+        return metrics
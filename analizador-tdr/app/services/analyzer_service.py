@@ -2,26 +2,44 @@
 Orquestador principal del pipeline RAG de análisis de TDRs.
 Coordina PDF Processor → RAG Extractor → LLM Client.
 """
-from typing import Dict, Optional, Literal
-from app.services.pdf_processor import PDFProcessorService
+from typing import Awaitable, Callable, Dict, List, Optional, Literal, Tuple
 from app.services.rag_extractor import RAGExtractionService
-from app.services.llm import LLMFactory, BaseLLMClient
+from app.services.semantic_retriever import SemanticRetriever
+from app.services.result_cache import analysis_cache
+from app.services.document_understanding import DocumentUnderstanding, document_understanding
+from app.services.pdf_reader import ROUTE_HYBRID, BlockSpan, MergedDocument, ProbeResult
+from app.services.analysis_envelope import (
+    AnalysisEnvelope,
+    CACHE_DISABLED,
+    CACHE_HIT,
+    CACHE_MISS,
+    PATH_DOCX,
+    PATH_FALLBACK,
+    PATH_HYBRID,
+    PATH_MULTIMODAL,
+    PATH_NATIVE,
+)
+from app.services.llm import LLMFactory, BaseLLMClient, hedged_call, token_estimator, context_token_budget
+from app.services.llm.json_stream import field_events
+from config import settings
 from app.models.schemas import (
     TDRAnalysisResponse,
     CompatibilityScoreRequest,
     CompatibilityScoreResponse,
     DireccionamientoAnalysisResponse,
+    FullAnalysisResponse,
     ProformaResponse,
     ProformaItem,
 )
+from dataclasses import replace
 from datetime import datetime
-import fitz
-import io
 import logging
 
 logger = logging.getLogger(__name__)
 MAX_RESUMEN_LENGTH = 1000
-MIN_CHARS_PER_PAGE = 200
+
+# Receptor de eventos de streaming ("field", "item", "reset") de /analyze-tdr/stream
+EventSink = Callable[[Dict], Awaitable[None]]
 
 
 class TDRAnalyzerService:
@@ -30,10 +48,109 @@ class TDRAnalyzerService:
     """
 
     def __init__(self):
-        self.pdf_processor = PDFProcessorService()
-        self.rag_extractor = RAGExtractionService()
+        self.rag_extractor = RAGExtractionService(
+            chunk_size=settings.chunk_size,
+            top_k=settings.top_k_chunks,
+            max_context_tokens=settings.rag_context_max_tokens,
+            semantic=SemanticRetriever.from_settings(),
+        )
         self.logger = logger
-        self.last_token_usage: Dict = {}
+
+    def _build_context(
+        self,
+        full_text: str,
+        envelope: AnalysisEnvelope,
+        llm_provider: Optional[str] = None,
+        layout: Optional[List[BlockSpan]] = None,
+        understanding: Optional[DocumentUnderstanding] = None,
+        source: Optional[str] = None,
+    ) -> str:
+        """
+        Contexto de texto para el LLM dentro del presupuesto de tokens del proveedor.
+
+        Si el documento completo (estimado en tokens del proveedor) no supera
+        `rag_full_document_max_tokens` ni el presupuesto, se envía entero;
+        si no, pasos 2-3: RAG (fragmentos relevantes) + ensamblado por presupuesto.
+
+        Con `understanding`, los fragmentos y el contexto se reutilizan entre
+        pipelines del mismo documento (PDF con layout → "pdf"; sin layout → "docx";
+        `source` lo fija explícitamente, p. ej. "hybrid" con páginas transcritas).
+        """
+        provider = LLMFactory.resolve_provider(llm_provider)
+        budget = context_token_budget(provider)
+        source = source or ("pdf" if layout is not None else "docx")
+        context_key = (source, provider, budget)
+
+        context = understanding.contexts.get(context_key) if understanding else None
+        if context is not None:
+            self.logger.info("♻️  Contexto reutilizado de un análisis previo del mismo documento (sin RAG)")
+        elif token_estimator.estimate(full_text, provider) <= min(
+            settings.rag_full_document_max_tokens, budget or settings.rag_full_document_max_tokens
+        ):
+            self.logger.info("⚡ Documento pequeño, enviando texto completo al LLM (sin RAG)...")
+            context = f"DOCUMENTO COMPLETO DEL TDR:\n\n{full_text}\n\n===== FIN DEL DOCUMENTO ====="
+        else:
+            with envelope.stage("rag"):
+                fragments = understanding.fragments.get(source) if understanding else None
+                if fragments is None:
+                    # Paso 2: Recuperar fragmentos relevantes (RAG) - método SÍNCRONO
+                    self.logger.info("Paso 2/4: Recuperando fragmentos relevantes (RAG)...")
+                    fragments = self.rag_extractor.extract_relevant_fragments(full_text, layout)
+                    total_fragments = sum(len(chunks) for chunks in fragments.values())
+                    self.logger.info(f"✓ Fragmentos recuperados: {total_fragments} chunks")
+                    if understanding:
+                        understanding.fragments[source] = fragments
+
+                # Paso 3: Construir contexto para el LLM - método SÍNCRONO
+                self.logger.info("Paso 3/4: Construyendo contexto para el LLM...")
+                context = self.rag_extractor.build_context_for_llm(fragments, max_tokens=budget, provider=provider)
+
+        if understanding:
+            understanding.contexts[context_key] = context
+        envelope.context_tokens = token_estimator.estimate(context, provider)
+        self.logger.info(
+            f"✓ Contexto construido: {len(context)} caracteres, ~{envelope.context_tokens} tokens "
+            f"({provider}, presupuesto {budget or 'sin límite'})"
+        )
+        return context
+
+    async def _document_text(
+        self,
+        probe: ProbeResult,
+        merged: Optional[MergedDocument],
+        understanding: DocumentUnderstanding,
+        pdf_bytes: bytes,
+        llm_client: BaseLLMClient,
+        envelope: AnalysisEnvelope,
+    ) -> Tuple[str, List[BlockSpan], str]:
+        """
+        Texto para la ruta de texto: el extraído en el sondeo y, si el documento
+        es mixto (ruta híbrida), la transcripción de sus páginas escaneadas al final.
+
+        Returns:
+            (texto, spans de bloques, fuente para _build_context: "pdf" o "hybrid")
+        """
+        if merged is None:
+            raise ValueError("El archivo no es un PDF válido o está corrupto")
+        if probe.route() != ROUTE_HYBRID:
+            self.logger.info("📄 PDF nativo — texto + tablas extraídos en el sondeo")
+            envelope.path = PATH_NATIVE
+            return merged.text, merged.spans, "pdf"
+
+        scanned_pages = probe.scanned_pages
+        self.logger.info(
+            f"🔀 Documento mixto — {probe.page_count - len(scanned_pages)} págs nativas por texto, "
+            f"{len(scanned_pages)} escaneadas {scanned_pages}"
+        )
+        envelope.path = PATH_HYBRID
+        scanned = await document_understanding.scanned_pages_text(understanding, pdf_bytes, llm_client, envelope)
+        if scanned is None:
+            return merged.text, merged.spans, "pdf"
+        offset = len(merged.text) + 2
+        spans = merged.spans + [
+            replace(span, start=span.start + offset, end=span.end + offset) for span in scanned.spans
+        ]
+        return f"{merged.text}\n\n{scanned.text}", spans, "hybrid"
 
     async def analyze_tdr_document(
         self,
@@ -41,7 +158,75 @@ class TDRAnalyzerService:
         llm_provider: Optional[Literal["gemini", "openai", "anthropic"]] = None,
         tipo_contrato: str = "menores",
         filename: str = "document.pdf",
-    ) -> TDRAnalysisResponse:
+        on_event: Optional[EventSink] = None,
+    ) -> AnalysisEnvelope:
+        """
+        Análisis de TDR con caché de resultados direccionada por contenido.
+
+        La clave combina SHA-256 del documento + proveedor + tipo de contrato +
+        modelo + versión de prompt. En un hit se devuelve el análisis y el
+        token_usage almacenados sin parsear el PDF ni llamar al LLM.
+
+        Con `on_event` (endpoint SSE) la respuesta del LLM se recibe en
+        streaming y cada campo se entrega apenas se cierra (ver _tdr_llm_call).
+
+        Returns:
+            AnalysisEnvelope: result (TDRAnalysisResponse o dict para Mayores),
+            token_usage, tiempos por etapa, ruta y estado de caché de esta petición.
+        """
+        envelope = AnalysisEnvelope(
+            cache_status=CACHE_MISS if analysis_cache.enabled else CACHE_DISABLED
+        )
+
+        with envelope.stage("cache"):
+            provider = LLMFactory.resolve_provider(llm_provider)
+            cache_key = analysis_cache.build_key(
+                document_hash=analysis_cache.document_hash(pdf_bytes),
+                llm_provider=provider,
+                tipo_contrato=tipo_contrato,
+                model_name=LLMFactory.resolve_model_name(provider),
+                prompt_version=BaseLLMClient.PROMPT_VERSION,
+            )
+            cached = analysis_cache.get(cache_key)
+
+        if cached is not None:
+            self.logger.info(f"⚡ Caché HIT ({cache_key[:20]}…) — análisis servido sin PDF ni LLM")
+            data = cached["data"]
+            envelope.result = data if tipo_contrato == "mayores" else TDRAnalysisResponse(**data)
+            envelope.token_usage = cached.get("token_usage", {})
+            envelope.path = cached.get("path")
+            envelope.cache_status = CACHE_HIT
+            if on_event is not None:
+                for event in field_events(data):
+                    await self._emit(on_event, envelope, event)
+            return envelope.finish()
+
+        envelope.result = await self._run_tdr_pipeline(
+            pdf_bytes, llm_provider, tipo_contrato, filename, envelope, on_event
+        )
+
+        if envelope.answered_by is None:
+            analysis_cache.set(cache_key, {
+                "data": envelope.data(),
+                "token_usage": envelope.token_usage,
+                "path": envelope.path,
+            })
+        else:
+            # La clave es del proveedor pedido: no guardar la respuesta de otro
+            self.logger.info(f"⏭️  Caché omitida: respondió {envelope.answered_by} (hedging), no {provider}")
+        envelope.finish()
+        self.logger.info(f"⏱️  TDR: {envelope.metrics()} — tokens: {envelope.token_usage}")
+        return envelope
+
+    async def _run_tdr_pipeline(
+        self,
+        pdf_bytes: bytes,
+        llm_provider: Optional[Literal["gemini", "openai", "anthropic"]],
+        tipo_contrato: str,
+        filename: str,
+        envelope: AnalysisEnvelope,
+        on_event: Optional[EventSink] = None,
+    ):
         """
         Pipeline completo de análisis de TDR.
 
@@ -55,9 +240,11 @@ class TDRAnalyzerService:
         Args:
             pdf_bytes: Contenido binario del PDF
             llm_provider: Proveedor LLM a usar (opcional)
+            envelope: Sobre de la petición (acumula tokens, tiempos y ruta)
+            on_event: Receptor de campos en streaming (opcional, ver _tdr_llm_call)
 
         Returns:
-            TDRAnalysisResponse: Análisis estructurado validado
+            TDRAnalysisResponse validado (o dict crudo para Mayores)
 
         Raises:
             ValueError: Si hay errores en el procesamiento o validación
@@ -65,6 +252,8 @@ class TDRAnalyzerService:
         self.logger.info("=== INICIANDO PIPELINE DE ANÁLISIS DE TDR (EXTRACCIÓN INTELIGENTE) ===")
 
         llm_client = LLMFactory.create_client(llm_provider)
+        understanding = document_understanding.get(pdf_bytes)
+        es_mayor = (tipo_contrato == "mayores")
 
         # ── Reconocimiento de formato por extensión ──────────────────────────
         ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
@@ -72,78 +261,81 @@ class TDRAnalyzerService:
         # DOCX/DOC: extraer texto y analizar como texto (Gemini multimodal no soporta DOCX)
         if ext in ('docx', 'doc'):
             self.logger.info(f"📝 Word (.{ext}) — extrayendo texto...")
-            docx_text = self._extract_docx_text(pdf_bytes)
+            envelope.path = PATH_DOCX
+            docx_text = await document_understanding.docx_text(understanding, pdf_bytes, envelope)
             if not docx_text:
                 raise ValueError("No se pudo extraer texto del documento Word. El archivo podría estar corrupto o protegido.")
             
             self.logger.info(f"✓ DOCX: {len(docx_text)} chars extraídos")
-            es_mayor = (tipo_contrato == "mayores")
             
-            if len(docx_text) < 5000:
-                context = f"DOCUMENTO COMPLETO DEL TDR:\n\n{docx_text}\n\n===== FIN DEL DOCUMENTO ====="
-            else:
-                fragments = self.rag_extractor.extract_relevant_fragments(docx_text)
-                context = self.rag_extractor.build_context_for_llm(fragments)
-                self.logger.info(f"✓ RAG: {len(context)} chars")
+            context = self._build_context(docx_text, envelope, llm_provider, understanding=understanding)
             
             self.logger.info(f"Paso 4/4: Analizando con LLM (tipo: {tipo_contrato})...")
-            if es_mayor:
-                if hasattr(llm_client, 'analyze_tdr_mayores') and type(llm_client).analyze_tdr_mayores != BaseLLMClient.analyze_tdr_mayores:
-                    analysis_dict = await llm_client.analyze_tdr_mayores(context)
+            with envelope.stage("llm"):
+                if es_mayor:
+                    if hasattr(llm_client, 'analyze_tdr_mayores') and type(llm_client).analyze_tdr_mayores != BaseLLMClient.analyze_tdr_mayores:
+                        analysis_dict = await self._tdr_llm_call(llm_client, "analyze_tdr_mayores", context, envelope=envelope, on_event=on_event)
+                    else:
+                        mayores_prefix = """[INSTRUCCION: Contrato Mayor (>8 UIT) bajo Ley N 32069. DEBES devolver UNICAMENTE un JSON con metadatos_proceso, requisitos_admisibilidad_y_calificacion, factores_puntaje_evaluacion, parametros_consorcio, garantias_y_penalidades.]\n\n"""
+                        analysis_dict = await self._tdr_llm_call(llm_client, "analyze_tdr", mayores_prefix + context, envelope=envelope, on_event=on_event)
                 else:
-                    mayores_prefix = """[INSTRUCCION: Contrato Mayor (>8 UIT) bajo Ley N 32069. DEBES devolver UNICAMENTE un JSON con metadatos_proceso, requisitos_admisibilidad_y_calificacion, factores_puntaje_evaluacion, parametros_consorcio, garantias_y_penalidades.]\n\n"""
-                    analysis_dict = await llm_client.analyze_tdr(mayores_prefix + context)
-            else:
-                analysis_dict = await llm_client.analyze_tdr(context)
-            self.last_token_usage = analysis_dict.pop('_token_usage', {})
-            return analysis_dict if es_mayor else self._validate_response(self._sanitize_llm_payload(analysis_dict))
+                    analysis_dict = await self._tdr_llm_call(llm_client, "analyze_tdr", context, envelope=envelope, on_event=on_event)
+            envelope.consume_token_usage(analysis_dict)
+            if es_mayor:
+                return analysis_dict
+            with envelope.stage("validate"):
+                return self._validate_response(self._sanitize_llm_payload(analysis_dict))
 
-        # Paso 1: Detección ultrarrápida — PyMuPDF directo, cero OCR (~0.3s)
-        self.logger.info("Paso 1/4: Detectando tipo de PDF (nativo vs escaneado)...")
-        detect_text = self._extract_native_text(pdf_bytes)
-        num_pages = self._get_page_count(pdf_bytes)
+        # Paso 1: Sondeo en una sola apertura de fitz (+ texto si el PDF es nativo)
+        self.logger.info("Paso 1/4: Sondeando PDF (nativo vs escaneado)...")
+        probe, merged = await document_understanding.probe(
+            understanding, pdf_bytes, hasattr(llm_client, 'analyze_tdr_from_pdf'), envelope
+        )
+        num_pages = probe.page_count
 
         # PyMuPDF no pudo leer el archivo (DOCX, etc.) → extraer texto de DOCX o markdown
-        if num_pages == 0 and len(detect_text) < 50:
-            docx_text = self._extract_docx_text(pdf_bytes)
+        if not probe.opened:
+            docx_text = await document_understanding.docx_text(understanding, pdf_bytes, envelope)
             if docx_text:
+                envelope.path = PATH_DOCX
                 self.logger.info(f"📝 Documento no-PDF detectado (DOCX/Word) — {len(docx_text)} chars extraídos")
                 context = f"DOCUMENTO COMPLETO DEL TDR:\n\n{docx_text}\n\n===== FIN DEL DOCUMENTO ====="
                 self.logger.info(f"✓ Contexto preparado: {len(context)} caracteres")
                 self.logger.info(f"Paso 4/4: Analizando con LLM (provider: {llm_provider or 'default'}, tipo: {tipo_contrato})...")
                 # Para DOCX, usar el prompt textual de Mayores o Menores según corresponda
-                if es_mayor:
-                    if hasattr(llm_client, 'analyze_tdr_mayores') and type(llm_client).analyze_tdr_mayores != BaseLLMClient.analyze_tdr_mayores:
-                        analysis_dict = await llm_client.analyze_tdr_mayores(context)
+                with envelope.stage("llm"):
+                    if es_mayor:
+                        if hasattr(llm_client, 'analyze_tdr_mayores') and type(llm_client).analyze_tdr_mayores != BaseLLMClient.analyze_tdr_mayores:
+                            analysis_dict = await self._tdr_llm_call(llm_client, "analyze_tdr_mayores", context, envelope=envelope, on_event=on_event)
+                        else:
+                            # Inyectar instrucción Mayores
+                            mayores_prefix = """[INSTRUCCIÓN: Contrato Mayor (>8 UIT) bajo Ley N° 32069. DEBES devolver ÚNICAMENTE un JSON con metadatos_proceso, requisitos_admisibilidad_y_calificacion, factores_puntaje_evaluacion, parametros_consorcio, garantias_y_penalidades.]\n\n"""
+                            analysis_dict = await self._tdr_llm_call(llm_client, "analyze_tdr", mayores_prefix + context, envelope=envelope, on_event=on_event)
                     else:
-                        # Inyectar instrucción Mayores
-                        mayores_prefix = """[INSTRUCCIÓN: Contrato Mayor (>8 UIT) bajo Ley N° 32069. DEBES devolver ÚNICAMENTE un JSON con metadatos_proceso, requisitos_admisibilidad_y_calificacion, factores_puntaje_evaluacion, parametros_consorcio, garantias_y_penalidades.]\n\n"""
-                        analysis_dict = await llm_client.analyze_tdr(mayores_prefix + context)
-                else:
-                    analysis_dict = await llm_client.analyze_tdr(context)
-                self.last_token_usage = analysis_dict.pop('_token_usage', {})
-                return analysis_dict if es_mayor else self._validate_response(self._sanitize_llm_payload(analysis_dict))
+                        analysis_dict = await self._tdr_llm_call(llm_client, "analyze_tdr", context, envelope=envelope, on_event=on_event)
+                envelope.consume_token_usage(analysis_dict)
+                if es_mayor:
+                    return analysis_dict
+                with envelope.stage("validate"):
+                    return self._validate_response(self._sanitize_llm_payload(analysis_dict))
             else:
                 # Ni PDF ni DOCX — intentar multimodal de todas formas (podría ser PDF corrupto)
                 pass
 
-        chars_per_page = len(detect_text) / max(num_pages, 1)
+        chars_per_page = probe.chars_per_page
 
         self.logger.info(
-            f"✓ Detección: {len(detect_text)} chars, "
+            f"✓ Detección: {probe.total_chars} chars, "
             f"{num_pages} págs, {chars_per_page:.0f} chars/pág"
         )
 
-        # ── Router: Contratos Mayores vs Menores ──────────────────────────────
-        es_mayor = (tipo_contrato == "mayores")
-
         # ── Estrategia híbrida ─────────────────────────────────────────────
-        # PDF escaneado (<200 chars/pág) O PDF grande (>50 págs): multimodal directo
+        # PDF escaneado (mayoría de páginas escaneadas) O PDF nativo grande (>20 págs): multimodal directo
         #   Salta extract_text_from_pdf, RAG y Tesseract por completo.
+        # Documento mixto: ruta de texto (ver _document_text), las páginas escaneadas aparte.
         #   Gemini procesa el PDF visualmente en ~30s constante.
-        pdf_muy_grande = num_pages > 20
         use_multimodal = (
-            (chars_per_page < MIN_CHARS_PER_PAGE or pdf_muy_grande)
+            probe.prefers_multimodal()
             and hasattr(llm_client, 'analyze_tdr_from_pdf')
         )
 
@@ -152,19 +344,22 @@ class TDRAnalyzerService:
                 f"📸 PDF escaneado ({chars_per_page:.0f} chars/pág) "
                 f"— multimodal directo, sin OCR, sin Tesseract..."
             )
-            analysis_dict = await llm_client.analyze_tdr_from_pdf(pdf_bytes, "document.pdf")
-            self.last_token_usage = analysis_dict.pop('_token_usage', {})
+            envelope.path = PATH_MULTIMODAL
+            multimodal_bytes = await document_understanding.multimodal_document(understanding, pdf_bytes, envelope)
+            with envelope.stage("llm"):
+                analysis_dict = await self._tdr_llm_call(llm_client, "analyze_tdr_from_pdf", multimodal_bytes, "document.pdf", envelope=envelope, on_event=on_event)
+            envelope.consume_token_usage(analysis_dict)
             # Para Mayores, el resultado multimodal viene en formato Menores — es aceptable
             if es_mayor:
                 return analysis_dict
-            analysis_dict = self._sanitize_llm_payload(analysis_dict)
-            return self._validate_response(analysis_dict)
+            with envelope.stage("validate"):
+                analysis_dict = self._sanitize_llm_payload(analysis_dict)
+                return self._validate_response(analysis_dict)
 
         # ── Camino texto nativo ────────────────────────────────────────────
-        # Solo llegamos aquí si el PDF tiene texto seleccionable.
-        # Ejecutar pipeline completo (texto + tablas). OCR desactivado via env.
-        self.logger.info("📄 PDF nativo — extrayendo texto + tablas (sin OCR)...")
-        full_text = self.pdf_processor.extract_text_from_pdf(pdf_bytes)
+        # Solo llegamos aquí si el PDF tiene texto seleccionable. El texto
+        # (texto + tablas) ya se extrajo en el sondeo, sobre el mismo documento abierto.
+        full_text, layout, source = await self._document_text(probe, merged, understanding, pdf_bytes, llm_client, envelope)
 
         if len(full_text) < 100:
             raise ValueError("El PDF contiene muy poco texto para analizar")
@@ -172,38 +367,19 @@ class TDRAnalyzerService:
         self.logger.info(f"✓ Texto completo: {len(full_text)} chars")
 
         # Paso 2 y 3: Construir contexto para el LLM
-        if len(full_text) < 5000:
-            self.logger.info("⚡ Documento pequeño detectado, enviando texto completo al LLM (sin RAG)...")
-            context = f"""DOCUMENTO COMPLETO DEL TDR:
-
-{full_text}
-
-===== FIN DEL DOCUMENTO ====="""
-            self.logger.info(f"✓ Contexto completo preparado: {len(context)} caracteres")
-        else:
-            # Paso 2: Recuperar fragmentos relevantes (RAG) - método SÍNCRONO
-            self.logger.info("Paso 2/4: Recuperando fragmentos relevantes (RAG)...")
-            fragments = self.rag_extractor.extract_relevant_fragments(full_text)
-
-            # Verificar que se recuperaron fragmentos
-            total_fragments = sum(len(chunks) for chunks in fragments.values())
-            self.logger.info(f"✓ Fragmentos recuperados: {total_fragments} chunks")
-
-            # Paso 3: Construir contexto para el LLM - método SÍNCRONO
-            self.logger.info("Paso 3/4: Construyendo contexto para el LLM...")
-            context = self.rag_extractor.build_context_for_llm(fragments)
-            self.logger.info(f"✓ Contexto construido: {len(context)} caracteres")
+        context = self._build_context(full_text, envelope, llm_provider, layout, understanding, source)
 
         # Paso 4: Analizar con el LLM usando texto enriquecido
         self.logger.info(f"Paso 4/4: Analizando con LLM (provider: {llm_provider or 'default'}, tipo: {tipo_contrato})...")
-        if es_mayor:
-            # Para Mayores, si el cliente tiene método especializado, usarlo.
-            # Si no (Gemini, OpenAI), inyectar instrucción Mayores en el contexto.
-            if hasattr(llm_client, 'analyze_tdr_mayores') and type(llm_client).analyze_tdr_mayores != BaseLLMClient.analyze_tdr_mayores:
-                analysis_dict = await llm_client.analyze_tdr_mayores(context)
-            else:
-                # Gemini/OpenAI: envolver contexto con instrucciones Mayores
-                mayores_prefix = """[INSTRUCCIÓN: Contrato Mayor (>8 UIT) bajo Ley N° 32069.
+        with envelope.stage("llm"):
+            if es_mayor:
+                # Para Mayores, si el cliente tiene método especializado, usarlo.
+                # Si no (Gemini, OpenAI), inyectar instrucción Mayores en el contexto.
+                if hasattr(llm_client, 'analyze_tdr_mayores') and type(llm_client).analyze_tdr_mayores != BaseLLMClient.analyze_tdr_mayores:
+                    analysis_dict = await self._tdr_llm_call(llm_client, "analyze_tdr_mayores", context, envelope=envelope, on_event=on_event)
+                else:
+                    # Gemini/OpenAI: envolver contexto con instrucciones Mayores
+                    mayores_prefix = """[INSTRUCCIÓN: Contrato Mayor (>8 UIT) bajo Ley N° 32069.
 DEBES devolver ÚNICAMENTE un JSON con esta estructura (no uses el formato de contratos menores):
 {
   "metadatos_proceso": {"objeto_principal": "...", "sistema_de_contratacion": "...", "valor_monetario_referencial": "...", "modalidad_inferida": "..."},
@@ -214,13 +390,13 @@ DEBES devolver ÚNICAMENTE un JSON con esta estructura (no uses el formato de co
 }
 Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de Evaluación (puntaje 0-100).
 ]\n\n"""
-                context = mayores_prefix + context
-                analysis_dict = await llm_client.analyze_tdr(context)
-        else:
-            analysis_dict = await llm_client.analyze_tdr(context)
+                    context = mayores_prefix + context
+                    analysis_dict = await self._tdr_llm_call(llm_client, "analyze_tdr", context, envelope=envelope, on_event=on_event)
+            else:
+                analysis_dict = await self._tdr_llm_call(llm_client, "analyze_tdr", context, envelope=envelope, on_event=on_event)
 
         # Extraer token usage antes de validar con Pydantic
-        self.last_token_usage = analysis_dict.pop('_token_usage', {})
+        envelope.consume_token_usage(analysis_dict)
 
         # Contratos Mayores: devolver raw dict (esquema diferente a Menores)
         if es_mayor:
@@ -247,10 +423,16 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
                 self.logger.warning(
                     "⚠️ Respuesta vacía del LLM textual — reintentando con PDF directo (multimodal)..."
                 )
-                analysis_dict = await llm_client.analyze_tdr_from_pdf(pdf_bytes, "fallback.pdf")
-                self.last_token_usage = analysis_dict.pop('_token_usage', {})
-                analysis_dict = self._sanitize_llm_payload(analysis_dict)
-                return self._validate_response(analysis_dict)
+                envelope.path = PATH_FALLBACK
+                if on_event is not None:
+                    # Los campos ya emitidos (vacíos) se descartan en el cliente
+                    await on_event({"type": "reset", "path": PATH_FALLBACK})
+                with envelope.stage("llm"):
+                    analysis_dict = await self._tdr_llm_call(llm_client, "analyze_tdr_from_pdf", pdf_bytes, "fallback.pdf", envelope=envelope, on_event=on_event)
+                envelope.consume_token_usage(analysis_dict)
+                with envelope.stage("validate"):
+                    analysis_dict = self._sanitize_llm_payload(analysis_dict)
+                    return self._validate_response(analysis_dict)
 
             self.logger.error("El LLM no pudo extraer contenido — PDF posiblemente escaneado sin OCR disponible")
             raise ValueError(
@@ -258,27 +440,81 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
                 "No se pudo extraer contenido analizable. Intente con un PDF que contenga texto digital."
             )
 
-        return self._validate_response(analysis_dict)
+        with envelope.stage("validate"):
+            return self._validate_response(analysis_dict)
+
+    async def _tdr_llm_call(
+        self,
+        llm_client: BaseLLMClient,
+        operation: str,
+        *args,
+        envelope: AnalysisEnvelope,
+        on_event: Optional[EventSink] = None,
+    ) -> Dict:
+        """
+        Llamada al LLM del pipeline TDR.
+
+        Sin `on_event`: hedged_call, como el resto de pipelines. Con `on_event`
+        se usa la variante `<operation>_stream` del cliente y cada campo se
+        reenvía en cuanto el LLM lo cierra (sin hedging: lo emitido por un
+        proveedor no se puede retirar). Las operaciones sin streaming
+        (Mayores) emiten sus campos al terminar.
+        """
+        if on_event is None:
+            return await hedged_call(llm_client, operation, *args)
+
+        stream = getattr(llm_client, f"{operation}_stream", None)
+        if stream is None:
+            result = await hedged_call(llm_client, operation, *args)
+            for event in field_events(result):
+                await self._emit(on_event, envelope, event)
+            return result
+
+        result = None
+        async for event in stream(*args):
+            if event["type"] == "result":
+                result = event["data"]
+            else:
+                await self._emit(on_event, envelope, event)
+        if result is None:
+            raise ValueError(f"El stream de {operation} terminó sin resultado")
+        return result
+
+    @staticmethod
+    async def _emit(on_event: EventSink, envelope: AnalysisEnvelope, event: Dict) -> None:
+        envelope.mark_first_event()
+        await on_event(event)
 
     async def evaluate_compatibility(
         self,
         request: CompatibilityScoreRequest,
         llm_provider: Optional[Literal["gemini", "openai", "anthropic"]] = None
-    ) -> CompatibilityScoreResponse:
-        """Evalúa la compatibilidad usando el análisis existente y el copy del suscriptor."""
+    ) -> AnalysisEnvelope:
+        """
+        Evalúa la compatibilidad usando el análisis existente y el copy del suscriptor.
+
+        Returns:
+            AnalysisEnvelope con result = CompatibilityScoreResponse.
+        """
         if not request.company_copy.strip():
             raise ValueError("El copy del suscriptor es obligatorio para evaluar compatibilidad")
 
+        envelope = AnalysisEnvelope()
         llm_client = LLMFactory.create_client(llm_provider)
-        raw_response = await llm_client.evaluate_compatibility(
-            request.company_copy,
-            request.analisis_tdr,
-            request.contrato_contexto,
-            request.keywords,
-        )
+        with envelope.stage("llm"):
+            raw_response = await hedged_call(
+                llm_client, "evaluate_compatibility",
+                request.company_copy,
+                request.analisis_tdr,
+                request.contrato_contexto,
+                request.keywords,
+            )
+        envelope.consume_token_usage(raw_response)
 
-        sanitized = self._sanitize_compatibility_payload(raw_response)
-        return CompatibilityScoreResponse(**sanitized)
+        with envelope.stage("validate"):
+            sanitized = self._sanitize_compatibility_payload(raw_response)
+            envelope.result = CompatibilityScoreResponse(**sanitized)
+        return envelope.finish()
 
     def _sanitize_llm_payload(self, analysis: Dict) -> Dict:
         """Ajusta el payload devuelto por el LLM para cumplir con los límites del esquema."""
@@ -311,30 +547,6 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
             self.logger.error(f"Respuesta recibida: {analysis_dict}")
             raise ValueError(f"La respuesta del LLM no cumple con el esquema esperado: {str(e)}")
 
-    @staticmethod
-    def _extract_native_text(pdf_bytes: bytes) -> str:
-        """Extrae solo texto nativo del PDF via PyMuPDF (cero OCR, ~0.3s).
-        Usado para detectar si el PDF es escaneado sin invocar Tesseract.
-        """
-        try:
-            doc = fitz.open(stream=io.BytesIO(pdf_bytes), filetype="pdf")
-            text = "\n".join(page.get_text() for page in doc)
-            doc.close()
-            return text
-        except Exception:
-            return ""
-
-    @staticmethod
-    def _get_page_count(pdf_bytes: bytes) -> int:
-        """Obtiene el número de páginas del PDF usando PyMuPDF."""
-        try:
-            doc = fitz.open(stream=io.BytesIO(pdf_bytes), filetype="pdf")
-            count = len(doc)
-            doc.close()
-            return count
-        except Exception:
-            return 1
-
     def _sanitize_compatibility_payload(self, payload: Dict) -> Dict:
         score = payload.get("score")
         try:
@@ -370,7 +582,29 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
         pdf_bytes: bytes,
         llm_provider: Optional[Literal["gemini", "openai", "anthropic"]] = None,
         tipo_contrato: str = "menores",
-    ) -> DireccionamientoAnalysisResponse:
+    ) -> AnalysisEnvelope:
+        """
+        Análisis forense de direccionamiento.
+
+        Returns:
+            AnalysisEnvelope con result = DireccionamientoAnalysisResponse
+            (dict crudo para Mayores) + tokens, tiempos y ruta de esta petición.
+        """
+        envelope = AnalysisEnvelope()
+        envelope.result = await self._run_direccionamiento_pipeline(
+            pdf_bytes, llm_provider, tipo_contrato, envelope
+        )
+        envelope.finish()
+        self.logger.info(f"⏱️  Direccionamiento: {envelope.metrics()} — tokens: {envelope.token_usage}")
+        return envelope
+
+    async def _run_direccionamiento_pipeline(
+        self,
+        pdf_bytes: bytes,
+        llm_provider: Optional[Literal["gemini", "openai", "anthropic"]],
+        tipo_contrato: str,
+        envelope: AnalysisEnvelope,
+    ):
         """
         Pipeline de análisis forense de direccionamiento.
         Estrategia híbrida: multimodal para escaneados, texto+RAG para nativos.
@@ -378,50 +612,50 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
         self.logger.info("=== INICIANDO PIPELINE DE DIRECCIONAMIENTO ===")
 
         llm_client = LLMFactory.create_client(llm_provider)
+        understanding = document_understanding.get(pdf_bytes)
 
         # ── DOCX/DOC detectado por MAGIC BYTES (Gemini multimodal no soporta
         #    DOCX; los TDR del SEACE a veces vienen Word con extensión .pdf) ──
         if pdf_bytes[:2] == b'PK' or pdf_bytes[:8] == b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1':
             self.logger.info("📝 Documento Word detectado (magic bytes) — extrayendo texto...")
-            docx_text = self._extract_docx_text(pdf_bytes)
+            envelope.path = PATH_DOCX
+            docx_text = await document_understanding.docx_text(understanding, pdf_bytes, envelope)
             if not docx_text:
                 raise ValueError("No se pudo extraer texto del documento Word. El archivo podría estar corrupto o protegido.")
 
             self.logger.info(f"✓ DOCX: {len(docx_text)} chars extraídos")
 
-            if len(docx_text) < 5000:
-                context = f"DOCUMENTO COMPLETO DEL TDR:\n\n{docx_text}\n\n===== FIN DEL DOCUMENTO ====="
-            else:
-                fragments = self.rag_extractor.extract_relevant_fragments(docx_text)
-                context = self.rag_extractor.build_context_for_llm(fragments)
-
-            self.logger.info(f"✓ Contexto construido: {len(context)} caracteres")
+            context = self._build_context(docx_text, envelope, llm_provider, understanding=understanding)
 
             es_mayor = (tipo_contrato == "mayores")
-            if es_mayor:
-                analysis_dict = await llm_client.analyze_direccionamiento_mayores(context)
-            else:
-                analysis_dict = await llm_client.analyze_direccionamiento(context)
+            with envelope.stage("llm"):
+                if es_mayor:
+                    analysis_dict = await hedged_call(llm_client, "analyze_direccionamiento_mayores", context)
+                else:
+                    analysis_dict = await hedged_call(llm_client, "analyze_direccionamiento", context)
 
-            self.last_token_usage = analysis_dict.pop('_token_usage', {})
+            envelope.consume_token_usage(analysis_dict)
             analysis_dict = self._sanitize_direccionamiento_payload(analysis_dict)
 
             try:
-                validated = DireccionamientoAnalysisResponse(**analysis_dict)
+                with envelope.stage("validate"):
+                    validated = DireccionamientoAnalysisResponse(**analysis_dict)
                 self.logger.info(f"✅ Direccionamiento DOCX — Score: {validated.score_riesgo_corrupcion}")
                 return validated
             except Exception as e:
                 self.logger.error(f"Error al validar respuesta de direccionamiento DOCX: {str(e)}")
                 raise ValueError(f"Respuesta del LLM no cumple esquema: {str(e)}")
 
-        # Paso 1: Detección ultrarrápida — PyMuPDF directo (~0.3s)
-        self.logger.info("Paso 1: Detectando tipo de PDF (nativo vs escaneado)...")
-        detect_text = self._extract_native_text(pdf_bytes)
-        num_pages = self._get_page_count(pdf_bytes)
-        chars_per_page = len(detect_text) / max(num_pages, 1)
+        # Paso 1: Sondeo en una sola apertura de fitz (+ texto si el PDF es nativo)
+        self.logger.info("Paso 1: Sondeando PDF (nativo vs escaneado)...")
+        probe, merged = await document_understanding.probe(
+            understanding, pdf_bytes, hasattr(llm_client, 'analyze_direccionamiento_from_pdf'), envelope
+        )
+        num_pages = probe.page_count
+        chars_per_page = probe.chars_per_page
 
         self.logger.info(
-            f"✓ Detección: {len(detect_text)} chars, "
+            f"✓ Detección: {probe.total_chars} chars, "
             f"{num_pages} págs, {chars_per_page:.0f} chars/pág"
         )
 
@@ -430,7 +664,7 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
 
         # ── Estrategia híbrida ─────────────────────────────────────────────
         use_multimodal = (
-            (chars_per_page < MIN_CHARS_PER_PAGE or num_pages > 20)
+            probe.prefers_multimodal()
             and hasattr(llm_client, 'analyze_direccionamiento_from_pdf')
         )
 
@@ -439,11 +673,15 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
                 f"📸 PDF escaneado ({chars_per_page:.0f} chars/pág) "
                 f"— direccionamiento multimodal directo, sin OCR..."
             )
-            analysis_dict = await llm_client.analyze_direccionamiento_from_pdf(pdf_bytes, "document.pdf")
-            self.last_token_usage = analysis_dict.pop('_token_usage', {})
+            envelope.path = PATH_MULTIMODAL
+            multimodal_bytes = await document_understanding.multimodal_document(understanding, pdf_bytes, envelope)
+            with envelope.stage("llm"):
+                analysis_dict = await hedged_call(llm_client, "analyze_direccionamiento_from_pdf", multimodal_bytes, "document.pdf")
+            envelope.consume_token_usage(analysis_dict)
             analysis_dict = self._sanitize_direccionamiento_payload(analysis_dict)
             try:
-                validated = DireccionamientoAnalysisResponse(**analysis_dict)
+                with envelope.stage("validate"):
+                    validated = DireccionamientoAnalysisResponse(**analysis_dict)
                 self.logger.info(f"✅ Direccionamiento multimodal — Score: {validated.score_riesgo_corrupcion}, Veredicto: {validated.veredicto_flash}")
                 return validated
             except Exception as e:
@@ -451,8 +689,7 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
                 raise ValueError(f"Respuesta del LLM no cumple esquema: {str(e)}")
 
         # ── Camino texto nativo ────────────────────────────────────────────
-        self.logger.info("📄 PDF nativo — extrayendo texto + tablas (sin OCR)...")
-        full_text = self.pdf_processor.extract_text_from_pdf(pdf_bytes)
+        full_text, layout, source = await self._document_text(probe, merged, understanding, pdf_bytes, llm_client, envelope)
 
         if len(full_text) < 100:
             raise ValueError("El PDF contiene muy poco texto para analizar")
@@ -460,23 +697,18 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
         self.logger.info(f"✓ Texto completo: {len(full_text)} caracteres")
 
         # Paso 2-3: Construir contexto (mismo que análisis general)
-        if len(full_text) < 5000:
-            context = f"DOCUMENTO COMPLETO DEL TDR:\n\n{full_text}\n\n===== FIN DEL DOCUMENTO ====="
-        else:
-            fragments = self.rag_extractor.extract_relevant_fragments(full_text)
-            context = self.rag_extractor.build_context_for_llm(fragments)
-
-        self.logger.info(f"✓ Contexto construido: {len(context)} caracteres")
+        context = self._build_context(full_text, envelope, llm_provider, layout, understanding, source)
 
         # Paso 4: Analizar con prompt forense
         self.logger.info(f"🔍 Analizando direccionamiento con LLM (tipo: {tipo_contrato})...")
+        with envelope.stage("llm"):
+            if es_mayor:
+                analysis_dict = await hedged_call(llm_client, "analyze_direccionamiento_mayores", context)
+            else:
+                analysis_dict = await hedged_call(llm_client, "analyze_direccionamiento", context)
+        envelope.consume_token_usage(analysis_dict)
         if es_mayor:
-            analysis_dict = await llm_client.analyze_direccionamiento_mayores(context)
-            self.last_token_usage = analysis_dict.pop('_token_usage', {})
             return analysis_dict
-        else:
-            analysis_dict = await llm_client.analyze_direccionamiento(context)
-        self.last_token_usage = analysis_dict.pop('_token_usage', {})
         analysis_dict = self._sanitize_direccionamiento_payload(analysis_dict)
 
         # Fallback: si el análisis textual falla, reintentar con multimodal
@@ -486,13 +718,16 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
         is_empty = score == 0 and not hallazgos and len(argumento) < 30
         if is_empty and hasattr(llm_client, 'analyze_direccionamiento_from_pdf'):
             self.logger.warning("⚠️ Respuesta vacía del LLM textual — reintentando con multimodal...")
-            analysis_dict = await llm_client.analyze_direccionamiento_from_pdf(pdf_bytes, "fallback.pdf")
-            self.last_token_usage = analysis_dict.pop('_token_usage', {})
+            envelope.path = PATH_FALLBACK
+            with envelope.stage("llm"):
+                analysis_dict = await hedged_call(llm_client, "analyze_direccionamiento_from_pdf", pdf_bytes, "fallback.pdf")
+            envelope.consume_token_usage(analysis_dict)
             analysis_dict = self._sanitize_direccionamiento_payload(analysis_dict)
 
         # Paso 5: Validar con Pydantic
         try:
-            validated = DireccionamientoAnalysisResponse(**analysis_dict)
+            with envelope.stage("validate"):
+                validated = DireccionamientoAnalysisResponse(**analysis_dict)
             self.logger.info(f"✅ Direccionamiento completado — Score: {validated.score_riesgo_corrupcion}, Veredicto: {validated.veredicto_flash}")
             return validated
         except Exception as e:
@@ -626,7 +861,33 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
         contrato_contexto: Optional[Dict] = None,
         llm_provider: Optional[Literal["gemini", "openai", "anthropic"]] = None,
         tipo_contrato: str = "menores",
-    ) -> ProformaResponse:
+    ) -> AnalysisEnvelope:
+        """
+        Generación de proforma técnica de cotización.
+
+        Returns:
+            AnalysisEnvelope con result = ProformaResponse (dict crudo para
+            Mayores) + tokens, tiempos y ruta de esta petición.
+        """
+        envelope = AnalysisEnvelope()
+        envelope.result = await self._run_proforma_pipeline(
+            pdf_bytes, company_name, company_copy, contrato_contexto,
+            llm_provider, tipo_contrato, envelope,
+        )
+        envelope.finish()
+        self.logger.info(f"⏱️  Proforma: {envelope.metrics()} — tokens: {envelope.token_usage}")
+        return envelope
+
+    async def _run_proforma_pipeline(
+        self,
+        pdf_bytes: bytes,
+        company_name: str,
+        company_copy: str,
+        contrato_contexto: Optional[Dict],
+        llm_provider: Optional[Literal["gemini", "openai", "anthropic"]],
+        tipo_contrato: str,
+        envelope: AnalysisEnvelope,
+    ):
         """
         Pipeline de generación de proforma técnica de cotización.
         Estrategia híbrida: multimodal para escaneados, texto+RAG para nativos.
@@ -634,54 +895,57 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
         self.logger.info("=== INICIANDO PIPELINE DE PROFORMA TÉCNICA ===")
 
         llm_client = LLMFactory.create_client(llm_provider)
+        understanding = document_understanding.get(pdf_bytes)
 
         # ── DOCX/DOC detectado por MAGIC BYTES (Gemini multimodal no soporta
         #    DOCX; los TDR del SEACE a veces vienen Word con extensión .pdf) ──
         if pdf_bytes[:2] == b'PK' or pdf_bytes[:8] == b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1':
             self.logger.info("📝 Documento Word detectado (magic bytes) — extrayendo texto...")
-            docx_text = self._extract_docx_text(pdf_bytes)
+            envelope.path = PATH_DOCX
+            docx_text = await document_understanding.docx_text(understanding, pdf_bytes, envelope)
             if not docx_text:
                 raise ValueError("No se pudo extraer texto del documento Word. El archivo podría estar corrupto o protegido.")
 
             self.logger.info(f"✓ DOCX: {len(docx_text)} chars extraídos")
 
-            if len(docx_text) < 5000:
-                context = f"DOCUMENTO COMPLETO DEL TDR:\n\n{docx_text}\n\n===== FIN DEL DOCUMENTO ====="
-            else:
-                fragments = self.rag_extractor.extract_relevant_fragments(docx_text)
-                context = self.rag_extractor.build_context_for_llm(fragments)
-
-            self.logger.info(f"✓ Contexto construido: {len(context)} caracteres")
+            context = self._build_context(docx_text, envelope, llm_provider, understanding=understanding)
 
             es_mayor = (tipo_contrato == "mayores")
+            with envelope.stage("llm"):
+                if es_mayor:
+                    raw = await hedged_call(
+                        llm_client, "generate_proforma_mayores",
+                        context, company_name, company_copy, contrato_contexto,
+                    )
+                else:
+                    raw = await hedged_call(
+                        llm_client, "generate_proforma",
+                        context, company_name, company_copy, contrato_contexto,
+                    )
+            envelope.consume_token_usage(raw)
             if es_mayor:
-                raw = await llm_client.generate_proforma_mayores(
-                    context, company_name, company_copy, contrato_contexto,
-                )
-                self.last_token_usage = raw.pop('_token_usage', {})
                 return raw
 
-            raw = await llm_client.generate_proforma(
-                context, company_name, company_copy, contrato_contexto,
-            )
-            self.last_token_usage = raw.pop('_token_usage', {})
             sanitized = self._sanitize_proforma_payload(raw)
             try:
-                validated = ProformaResponse(**sanitized)
+                with envelope.stage("validate"):
+                    validated = ProformaResponse(**sanitized)
                 self.logger.info(f"✅ Proforma DOCX — {len(validated.items)} ítems")
                 return validated
             except Exception as e:
                 self.logger.error(f"Error al validar proforma DOCX: {str(e)}")
                 raise ValueError(f"Respuesta del LLM no cumple esquema de proforma: {str(e)}")
 
-        # Paso 1: Detección ultrarrápida — PyMuPDF directo (~0.3s)
-        self.logger.info("Paso 1: Detectando tipo de PDF (nativo vs escaneado)...")
-        detect_text = self._extract_native_text(pdf_bytes)
-        num_pages = self._get_page_count(pdf_bytes)
-        chars_per_page = len(detect_text) / max(num_pages, 1)
+        # Paso 1: Sondeo en una sola apertura de fitz (+ texto si el PDF es nativo)
+        self.logger.info("Paso 1: Sondeando PDF (nativo vs escaneado)...")
+        probe, merged = await document_understanding.probe(
+            understanding, pdf_bytes, hasattr(llm_client, 'generate_proforma_from_pdf'), envelope
+        )
+        num_pages = probe.page_count
+        chars_per_page = probe.chars_per_page
 
         self.logger.info(
-            f"✓ Detección: {len(detect_text)} chars, "
+            f"✓ Detección: {probe.total_chars} chars, "
             f"{num_pages} págs, {chars_per_page:.0f} chars/pág"
         )
 
@@ -690,7 +954,7 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
 
         # ── Estrategia híbrida ─────────────────────────────────────────────
         use_multimodal = (
-            (chars_per_page < MIN_CHARS_PER_PAGE or num_pages > 20)
+            probe.prefers_multimodal()
             and hasattr(llm_client, 'generate_proforma_from_pdf')
         )
 
@@ -699,13 +963,18 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
                 f"📸 PDF escaneado ({chars_per_page:.0f} chars/pág) "
                 f"— proforma multimodal directo, sin OCR..."
             )
-            raw = await llm_client.generate_proforma_from_pdf(
-                pdf_bytes, "document.pdf", company_name, company_copy, contrato_contexto
-            )
-            self.last_token_usage = raw.pop('_token_usage', {})
+            envelope.path = PATH_MULTIMODAL
+            multimodal_bytes = await document_understanding.multimodal_document(understanding, pdf_bytes, envelope)
+            with envelope.stage("llm"):
+                raw = await hedged_call(
+                    llm_client, "generate_proforma_from_pdf",
+                    multimodal_bytes, "document.pdf", company_name, company_copy, contrato_contexto
+                )
+            envelope.consume_token_usage(raw)
             sanitized = self._sanitize_proforma_payload(raw)
             try:
-                validated = ProformaResponse(**sanitized)
+                with envelope.stage("validate"):
+                    validated = ProformaResponse(**sanitized)
                 self.logger.info(f"✅ Proforma multimodal — {len(validated.items)} ítems")
                 return validated
             except Exception as e:
@@ -713,8 +982,7 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
                 raise ValueError(f"Respuesta del LLM no cumple esquema de proforma: {str(e)}")
 
         # ── Camino texto nativo ────────────────────────────────────────────
-        self.logger.info("📄 PDF nativo — extrayendo texto + tablas (sin OCR)...")
-        full_text = self.pdf_processor.extract_text_from_pdf(pdf_bytes)
+        full_text, layout, source = await self._document_text(probe, merged, understanding, pdf_bytes, llm_client, envelope)
 
         if len(full_text) < 50:
             raise ValueError("El PDF contiene muy poco texto para generar la proforma")
@@ -722,46 +990,223 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
         self.logger.info(f"✓ Texto completo: {len(full_text)} caracteres")
 
         # Paso 2-3: Construir contexto (mismo pipeline que análisis general)
-        if len(full_text) < 5000:
-            context = f"DOCUMENTO COMPLETO DEL TDR:\n\n{full_text}\n\n===== FIN DEL DOCUMENTO ====="
-        else:
-            fragments = self.rag_extractor.extract_relevant_fragments(full_text)
-            context = self.rag_extractor.build_context_for_llm(fragments)
-
-        self.logger.info(f"✓ Contexto construido: {len(context)} caracteres")
+        context = self._build_context(full_text, envelope, llm_provider, layout, understanding, source)
 
         # Paso 4: Generar proforma con LLM
         self.logger.info(f"📋 Generando proforma con LLM (tipo: {tipo_contrato})...")
+        with envelope.stage("llm"):
+            if es_mayor:
+                raw = await hedged_call(
+                    llm_client, "generate_proforma_mayores",
+                    context, company_name, company_copy, contrato_contexto,
+                )
+            else:
+                raw = await hedged_call(
+                    llm_client, "generate_proforma",
+                    context, company_name, company_copy, contrato_contexto,
+                )
+        envelope.consume_token_usage(raw)
         if es_mayor:
-            raw = await llm_client.generate_proforma_mayores(
-                context, company_name, company_copy, contrato_contexto,
-            )
-            self.last_token_usage = raw.pop('_token_usage', {})
             return raw
-        else:
-            raw = await llm_client.generate_proforma(
-                context, company_name, company_copy, contrato_contexto,
-            )
-        self.last_token_usage = raw.pop('_token_usage', {})
         sanitized = self._sanitize_proforma_payload(raw)
 
         # Fallback: si la proforma textual no tiene ítems, reintentar con multimodal
         if not sanitized.get("items") and hasattr(llm_client, 'generate_proforma_from_pdf'):
             self.logger.warning("⚠️ Proforma vacía del LLM textual — reintentando con multimodal...")
-            raw = await llm_client.generate_proforma_from_pdf(
-                pdf_bytes, "fallback.pdf", company_name, company_copy, contrato_contexto
-            )
-            self.last_token_usage = raw.pop('_token_usage', {})
+            envelope.path = PATH_FALLBACK
+            with envelope.stage("llm"):
+                raw = await hedged_call(
+                    llm_client, "generate_proforma_from_pdf",
+                    pdf_bytes, "fallback.pdf", company_name, company_copy, contrato_contexto
+                )
+            envelope.consume_token_usage(raw)
             sanitized = self._sanitize_proforma_payload(raw)
 
         try:
-            validated = ProformaResponse(**sanitized)
+            with envelope.stage("validate"):
+                validated = ProformaResponse(**sanitized)
             self.logger.info(f"✅ Proforma generada — {len(validated.items)} ítems")
             return validated
         except Exception as e:
             self.logger.error(f"Error al validar respuesta de proforma: {str(e)}")
             raise ValueError(f"Respuesta del LLM no cumple esquema de proforma: {str(e)}")
 
+    # ═══════════════════════════════════════════════════════════════
+    # ANÁLISIS COMPLETO (/analyze-full) — resumen + forense + proforma
+    # ═══════════════════════════════════════════════════════════════
+
+    async def analyze_full_document(
+        self,
+        pdf_bytes: bytes,
+        company_name: str,
+        company_copy: str,
+        contrato_contexto: Optional[Dict] = None,
+        llm_provider: Optional[Literal["gemini", "openai", "anthropic"]] = None,
+        tipo_contrato: str = "menores",
+        filename: str = "document.pdf",
+    ) -> AnalysisEnvelope:
+        """
+        Resumen del TDR, análisis forense y proforma a partir de un solo envío.
+
+        Una sola llamada al LLM produce las tres secciones (el documento o su
+        contexto RAG se envía una vez). Cada sección se valida con su esquema
+        de siempre; solo las que fallan se regeneran con su pipeline propio,
+        que reutiliza la comprensión del documento ya calculada.
+
+        Returns:
+            AnalysisEnvelope con result = FullAnalysisResponse + tokens (de
+            todas las llamadas), tiempos y ruta de la llamada combinada.
+        """
+        envelope = AnalysisEnvelope()
+
+        if tipo_contrato == "mayores":
+            # Los prompts de Mayores (Ley N° 32069) son propios de cada análisis:
+            # se ejecutan los tres pipelines (comparten sondeo, texto y RAG)
+            self.logger.info("=== ANÁLISIS COMPLETO (MAYORES): tres pipelines sobre la misma comprensión ===")
+            envelope.result = FullAnalysisResponse(
+                analisis_tdr=await self._run_tdr_pipeline(pdf_bytes, llm_provider, tipo_contrato, filename, envelope),
+                direccionamiento=await self._run_direccionamiento_pipeline(pdf_bytes, llm_provider, tipo_contrato, envelope),
+                proforma=await self._run_proforma_pipeline(
+                    pdf_bytes, company_name, company_copy, contrato_contexto,
+                    llm_provider, tipo_contrato, envelope,
+                ),
+            )
+        else:
+            envelope.result = await self._run_full_pipeline(
+                pdf_bytes, company_name, company_copy, contrato_contexto,
+                llm_provider, filename, envelope,
+            )
+
+        envelope.finish()
+        self.logger.info(f"⏱️  Análisis completo: {envelope.metrics()} — tokens: {envelope.token_usage}")
+        return envelope
+
+    async def _run_full_pipeline(
+        self,
+        pdf_bytes: bytes,
+        company_name: str,
+        company_copy: str,
+        contrato_contexto: Optional[Dict],
+        llm_provider: Optional[Literal["gemini", "openai", "anthropic"]],
+        filename: str,
+        envelope: AnalysisEnvelope,
+    ) -> FullAnalysisResponse:
+        """Llamada combinada + validación por sección + reintento solo de lo que falló."""
+        self.logger.info("=== INICIANDO PIPELINE DE ANÁLISIS COMPLETO ===")
+
+        llm_client = LLMFactory.create_client(llm_provider)
+        understanding = document_understanding.get(pdf_bytes)
+        multimodal_available = hasattr(llm_client, 'analyze_full_from_pdf')
+
+        is_word = pdf_bytes[:2] == b'PK' or pdf_bytes[:8] == b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+        probe = merged = None
+        if not is_word:
+            self.logger.info("Paso 1: Sondeando PDF (nativo vs escaneado)...")
+            probe, merged = await document_understanding.probe(understanding, pdf_bytes, multimodal_available, envelope)
+            # PyMuPDF no pudo leer el archivo → intentar como Word (mismo criterio que el pipeline TDR)
+            is_word = not probe.opened
+
+        if is_word:
+            self.logger.info("📝 Documento Word detectado — extrayendo texto...")
+            envelope.path = PATH_DOCX
+            docx_text = await document_understanding.docx_text(understanding, pdf_bytes, envelope)
+            if not docx_text:
+                raise ValueError("No se pudo extraer texto del documento Word. El archivo podría estar corrupto o protegido.")
+            context = self._build_context(docx_text, envelope, llm_provider, understanding=understanding)
+            combined_call = ("analyze_full", context, company_name, company_copy, contrato_contexto)
+
+        elif probe.prefers_multimodal() and multimodal_available:
+            self.logger.info(
+                f"📸 PDF escaneado ({probe.chars_per_page:.0f} chars/pág) "
+                f"— análisis completo multimodal directo, sin OCR..."
+            )
+            envelope.path = PATH_MULTIMODAL
+            multimodal_bytes = await document_understanding.multimodal_document(understanding, pdf_bytes, envelope)
+            combined_call = (
+                "analyze_full_from_pdf", multimodal_bytes, filename, company_name, company_copy, contrato_contexto,
+            )
+
+        else:
+            full_text, layout, source = await self._document_text(probe, merged, understanding, pdf_bytes, llm_client, envelope)
+            if len(full_text) < 100:
+                raise ValueError("El PDF contiene muy poco texto para analizar")
+            context = self._build_context(full_text, envelope, llm_provider, layout, understanding, source)
+            combined_call = ("analyze_full", context, company_name, company_copy, contrato_contexto)
+
+        try:
+            with envelope.stage("llm"):
+                raw = await hedged_call(llm_client, *combined_call)
+        except ValueError as e:
+            # JSON irreparable o truncado: las tres secciones cuentan como fallidas
+            # y se regeneran por separado abajo
+            self.logger.warning(f"⚠️ Llamada combinada falló ({e}) — se generan las secciones por separado")
+            raw = {}
+
+        envelope.consume_token_usage(raw)
+
+        with envelope.stage("validate"):
+            sections = {
+                "analisis_tdr": self._validate_full_tdr(raw.get("analisis_tdr")),
+                "direccionamiento": self._validate_full_direccionamiento(raw.get("direccionamiento")),
+                "proforma": self._validate_full_proforma(raw.get("proforma")),
+            }
+
+        # Fallback por sección: solo se regenera lo que no cumplió su esquema
+        retried = [name for name, value in sections.items() if value is None]
+        if retried:
+            self.logger.warning(f"⚠️ Secciones inválidas en la llamada combinada: {retried} — regenerando por separado")
+            combined_path = envelope.path
+            if "analisis_tdr" in retried:
+                sections["analisis_tdr"] = await self._run_tdr_pipeline(
+                    pdf_bytes, llm_provider, "menores", filename, envelope
+                )
+            if "direccionamiento" in retried:
+                sections["direccionamiento"] = await self._run_direccionamiento_pipeline(
+                    pdf_bytes, llm_provider, "menores", envelope
+                )
+            if "proforma" in retried:
+                sections["proforma"] = await self._run_proforma_pipeline(
+                    pdf_bytes, company_name, company_copy, contrato_contexto,
+                    llm_provider, "menores", envelope,
+                )
+            envelope.path = combined_path
+
+        self.logger.info(f"✅ Análisis completo — reintentadas: {retried or 'ninguna'}")
+        return FullAnalysisResponse(**sections, secciones_reintentadas=retried)
+
+    def _validate_full_tdr(self, section) -> Optional[TDRAnalysisResponse]:
+        """Sección analisis_tdr de la llamada combinada, o None si no es válida."""
+        if not isinstance(section, dict) or not section:
+            return None
+        try:
+            return self._validate_response(self._sanitize_llm_payload(section))
+        except ValueError:
+            return None
+
+    def _validate_full_direccionamiento(self, section) -> Optional[DireccionamientoAnalysisResponse]:
+        """Sección direccionamiento de la llamada combinada, o None si no es válida."""
+        if not isinstance(section, dict) or not section.get("argumento_para_observacion"):
+            # El sanitizador rellenaría un argumento genérico: una sección ausente no cuenta
+            return None
+        try:
+            return DireccionamientoAnalysisResponse(**self._sanitize_direccionamiento_payload(section))
+        except Exception as e:
+            self.logger.warning(f"Sección direccionamiento no cumple esquema: {str(e)}")
+            return None
+
+    def _validate_full_proforma(self, section) -> Optional[ProformaResponse]:
+        """Sección proforma de la llamada combinada, o None si no es válida (o no tiene ítems)."""
+        if not isinstance(section, dict):
+            return None
+        sanitized = self._sanitize_proforma_payload(section)
+        if not sanitized["items"]:
+            return None
+        try:
+            return ProformaResponse(**sanitized)
+        except Exception as e:
+            self.logger.warning(f"Sección proforma no cumple esquema: {str(e)}")
+            return None
+
     async def generate_proforma_from_analysis(
         self,
         analisis_tdr: Dict,
@@ -791,7 +1236,8 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
 
         context = "\n\n".join(partes) if partes else "Sin información del TDR disponible"
 
-        raw = await llm_client.generate_proforma(
+        raw = await hedged_call(
+            llm_client, "generate_proforma",
             context,
             company_name,
             company_copy,
@@ -845,34 +1291,3 @@ Separa estrictamente Requisitos de Calificación (Pasa/No Pasa) de Factores de E
             payload["analisis_viabilidad"] = viab[:2997] + "..."
 
         return payload
-
-    def _extract_docx_text(self, pdf_bytes: bytes) -> str:
-        """Extrae texto de un archivo DOCX (Office Open XML) sin dependencias externas."""
-        import zipfile
-        import xml.etree.ElementTree as ET
-        import io
-
-        try:
-            with zipfile.ZipFile(io.BytesIO(pdf_bytes)) as zf:
-                if 'word/document.xml' not in zf.namelist():
-                    return ""
-
-                xml_content = zf.read('word/document.xml')
-                root = ET.fromstring(xml_content)
-
-                paragraphs = []
-                for p in root.iter('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}p'):
-                    texts = []
-                    for t in p.iter('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t'):
-                        if t.text:
-                            texts.append(t.text)
-                    if texts:
-                        paragraphs.append(''.join(texts))
-
-                text = '\n\n'.join(paragraphs)
-                self.logger.info(f"✓ DOCX: {len(text)} chars extraídos de {len(paragraphs)} párrafos")
-                return text
-
-        except Exception as e:
-            self.logger.warning(f"No se pudo extraer texto del DOCX: {e}")
-            return ""
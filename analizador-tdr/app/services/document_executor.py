@@ -0,0 +1,268 @@
+"""
+Executor acotado para el trabajo CPU-bound de documentos (PyMuPDF, Tesseract,
+compresión, DOCX) fuera del event loop de FastAPI.
+
+Un TDR escaneado de 40 páginas puede tardar decenas de segundos en parsearse;
+ejecutado dentro de un handler async congela todas las demás peticiones del
+worker. Aquí ese trabajo corre en un ProcessPoolExecutor de tamaño fijo.
+
+Reglas de las tareas:
+- Funciones de módulo (picklables).
+- Reciben bytes y retornan datos planos (str, int, bytes, dicts).
+- Nunca reciben ni retornan objetos fitz/PIL.
+
+Con document_pool_size=0 las tareas corren en hilos (asyncio.to_thread):
+el event loop sigue libre, pero sin aislamiento de procesos.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional
+import asyncio
+import functools
+import logging
+import multiprocessing
+import threading
+import time
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_document_executor() -> Optional[ProcessPoolExecutor]:
+    """Retorna el pool de procesos (lo crea en el primer uso) o None si está deshabilitado."""
+    global _executor
+    if settings.document_pool_size <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            # "spawn": requerido por max_tasks_per_child y portable a Windows
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.document_pool_size,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=settings.document_pool_max_tasks_per_child or None,
+            )
+            logger.info(
+                f"⚙️  Pool de documentos: {settings.document_pool_size} procesos, "
+                f"max_tasks_per_child={settings.document_pool_max_tasks_per_child or '∞'}"
+            )
+        return _executor
+
+
+def _discard_broken_executor(broken: ProcessPoolExecutor) -> None:
+    """
+    Descarta un pool roto (un worker murió: segfault de MuPDF, OOM killer…).
+
+    Un ProcessPoolExecutor roto rechaza todas las tareas siguientes; se cierra
+    y el próximo get_document_executor() crea uno nuevo. Si otra petición ya
+    lo reemplazó, no se toca el pool nuevo.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_document_executor() -> None:
+    """Cierra el pool de procesos (llamado desde el lifespan de FastAPI)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        logger.info("⚙️  Pool de documentos detenido")
+
+
+async def run_document_task(fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    Ejecuta una tarea de documento fuera del event loop.
+
+    Args:
+        fn: Función de módulo picklable.
+        *args: Argumentos planos (bytes, números, strings).
+
+    Returns:
+        El resultado de fn(*args).
+
+    Raises:
+        ValueError: Si el worker muere también en el reintento (pool recreado).
+    """
+    executor = get_document_executor()
+    if executor is None:
+        return await asyncio.to_thread(fn, *args)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(executor, functools.partial(fn, *args))
+    except BrokenProcessPool:
+        # Se recrea el pool y se reintenta una vez; si vuelve a romperse (p. ej.
+        # este documento es el que tumba al worker), falla solo este documento
+        logger.error(f"💥 Pool de documentos roto durante {getattr(fn, '__name__', fn)} — recreándolo y reintentando")
+        _discard_broken_executor(executor)
+        executor = get_document_executor()
+        try:
+            return await loop.run_in_executor(executor, functools.partial(fn, *args))
+        except BrokenProcessPool:
+            _discard_broken_executor(executor)
+            raise ValueError("El documento no pudo procesarse (el proceso de lectura terminó abruptamente)")
+
+
+# ============================================================================
+# TAREAS (se ejecutan dentro de los procesos del pool)
+# ============================================================================
+
+_pdf_processor = None
+
+
+def _get_pdf_processor():
+    """PDFProcessorService local al proceso (se construye una sola vez por proceso)."""
+    global _pdf_processor
+    if _pdf_processor is None:
+        from app.services.pdf_processor import PDFProcessorService
+        _pdf_processor = PDFProcessorService()
+    return _pdf_processor
+
+
+def extract_text_from_pdf(pdf_bytes: bytes) -> str:
+    """Pipeline completo (texto + tablas + OCR) → texto unificado."""
+    return _get_pdf_processor().extract_text_from_pdf(pdf_bytes)
+
+
+def parse_page_range(pdf_bytes: bytes, start: int, stop: int):
+    """Parsea las páginas [start, stop) abriendo un documento propio → DocumentContent parcial."""
+    return _get_pdf_processor().parse_page_range(pdf_bytes, start, stop)
+
+
+def probe_and_extract(pdf_bytes: bytes, multimodal_available: bool):
+    """
+    Sondea el PDF y, si irá por la ruta de texto nativo o híbrida, extrae su
+    contenido reutilizando el mismo documento abierto (una sola apertura de fitz).
+
+    Args:
+        pdf_bytes: Contenido binario del PDF.
+        multimodal_available: Si el cliente LLM soporta envío directo del PDF.
+
+    Returns:
+        (ProbeResult, MergedDocument o None, tiempos). El documento (texto +
+        spans de bloques) es None si el PDF no abre o si irá por la ruta
+        multimodal. `tiempos` tiene los segundos de las etapas "probe" y
+        "extract" medidos dentro del worker.
+    """
+    from app.services.pdf_reader import DocumentProbe, ProbeResult
+
+    timings = {}
+    start = time.perf_counter()
+    try:
+        doc = DocumentProbe.open(pdf_bytes)
+    except ValueError:
+        timings["probe"] = time.perf_counter() - start
+        return ProbeResult(opened=False), None, timings
+
+    try:
+        probe = DocumentProbe().probe(doc)
+        timings["probe"] = time.perf_counter() - start
+        if multimodal_available and probe.prefers_multimodal():
+            return probe, None, timings
+        if _should_shard(probe.page_count):
+            # Documento grande: la extracción la hace probe_document() en fragmentos
+            return probe, None, timings
+        start = time.perf_counter()
+        merged = _get_pdf_processor().extract_merged_from_document(doc)
+        timings["extract"] = time.perf_counter() - start
+        return probe, merged, timings
+    finally:
+        doc.close()
+
+
+def select_pages(pdf_bytes: bytes, relevance_patterns: List[str], max_pages: int, probe=None):
+    """
+    Elige las páginas informativas y arma el sub-PDF (una sola apertura).
+
+    Returns:
+        (sub-PDF o None si se conservan todas las páginas, PageSelection).
+    """
+    from app.services.pdf_reader import DocumentProbe, PageSelector
+
+    doc = DocumentProbe.open(pdf_bytes)
+    try:
+        selector = PageSelector(relevance_patterns, max_pages=max_pages)
+        selection = selector.select(doc, probe)
+        if not selection.is_subset:
+            return None, selection
+        return selector.build_subset(doc, selection.pages), selection
+    finally:
+        doc.close()
+
+
+def extract_pages(pdf_bytes: bytes, pages: List[int]) -> bytes:
+    """Sub-PDF con las páginas indicadas (1-based, en orden)."""
+    from app.services.pdf_reader import DocumentProbe, PageSelector
+
+    doc = DocumentProbe.open(pdf_bytes)
+    try:
+        return PageSelector.build_subset(doc, pages)
+    finally:
+        doc.close()
+
+
+def _should_shard(page_count: int) -> bool:
+    """True si el documento es lo bastante grande para parsearse en fragmentos paralelos."""
+    return (
+        settings.parse_shard_min_pages > 0
+        and settings.document_pool_size > 1
+        and page_count >= settings.parse_shard_min_pages
+    )
+
+
+# ============================================================================
+# ORQUESTACIÓN (se ejecuta en el event loop)
+# ============================================================================
+
+async def extract_text_sharded(pdf_bytes: bytes, page_count: int):
+    """
+    Extrae el texto repartiendo rangos de páginas entre los procesos del pool.
+
+    Cada worker abre su propio documento a partir de los mismos bytes; los
+    PageContent parciales se unen en orden de página y se fusionan aquí,
+    conservando el contrato de DocumentContent.
+
+    Returns:
+        MergedDocument (texto fusionado + spans de bloques).
+
+    Raises:
+        ValueError: Si el PDF no contiene contenido extraíble.
+    """
+    from app.services.pdf_reader import DocumentParser
+
+    ranges = DocumentParser.plan_shards(
+        page_count,
+        max_shards=settings.document_pool_size * 2,
+        min_pages_per_shard=settings.parse_shard_pages,
+    )
+    logger.info(f"🧩 Parseo fragmentado: {page_count} págs en {len(ranges)} fragmentos")
+    shards = await asyncio.gather(*(
+        run_document_task(parse_page_range, pdf_bytes, start, stop)
+        for start, stop in ranges
+    ))
+    return _get_pdf_processor().merge_document(DocumentParser.merge_shards(list(shards)))
+
+
+async def probe_document(pdf_bytes: bytes, multimodal_available: bool):
+    """
+    Sondea el documento y obtiene su texto si irá por la ruta nativa.
+
+    Documentos pequeños: sondeo + extracción en una sola apertura (un worker).
+    Documentos grandes: sondeo en un worker y extracción fragmentada en paralelo.
+
+    Returns:
+        (ProbeResult, MergedDocument o None, tiempos) — mismo contrato que probe_and_extract().
+    """
+    probe, merged, timings = await run_document_task(probe_and_extract, pdf_bytes, multimodal_available)
+    needs_text = probe.opened and not (multimodal_available and probe.prefers_multimodal())
+    if merged is None and needs_text and _should_shard(probe.page_count):
+        start = time.perf_counter()
+        merged = await extract_text_sharded(pdf_bytes, probe.page_count)
+        timings["extract"] = time.perf_counter() - start
+    return probe, merged, timings
@@ -0,0 +1,149 @@
+"""
+Recepción de documentos subidos por bloques, con SHA-256 al vuelo.
+
+`await file.read()` materializaba el documento completo antes de comprobar su
+tamaño, y el lote retenía todos los documentos en memoria mientras esperaban
+turno en el semáforo (diez escaneos de 40 MB ≈ 400 MB por worker). Aquí:
+
+- El upload se copia por bloques (`upload_chunk_kb`): en memoria hasta
+  `upload_spool_memory_kb`, luego a un archivo temporal en disco.
+- El SHA-256 se calcula mientras se lee; `document_sha256` lo reutiliza
+  (caché de resultados, comprensión del documento, Files API) sin re-hashear.
+- El límite se comprueba antes de leer (si Starlette ya conoce el tamaño) y
+  en cada bloque: un archivo enorme se rechaza sin copiarlo entero.
+- `view()` es un mmap de solo lectura sobre el archivo temporal (sin copia;
+  las páginas las respalda el disco). `read()` materializa `bytes` solo cuando
+  una etapa los necesita (PyMuPDF no acepta mmap; el pool de procesos los
+  serializa).
+
+    with await spool_upload(file, max_bytes) as documento:
+        pdf_bytes = documento.read()
+"""
+from typing import Optional, Union
+import hashlib
+import mmap
+import tempfile
+
+from fastapi import UploadFile
+
+from config import settings
+
+_MB = 1024 * 1024
+
+
+class DocumentBytes(bytes):
+    """bytes del documento con su SHA-256 ya calculado (`sha256`, hexadecimal)."""
+    sha256: str
+
+
+def document_sha256(document: Union[bytes, memoryview, mmap.mmap]) -> str:
+    """SHA-256 hexadecimal del documento, reutilizando el calculado al recibirlo."""
+    digest = getattr(document, "sha256", None)
+    if isinstance(digest, str):
+        return digest
+    return hashlib.sha256(document).hexdigest()
+
+
+class UploadTooLarge(ValueError):
+    """El upload supera el límite; `size` son los bytes conocidos (total o leídos hasta cortar)."""
+
+    def __init__(self, size: int, limit: int):
+        self.size = size
+        self.limit = limit
+        super().__init__(f"El archivo excede el tamaño máximo permitido ({limit / _MB:.0f}MB)")
+
+
+class SpooledDocument:
+    """Documento recibido: en memoria (pequeño) o en un archivo temporal (grande)."""
+
+    def __init__(self, filename: str, size: int, sha256: str, data: Optional[bytes] = None, spool=None):
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+        self._data = data
+        self._spool = spool
+        self._mmap: Optional[mmap.mmap] = None
+
+    @property
+    def on_disk(self) -> bool:
+        return self._spool is not None
+
+    def view(self) -> Union[memoryview, mmap.mmap]:
+        """Vista de solo lectura sin copia (mmap si está en disco)."""
+        if self._spool is None:
+            return memoryview(self._data or b"")
+        if self._mmap is None:
+            self._mmap = mmap.mmap(self._spool.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def read(self) -> DocumentBytes:
+        """Copia única a `bytes` (con el SHA-256 adjunto) para las etapas que no aceptan un buffer."""
+        document = DocumentBytes(self.view())
+        document.sha256 = self.sha256
+        return document
+
+    def close(self) -> None:
+        """Libera el mmap y borra el archivo temporal. Idempotente."""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        self._data = None
+
+    def __enter__(self) -> "SpooledDocument":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+async def spool_upload(
+    file: UploadFile,
+    max_bytes: int,
+    chunk_bytes: Optional[int] = None,
+    memory_bytes: Optional[int] = None,
+) -> SpooledDocument:
+    """
+    Lee el upload por bloques calculando el SHA-256.
+
+    Lanza UploadTooLarge en cuanto el tamaño supera `max_bytes` (sin leer
+    nada si el tamaño ya se conoce).
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(file.size, max_bytes)
+    chunk_bytes = chunk_bytes or settings.upload_chunk_kb * 1024
+    memory_bytes = settings.upload_spool_memory_kb * 1024 if memory_bytes is None else memory_bytes
+
+    digest = hashlib.sha256()
+    buffer = bytearray()
+    spool = None
+    size = 0
+    try:
+        while True:
+            chunk = await file.read(chunk_bytes)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(size, max_bytes)
+            digest.update(chunk)
+            if spool is None and size > memory_bytes:
+                spool = tempfile.TemporaryFile(prefix="tdr-upload-")
+                spool.write(buffer)
+                buffer = bytearray()
+            if spool is not None:
+                spool.write(chunk)
+            else:
+                buffer += chunk
+        if spool is not None:
+            spool.flush()
+    except BaseException:
+        if spool is not None:
+            spool.close()
+        raise
+
+    if spool is not None:
+        return SpooledDocument(file.filename, size, digest.hexdigest(), spool=spool)
+    return SpooledDocument(file.filename, size, digest.hexdigest(), data=bytes(buffer))
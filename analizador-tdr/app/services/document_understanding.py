@@ -0,0 +1,331 @@
+"""
+Etapa compartida de comprensión del documento.
+
+Laravel suele llamar /analyze-tdr, luego /analyze-direccionamiento y luego
+/generate-proforma sobre el mismo archivo. Los tres pipelines hacen el mismo
+trabajo previo al LLM: sondeo, extracción (texto fusionado + spans), chunking,
+RAG y ensamblado del contexto. Este módulo guarda esos artefactos en memoria
+por SHA-256 del documento (LRU + TTL) para que el segundo y tercer endpoint
+pasen directo a la etapa del LLM.
+
+- Single-flight: si dos peticiones del mismo documento llegan a la vez, la
+  segunda espera el lock del documento y reutiliza lo que calculó la primera.
+- Es una caché en proceso de objetos (ProbeResult, MergedDocument, TextChunk):
+  no se serializa ni se comparte entre réplicas.
+
+    understanding = document_understanding.get(pdf_bytes)
+    probe, merged = await document_understanding.probe(understanding, pdf_bytes, True, envelope)
+"""
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import re
+import threading
+import time
+
+from app.services.analysis_envelope import AnalysisEnvelope, CACHE_HIT, CACHE_MISS
+from app.services.document_executor import extract_pages, run_document_task, probe_document, select_pages
+from app.services.document_spool import document_sha256
+from app.services.docx_processor import extract_docx_text
+from app.services.llm.resilience import hedged_call
+from app.services.pdf_reader import (
+    GEMINI_TOKENS_PER_PAGE,
+    ROUTE_HYBRID,
+    BlockSpan,
+    BlockType,
+    MergedDocument,
+    ProbeResult,
+)
+from app.services.pdf_reader.document_probe import MIN_CHARS_PER_PAGE
+from app.services.rag_chunker import TextChunk
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Marcador de página que la transcripción multimodal antepone a cada página
+_PAGE_MARKER = re.compile(r"^-{2,}\s*P[áa]gina\s+(\d+)\s*-{2,}\s*$", re.MULTILINE | re.IGNORECASE)
+
+
+@dataclass
+class DocumentUnderstanding:
+    """Artefactos previos al LLM de un documento (se completan bajo demanda)."""
+    document_hash: str
+    probe_result: Optional[ProbeResult] = None
+    merged: Optional[MergedDocument] = None
+    docx_text: Optional[str] = None
+    # Fragmentos RAG por fuente de texto ("pdf" | "docx")
+    fragments: Dict[str, Dict[str, List[TextChunk]]] = field(default_factory=dict)
+    # Contexto final por (fuente, proveedor, presupuesto)
+    contexts: Dict[Tuple[str, str, int], str] = field(default_factory=dict)
+    # Envío multimodal: sub-PDF de páginas informativas (None = el original) y páginas enviadas/total
+    multimodal_pdf: Optional[bytes] = None
+    multimodal_pages: Optional[Dict[str, int]] = None
+    # Ruta híbrida: transcripción de las páginas escaneadas sin texto tras la extracción
+    scanned: Optional[MergedDocument] = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+
+class DocumentUnderstandingCache:
+    """LRU con TTL de DocumentUnderstanding por SHA-256. Thread-safe."""
+
+    def __init__(self, ttl_seconds: int, max_entries: int, enabled: bool = True):
+        self._ttl = ttl_seconds
+        self._max_entries = max(1, max_entries)
+        self.enabled = enabled
+        self._data: "OrderedDict[str, Tuple[float, DocumentUnderstanding]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, document_bytes: bytes) -> DocumentUnderstanding:
+        """Entrada del documento (nueva si no existe, expiró o la caché está desactivada)."""
+        document_hash = document_sha256(document_bytes)
+        if not self.enabled:
+            return DocumentUnderstanding(document_hash)
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(document_hash)
+            if entry is not None and entry[0] >= now:
+                self._data.move_to_end(document_hash)
+                return entry[1]
+            understanding = DocumentUnderstanding(document_hash)
+            # El TTL corre desde que se creó la entrada (no se renueva con cada uso)
+            self._data[document_hash] = (now + self._ttl, understanding)
+            self._data.move_to_end(document_hash)
+            while len(self._data) > self._max_entries:
+                self._data.popitem(last=False)
+            return understanding
+
+    async def probe(
+        self,
+        understanding: DocumentUnderstanding,
+        pdf_bytes: bytes,
+        multimodal_available: bool,
+        envelope: AnalysisEnvelope,
+    ) -> Tuple[ProbeResult, Optional[MergedDocument]]:
+        """
+        Sondeo (+ texto fusionado si irá por la ruta nativa), reutilizando lo ya calculado.
+
+        Si el sondeo previo se hizo para un cliente multimodal (sin extraer
+        texto) y este pipeline sí necesita el texto, solo se completa la extracción.
+        """
+        async with understanding.lock:
+            probe = understanding.probe_result
+            needs_text = probe is not None and probe.opened and not (
+                multimodal_available and probe.prefers_multimodal()
+            )
+            if probe is not None and (understanding.merged is not None or not needs_text):
+                self._record(envelope, hit=True)
+                logger.info(f"♻️  Comprensión del documento reutilizada ({understanding.document_hash[:12]}…) — sin re-sondear")
+                return probe, understanding.merged
+
+            self._record(envelope, hit=False)
+            probe, merged, timings = await probe_document(pdf_bytes, multimodal_available if probe is None else False)
+            for stage_name, seconds in timings.items():
+                envelope.add_timing(stage_name, seconds)
+            understanding.probe_result = probe
+            understanding.merged = merged or understanding.merged
+            return probe, understanding.merged
+
+    async def docx_text(
+        self,
+        understanding: DocumentUnderstanding,
+        document_bytes: bytes,
+        envelope: AnalysisEnvelope,
+    ) -> str:
+        """Texto de un documento Word (extraído una sola vez por documento)."""
+        async with understanding.lock:
+            if understanding.docx_text is not None:
+                self._record(envelope, hit=True)
+                return understanding.docx_text
+            self._record(envelope, hit=False)
+            with envelope.stage("extract"):
+                understanding.docx_text = await run_document_task(extract_docx_text, document_bytes) or ""
+            return understanding.docx_text
+
+    async def multimodal_document(
+        self,
+        understanding: DocumentUnderstanding,
+        pdf_bytes: bytes,
+        envelope: AnalysisEnvelope,
+    ) -> bytes:
+        """
+        PDF para el envío multimodal: sub-PDF con las páginas informativas
+        (calculado una sola vez por documento) o el original si no sobra
+        ninguna página. Los pipelines comparten así también la subida a la
+        Files API (mismo SHA-256).
+        """
+        if not settings.multimodal_page_selection_enabled:
+            return pdf_bytes
+        async with understanding.lock:
+            if understanding.multimodal_pages is not None:
+                self._record(envelope, hit=True)
+            else:
+                self._record(envelope, hit=False)
+                with envelope.stage("page_select"):
+                    await self._select_pages(understanding, pdf_bytes)
+            envelope.multimodal_pages = understanding.multimodal_pages
+            return understanding.multimodal_pdf or pdf_bytes
+
+    async def scanned_pages_text(
+        self,
+        understanding: DocumentUnderstanding,
+        pdf_bytes: bytes,
+        llm_client: Any,
+        envelope: AnalysisEnvelope,
+    ) -> Optional[MergedDocument]:
+        """
+        Ruta híbrida: texto de las páginas escaneadas que la extracción dejó
+        sin contenido (sin OCR local o con OCR fallido), transcritas en una
+        sola llamada multimodal con un sub-PDF de solo esas páginas.
+
+        Se calcula una vez por documento. Los spans (una por página transcrita,
+        relativos al texto de la transcripción) permiten que el RAG la trocee
+        como el resto del documento. None si no hay páginas por cubrir o el
+        cliente no soporta la transcripción.
+        """
+        probe, merged = understanding.probe_result, understanding.merged
+        if probe is None or merged is None or probe.route() != ROUTE_HYBRID:
+            return None
+        if not settings.hybrid_transcription_enabled or not hasattr(llm_client, "transcribe_pdf_pages"):
+            return understanding.scanned or None
+
+        async with understanding.lock:
+            if understanding.scanned is not None:
+                self._record(envelope, hit=True)
+                return understanding.scanned or None
+
+            pages = self._uncovered_pages(probe, merged)
+            if not pages:
+                understanding.scanned = MergedDocument(text="")
+                return None
+            max_pages = self._page_budget()
+            if max_pages and len(pages) > max_pages:
+                logger.info(f"📝 {len(pages)} páginas escaneadas sin texto; se transcriben las primeras {max_pages}")
+                pages = pages[:max_pages]
+
+            self._record(envelope, hit=False)
+            try:
+                with envelope.stage("transcribe"):
+                    subset = await run_document_task(extract_pages, pdf_bytes, pages)
+                    result = await hedged_call(llm_client, "transcribe_pdf_pages", subset, pages)
+            except Exception as e:
+                # Sin transcripción el análisis sigue con las páginas nativas
+                logger.warning(f"⚠️ Transcripción de páginas escaneadas falló ({e}); se analizan solo las nativas")
+                return None
+            envelope.consume_token_usage(result)
+            envelope.multimodal_pages = {"sent": len(pages), "total": probe.page_count}
+            text = (result.get("text") or "").strip()
+            understanding.scanned = self._transcription_document(text, pages)
+            logger.info(
+                f"📝 Ruta híbrida: {len(pages)}/{probe.page_count} págs escaneadas transcritas "
+                f"({len(text)} chars) — ~{(probe.page_count - len(pages)) * GEMINI_TOKENS_PER_PAGE:,} "
+                f"tokens de prompt menos que el PDF completo"
+            )
+            return understanding.scanned or None
+
+    @staticmethod
+    def _transcription_document(text: str, pages: List[int]) -> MergedDocument:
+        """Transcripción con su encabezado y un span por marcador "--- Página N ---"."""
+        if not text:
+            return MergedDocument(text="")
+        header = "===== PÁGINAS ESCANEADAS (transcripción) =====\n\n"
+        markers = list(_PAGE_MARKER.finditer(text))
+        bounds = [(m.start(), int(m.group(1))) for m in markers] or [(0, pages[0])]
+        if bounds[0][0] > 0:
+            bounds.insert(0, (0, pages[0]))
+        spans = []
+        for index, (start, page_number) in enumerate(bounds):
+            end = bounds[index + 1][0] if index + 1 < len(bounds) else len(text)
+            spans.append(BlockSpan(
+                start=len(header) + start,
+                end=len(header) + end,
+                page_number=page_number if page_number in pages else pages[0],
+                block_type=BlockType.IMAGE,
+            ))
+        return MergedDocument(text=header + text, spans=spans)
+
+    @staticmethod
+    def _uncovered_pages(probe: ProbeResult, merged: MergedDocument) -> List[int]:
+        """Páginas escaneadas que tras la extracción (texto + OCR) siguen casi sin texto."""
+        chars: Dict[int, int] = {}
+        for span in merged.spans:
+            chars[span.page_number] = chars.get(span.page_number, 0) + span.end - span.start
+        return [page for page in probe.scanned_pages if chars.get(page, 0) < MIN_CHARS_PER_PAGE]
+
+    @staticmethod
+    def _page_budget() -> int:
+        """Tope de páginas del envío multimodal (0 = sin tope)."""
+        budgets = [settings.multimodal_max_pages, settings.multimodal_max_tokens // GEMINI_TOKENS_PER_PAGE]
+        return min((budget for budget in budgets if budget > 0), default=0)
+
+    @classmethod
+    async def _select_pages(cls, understanding: DocumentUnderstanding, pdf_bytes: bytes) -> None:
+        from app.services.rag_extractor import RAGExtractionService
+
+        patterns = [pattern for group in RAGExtractionService.SECTION_PATTERNS.values() for pattern in group]
+        max_pages = cls._page_budget()
+        try:
+            subset, selection = await run_document_task(
+                select_pages, pdf_bytes, patterns, max_pages, understanding.probe_result
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Selección de páginas falló ({e}); se envía el PDF completo")
+            page_count = understanding.probe_result.page_count if understanding.probe_result else 0
+            understanding.multimodal_pages = {"sent": page_count, "total": page_count}
+            return
+
+        understanding.multimodal_pages = {"sent": len(selection.pages), "total": selection.page_count}
+        informative = sum(1 for s in selection.scores if s.page_number == 1 or not (s.blank or s.boilerplate))
+        truncated = informative - len(selection.pages)
+        if truncated > 0:
+            understanding.multimodal_pages["truncated"] = truncated
+            logger.warning(
+                f"⚠️ Tope de {max_pages} págs multimodales: {truncated} páginas informativas no se envían al LLM"
+            )
+        if subset is None:
+            logger.info(f"📄 Selección de páginas: las {selection.page_count} págs son informativas — PDF completo")
+            return
+        understanding.multimodal_pdf = subset
+        blank = sum(1 for score in selection.scores if score.blank)
+        boilerplate = sum(1 for score in selection.scores if score.boilerplate)
+        logger.info(
+            f"✂️  Selección de páginas: {selection.page_count} → {len(selection.pages)} págs "
+            f"({blank} en blanco, {boilerplate} formatos/anexos, tope {max_pages or '∞'}) — "
+            f"{len(pdf_bytes) / 1048576:.1f}MB → {len(subset) / 1048576:.1f}MB, "
+            f"~{selection.dropped * GEMINI_TOKENS_PER_PAGE:,} tokens de prompt menos"
+        )
+
+    def _record(self, envelope: AnalysisEnvelope, hit: bool) -> None:
+        if not self.enabled:
+            return
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        # Una petición que completa algo (p. ej. solo la extracción) cuenta como miss
+        if envelope.understanding_status != CACHE_MISS:
+            envelope.understanding_status = CACHE_HIT if hit else CACHE_MISS
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores expuestos en /health."""
+        total = self.hits + self.misses
+        with self._lock:
+            entries = len(self._data)
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            "entries": entries,
+        }
+
+
+# Instancia global (compartida por los tres pipelines del analizador)
+document_understanding = DocumentUnderstandingCache(
+    ttl_seconds=settings.understanding_cache_ttl_seconds,
+    max_entries=settings.understanding_cache_max_entries,
+    enabled=settings.understanding_cache_enabled,
+)
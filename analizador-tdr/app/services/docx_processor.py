@@ -0,0 +1,40 @@
+"""
+Extracción de texto de documentos Word (DOCX).
+Función de módulo (sin estado) para poder ejecutarse en el pool de procesos.
+"""
+import io
+import logging
+import xml.etree.ElementTree as ET
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def extract_docx_text(docx_bytes: bytes) -> str:
+    """Extrae texto de un archivo DOCX (Office Open XML) sin dependencias externas."""
+    try:
+        with zipfile.ZipFile(io.BytesIO(docx_bytes)) as zf:
+            if 'word/document.xml' not in zf.namelist():
+                return ""
+
+            xml_content = zf.read('word/document.xml')
+            root = ET.fromstring(xml_content)
+
+            paragraphs = []
+            for p in root.iter(f'{_W_NS}p'):
+                texts = []
+                for t in p.iter(f'{_W_NS}t'):
+                    if t.text:
+                        texts.append(t.text)
+                if texts:
+                    paragraphs.append(''.join(texts))
+
+            text = '\n\n'.join(paragraphs)
+            logger.info(f"✓ DOCX: {len(text)} chars extraídos de {len(paragraphs)} párrafos")
+            return text
+
+    except Exception as e:
+        logger.warning(f"No se pudo extraer texto del DOCX: {e}")
+        return ""
@@ -0,0 +1,427 @@
+"""
+Cola de trabajos asíncrona y durable para análisis de TDR.
+
+Los análisis multimodales tardan 30s+; mantener la conexión HTTP abierta
+provoca timeouts de proxy y pérdida de trabajo si el worker reinicia.
+Con la cola, POST /jobs guarda el documento y responde un id de inmediato;
+GET /jobs/{id} devuelve el estado y el resultado.
+
+Persistencia en SQLite (sobrevive reinicios):
+- Cada trabajo en "running" tiene dueño (id del proceso) y un lease que el
+  dueño renueva periódicamente. Solo vuelven a "queued" los trabajos cuyo
+  lease venció (su proceso murió): reiniciar un proceso uvicorn no re-encola
+  lo que sus hermanos siguen ejecutando sobre la misma base.
+- Si el proveedor LLM no está disponible (LLMUnavailableError) el trabajo
+  vuelve a la cola con un retraso (backoff, o el Retry-After del proveedor):
+  una caída del proveedor se absorbe en lugar de fallar los trabajos.
+- Tras `job_max_attempts` intentos el trabajo pasa a "error" (un documento
+  que tumba el proceso no se re-encola para siempre).
+- El documento se borra de la base al terminar (solo queda el resultado).
+
+Concurrencia configurable por tipo de trabajo (tdr, direccionamiento, proforma):
+cada tipo tiene sus propios workers, de modo que un pico de proformas no
+bloquea los análisis de TDR del scraper.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import socket
+import threading
+import time
+import uuid
+
+from config import settings
+from app.services.analyzer_service import TDRAnalyzerService
+from app.services.llm import LLMUnavailableError, llm_priority, PRIORITY_JOB
+
+logger = logging.getLogger(__name__)
+
+JOB_TYPES = ("tdr", "direccionamiento", "proforma")
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_ERROR = "error"
+
+
+class JobStore:
+    """Persistencia de trabajos en SQLite. Thread-safe; llamado vía asyncio.to_thread."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " job_type TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " filename TEXT,"
+            " params TEXT NOT NULL,"
+            " document BLOB,"
+            " result TEXT,"
+            " token_usage TEXT,"
+            " metrics TEXT,"
+            " error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " created_at TEXT NOT NULL,"
+            " started_at TEXT,"
+            " finished_at TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, job_type, created_at)")
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "metrics" not in columns:
+            # Bases creadas antes de que los trabajos guardaran métricas del pipeline
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN metrics TEXT")
+        # Bases creadas antes de los leases: worker_id/lease_expires_at (epoch) del
+        # trabajo en running; available_at (epoch) retrasa un reintento
+        for column in ("worker_id TEXT", "lease_expires_at REAL", "available_at REAL"):
+            if column.split()[0] not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+
+    def insert(self, job_type: str, filename: str, params: Dict[str, Any], document: bytes) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, job_type, status, filename, params, document, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, job_type, STATUS_QUEUED, filename, json.dumps(params, ensure_ascii=False),
+                 document, datetime.now().isoformat()),
+            )
+        return job_id
+
+    def claim_next(self, job_type: str, worker_id: str, lease_seconds: float) -> Optional[sqlite3.Row]:
+        """
+        Toma el trabajo en cola más antiguo del tipo (ya disponible) y lo marca
+        como running a nombre de `worker_id`, con un lease de `lease_seconds` (atómico).
+        """
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE: atómico incluso con varios procesos uvicorn sobre la misma base
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? AND job_type = ?"
+                    " AND (available_at IS NULL OR available_at <= ?) ORDER BY created_at LIMIT 1",
+                    (STATUS_QUEUED, job_type, now),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1,"
+                        " worker_id = ?, lease_expires_at = ?, available_at = NULL WHERE id = ?",
+                        (STATUS_RUNNING, datetime.now().isoformat(), worker_id, now + lease_seconds, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def finish(
+        self,
+        job_id: str,
+        worker_id: str,
+        result: Optional[Any],
+        token_usage: Optional[Dict],
+        metrics: Optional[Dict],
+        error: Optional[str],
+    ) -> bool:
+        """Cierra el trabajo; False si ya no es de `worker_id` (su lease venció y otro lo tomó)."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, token_usage = ?, metrics = ?, error = ?,"
+                " finished_at = ?, document = NULL, worker_id = NULL, lease_expires_at = NULL"
+                " WHERE id = ? AND status = ? AND worker_id = ?",
+                (
+                    STATUS_ERROR if error else STATUS_DONE,
+                    json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                    json.dumps(token_usage or {}),
+                    json.dumps(metrics) if metrics else None,
+                    error,
+                    datetime.now().isoformat(),
+                    job_id,
+                    STATUS_RUNNING,
+                    worker_id,
+                ),
+            )
+        return cursor.rowcount > 0
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, job_type, status, filename, result, token_usage, metrics, error, attempts,"
+                " created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["token_usage"] = json.loads(job["token_usage"]) if job["token_usage"] else None
+        job["metrics"] = json.loads(job["metrics"]) if job["metrics"] else None
+        return job
+
+    def retry_later(self, job_id: str, worker_id: str, delay_seconds: float, error: str) -> bool:
+        """Devuelve el trabajo a la cola, disponible dentro de `delay_seconds` (conserva el error)."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, started_at = NULL, worker_id = NULL,"
+                " lease_expires_at = NULL, available_at = ? WHERE id = ? AND status = ? AND worker_id = ?",
+                (STATUS_QUEUED, error, time.time() + delay_seconds, job_id, STATUS_RUNNING, worker_id),
+            )
+        return cursor.rowcount > 0
+
+    def renew_leases(self, worker_id: str, lease_seconds: float) -> int:
+        """Extiende el lease de los trabajos que `worker_id` tiene en running (heartbeat)."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE status = ? AND worker_id = ?",
+                (time.time() + lease_seconds, STATUS_RUNNING, worker_id),
+            )
+        return cursor.rowcount
+
+    def release(self, worker_id: str) -> int:
+        """Apagado ordenado: devuelve a la cola los trabajos de `worker_id` sin gastar el intento."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, worker_id = NULL, lease_expires_at = NULL,"
+                " attempts = MAX(attempts - 1, 0) WHERE status = ? AND worker_id = ?",
+                (STATUS_QUEUED, STATUS_RUNNING, worker_id),
+            )
+        return cursor.rowcount
+
+    def requeue_expired(self, max_attempts: int) -> Tuple[int, int]:
+        """
+        Recupera los trabajos en running cuyo lease venció (su proceso murió):
+        vuelven a la cola, o pasan a error si ya agotaron `max_attempts`.
+
+        Returns:
+            (re-encolados, descartados por intentos)
+        """
+        now = time.time()
+        expired = "status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)"
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                failed = self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ?, document = NULL,"
+                    f" worker_id = NULL, lease_expires_at = NULL WHERE {expired} AND attempts >= ?",
+                    (STATUS_ERROR, f"El trabajo se interrumpió en {max_attempts} intento(s) (el proceso terminó)",
+                     datetime.now().isoformat(), STATUS_RUNNING, now, max_attempts),
+                ).rowcount
+                requeued = self._conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = NULL, worker_id = NULL, lease_expires_at = NULL"
+                    f" WHERE {expired}",
+                    (STATUS_QUEUED, STATUS_RUNNING, now),
+                ).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return requeued, failed
+
+    def purge_finished(self, older_than: datetime) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (STATUS_DONE, STATUS_ERROR, older_than.isoformat()),
+            )
+        return cursor.rowcount
+
+    def count_by_status(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+class JobQueue:
+    """
+    Workers asyncio que consumen la cola y reutilizan TDRAnalyzerService.
+
+    Uso (lifespan de FastAPI):
+        await job_queue.start()
+        ...
+        await job_queue.stop()
+    """
+
+    # Si no llega notificación de un submit, los workers revisan la base cada N segundos
+    # (cubre trabajos encolados por otro proceso uvicorn).
+    POLL_INTERVAL_SECONDS = 5.0
+
+    def __init__(self, store: JobStore, analyzer: TDRAnalyzerService, concurrency: Dict[str, int]):
+        self._store = store
+        self._analyzer = analyzer
+        self._concurrency = concurrency
+        self._wakeups = {job_type: asyncio.Event() for job_type in JOB_TYPES}
+        self._workers: list[asyncio.Task] = []
+        # Dueño de los leases de este proceso (único por arranque)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    async def start(self) -> None:
+        await self._recover_expired()
+
+        purged = await asyncio.to_thread(
+            self._store.purge_finished,
+            datetime.now() - timedelta(hours=settings.job_retention_hours),
+        )
+        if purged:
+            logger.info(f"🧹 {purged} trabajo(s) finalizado(s) purgado(s)")
+
+        for job_type in JOB_TYPES:
+            for n in range(max(0, self._concurrency.get(job_type, 0))):
+                self._workers.append(asyncio.create_task(
+                    self._worker_loop(job_type), name=f"job-worker-{job_type}-{n}"
+                ))
+        self._workers.append(asyncio.create_task(self._heartbeat_loop(), name="job-heartbeat"))
+        logger.info(f"📬 Cola de trabajos iniciada ({self.worker_id}): {self._concurrency}")
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        released = await asyncio.to_thread(self._store.release, self.worker_id)
+        if released:
+            logger.info(f"♻️  {released} trabajo(s) en curso devuelto(s) a la cola")
+        logger.info("📬 Cola de trabajos detenida")
+
+    async def _recover_expired(self) -> None:
+        """Re-encola los trabajos de procesos muertos (lease vencido) o los cierra si agotaron intentos."""
+        requeued, failed = await asyncio.to_thread(self._store.requeue_expired, settings.job_max_attempts)
+        if requeued:
+            logger.info(f"♻️  {requeued} trabajo(s) interrumpido(s) devuelto(s) a la cola")
+            for wakeup in self._wakeups.values():
+                wakeup.set()
+        if failed:
+            logger.warning(f"🪦 {failed} trabajo(s) interrumpido(s) {settings.job_max_attempts} veces: marcados como error")
+
+    async def _heartbeat_loop(self) -> None:
+        """Renueva los leases propios y recupera los vencidos de otros procesos."""
+        while True:
+            await asyncio.sleep(settings.job_lease_seconds / 3)
+            try:
+                await asyncio.to_thread(self._store.renew_leases, self.worker_id, settings.job_lease_seconds)
+                await self._recover_expired()
+            except Exception as e:
+                logger.error(f"Cola de trabajos: error al renovar leases: {e}")
+
+    async def submit(self, job_type: str, filename: str, document: bytes, params: Dict[str, Any]) -> str:
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Tipo de trabajo no soportado: {job_type}")
+        job_id = await asyncio.to_thread(self._store.insert, job_type, filename, params, document)
+        self._wakeups[job_type].set()
+        logger.info(f"📥 Trabajo {job_id} encolado ({job_type}: {filename})")
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._store.get, job_id)
+
+    async def stats(self) -> Dict[str, int]:
+        return await asyncio.to_thread(self._store.count_by_status)
+
+    async def _worker_loop(self, job_type: str) -> None:
+        wakeup = self._wakeups[job_type]
+        while True:
+            try:
+                job = await asyncio.to_thread(
+                    self._store.claim_next, job_type, self.worker_id, settings.job_lease_seconds
+                )
+            except Exception as e:
+                logger.error(f"Cola de trabajos: error al tomar trabajo {job_type}: {e}")
+                job = None
+
+            if job is None:
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=self.POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(job)
+
+    async def _run(self, job: sqlite3.Row) -> None:
+        job_id, job_type = job["id"], job["job_type"]
+        params = json.loads(job["params"])
+        attempt = job["attempts"] + 1
+        logger.info(f"⚙️  Trabajo {job_id} ({job_type}) en ejecución — intento {attempt}")
+
+        result, token_usage, metrics, error = None, None, None, None
+        try:
+            with llm_priority(PRIORITY_JOB):
+                envelope = await self._dispatch(job_type, job["document"], job["filename"], params)
+            result = envelope.data()
+            token_usage = envelope.token_usage
+            metrics = envelope.metrics()
+        except asyncio.CancelledError:
+            # Apagado: stop() devuelve el trabajo a la cola (si el proceso muere, vence su lease)
+            raise
+        except LLMUnavailableError as e:
+            if attempt < settings.job_max_attempts:
+                await self._retry_later(job_id, attempt, e)
+                return
+            logger.error(f"❌ Trabajo {job_id}: proveedor no disponible tras {attempt} intentos: {e}")
+            error = str(e)
+        except Exception as e:
+            logger.error(f"❌ Trabajo {job_id} falló: {e}")
+            error = str(e)
+
+        owned = await asyncio.to_thread(
+            self._store.finish, job_id, self.worker_id, result, token_usage, metrics, error
+        )
+        if not owned:
+            logger.warning(f"⚠️ Trabajo {job_id}: lease perdido, resultado descartado (lo tomó otro proceso)")
+            return
+        logger.info(f"✅ Trabajo {job_id} finalizado ({'error' if error else 'ok'})")
+
+    async def _retry_later(self, job_id: str, attempt: int, e: LLMUnavailableError) -> None:
+        """Re-encola tras una caída del proveedor: backoff exponencial o su Retry-After, el mayor."""
+        delay = max(e.retry_after, settings.job_retry_delay_seconds * 2 ** (attempt - 1))
+        owned = await asyncio.to_thread(self._store.retry_later, job_id, self.worker_id, delay, str(e))
+        if owned:
+            logger.warning(f"⏳ Trabajo {job_id}: proveedor no disponible; reintento {attempt + 1} en {delay:.0f}s ({e})")
+
+    async def _dispatch(self, job_type: str, document: bytes, filename: str, params: Dict[str, Any]):
+        llm_provider = params.get("llm_provider")
+        tipo_contrato = params.get("tipo_contrato") or "menores"
+
+        if job_type == "tdr":
+            return await self._analyzer.analyze_tdr_document(
+                pdf_bytes=document,
+                llm_provider=llm_provider,
+                tipo_contrato=tipo_contrato,
+                filename=filename,
+            )
+        if job_type == "direccionamiento":
+            return await self._analyzer.analyze_direccionamiento_document(
+                pdf_bytes=document,
+                llm_provider=llm_provider,
+                tipo_contrato=tipo_contrato,
+            )
+        return await self._analyzer.generate_proforma_document(
+            pdf_bytes=document,
+            company_name=params.get("company_name", ""),
+            company_copy=params.get("company_copy", ""),
+            llm_provider=llm_provider,
+            tipo_contrato=tipo_contrato,
+        )
+
+
+# Instancia global (iniciada/detenida en el lifespan de main.py)
+job_queue = JobQueue(
+    store=JobStore(settings.jobs_db_path),
+    analyzer=TDRAnalyzerService(),
+    concurrency={
+        "tdr": settings.job_concurrency_tdr,
+        "direccionamiento": settings.job_concurrency_direccionamiento,
+        "proforma": settings.job_concurrency_proforma,
+    },
+)
@@ -4,11 +4,32 @@ from .base_client import BaseLLMClient
 from .gemini_client import GeminiClient
 from .openai_client import OpenAIClient
 from .anthropic_client import AnthropicClient
+from .rate_limiter import (
+    rate_limiter,
+    llm_priority,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_JOB,
+    PRIORITY_BATCH,
+)
+from .resilience import LLMUnavailableError, hedged_call, is_retryable_error
+from .token_budget import token_estimator, context_token_budget
+from .gemini_files import gemini_documents
 
 __all__ = [
     "LLMFactory",
     "BaseLLMClient",
     "GeminiClient",
     "OpenAIClient",
-    "AnthropicClient"
+    "AnthropicClient",
+    "rate_limiter",
+    "llm_priority",
+    "PRIORITY_INTERACTIVE",
+    "PRIORITY_JOB",
+    "PRIORITY_BATCH",
+    "LLMUnavailableError",
+    "hedged_call",
+    "is_retryable_error",
+    "token_estimator",
+    "context_token_budget",
+    "gemini_documents",
 ]
@@ -2,9 +2,12 @@
 Cliente para Anthropic Claude API.
 """
 from anthropic import AsyncAnthropic
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 import logging
 from .base_client import BaseLLMClient
+from .rate_limiter import estimate_tokens
+from .token_budget import prompt_chars
+from .resilience import LLMUnavailableError, resilient_call, resilient_stream
 
 logger = logging.getLogger(__name__)
 
@@ -12,11 +15,115 @@ logger = logging.getLogger(__name__)
 class AnthropicClient(BaseLLMClient):
     """Cliente para Anthropic Claude API"""
 
-    def __init__(self, api_key: str, model_name: str = "claude-3-5-sonnet-20241022"):
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = "claude-3-5-sonnet-20241022",
+        http_client=None,
+        base_url: Optional[str] = None,
+    ):
         self.api_key = api_key
         self.model_name = model_name
         self.logger = logger
-        self.client = AsyncAnthropic(api_key=api_key)
+        # http_client: pool del SDK (DefaultAsyncHttpxClient) con keep-alive/TLS reutilizados entre llamadas
+        # max_retries=0: los reintentos los gestiona resilient_call (con plazo y rate limiter)
+        self.client = AsyncAnthropic(
+            api_key=api_key, base_url=base_url or None, http_client=http_client, max_retries=0
+        )
+
+    async def aclose(self) -> None:
+        """Cierra el cliente y su pool de conexiones."""
+        await self.client.close()
+
+    async def _create_message(self, **kwargs):
+        """Único punto de salida hacia la API de Anthropic (rate limiter + reintentos)."""
+        prompt = [kwargs.get("system"), kwargs.get("messages")]
+        estimated_prompt = estimate_tokens(prompt, "anthropic")
+        return await resilient_call(
+            "anthropic",
+            self.model_name,
+            estimated_prompt + kwargs.get("max_tokens", 0),
+            lambda: self.client.messages.create(model=self.model_name, **kwargs),
+            self._extract_token_usage,
+            prompt_chars=prompt_chars(prompt),
+            estimated_prompt_tokens=estimated_prompt,
+        )
+
+    async def _stream_message(self, token_usage: Dict, **kwargs) -> AsyncIterator[str]:
+        """Versión streaming de _create_message: fragmentos de texto (uso acumulado en `token_usage`)."""
+        prompt = [kwargs.get("system"), kwargs.get("messages")]
+        estimated_prompt = estimate_tokens(prompt, "anthropic")
+
+        async def open_stream():
+            stream = await self.client.messages.create(model=self.model_name, stream=True, **kwargs)
+            return self._stream_events(stream)
+
+        async for text in resilient_stream(
+            "anthropic",
+            self.model_name,
+            estimated_prompt + kwargs.get("max_tokens", 0),
+            open_stream,
+            token_usage,
+            prompt_chars=prompt_chars(prompt),
+            estimated_prompt_tokens=estimated_prompt,
+        ):
+            yield text
+
+    @staticmethod
+    async def _stream_events(stream):
+        # input_tokens llega en message_start; output_tokens (acumulado) en message_delta
+        prompt = 0
+        try:
+            async for event in stream:
+                if event.type == "message_start":
+                    prompt = getattr(event.message.usage, "input_tokens", 0) or 0
+                    yield "", {"prompt_tokens": prompt, "completion_tokens": 0, "total_tokens": prompt}
+                elif event.type == "content_block_delta" and getattr(event.delta, "type", "") == "text_delta":
+                    yield event.delta.text, None
+                elif event.type == "message_delta":
+                    completion = getattr(event.usage, "output_tokens", 0) or 0
+                    yield "", {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+        finally:
+            await stream.close()
+
+    @staticmethod
+    def _extract_token_usage(response) -> dict:
+        """Extrae conteo de tokens del campo usage de la respuesta de Claude."""
+        try:
+            usage = getattr(response, "usage", None)
+            if usage:
+                prompt = getattr(usage, "input_tokens", 0) or 0
+                completion = getattr(usage, "output_tokens", 0) or 0
+                return {
+                    "prompt_tokens": prompt,
+                    "completion_tokens": completion,
+                    "total_tokens": prompt + completion,
+                }
+        except Exception:
+            pass
+        return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+    @staticmethod
+    def _tdr_prompt(context: str) -> str:
+        return f"""
+Analiza el siguiente TDR del SEACE y entrega únicamente un JSON con las claves: resumen_ejecutivo, requisitos_tecnicos, reglas_de_negocio, politicas_y_penalidades, presupuesto_referencial. Usa arrays vacíos o null cuando falte información.
+
+TDR:
+{context}
+
+Recuerda: Devuelve SOLO el objeto JSON sin texto adicional.
+"""
+
+    def _tdr_request(self, user_prompt: str) -> Dict:
+        """Parámetros de analyze_tdr (compartidos con la variante streaming)."""
+        return {
+            "max_tokens": 2048,
+            "temperature": 0.2,
+            "system": self.SYSTEM_PROMPT,
+            "messages": [
+                {"role": "user", "content": user_prompt}
+            ],
+        }
 
     async def analyze_tdr(self, context: str) -> Dict:
         """
@@ -32,25 +139,10 @@ class AnthropicClient(BaseLLMClient):
             self.logger.info(f"Analizando TDR con Anthropic ({self.model_name})")
 
             # Prompt del usuario
-            user_prompt = f"""
-Analiza el siguiente TDR del SEACE y entrega únicamente un JSON con las claves: resumen_ejecutivo, requisitos_tecnicos, reglas_de_negocio, politicas_y_penalidades, presupuesto_referencial. Usa arrays vacíos o null cuando falte información.
-
-TDR:
-{context}
-
-Recuerda: Devuelve SOLO el objeto JSON sin texto adicional.
-"""
+            user_prompt = self._tdr_prompt(context)
 
             # Llamada a la API
-            response = await self.client.messages.create(
-                model=self.model_name,
-                max_tokens=2048,
-                temperature=0.2,
-                system=self.SYSTEM_PROMPT,
-                messages=[
-                    {"role": "user", "content": user_prompt}
-                ]
-            )
+            response = await self._create_message(**self._tdr_request(user_prompt))
 
             # Extraer contenido
             response_text = response.content[0].text
@@ -59,15 +151,32 @@ Recuerda: Devuelve SOLO el objeto JSON sin texto adicional.
 
             # Parsear JSON
             result = self._parse_json_response(response_text)
+            result["_token_usage"] = self._extract_token_usage(response)
 
             self.logger.info("Análisis completado exitosamente con Claude")
 
             return result
 
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"Error al analizar con Anthropic: {str(e)}")
             raise ValueError(f"Error en Anthropic API: {str(e)}")
 
+    async def analyze_tdr_stream(self, context: str) -> AsyncIterator[Dict]:
+        """Variante streaming de analyze_tdr (ver BaseLLMClient.analyze_tdr_stream)."""
+        self.logger.info(f"Analizando TDR en streaming con Anthropic ({self.model_name})")
+        token_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        try:
+            fragments = self._stream_message(token_usage, **self._tdr_request(self._tdr_prompt(context)))
+            async for event in self._stream_json(fragments, token_usage):
+                yield event
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Error en streaming con Anthropic: {str(e)}")
+            raise ValueError(f"Error en Anthropic API: {str(e)}")
+
     async def evaluate_compatibility(
         self,
         company_copy: str,
@@ -77,8 +186,7 @@ Recuerda: Devuelve SOLO el objeto JSON sin texto adicional.
     ) -> Dict:
         try:
             prompt = self._build_compatibility_prompt(company_copy, analisis_tdr, contrato_contexto, keywords)
-            response = await self.client.messages.create(
-                model=self.model_name,
+            response = await self._create_message(
                 max_tokens=1024,
                 temperature=0.2,
                 system="Asesor en compatibilidad de TDR para proveedores SEACE",
@@ -87,7 +195,9 @@ Recuerda: Devuelve SOLO el objeto JSON sin texto adicional.
 
             response_text = response.content[0].text
             self.logger.debug(f"Compatibilidad Claude (primeros 400 chars): {response_text[:400]}")
-            return self._parse_json_response(response_text)
+            return self._with_token_usage(self._parse_json_response(response_text), response)
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"Error en compatibilidad Anthropic: {str(e)}")
             raise ValueError(f"Error al evaluar compatibilidad: {str(e)}")
@@ -115,8 +225,7 @@ TDR:
 
 Devuelve SOLO el objeto JSON sin texto adicional.
 """
-            response = await self.client.messages.create(
-                model=self.model_name,
+            response = await self._create_message(
                 max_tokens=4096,
                 temperature=0.15,
                 system=self.FORENSIC_SYSTEM_PROMPT,
@@ -124,7 +233,9 @@ Devuelve SOLO el objeto JSON sin texto adicional.
             )
 
             response_text = response.content[0].text
-            return self._parse_json_response(response_text)
+            return self._with_token_usage(self._parse_json_response(response_text), response)
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"❌ Error en direccionamiento Anthropic: {str(e)}")
             raise ValueError(f"Error al analizar direccionamiento: {str(e)}")
@@ -165,18 +276,43 @@ Devuelve ÚNICAMENTE este JSON:
 
 TDR:\n{context}\n\nDevuelve SOLO el JSON sin texto adicional."""
 
-            response = await self.client.messages.create(
-                model=self.model_name,
+            response = await self._create_message(
                 max_tokens=4096,
                 temperature=0.3,
                 system=self.SYSTEM_PROMPT,
                 messages=[{"role": "user", "content": user_prompt}],
             )
-            return self._parse_json_response(response.content[0].text)
+            return self._with_token_usage(self._parse_json_response(response.content[0].text), response)
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"❌ Error en proforma Anthropic: {str(e)}")
             raise ValueError(f"Error al generar proforma: {str(e)}")
 
+    async def analyze_full(
+        self,
+        context: str,
+        company_name: str,
+        company_copy: str,
+        contrato_contexto=None,
+    ) -> Dict:
+        """Resumen, análisis forense y proforma en una sola llamada a Anthropic."""
+        try:
+            self.logger.info(f"🧩 Análisis completo con Anthropic ({self.model_name})")
+            user_prompt = self._build_full_analysis_prompt(company_name, company_copy, contrato_contexto, context)
+            response = await self._create_message(
+                max_tokens=8192,
+                temperature=0.2,
+                system=f"{self.SYSTEM_PROMPT.strip()}\n\n{self.FORENSIC_SYSTEM_PROMPT.strip()}",
+                messages=[{"role": "user", "content": user_prompt + "\nDevuelve SOLO el objeto JSON sin texto adicional."}],
+            )
+            return self._with_token_usage(self._parse_json_response(response.content[0].text), response)
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            self.logger.error(f"❌ Error en análisis completo Anthropic: {str(e)}")
+            raise ValueError(f"Error en análisis completo: {str(e)}")
+
     # ═══════════════════════════════════════════════════════════════
     # CONTRATOS MAYORES (> 8 UIT) — Ley N° 32069
     # ═══════════════════════════════════════════════════════════════
@@ -246,16 +382,17 @@ Documento a evaluar:
 
 Devuelve SOLO el JSON, sin markdown ni texto adicional."""
 
-            response = await self.client.messages.create(
-                model=self.model_name,
+            response = await self._create_message(
                 max_tokens=4096,
                 temperature=0.15,
                 system=self.SYSTEM_PROMPT_MAYORES,
                 messages=[{"role": "user", "content": user_prompt}],
             )
 
-            return self._parse_json_response(response.content[0].text)
+            return self._with_token_usage(self._parse_json_response(response.content[0].text), response)
 
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"Error en analyze_tdr_mayores Anthropic: {str(e)}")
             raise ValueError(f"Error al analizar TDR mayor: {str(e)}")
@@ -310,16 +447,17 @@ Documento a auditar:
 
 Devuelve SOLO el JSON, sin markdown ni texto adicional."""
 
-            response = await self.client.messages.create(
-                model=self.model_name,
+            response = await self._create_message(
                 max_tokens=4096,
                 temperature=0.1,
                 system=self.FORENSIC_SYSTEM_PROMPT_MAYORES,
                 messages=[{"role": "user", "content": user_prompt}],
             )
 
-            return self._parse_json_response(response.content[0].text)
+            return self._with_token_usage(self._parse_json_response(response.content[0].text), response)
 
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"Error en direccionamiento_mayores Anthropic: {str(e)}")
             raise ValueError(f"Error al auditar direccionamiento mayor: {str(e)}")
@@ -399,16 +537,17 @@ TDR / Bases Estándar:
 
 Devuelve SOLO el JSON sin markdown ni texto adicional."""
 
-            response = await self.client.messages.create(
-                model=self.model_name,
+            response = await self._create_message(
                 max_tokens=4096,
                 temperature=0.3,
                 system=self.PROFORMA_SYSTEM_PROMPT_MAYORES,
                 messages=[{"role": "user", "content": user_prompt}],
             )
 
-            return self._parse_json_response(response.content[0].text)
+            return self._with_token_usage(self._parse_json_response(response.content[0].text), response)
 
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"Error en proforma_mayores Anthropic: {str(e)}")
             raise ValueError(f"Error al generar proforma mayor: {str(e)}")
@@ -3,13 +3,24 @@ Interfaz abstracta para clientes LLM.
 Define el contrato que deben cumplir todos los proveedores de LLM.
 """
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 import json
+import logging
+
+from .json_repair import json_candidates, repair_json
+from .json_stream import IncrementalJSONParser, field_events
+
+logger = logging.getLogger(__name__)
+_JSON_DECODER = json.JSONDecoder()
 
 
 class BaseLLMClient(ABC):
     """Clase base abstracta para clientes LLM"""
 
+    # Versión de los prompts. Forma parte de la clave de la caché de resultados:
+    # incrementarla al modificar cualquier prompt invalida los análisis cacheados.
+    PROMPT_VERSION = "2026.1"
+
     SYSTEM_PROMPT = """
 Eres un analista experto en licitaciones públicas del SEACE (Perú) con más de 10 años de experiencia.
 
@@ -85,6 +96,9 @@ VALORES PERMITIDOS (OBLIGATORIO respetar exactamente):
 - veredicto_flash: SOLO uno de ["LIMPIO", "SOSPECHOSO", "ALTAMENTE DIRECCIONADO"]
 """
 
+    # Análisis completo (/analyze-full): resumen + forense + proforma en una sola llamada
+    FULL_ANALYSIS_SECTIONS = ("analisis_tdr", "direccionamiento", "proforma")
+
     # ═══════════════════════════════════════════════════════════════
     # CONTRATOS MAYORES (> 8 UIT) — Ley N° 32069
     # ═══════════════════════════════════════════════════════════════
@@ -151,6 +165,47 @@ Debes advertir sobre:
         """
         pass
 
+    async def analyze_tdr_stream(self, context: str) -> AsyncIterator[Dict]:
+        """
+        Variante streaming de analyze_tdr.
+
+        Produce eventos "field" / "item" (ver json_stream) a medida que el LLM
+        cierra cada campo y, al final, {"type": "result", "data": análisis}
+        con el mismo dict que devolvería analyze_tdr. Por defecto (clientes
+        sin streaming) todos los eventos llegan al final.
+        """
+        result = await self.analyze_tdr(context)
+        for event in field_events(result):
+            yield event
+        yield {"type": "result", "data": result}
+
+    async def _stream_json(self, fragments: AsyncIterator[str], token_usage: Dict) -> AsyncIterator[Dict]:
+        """
+        Convierte los fragmentos de texto de un stream en eventos de campo y
+        un evento final "result". El resultado se parsea sobre el texto
+        completo con _parse_json_response: un stream cortado por
+        max_output_tokens se repara igual que una respuesta truncada. Si ni
+        la reparación lo salva (p. ej. cortado a mitad de una clave), se
+        conservan los campos que ya se habían cerrado.
+        """
+        parser = IncrementalJSONParser()
+        async for fragment in fragments:
+            for event in parser.feed(fragment):
+                yield event
+        try:
+            result = self._parse_json_response(parser.text)
+        except ValueError:
+            if not parser.fields:
+                raise
+            logger.warning(
+                f"JSON del stream irreparable ({len(parser.text)} chars); "
+                f"se conservan {len(parser.fields)} campos cerrados"
+            )
+            result = dict(parser.fields)
+        if isinstance(result, dict):
+            result["_token_usage"] = dict(token_usage)
+        yield {"type": "result", "data": result}
+
     @abstractmethod
     async def evaluate_compatibility(
         self,
@@ -198,6 +253,30 @@ Debes advertir sobre:
         """
         pass
 
+    @abstractmethod
+    async def analyze_full(
+        self,
+        context: str,
+        company_name: str,
+        company_copy: str,
+        contrato_contexto: Optional[Dict] = None,
+    ) -> Dict:
+        """
+        Resumen del TDR, análisis forense y proforma en una sola llamada.
+
+        Args:
+            context: Texto extraído del TDR (contexto RAG o documento completo)
+            company_name: Nombre de la empresa proveedora (para la proforma)
+            company_copy: Descripción del rubro y experiencia
+            contrato_contexto: Metadata del contrato (entidad, objeto, fechas)
+
+        Returns:
+            Dict con las claves de FULL_ANALYSIS_SECTIONS: analisis_tdr
+            (TDRAnalysisResponse), direccionamiento (DireccionamientoAnalysisResponse)
+            y proforma (ProformaResponse)
+        """
+        pass
+
     # ═══════════════════════════════════════════════════════════════
     # CONTRATOS MAYORES (> 8 UIT) — Métodos especializados
     # ═══════════════════════════════════════════════════════════════
@@ -224,45 +303,19 @@ Debes advertir sobre:
         """
         Intenta reparar un JSON truncado cerrando strings, arrays y objetos abiertos.
         Útil cuando el LLM alcanza max_output_tokens y corta la respuesta.
+        Una pasada O(n) consciente de strings y del orden de la pila (ver json_repair).
         """
-        import re
-
-        repaired = text.rstrip()
-
-        # Si termina a mitad de un string (comilla abierta sin cerrar),
-        # cerrar la comilla y truncar el valor.
-        in_string = False
-        escape_next = False
-        for ch in repaired:
-            if escape_next:
-                escape_next = False
-                continue
-            if ch == '\\':
-                escape_next = True
-                continue
-            if ch == '"':
-                in_string = not in_string
-
-        if in_string:
-            # Cortar hasta la última comilla válida + cerrar string
-            repaired = repaired.rstrip()
-            # Remover caracteres parciales al final del string truncado
-            repaired += '"'
-
-        # Remover trailing commas antes de cerrar
-        repaired = re.sub(r',\s*$', '', repaired)
-
-        # Contar llaves y corchetes abiertos y cerrarlos
-        open_braces = repaired.count('{') - repaired.count('}')
-        open_brackets = repaired.count('[') - repaired.count(']')
-
-        # Cerrar corchetes primero (están dentro de objetos normalmente)
-        for _ in range(max(0, open_brackets)):
-            repaired += ']'
-        for _ in range(max(0, open_braces)):
-            repaired += '}'
-
-        return repaired
+        return repair_json(text.rstrip())
+
+    async def aclose(self) -> None:
+        """Libera conexiones HTTP del cliente (llamado por LLMFactory.close_clients)."""
+        return None
+
+    def _with_token_usage(self, result: Dict, response) -> Dict:
+        """Adjunta `_token_usage` (extraído por el cliente concreto) al dict de respuesta."""
+        if isinstance(result, dict) and hasattr(self, "_extract_token_usage"):
+            result["_token_usage"] = self._extract_token_usage(response)
+        return result
 
     def _parse_json_response(self, response_text: str) -> Dict:
         """
@@ -270,6 +323,10 @@ Debes advertir sobre:
         Intenta limpiar la respuesta si viene con markdown o texto adicional.
         Si el JSON está truncado (Unterminated string), intenta repararlo.
 
+        Tras el intento directo, una sola pasada lineal (json_repair) extrae
+        los objetos del texto (markdown incluido) y repara el último si quedó
+        abierto, aunque el bloque ```json no llegue a cerrarse.
+
         Args:
             response_text: Texto de respuesta del LLM
 
@@ -279,54 +336,97 @@ Debes advertir sobre:
         Raises:
             ValueError: Si no se puede parsear como JSON válido
         """
-        import re
-        import logging
-        logger = logging.getLogger(__name__)
-
         # Limpiar espacios y saltos de línea problemáticos
+        # (los bloques ```json y el texto alrededor los descarta json_candidates)
         cleaned = response_text.strip()
 
-        # Remover bloques de código markdown si existen
-        if cleaned.startswith("```"):
-            lines = cleaned.split("\n")
-            cleaned = "\n".join(lines[1:-1]) if len(lines) > 2 else cleaned
-            cleaned = cleaned.replace("```json", "").replace("```", "").strip()
-
         # Intentar parsear directamente primero
         try:
             return json.loads(cleaned)
         except json.JSONDecodeError as first_error:
-            # Estrategia 2: Reparar JSON truncado (Unterminated string, etc.)
-            if 'Unterminated' in str(first_error) or 'Expecting' in str(first_error):
+            # Caso común: un objeto completo con texto antes/después (decodificador en C)
+            start = cleaned.find("{")
+            if start > 0 or first_error.msg == "Extra data":
                 try:
-                    repaired = self._repair_truncated_json(cleaned)
-                    result = json.loads(repaired)
-                    logger.warning(f"JSON reparado exitosamente (truncado por max_output_tokens). Original: {len(cleaned)} chars, reparado: {len(repaired)} chars")
-                    return result
+                    return _JSON_DECODER.raw_decode(cleaned, max(start, 0))[0]
                 except json.JSONDecodeError:
-                    pass  # Continuar con otras estrategias
-
-            # Estrategia 3: Buscar objeto JSON completo usando regex
-            json_pattern = r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}'
-            matches = re.finditer(json_pattern, cleaned, re.DOTALL)
+                    pass
 
-            for match in matches:
+            # Objetos completos rodeados de texto y, al final, el objeto truncado reparado
+            for candidate, repaired in json_candidates(cleaned):
                 try:
-                    potential_json = match.group(0)
-                    return json.loads(potential_json)
+                    result = json.loads(candidate)
                 except json.JSONDecodeError:
                     continue
-
-            # Estrategia 4: Reparar + regex (para JSONs grandes truncados)
-            try:
-                repaired = self._repair_truncated_json(cleaned)
-                return json.loads(repaired)
-            except json.JSONDecodeError:
-                pass
+                if repaired:
+                    logger.warning(f"JSON reparado exitosamente (truncado por max_output_tokens). Original: {len(cleaned)} chars, reparado: {len(candidate)} chars")
+                return result
 
             # Si todo falla, lanzar error con contexto
             raise ValueError(f"La respuesta del LLM no es un JSON válido: {str(first_error)}\n\nRespuesta recibida (primeros 500 chars): {cleaned[:500]}")
 
+    def _build_full_analysis_prompt(
+        self,
+        company_name: str,
+        company_copy: str,
+        contrato_contexto: Optional[Dict] = None,
+        context: Optional[str] = None,
+    ) -> str:
+        """Prompt del análisis completo; sin `context` se refiere al documento adjunto (multimodal)."""
+        nombre_empresa = company_name.strip() or "Mi Empresa"
+        contexto = contrato_contexto or {}
+        entidad = contexto.get("nomEntidad") or contexto.get("entidad") or ""
+        objeto = (
+            contexto.get("desObjetoContrato")
+            or contexto.get("nomObjetoContrato")
+            or contexto.get("objeto")
+            or ""
+        )
+        forensic_template = self.FORENSIC_JSON_TEMPLATE.split("VALORES PERMITIDOS")[0].strip()
+        fuente = f"TDR:\n{context}" if context is not None else "El TDR es el documento adjunto."
+
+        return f"""
+Analiza este TDR del SEACE (Perú) y entrega TRES resultados independientes en una sola respuesta.
+Devuelve ÚNICAMENTE un JSON con exactamente estas tres claves (sin markdown, sin texto adicional):
+
+{{
+  "analisis_tdr": {{
+    "resumen_ejecutivo": "100-200 palabras sobre objetivos, alcance y entregables",
+    "requisitos_tecnicos": ["certificaciones, experiencia o equipamiento requerido"],
+    "reglas_de_negocio": ["plazos, lugar de entrega, modalidad de pago, garantías"],
+    "politicas_y_penalidades": ["multas, sanciones, porcentajes"],
+    "presupuesto_referencial": "S/ X,XXX.XX o null"
+  }},
+  "direccionamiento": {forensic_template},
+  "proforma": {{
+    "titulo_proceso": "Descripción corta del proceso (máx 80 chars)",
+    "empresa_nombre": "{nombre_empresa}",
+    "empresa_rubro": "Rubro resumido en 1 línea",
+    "items": [{{"item": 1, "descripcion": "...", "unidad": "Und/Servicio/Mes", "cantidad": 1, "precio_unitario": 1000.00, "subtotal": 1000.00}}],
+    "total_estimado": "S/ X,XXX.XX",
+    "analisis_viabilidad": "Análisis de viabilidad operativa (2-3 párrafos)",
+    "condiciones": ["Condición o supuesto"]
+  }}
+}}
+
+REGLAS — analisis_tdr (analista de licitaciones):
+- Si algún bloque no aparece en el TDR, devuelve [] o null. Máximo 10 ítems por lista.
+
+REGLAS — direccionamiento (auditor forense, Ley N.º 32069):
+- score_riesgo_corrupcion: entero 0-100. veredicto_flash: "LIMPIO" si score<30, "SOSPECHOSO" si 30-69, "ALTAMENTE DIRECCIONADO" si >=70.
+- Máximo 8 hallazgos. categoria: "Técnica" | "Experiencia" | "Personal" | "Puntaje" | "Fraccionamiento" | "Otra".
+  nivel_de_gravedad: "Alto" | "Medio" | "Bajo". No inventes otros valores.
+- argumento_para_observacion: texto legal/técnico formal (si es LIMPIO, indica que no se encontraron indicios).
+
+REGLAS — proforma (Director de Operaciones de "{nombre_empresa}", especialidad: "{company_copy}"):
+{"- Entidad convocante: " + entidad if entidad else ""}
+{"- Objeto del proceso: " + objeto if objeto else ""}
+- Precios realistas para el mercado peruano de contrataciones públicas, en soles (S/).
+- Si el TDR no especifica cantidades, estímalas razonablemente; el total debe ser coherente con el presupuesto referencial.
+
+{fuente}
+"""
+
     def _build_compatibility_prompt(
         self,
         company_copy: str,
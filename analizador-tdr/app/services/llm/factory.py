@@ -1,7 +1,16 @@
 """
 Factory para crear clientes LLM según el proveedor seleccionado.
+
+Los clientes son de larga vida: se crea una instancia por proveedor/modelo y
+se reutiliza en todo el proceso. Así se conservan las conexiones keep-alive,
+las sesiones TLS y la configuración de generación entre peticiones. Se cierran
+en el lifespan de FastAPI con `LLMFactory.close_clients()`.
 """
-from typing import Literal
+from typing import Dict, Literal, Tuple
+import sys
+import anthropic
+import httpx
+import openai
 from .gemini_client import GeminiClient
 from .openai_client import OpenAIClient
 from .anthropic_client import AnthropicClient
@@ -15,26 +24,88 @@ logger = logging.getLogger(__name__)
 class LLMFactory:
     """Factory para instanciar el cliente LLM correcto"""
 
+    # Clientes vivos del proceso, por (proveedor, modelo)
+    _clients: Dict[Tuple[str, str], BaseLLMClient] = {}
+
+    @staticmethod
+    def resolve_provider(provider: Literal["gemini", "openai", "anthropic"] = None) -> str:
+        """Retorna el proveedor efectivo (el configurado por defecto si es None)."""
+        return provider or settings.default_llm_provider
+
     @staticmethod
+    def resolve_model_name(provider: Literal["gemini", "openai", "anthropic"] = None) -> str:
+        """Retorna el nombre del modelo configurado para el proveedor."""
+        provider = LLMFactory.resolve_provider(provider)
+        return {
+            "gemini": settings.gemini_model,
+            "openai": settings.openai_model,
+            "anthropic": settings.anthropic_model,
+        }.get(provider, "")
+
+    @staticmethod
+    def build_http_client(client_cls=httpx.AsyncClient):
+        """
+        Pool HTTP con los límites configurados (uno por cliente LLM).
+
+        Args:
+            client_cls: Clase AsyncClient a instanciar. Los SDK de OpenAI y
+                Anthropic exigen su propio DefaultAsyncHttpxClient (según la
+                versión se basa en httpx o httpx2); Limits/Timeout se toman del
+                mismo paquete que la clase.
+        """
+        base = next((c for c in client_cls.__mro__ if c.__name__ == "AsyncClient"), httpx.AsyncClient)
+        http_module = sys.modules[base.__module__.split(".")[0]]
+        return client_cls(
+            limits=http_module.Limits(
+                max_connections=settings.llm_max_connections,
+                max_keepalive_connections=settings.llm_max_keepalive_connections,
+                keepalive_expiry=settings.llm_keepalive_expiry_seconds,
+            ),
+            timeout=http_module.Timeout(settings.llm_timeout_seconds, connect=10.0),
+        )
+
+    @classmethod
     def create_client(
+        cls,
         provider: Literal["gemini", "openai", "anthropic"] = None
     ) -> BaseLLMClient:
         """
-        Crea una instancia del cliente LLM según el proveedor.
+        Retorna el cliente LLM del proceso para el proveedor (lo crea la primera vez).
 
         Args:
             provider: Nombre del proveedor (gemini, openai, anthropic).
                      Si es None, usa el configurado por defecto.
 
         Returns:
-            Instancia del cliente LLM
+            Instancia compartida del cliente LLM
 
         Raises:
             ValueError: Si el proveedor no está soportado o falta la API key
         """
-        if provider is None:
-            provider = settings.default_llm_provider
+        provider = cls.resolve_provider(provider)
+        key = (provider, cls.resolve_model_name(provider))
+
+        client = cls._clients.get(key)
+        if client is None:
+            client = cls._build_client(provider)
+            cls._clients[key] = client
+        return client
+
+    @classmethod
+    async def close_clients(cls) -> None:
+        """Cierra todos los clientes y sus pools de conexiones (shutdown)."""
+        clients = list(cls._clients.values())
+        cls._clients.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Error al cerrar cliente LLM {type(client).__name__}: {e}")
+        if clients:
+            logger.info(f"🔌 {len(clients)} cliente(s) LLM cerrados")
 
+    @classmethod
+    def _build_client(cls, provider: str) -> BaseLLMClient:
         logger.info(f"Creando cliente LLM: {provider}")
 
         if provider == "gemini":
@@ -42,7 +113,9 @@ class LLMFactory:
                 raise ValueError("GEMINI_API_KEY no configurada en .env")
             return GeminiClient(
                 api_key=settings.gemini_api_key,
-                model_name=settings.gemini_model
+                model_name=settings.gemini_model,
+                http_client=cls.build_http_client(),
+                base_url=settings.gemini_base_url or None,
             )
 
         elif provider == "openai":
@@ -50,7 +123,9 @@ class LLMFactory:
                 raise ValueError("OPENAI_API_KEY no configurada en .env")
             return OpenAIClient(
                 api_key=settings.openai_api_key,
-                model_name=settings.openai_model
+                model_name=settings.openai_model,
+                http_client=cls.build_http_client(openai.DefaultAsyncHttpxClient),
+                base_url=settings.openai_base_url or None,
             )
 
         elif provider == "anthropic":
@@ -58,7 +133,9 @@ class LLMFactory:
                 raise ValueError("ANTHROPIC_API_KEY no configurada en .env")
             return AnthropicClient(
                 api_key=settings.anthropic_api_key,
-                model_name=settings.anthropic_model
+                model_name=settings.anthropic_model,
+                http_client=cls.build_http_client(anthropic.DefaultAsyncHttpxClient),
+                base_url=settings.anthropic_base_url or None,
             )
 
         else:
@@ -2,11 +2,16 @@
 Cliente para Google Gemini API.
 """
 from google import genai
-from google.genai import types
-from typing import Dict, List, Optional
+from google.genai import errors, types
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import asyncio
 import logging
+import httpx
 from .base_client import BaseLLMClient
+from .rate_limiter import estimate_tokens, DOCUMENT_PART_TOKENS
+from .gemini_files import gemini_documents, document_scope
+from .token_budget import prompt_chars
+from .resilience import LLMUnavailableError, resilient_call, resilient_stream
 
 logger = logging.getLogger(__name__)
 
@@ -18,13 +23,35 @@ class GeminiClient(BaseLLMClient):
     Free Tier: 1,500 requests/día, 15 RPM.
     """
 
-    def __init__(self, api_key: str, model_name: str):
-        """El model_name debe venir desde settings.gemini_model"""
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str,
+        http_client: Optional[httpx.AsyncClient] = None,
+        base_url: Optional[str] = None,
+    ):
+        """
+        El model_name debe venir desde settings.gemini_model.
+
+        http_client: pool httpx compartido (keep-alive/TLS reutilizados entre llamadas).
+        base_url: endpoint alternativo (proxy, mock local para benchmarks).
+        """
         self.api_key = api_key
         self.model_name = model_name
         self.logger = logger
-
-        self.client = genai.Client(api_key=api_key)
+        self._http_client = http_client
+
+        http_options = {}
+        if http_client is not None:
+            http_options["httpx_async_client"] = http_client
+        if base_url:
+            http_options["base_url"] = base_url
+        self.client = genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(**http_options) if http_options else None,
+        )
+        # Archivos subidos / cachés de contexto pertenecen al proyecto de la API key
+        self._documents_scope = document_scope(api_key, base_url)
 
         # Configuración de generación (JSON mode sin schema - salida estricta JSON)
         self.generation_config = types.GenerateContentConfig(
@@ -54,21 +81,188 @@ class GeminiClient(BaseLLMClient):
             ],
         )
 
-    async def _generate_content(self, contents):
-        if hasattr(self.client, "aio"):
-            return await self.client.aio.models.generate_content(
+        # Configuraciones forense y de proforma: se construyen una sola vez por cliente
+        # (el cliente es de larga vida, ver LLMFactory)
+        self.forensic_config = types.GenerateContentConfig(
+            temperature=0.15,
+            top_p=0.95,
+            top_k=40,
+            max_output_tokens=16384,
+            response_mime_type="application/json",
+            system_instruction=self.FORENSIC_SYSTEM_PROMPT,
+            safety_settings=self.generation_config.safety_settings,
+        )
+        self.proforma_config = types.GenerateContentConfig(
+            temperature=0.3,
+            top_p=0.95,
+            max_output_tokens=8192,
+            response_mime_type="application/json",
+            safety_settings=self.generation_config.safety_settings,
+        )
+        # Análisis completo (resumen + forense + proforma): salida más larga
+        self.full_config = types.GenerateContentConfig(
+            temperature=0.2,
+            top_p=0.95,
+            max_output_tokens=16384,
+            response_mime_type="application/json",
+            system_instruction=f"{self.SYSTEM_PROMPT.strip()}\n\n{self.FORENSIC_SYSTEM_PROMPT.strip()}",
+            safety_settings=self.generation_config.safety_settings,
+        )
+        # Transcripción de páginas escaneadas (ruta híbrida): texto plano, sin creatividad
+        self.transcription_config = types.GenerateContentConfig(
+            temperature=0.0,
+            max_output_tokens=16384,
+            response_mime_type="text/plain",
+            safety_settings=self.generation_config.safety_settings,
+        )
+
+    async def aclose(self) -> None:
+        """Cierra el cliente genai y el pool httpx compartido."""
+        try:
+            await self.client.aio.aclose()
+        finally:
+            if self._http_client is not None:
+                await self._http_client.aclose()
+
+    def _estimate_request(self, contents, config: types.GenerateContentConfig) -> Tuple[int, Optional[int], int]:
+        """(tokens estimados del prompt, caracteres para calibrar, tokens a reservar)."""
+        estimated_prompt = estimate_tokens(contents, "gemini")
+        chars = prompt_chars(contents)
+        if config.cached_content:
+            # El documento va en la caché de contexto: cuenta para TPM, no sirve para calibrar
+            estimated_prompt += DOCUMENT_PART_TOKENS
+            chars = None
+        return estimated_prompt, chars, estimated_prompt + (config.max_output_tokens or 0)
+
+    async def _generate_content(self, contents, config: Optional[types.GenerateContentConfig] = None):
+        """Único punto de salida hacia la API de Gemini (rate limiter + reintentos)."""
+        config = config or self.generation_config
+        estimated_prompt, chars, estimated = self._estimate_request(contents, config)
+
+        def send():
+            if hasattr(self.client, "aio"):
+                return self.client.aio.models.generate_content(
+                    model=self.model_name,
+                    contents=contents,
+                    config=config,
+                )
+            return asyncio.to_thread(
+                self.client.models.generate_content,
                 model=self.model_name,
                 contents=contents,
-                config=self.generation_config,
+                config=config,
             )
 
-        return await asyncio.to_thread(
-            self.client.models.generate_content,
-            model=self.model_name,
-            contents=contents,
-            config=self.generation_config,
+        return await resilient_call(
+            "gemini", self.model_name, estimated, send, self._extract_token_usage,
+            prompt_chars=chars, estimated_prompt_tokens=estimated_prompt,
         )
 
+    async def _stream_content(
+        self,
+        contents,
+        config: Optional[types.GenerateContentConfig] = None,
+        token_usage: Optional[Dict] = None,
+    ) -> AsyncIterator[str]:
+        """Versión streaming de _generate_content: fragmentos de texto (uso acumulado en `token_usage`)."""
+        config = config or self.generation_config
+        estimated_prompt, chars, estimated = self._estimate_request(contents, config)
+        usage = token_usage if token_usage is not None else {}
+
+        async def open_stream():
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self.model_name,
+                contents=contents,
+                config=config,
+            )
+            return self._stream_chunks(stream)
+
+        async for text in resilient_stream(
+            "gemini", self.model_name, estimated, open_stream, usage,
+            prompt_chars=chars, estimated_prompt_tokens=estimated_prompt,
+        ):
+            yield text
+
+    @classmethod
+    async def _stream_chunks(cls, stream):
+        # usage_metadata de cada chunk es acumulado: el último trae el total
+        async for chunk in stream:
+            usage = cls._extract_token_usage(chunk) if getattr(chunk, "usage_metadata", None) else None
+            yield cls._extract_text(chunk), usage
+
+    async def _document_request(
+        self,
+        prompt: str,
+        pdf_bytes: bytes,
+        mime_type: str,
+        filename: str,
+        config: types.GenerateContentConfig,
+    ) -> Tuple[list, types.GenerateContentConfig, bool]:
+        """
+        (contents, config, documento_subido) de una llamada multimodal: documento
+        inline, referencia a la Files API o caché de contexto según gemini_documents.
+        """
+        part = await gemini_documents.document_part(self.client, self._documents_scope, pdf_bytes, mime_type, filename)
+        if part.file_data is None:
+            return [prompt, part], config, False
+        cache_name = await gemini_documents.cached_content(
+            self.client, self._documents_scope, self.model_name, pdf_bytes, part, config.system_instruction,
+        )
+        if cache_name:
+            return prompt, config.model_copy(update={"system_instruction": None, "cached_content": cache_name}), True
+        return [prompt, part], config, True
+
+    def _forget_document(self, error: errors.ClientError, pdf_bytes: bytes, prompt: str, mime_type: str) -> list:
+        """Olvida el archivo/caché que Gemini ya no reconoce y devuelve contents inline."""
+        self.logger.warning(f"⚠️ Gemini no reconoce el documento subido ({error.code}); reenviando inline")
+        gemini_documents.invalidate(self._documents_scope, pdf_bytes)
+        return [prompt, types.Part.from_bytes(data=pdf_bytes, mime_type=mime_type)]
+
+    async def _generate_with_document(
+        self,
+        prompt: str,
+        pdf_bytes: bytes,
+        mime_type: str,
+        filename: str,
+        config: Optional[types.GenerateContentConfig] = None,
+    ):
+        """
+        Llamada multimodal (ver _document_request). Si Gemini ya no reconoce el
+        archivo o la caché (expirada/borrada en el servidor), se olvida y se reenvía inline.
+        """
+        config = config or self.generation_config
+        contents, call_config, uploaded = await self._document_request(prompt, pdf_bytes, mime_type, filename, config)
+        try:
+            return await self._generate_content(contents, call_config)
+        except errors.ClientError as e:
+            if not uploaded or e.code not in (403, 404):
+                raise
+            return await self._generate_content(self._forget_document(e, pdf_bytes, prompt, mime_type), config)
+
+    async def _stream_with_document(
+        self,
+        prompt: str,
+        pdf_bytes: bytes,
+        mime_type: str,
+        filename: str,
+        config: Optional[types.GenerateContentConfig] = None,
+        token_usage: Optional[Dict] = None,
+    ) -> AsyncIterator[str]:
+        """Versión streaming de _generate_with_document (reenvío inline solo antes del primer fragmento)."""
+        config = config or self.generation_config
+        contents, call_config, uploaded = await self._document_request(prompt, pdf_bytes, mime_type, filename, config)
+        emitted = False
+        try:
+            async for text in self._stream_content(contents, call_config, token_usage):
+                emitted = True
+                yield text
+        except errors.ClientError as e:
+            if emitted or not uploaded or e.code not in (403, 404):
+                raise
+            inline_contents = self._forget_document(e, pdf_bytes, prompt, mime_type)
+            async for text in self._stream_content(inline_contents, config, token_usage):
+                yield text
+
     @staticmethod
     def _extract_text(response) -> str:
         text = getattr(response, "text", None)
@@ -102,6 +296,38 @@ class GeminiClient(BaseLLMClient):
             pass
         return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
 
+    # Prompts de análisis del TDR (compartidos con las variantes streaming)
+    PDF_TDR_PROMPT = """
+Analiza este TDR del SEACE (Perú) y devuelve ÚNICAMENTE un JSON con las siguientes claves:
+{
+    "resumen_ejecutivo": "100-200 palabras sobre objetivos y alcance",
+    "requisitos_tecnicos": ["certificaciones, experiencia o equipamiento requerido"],
+    "reglas_de_negocio": ["plazos, lugar de entrega, modalidad de pago, garantías"],
+    "politicas_y_penalidades": ["multas, sanciones, porcentajes"],
+    "presupuesto_referencial": "S/ X,XXX.XX" o null
+}
+
+Reglas:
+- Si algún bloque no aparece en el PDF, devuelve [] o null.
+- Máximo 10 items por lista.
+- No incluyas texto fuera del JSON ni bloques ```json.
+"""
+
+    @staticmethod
+    def _tdr_prompt(context: str) -> str:
+        return f"""
+Analiza este Término de Referencia del SEACE y responde únicamente con un JSON que contenga:
+
+1. "resumen_ejecutivo": 1-2 párrafos concretos sobre alcance, objetivos y entregables.
+2. "requisitos_tecnicos": Lista de requisitos accionables (certificaciones, experiencia, equipamiento). Usa [] si no hay.
+3. "reglas_de_negocio": Lista de condiciones operativas (plazos, lugar, modalidad de pago, garantías). Usa [] si no hay.
+4. "politicas_y_penalidades": Lista de sanciones, multas, retenciones o políticas relevantes.
+5. "presupuesto_referencial": Monto textual ("S/ 120,000.00") o null.
+
+TDR:
+{context}
+"""
+
     async def analyze_tdr(self, context: str) -> Dict:
         """
         Analiza el TDR usando Gemini 2.5/3 Flash con JSON Schema enforced.
@@ -118,18 +344,7 @@ class GeminiClient(BaseLLMClient):
             self.logger.debug(f"Contexto: {len(context)} caracteres")
 
             # Prompt simplificado (el schema ya define la estructura)
-            user_prompt = f"""
-Analiza este Término de Referencia del SEACE y responde únicamente con un JSON que contenga:
-
-1. "resumen_ejecutivo": 1-2 párrafos concretos sobre alcance, objetivos y entregables.
-2. "requisitos_tecnicos": Lista de requisitos accionables (certificaciones, experiencia, equipamiento). Usa [] si no hay.
-3. "reglas_de_negocio": Lista de condiciones operativas (plazos, lugar, modalidad de pago, garantías). Usa [] si no hay.
-4. "politicas_y_penalidades": Lista de sanciones, multas, retenciones o políticas relevantes.
-5. "presupuesto_referencial": Monto textual ("S/ 120,000.00") o null.
-
-TDR:
-{context}
-"""
+            user_prompt = self._tdr_prompt(context)
 
             # Generar respuesta con JSON Schema enforced
             response = await self._generate_content(user_prompt)
@@ -147,22 +362,18 @@ TDR:
 
             return result
 
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"❌ Error al analizar con Gemini: {str(e)}")
-            # Fallback: devolver análisis básico
-            return {
-                "resumen_ejecutivo": f"Error al analizar el TDR: {str(e)}. Contexto disponible: {len(context)} caracteres.",
-                "requisitos_tecnicos": [],
-                "reglas_de_negocio": [],
-                "politicas_y_penalidades": [],
-                "presupuesto_referencial": None,
-            }
+            raise ValueError(f"Error en Gemini API: {str(e)}")
 
     async def analyze_tdr_from_pdf(self, pdf_bytes: bytes, filename: str) -> Dict:
         """
         Analiza un TDR enviando el PDF directamente a Gemini (sin extracción de texto).
         Gemini 2.5 Flash soporta PDFs nativamente con Vision integrada.
-        Usa inline_data para evitar subir archivos a Files API.
+        Inline data por defecto; con GEMINI_FILES_ENABLED el documento se sube
+        una vez a la Files API y se reutiliza (ver gemini_files).
 
         Args:
             pdf_bytes: Contenido binario del PDF
@@ -175,36 +386,16 @@ TDR:
             self.logger.info(f"📄 Analizando PDF directo con Gemini ({self.model_name})")
             self.logger.info(f"   Archivo: {filename} ({len(pdf_bytes)} bytes)")
 
-            # ESTRATEGIA: Inline data (sin Files API)
-            self.logger.info("📦 Preparando PDF inline para Gemini...")
-
             # Detectar MIME type real por magic bytes (extensión puede mentir)
             mime_type = self._detect_document_mime(pdf_bytes, filename)
-
-            # Crear parte inline con el documento
-            pdf_part = types.Part.from_bytes(data=pdf_bytes, mime_type=mime_type)
-            self.logger.info(f"✅ Documento preparado ({len(pdf_bytes)} bytes, MIME: {mime_type})")
+            self.logger.info(f"📦 Documento preparado ({len(pdf_bytes)} bytes, MIME: {mime_type})")
 
             # Prompt para análisis
-            prompt = """
-Analiza este TDR del SEACE (Perú) y devuelve ÚNICAMENTE un JSON con las siguientes claves:
-{
-    "resumen_ejecutivo": "100-200 palabras sobre objetivos y alcance",
-    "requisitos_tecnicos": ["certificaciones, experiencia o equipamiento requerido"],
-    "reglas_de_negocio": ["plazos, lugar de entrega, modalidad de pago, garantías"],
-    "politicas_y_penalidades": ["multas, sanciones, porcentajes"],
-    "presupuesto_referencial": "S/ X,XXX.XX" o null
-}
-
-Reglas:
-- Si algún bloque no aparece en el PDF, devuelve [] o null.
-- Máximo 10 items por lista.
-- No incluyas texto fuera del JSON ni bloques ```json.
-"""
+            prompt = self.PDF_TDR_PROMPT
 
-            # Analizar con el PDF inline
-            self.logger.info("🤖 Enviando PDF inline a Gemini...")
-            response = await self._generate_content([prompt, pdf_part])
+            # Analizar con el PDF (inline o referencia a la Files API)
+            self.logger.info("🤖 Enviando PDF a Gemini...")
+            response = await self._generate_with_document(prompt, pdf_bytes, mime_type, filename)
 
             # Parsear respuesta
             response_text = self._extract_text(response).strip()
@@ -214,14 +405,49 @@ Reglas:
 
             result = self._parse_json_response(response_text)
             result["_token_usage"] = token_usage
-            self.logger.info("✅ Análisis PDF inline completado exitosamente")
+            self.logger.info("✅ Análisis PDF directo completado exitosamente")
 
             return result
 
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"❌ Error al analizar PDF con Gemini: {str(e)}")
             raise ValueError(f"Error en análisis PDF directo: {str(e)}")
 
+    async def analyze_tdr_stream(self, context: str) -> AsyncIterator[Dict]:
+        """Variante streaming de analyze_tdr (ver BaseLLMClient.analyze_tdr_stream)."""
+        self.logger.info(f"Analizando TDR en streaming con Gemini ({self.model_name})")
+        token_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        try:
+            fragments = self._stream_content(self._tdr_prompt(context), token_usage=token_usage)
+            async for event in self._stream_json(fragments, token_usage):
+                yield event
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            self.logger.error(f"❌ Error en streaming con Gemini: {str(e)}")
+            raise ValueError(f"Error en Gemini API: {str(e)}")
+        self.logger.info(f"📊 Tokens: prompt={token_usage['prompt_tokens']}, respuesta={token_usage['completion_tokens']}, total={token_usage['total_tokens']}")
+
+    async def analyze_tdr_from_pdf_stream(self, pdf_bytes: bytes, filename: str) -> AsyncIterator[Dict]:
+        """Variante streaming de analyze_tdr_from_pdf (mismos eventos que analyze_tdr_stream)."""
+        self.logger.info(f"📄 Analizando PDF directo en streaming con Gemini ({self.model_name}): {filename}")
+        mime_type = self._detect_document_mime(pdf_bytes, filename)
+        token_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        try:
+            fragments = self._stream_with_document(
+                self.PDF_TDR_PROMPT, pdf_bytes, mime_type, filename, token_usage=token_usage,
+            )
+            async for event in self._stream_json(fragments, token_usage):
+                yield event
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            self.logger.error(f"❌ Error en streaming PDF con Gemini: {str(e)}")
+            raise ValueError(f"Error en análisis PDF directo: {str(e)}")
+        self.logger.info(f"📊 Tokens: prompt={token_usage['prompt_tokens']}, respuesta={token_usage['completion_tokens']}, total={token_usage['total_tokens']}")
+
     async def evaluate_compatibility(
         self,
         company_copy: str,
@@ -238,6 +464,8 @@ Reglas:
             result = self._parse_json_response(response_text)
             result["_token_usage"] = token_usage
             return result
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"❌ Error en compatibilidad Gemini: {str(e)}")
             raise ValueError(f"Error al evaluar compatibilidad: {str(e)}")
@@ -247,16 +475,6 @@ Reglas:
         try:
             self.logger.info(f"🔍 Analizando direccionamiento con Gemini ({self.model_name})")
 
-            forensic_config = types.GenerateContentConfig(
-                temperature=0.15,
-                top_p=0.95,
-                top_k=40,
-                max_output_tokens=16384,
-                response_mime_type="application/json",
-                system_instruction=self.FORENSIC_SYSTEM_PROMPT,
-                safety_settings=self.generation_config.safety_settings,
-            )
-
             user_prompt = f"""
 Analiza este TDR/ET del SEACE (Perú) buscando indicios de direccionamiento y corrupción.
 Responde ÚNICAMENTE con un JSON que siga este esquema:
@@ -275,20 +493,7 @@ Reglas ESTRICTAS:
 TDR:
 {context}
 """
-            if hasattr(self.client, "aio"):
-                response = await self.client.aio.models.generate_content(
-                    model=self.model_name,
-                    contents=user_prompt,
-                    config=forensic_config,
-                )
-            else:
-                import asyncio
-                response = await asyncio.to_thread(
-                    self.client.models.generate_content,
-                    model=self.model_name,
-                    contents=user_prompt,
-                    config=forensic_config,
-                )
+            response = await self._generate_content(user_prompt, self.forensic_config)
 
             response_text = self._extract_text(response).strip()
             token_usage = self._extract_token_usage(response)
@@ -299,14 +504,11 @@ TDR:
             self.logger.info("✅ Análisis de direccionamiento completado con Gemini")
             return result
 
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"❌ Error en direccionamiento Gemini: {str(e)}")
-            return {
-                "score_riesgo_corrupcion": 0,
-                "veredicto_flash": "LIMPIO",
-                "hallazgos_criticos": [],
-                "argumento_para_observacion": f"Error al analizar: {str(e)}",
-            }
+            raise ValueError(f"Error al analizar direccionamiento: {str(e)}")
 
     async def generate_proforma(
         self,
@@ -331,14 +533,6 @@ TDR:
                     or ""
                 )
 
-            proforma_config = types.GenerateContentConfig(
-                temperature=0.3,
-                top_p=0.95,
-                max_output_tokens=8192,
-                response_mime_type="application/json",
-                safety_settings=self.generation_config.safety_settings,
-            )
-
             user_prompt = f"""
 ### ROLE: SENIOR PRICING ANALYST & BID MANAGER (PERUVIAN GOV SPECIALIST)
 Actúa como Director de Operaciones de "{nombre_empresa}".
@@ -380,20 +574,7 @@ TDR:
 {context}
 """
 
-            if hasattr(self.client, "aio"):
-                response = await self.client.aio.models.generate_content(
-                    model=self.model_name,
-                    contents=user_prompt,
-                    config=proforma_config,
-                )
-            else:
-                import asyncio
-                response = await asyncio.to_thread(
-                    self.client.models.generate_content,
-                    model=self.model_name,
-                    contents=user_prompt,
-                    config=proforma_config,
-                )
+            response = await self._generate_content(user_prompt, self.proforma_config)
 
             response_text = self._extract_text(response).strip()
             token_usage = self._extract_token_usage(response)
@@ -404,17 +585,39 @@ TDR:
             self.logger.info("✅ Proforma técnica generada con Gemini")
             return result
 
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"❌ Error en proforma Gemini: {str(e)}")
-            return {
-                "titulo_proceso": "Error al generar proforma",
-                "empresa_nombre": company_name or "Mi Empresa",
-                "empresa_rubro": "",
-                "items": [],
-                "total_estimado": "S/ 0.00",
-                "analisis_viabilidad": f"Error al generar proforma: {str(e)}",
-                "condiciones": [],
-            }
+            raise ValueError(f"Error al generar proforma: {str(e)}")
+
+    async def analyze_full(
+        self,
+        context: str,
+        company_name: str,
+        company_copy: str,
+        contrato_contexto=None,
+    ) -> Dict:
+        """Resumen, análisis forense y proforma en una sola llamada a Gemini."""
+        try:
+            self.logger.info(f"🧩 Análisis completo con Gemini ({self.model_name})")
+            user_prompt = self._build_full_analysis_prompt(company_name, company_copy, contrato_contexto, context)
+            response = await self._generate_content(user_prompt, self.full_config)
+
+            response_text = self._extract_text(response).strip()
+            token_usage = self._extract_token_usage(response)
+            self.logger.debug(f"Análisis completo Gemini (primeros 500 chars): {response_text[:500]}")
+
+            result = self._parse_json_response(response_text)
+            result["_token_usage"] = token_usage
+            self.logger.info("✅ Análisis completo generado con Gemini")
+            return result
+
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            self.logger.error(f"❌ Error en análisis completo Gemini: {str(e)}")
+            raise ValueError(f"Error en análisis completo: {str(e)}")
 
     def _detect_document_mime(self, pdf_bytes: bytes, filename: str = '') -> str:
         """
@@ -452,18 +655,6 @@ TDR:
             mime_type = self._detect_document_mime(pdf_bytes, filename)
             self.logger.info(f"🔍📄 Direccionamiento multimodal con Gemini ({self.model_name}) — MIME: {mime_type}")
 
-            pdf_part = types.Part.from_bytes(data=pdf_bytes, mime_type=mime_type)
-
-            forensic_config = types.GenerateContentConfig(
-                temperature=0.15,
-                top_p=0.95,
-                top_k=40,
-                max_output_tokens=16384,
-                response_mime_type="application/json",
-                system_instruction=self.FORENSIC_SYSTEM_PROMPT,
-                safety_settings=self.generation_config.safety_settings,
-            )
-
             user_prompt = f"""
 Analiza este TDR/ET del SEACE (Perú) buscando indicios de direccionamiento y corrupción.
 Responde ÚNICAMENTE con un JSON que siga este esquema:
@@ -480,20 +671,7 @@ Reglas ESTRICTAS:
 - No incluyas texto fuera del JSON.
 """
 
-            if hasattr(self.client, "aio"):
-                response = await self.client.aio.models.generate_content(
-                    model=self.model_name,
-                    contents=[user_prompt, pdf_part],
-                    config=forensic_config,
-                )
-            else:
-                import asyncio
-                response = await asyncio.to_thread(
-                    self.client.models.generate_content,
-                    model=self.model_name,
-                    contents=[user_prompt, pdf_part],
-                    config=forensic_config,
-                )
+            response = await self._generate_with_document(user_prompt, pdf_bytes, mime_type, filename, self.forensic_config)
 
             response_text = self._extract_text(response).strip()
             token_usage = self._extract_token_usage(response)
@@ -503,6 +681,8 @@ Reglas ESTRICTAS:
             self.logger.info("✅ Direccionamiento multimodal completado")
             return result
 
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"❌ Error en direccionamiento multimodal: {str(e)}")
             raise ValueError(f"Error en análisis direccionamiento PDF directo: {str(e)}")
@@ -520,8 +700,6 @@ Reglas ESTRICTAS:
             mime_type = self._detect_document_mime(pdf_bytes, filename)
             self.logger.info(f"📋📄 Proforma multimodal con Gemini ({self.model_name}) — MIME: {mime_type}")
 
-            pdf_part = types.Part.from_bytes(data=pdf_bytes, mime_type=mime_type)
-
             nombre_empresa = company_name.strip() or "Mi Empresa"
             entidad = ""
             objeto = ""
@@ -534,14 +712,6 @@ Reglas ESTRICTAS:
                     or ""
                 )
 
-            proforma_config = types.GenerateContentConfig(
-                temperature=0.3,
-                top_p=0.95,
-                max_output_tokens=8192,
-                response_mime_type="application/json",
-                safety_settings=self.generation_config.safety_settings,
-            )
-
             user_prompt = f"""
 ### ROLE: SENIOR PRICING ANALYST & BID MANAGER (PERUVIAN GOV SPECIALIST)
 Actúa como Director de Operaciones de "{nombre_empresa}".
@@ -580,20 +750,7 @@ REGLAS:
 }}}}
 """
 
-            if hasattr(self.client, "aio"):
-                response = await self.client.aio.models.generate_content(
-                    model=self.model_name,
-                    contents=[user_prompt, pdf_part],
-                    config=proforma_config,
-                )
-            else:
-                import asyncio
-                response = await asyncio.to_thread(
-                    self.client.models.generate_content,
-                    model=self.model_name,
-                    contents=[user_prompt, pdf_part],
-                    config=proforma_config,
-                )
+            response = await self._generate_with_document(user_prompt, pdf_bytes, mime_type, filename, self.proforma_config)
 
             response_text = self._extract_text(response).strip()
             token_usage = self._extract_token_usage(response)
@@ -603,6 +760,80 @@ REGLAS:
             self.logger.info("✅ Proforma multimodal generada")
             return result
 
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"❌ Error en proforma multimodal: {str(e)}")
             raise ValueError(f"Error en proforma PDF directo: {str(e)}")
+
+    async def analyze_full_from_pdf(
+        self,
+        pdf_bytes: bytes,
+        filename: str,
+        company_name: str,
+        company_copy: str,
+        contrato_contexto=None,
+    ) -> Dict:
+        """Análisis completo enviando el PDF directo a Gemini multimodal (una sola llamada)."""
+        try:
+            mime_type = self._detect_document_mime(pdf_bytes, filename)
+            self.logger.info(f"🧩📄 Análisis completo multimodal con Gemini ({self.model_name}) — MIME: {mime_type}")
+
+            user_prompt = self._build_full_analysis_prompt(company_name, company_copy, contrato_contexto)
+
+            response = await self._generate_with_document(user_prompt, pdf_bytes, mime_type, filename, self.full_config)
+
+            response_text = self._extract_text(response).strip()
+            token_usage = self._extract_token_usage(response)
+
+            result = self._parse_json_response(response_text)
+            result["_token_usage"] = token_usage
+            self.logger.info("✅ Análisis completo multimodal generado")
+            return result
+
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            self.logger.error(f"❌ Error en análisis completo multimodal: {str(e)}")
+            raise ValueError(f"Error en análisis completo PDF directo: {str(e)}")
+
+    @staticmethod
+    def _transcription_prompt(page_numbers: List[int]) -> str:
+        pages = ", ".join(str(number) for number in page_numbers)
+        return f"""
+Este PDF contiene páginas escaneadas de un TDR del SEACE (Perú), en este orden: páginas {pages} del documento original.
+
+Transcribe el texto de cada página tal como aparece, sin resumir ni interpretar.
+- Antes de cada página escribe una línea "--- Página N ---" con su número en el documento original.
+- Las tablas, como filas con columnas separadas por " | ".
+- Omite sellos, firmas y texto ilegible.
+- Responde solo con la transcripción.
+"""
+
+    async def transcribe_pdf_pages(self, pdf_bytes: bytes, page_numbers: List[int]) -> Dict:
+        """
+        Transcribe un sub-PDF con las páginas escaneadas de un documento mixto
+        (ruta híbrida): una sola llamada para todas ellas, en texto plano.
+
+        Args:
+            pdf_bytes: Sub-PDF con solo las páginas escaneadas
+            page_numbers: Número de cada página en el documento original (1-based)
+
+        Returns:
+            Dict con "text" (transcripción) y "_token_usage"
+        """
+        try:
+            self.logger.info(f"📝 Transcribiendo {len(page_numbers)} páginas escaneadas con Gemini ({self.model_name})")
+            response = await self._generate_with_document(
+                self._transcription_prompt(page_numbers), pdf_bytes, "application/pdf",
+                "scanned-pages.pdf", self.transcription_config,
+            )
+            token_usage = self._extract_token_usage(response)
+            self.logger.info(f"📊 Tokens: prompt={token_usage['prompt_tokens']}, respuesta={token_usage['completion_tokens']}, total={token_usage['total_tokens']}")
+            return {"text": self._extract_text(response).strip(), "_token_usage": token_usage}
+
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            self.logger.error(f"❌ Error al transcribir páginas escaneadas con Gemini: {str(e)}")
+            raise ValueError(f"Error en transcripción de páginas escaneadas: {str(e)}")
@@ -0,0 +1,276 @@
+"""
+Referencias reutilizables a documentos multimodales de Gemini.
+
+Los métodos `*_from_pdf` de GeminiClient envían el documento como inline data:
+cada análisis de seguimiento del mismo TDR escaneado (direccionamiento,
+proforma, reintentos) vuelve a subir los megabytes y a pagar todos sus tokens.
+Con este módulo (opcional, desactivado por defecto):
+
+- Files API (`gemini_files_enabled`): el documento se sube una vez y se
+  referencia por URI (`Part.from_uri`) mientras no expire (48 h en Gemini).
+- Caché explícita de contexto (`gemini_context_cache_enabled`): además se crea
+  un CachedContent con el archivo + la system_instruction de la operación; las
+  llamadas siguientes envían solo el prompt y los tokens del documento se
+  facturan a tarifa de caché.
+
+Las referencias se guardan por SHA-256 del documento y por "scope" (API key +
+endpoint: los archivos pertenecen al proyecto) con su expiración. Cualquier
+fallo al subir o crear la caché degrada a inline data; nunca rompe el análisis.
+
+    part = await gemini_documents.document_part(client, scope, pdf_bytes, mime_type, filename)
+"""
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import io
+import logging
+import time
+
+from google.genai import types
+
+from app.services.document_spool import document_sha256
+from config import settings
+from .resilience import is_retryable_error
+
+logger = logging.getLogger(__name__)
+
+# Vida de un archivo en la Files API si la respuesta no trae expirationTime
+FILES_API_TTL_SECONDS = 48 * 3600
+# Margen antes de la expiración: una referencia a punto de vencer se renueva
+_EXPIRY_MARGIN_SECONDS = 300
+# Espera máxima a que un archivo recién subido pase de PROCESSING a ACTIVE
+_PROCESSING_WAIT_SECONDS = 30.0
+_MAX_ENTRIES = 256
+
+
+@dataclass
+class DocumentReference:
+    """Archivo subido (uri) o caché de contexto (name) con su expiración (epoch)."""
+    name: str
+    uri: str
+    mime_type: str
+    expires_at: float
+
+    def is_fresh(self) -> bool:
+        return self.expires_at - _EXPIRY_MARGIN_SECONDS > time.time()
+
+
+def _expiry(value: Any, default_ttl: float) -> float:
+    """datetime de la API → epoch; sin valor, ahora + default_ttl."""
+    if value is not None and hasattr(value, "timestamp"):
+        return value.timestamp()
+    return time.time() + default_ttl
+
+
+def _is_definitive_rejection(exc: BaseException) -> bool:
+    """4xx no transitorio de la API (p. ej. contenido bajo el mínimo cacheable)."""
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    return isinstance(code, int) and 400 <= code < 500 and not is_retryable_error(exc)
+
+
+def document_scope(api_key: str, base_url: Optional[str]) -> str:
+    """Identificador del proyecto dueño de los archivos (sin exponer la API key)."""
+    return hashlib.sha256(f"{api_key}|{base_url or ''}".encode()).hexdigest()[:16]
+
+
+class GeminiDocumentCache:
+    """Archivos subidos y cachés de contexto por (scope, SHA-256 del documento). LRU."""
+
+    def __init__(
+        self,
+        files_enabled: bool,
+        min_bytes: int,
+        context_cache_enabled: bool = False,
+        context_cache_ttl_seconds: int = 900,
+    ):
+        self.files_enabled = files_enabled
+        self.min_bytes = min_bytes
+        self.context_cache_enabled = context_cache_enabled
+        self.context_cache_ttl_seconds = context_cache_ttl_seconds
+        self._files: "OrderedDict[Tuple[str, str], DocumentReference]" = OrderedDict()
+        self._caches: "OrderedDict[Tuple[str, ...], Optional[DocumentReference]]" = OrderedDict()
+        # Single-flight: una sola subida / creación por documento a la vez.
+        # Solo viven mientras alguien usa la clave: [lock, usuarios]
+        self._locks: Dict[Tuple[str, ...], list] = {}
+        self.counters = {
+            "uploads": 0, "file_reuses": 0, "inline": 0, "upload_errors": 0,
+            "context_caches": 0, "context_cache_reuses": 0, "context_cache_errors": 0,
+            "invalidations": 0,
+        }
+
+    @asynccontextmanager
+    async def _single_flight(self, key: Tuple[str, ...]) -> AsyncIterator[None]:
+        """Lock por clave; se descarta cuando no quedan usuarios (no crece sin límite)."""
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(key, None)
+
+    @staticmethod
+    def _remember(store: OrderedDict, key, value) -> None:
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > _MAX_ENTRIES:
+            store.popitem(last=False)
+
+    async def document_part(
+        self,
+        client,
+        scope: str,
+        document: bytes,
+        mime_type: str,
+        display_name: str = "",
+    ) -> types.Part:
+        """
+        Parte del documento para `generate_content`: referencia a la Files API
+        si está activa y el documento supera `min_bytes`; si no, inline data.
+        """
+        if not self.files_enabled or len(document) < self.min_bytes:
+            self.counters["inline"] += 1
+            return types.Part.from_bytes(data=document, mime_type=mime_type)
+
+        key = (scope, document_sha256(document))
+        async with self._single_flight(key):
+            reference = self._files.get(key)
+            if reference is not None and reference.is_fresh():
+                self._files.move_to_end(key)
+                self.counters["file_reuses"] += 1
+                logger.info(f"♻️  Documento ya subido a Gemini ({reference.name}) — sin re-subir {len(document)} bytes")
+                return types.Part.from_uri(file_uri=reference.uri, mime_type=reference.mime_type)
+
+            try:
+                reference = await self._upload(client, document, mime_type, display_name)
+            except Exception as e:
+                self.counters["upload_errors"] += 1
+                logger.warning(f"⚠️ No se pudo subir el documento a la Files API ({e}); se envía inline")
+                return types.Part.from_bytes(data=document, mime_type=mime_type)
+
+            self._remember(self._files, key, reference)
+            self.counters["uploads"] += 1
+            return types.Part.from_uri(file_uri=reference.uri, mime_type=reference.mime_type)
+
+    async def _upload(self, client, document: bytes, mime_type: str, display_name: str) -> DocumentReference:
+        started = time.perf_counter()
+        uploaded = await client.aio.files.upload(
+            file=io.BytesIO(document),
+            config=types.UploadFileConfig(mime_type=mime_type, display_name=display_name[:120] or None),
+        )
+        # Los PDF suelen quedar ACTIVE al instante; si no, esperar un poco
+        deadline = time.monotonic() + _PROCESSING_WAIT_SECONDS
+        while uploaded.state == types.FileState.PROCESSING and time.monotonic() < deadline:
+            await asyncio.sleep(1.0)
+            uploaded = await client.aio.files.get(name=uploaded.name)
+        if uploaded.state == types.FileState.FAILED or not uploaded.uri:
+            raise ValueError(f"archivo {uploaded.name} en estado {uploaded.state}")
+
+        logger.info(
+            f"📤 Documento subido a Gemini Files API: {uploaded.name} "
+            f"({len(document)} bytes, {(time.perf_counter() - started) * 1000:.0f} ms)"
+        )
+        return DocumentReference(
+            name=uploaded.name,
+            uri=uploaded.uri,
+            mime_type=uploaded.mime_type or mime_type,
+            expires_at=_expiry(uploaded.expiration_time, FILES_API_TTL_SECONDS),
+        )
+
+    async def cached_content(
+        self,
+        client,
+        scope: str,
+        model_name: str,
+        document: bytes,
+        part: types.Part,
+        system_instruction: Optional[str],
+    ) -> Optional[str]:
+        """
+        Nombre de un CachedContent (documento + system_instruction) para el
+        modelo, creándolo si hace falta. None si la caché de contexto está
+        desactivada, el documento no está subido o la API la rechaza. Solo se
+        recuerda un rechazo definitivo (4xx, p. ej. por debajo del mínimo de
+        tokens cacheables); un 429/5xx/timeout se reintenta en la próxima llamada.
+        """
+        if not self.context_cache_enabled or part.file_data is None:
+            return None
+
+        instruction_hash = hashlib.sha256((system_instruction or "").encode()).hexdigest()[:16]
+        key = (scope, model_name, document_sha256(document), instruction_hash)
+        async with self._single_flight(key):
+            if key in self._caches:
+                reference = self._caches[key]
+                if reference is None:
+                    return None  # la API ya la rechazó para este documento
+                if reference.is_fresh():
+                    self._caches.move_to_end(key)
+                    self.counters["context_cache_reuses"] += 1
+                    return reference.name
+
+            try:
+                cache = await client.aio.caches.create(
+                    model=model_name,
+                    config=types.CreateCachedContentConfig(
+                        contents=[types.Content(role="user", parts=[part])],
+                        system_instruction=system_instruction,
+                        ttl=f"{self.context_cache_ttl_seconds}s",
+                    ),
+                )
+            except Exception as e:
+                self.counters["context_cache_errors"] += 1
+                if _is_definitive_rejection(e):
+                    logger.warning(f"⚠️ Gemini rechazó la caché de contexto ({e}); se usa la referencia al archivo")
+                    self._remember(self._caches, key, None)
+                else:
+                    logger.warning(f"⚠️ Caché de contexto no disponible ahora ({e}); se usa la referencia al archivo")
+                return None
+
+            logger.info(f"🗃️  Caché de contexto Gemini creada: {cache.name} (TTL {self.context_cache_ttl_seconds}s)")
+            self.counters["context_caches"] += 1
+            self._remember(self._caches, key, DocumentReference(
+                name=cache.name,
+                uri="",
+                mime_type=part.file_data.mime_type or "",
+                expires_at=_expiry(cache.expire_time, self.context_cache_ttl_seconds),
+            ))
+            return cache.name
+
+    def invalidate(self, scope: str, document: bytes) -> None:
+        """Olvida el archivo y las cachés de un documento (p. ej. borrado o expirado en el servidor)."""
+        document_hash = document_sha256(document)
+        self._files.pop((scope, document_hash), None)
+        for key in [key for key in self._caches if key[0] == scope and key[2] == document_hash]:
+            self._caches.pop(key, None)
+        self.counters["invalidations"] += 1
+
+    def clear(self) -> None:
+        """Olvida todas las referencias (los archivos expiran solos en el servidor)."""
+        self._files.clear()
+        self._caches.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores expuestos en /batch/stats."""
+        return {
+            "files_enabled": self.files_enabled,
+            "context_cache_enabled": self.context_cache_enabled,
+            "files": len(self._files),
+            "context_caches": sum(1 for reference in self._caches.values() if reference is not None),
+            **self.counters,
+        }
+
+
+# Instancia global (compartida por todos los GeminiClient del proceso)
+gemini_documents = GeminiDocumentCache(
+    files_enabled=settings.gemini_files_enabled,
+    min_bytes=settings.gemini_files_min_kb * 1024,
+    context_cache_enabled=settings.gemini_context_cache_enabled,
+    context_cache_ttl_seconds=settings.gemini_context_cache_ttl_seconds,
+)
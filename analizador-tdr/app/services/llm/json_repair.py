@@ -0,0 +1,130 @@
+"""
+Extracción y reparación de JSON en respuestas de LLM, en una sola pasada O(n).
+
+Las respuestas llegan con ruido (texto antes/después, bloques ```json) o
+truncadas por max_output_tokens. Un tokenizador avanza token a token con la
+pila de contenedores: una sola expresión regular reconoce un string completo
+(`"[^"\\]*(?:\\.[^"\\]*)*"`, bucle desenrollado sin backtracking
+catastrófico) o un carácter estructural, así que por Python solo pasan los
+tokens, no los caracteres.
+
+- Cada objeto de primer nivel que se cierra es un candidato completo (el
+  texto de alrededor se ignora).
+- Si el texto termina con contenedores abiertos, el candidato se repara:
+  un string de valor cortado se cierra (se conserva el texto parcial); una
+  clave, un primitivo a medias (`tru`, `12.`) o un escape incompleto se
+  descartan volviendo al último punto seguro; luego se cierra la pila en orden.
+
+    for candidate, repaired in json_candidates(text):
+        ...json.loads(candidate)
+"""
+from typing import Iterator, List, Tuple
+import re
+
+# Token: string (grupo 1 = comilla de cierre, vacío si quedó abierto) o carácter estructural
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*("?)|[{}\[\],:]', re.DOTALL)
+# Escape unicode incompleto al final del texto
+_PARTIAL_UNICODE = re.compile(r'\\u[0-9a-fA-F]{0,3}\Z')
+# Primitivo completo al final del texto (un `12.` o `tru` cortado no lo es)
+_LITERAL = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null")
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def json_candidates(text: str) -> Iterator[Tuple[str, bool]]:
+    """
+    Candidatos a JSON dentro de `text`, en orden: (texto, reparado).
+
+    Produce cada objeto de primer nivel balanceado y, si el texto termina con
+    un objeto abierto, su versión reparada. El llamador prueba `json.loads`
+    sobre cada uno; un candidato inválido no obliga a re-escanear (el
+    siguiente se busca a partir de su final).
+    """
+    search_token = _TOKEN.search
+    start = text.find("{")
+    while start != -1:
+        stack: List[str] = ["{"]
+        expect_key = True
+        safe_end = pos = start + 1      # safe_end: texto hasta aquí + cerrar la pila = JSON válido
+        open_string = -1                # comilla de un string de valor sin cerrar
+
+        while True:
+            match = search_token(text, pos)
+            if match is None:
+                break
+            token = match.start()
+            ch = text[token]
+
+            if ch == '"':
+                is_key = expect_key and stack[-1] == "{"
+                if not match.group(1):
+                    if not is_key:
+                        open_string = token
+                    break
+                pos = match.end()
+                if not is_key:
+                    safe_end = pos
+            elif ch == ",":
+                # Texto entre el token anterior y la coma: un primitivo (número, true, null)
+                if not text[pos:token].isspace() and token > pos:
+                    safe_end = token
+                expect_key = stack[-1] == "{"
+                pos = token + 1
+            elif ch == ":":
+                expect_key = False
+                pos = token + 1
+            elif ch == "{" or ch == "[":
+                stack.append(ch)
+                expect_key = ch == "{"
+                safe_end = pos = token + 1
+            else:
+                stack.pop()
+                pos = token + 1
+                if not stack:
+                    break
+                expect_key = False
+                safe_end = pos
+
+        if not stack:
+            yield text[start:pos], False
+            start = text.find("{", pos)
+            continue
+
+        if open_string >= 0:
+            yield _close_string(text, start, open_string) + _closers(stack), True
+            return
+        if match is None:
+            trailing = text[pos:].strip()
+            if trailing and not expect_key and _LITERAL.fullmatch(trailing):
+                safe_end = len(text.rstrip())
+        yield text[start:safe_end] + _closers(stack), True
+        return
+
+
+def _close_string(text: str, start: int, open_string: int) -> str:
+    """Cierra un string de valor truncado descartando un escape incompleto al final."""
+    end = len(text)
+    trailing_backslashes = end - len(text.rstrip("\\"))
+    if trailing_backslashes % 2:
+        end -= 1
+    else:
+        partial = _PARTIAL_UNICODE.search(text, open_string + 1)
+        if partial is not None:
+            preceding = partial.start() - len(text[:partial.start()].rstrip("\\"))
+            if preceding % 2 == 0:
+                end = partial.start()
+    return text[start:end] + '"'
+
+
+def _closers(stack: List[str]) -> str:
+    return "".join(_CLOSERS[opener] for opener in reversed(stack))
+
+
+def repair_json(text: str) -> str:
+    """
+    Último candidato de `text`: el objeto reparado si estaba truncado (o el
+    último objeto completo). Sin ningún "{" devuelve el texto sin cambios.
+    """
+    candidate = text
+    for candidate, _ in json_candidates(text):
+        pass
+    return candidate
@@ -0,0 +1,207 @@
+"""
+Parser JSON incremental para respuestas en streaming de los LLM.
+
+Los clientes reciben la respuesta en fragmentos de texto arbitrarios (cortan a
+mitad de una clave, de un string o de un escape). El parser recorre cada
+fragmento una sola vez con una máquina de estados (pila de contenedores +
+string/escape) y emite eventos en cuanto se cierra un valor del objeto raíz:
+
+- {"type": "item", "field": "requisitos_tecnicos", "index": 0, "value": "..."}
+  por cada elemento cerrado de una lista de primer nivel.
+- {"type": "field", "field": "resumen_ejecutivo", "value": "..."}
+  cuando se cierra el valor completo de una clave de primer nivel.
+
+Ignora el texto anterior a la primera "{" (p. ej. un bloque ```json). No
+valida el documento: el resultado final lo sigue dando `_parse_json_response`
+sobre el texto completo (con la reparación de JSON truncado).
+
+    parser = IncrementalJSONParser()
+    for event in parser.feed(delta):
+        ...
+    result = client._parse_json_response(parser.text)
+"""
+from typing import Any, Dict, Iterator, List, Optional
+import json
+
+_WHITESPACE = frozenset(" \t\r\n")
+
+
+class IncrementalJSONParser:
+    """Emite campos y elementos de lista del objeto raíz a medida que se cierran."""
+
+    def __init__(self):
+        # Campos de primer nivel ya cerrados (lo rescatable de un stream cortado)
+        self.fields: Dict[str, Any] = {}
+        self._chunks: List[str] = []
+        # Ventana del texto desde el inicio del valor abierto más antiguo
+        # (lo ya emitido se descarta: cada carácter se copia O(1) veces por valor)
+        self._window = ""
+        self._window_offset = 0
+        self._consumed = 0
+        self._stack: List[str] = []
+        self._started = False
+        self._finished = False
+        self._in_string = False
+        self._escape = False
+        self._expecting_key = True
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        # Inicio del valor de primer nivel / del elemento de lista en curso
+        self._value_start: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self._item_index = 0
+
+    @property
+    def text(self) -> str:
+        """Texto completo recibido hasta ahora."""
+        if len(self._chunks) > 1:
+            self._chunks[:] = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Procesa un fragmento y devuelve los eventos que cerró."""
+        if not chunk:
+            return []
+        self._chunks.append(chunk)
+        events: List[Dict[str, Any]] = []
+        if self._finished:
+            return events
+        self._window += chunk
+        base = self._consumed
+        for offset, ch in enumerate(chunk):
+            self._step(base + offset, ch, events)
+            if self._finished:
+                break
+        self._consumed += len(chunk)
+
+        open_starts = [s for s in (self._key_start, self._value_start, self._item_start) if s is not None]
+        keep_from = min(open_starts) if open_starts else self._consumed
+        if keep_from > self._window_offset:
+            self._window = self._window[keep_from - self._window_offset:]
+            self._window_offset = keep_from
+        return events
+
+    def _slice(self, start: int, end: int) -> str:
+        return self._window[start - self._window_offset:end - self._window_offset]
+
+    def _step(self, i: int, ch: str, events: List[Dict[str, Any]]) -> None:
+        if not self._started:
+            if ch == "{":
+                self._started = True
+                self._stack.append("{")
+            return
+
+        depth = len(self._stack)
+        in_root_list = depth == 2 and self._stack[1] == "["
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                if depth == 1 and self._expecting_key:
+                    key = _decode(self._slice(self._key_start, i + 1))
+                    self._key = key if isinstance(key, str) else None
+                    self._key_start = None
+                elif depth == 1:
+                    self._emit_field(i, events)
+                elif in_root_list:
+                    self._emit_item(i, events)
+            return
+
+        if ch in _WHITESPACE:
+            return
+
+        if ch == '"':
+            self._in_string = True
+            if depth == 1 and self._expecting_key:
+                self._key_start = i
+            else:
+                self._mark_start(depth, in_root_list, i)
+            return
+
+        if ch in "{[":
+            self._mark_start(depth, in_root_list, i)
+            self._stack.append(ch)
+            return
+
+        if ch in "}]":
+            # Un primitivo pendiente (número, true/false/null) termina en el cierre
+            if depth == 1:
+                self._emit_field(i - 1, events)
+            elif in_root_list:
+                self._emit_item(i - 1, events)
+            self._stack.pop()
+            depth = len(self._stack)
+            if depth == 0:
+                self._finished = True
+            elif depth == 1:
+                self._emit_field(i, events)
+            elif depth == 2 and self._stack[1] == "[":
+                self._emit_item(i, events)
+            return
+
+        if ch == ",":
+            if depth == 1:
+                self._emit_field(i - 1, events)
+                self._expecting_key = True
+            elif in_root_list:
+                self._emit_item(i - 1, events)
+            return
+
+        if ch == ":" and depth == 1:
+            self._expecting_key = False
+            return
+
+        # Inicio de un primitivo
+        self._mark_start(depth, in_root_list, i)
+
+    def _mark_start(self, depth: int, in_root_list: bool, i: int) -> None:
+        if depth == 1 and self._value_start is None:
+            self._value_start = i
+            self._item_index = 0
+        elif in_root_list and self._item_start is None:
+            self._item_start = i
+
+    def _emit_field(self, end: int, events: List[Dict[str, Any]]) -> None:
+        if self._value_start is None:
+            return
+        raw = self._slice(self._value_start, end + 1)
+        self._value_start = None
+        value = _decode(raw)
+        if value is not _INVALID and self._key is not None:
+            self.fields[self._key] = value
+            events.append({"type": "field", "field": self._key, "value": value})
+
+    def _emit_item(self, end: int, events: List[Dict[str, Any]]) -> None:
+        if self._item_start is None:
+            return
+        raw = self._slice(self._item_start, end + 1)
+        self._item_start = None
+        value = _decode(raw)
+        if value is not _INVALID and self._key is not None:
+            events.append({"type": "item", "field": self._key, "index": self._item_index, "value": value})
+        self._item_index += 1
+
+
+_INVALID = object()
+
+
+def _decode(raw: str) -> Any:
+    try:
+        return json.loads(raw)
+    except (json.JSONDecodeError, ValueError):
+        return _INVALID
+
+
+def field_events(result: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Eventos equivalentes a partir de un análisis ya completo (caché, rutas sin streaming)."""
+    for key, value in result.items():
+        if key.startswith("_"):
+            continue
+        if isinstance(value, list):
+            for index, item in enumerate(value):
+                yield {"type": "item", "field": key, "index": index, "value": item}
+        yield {"type": "field", "field": key, "value": value}
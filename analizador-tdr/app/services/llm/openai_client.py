@@ -2,9 +2,12 @@
 Cliente para OpenAI API (GPT-4o).
 """
 from openai import AsyncOpenAI
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 import logging
 from .base_client import BaseLLMClient
+from .rate_limiter import estimate_tokens
+from .token_budget import prompt_chars
+from .resilience import LLMUnavailableError, resilient_call, resilient_stream
 
 logger = logging.getLogger(__name__)
 
@@ -12,11 +15,106 @@ logger = logging.getLogger(__name__)
 class OpenAIClient(BaseLLMClient):
     """Cliente para OpenAI API (GPT-4o con Structured Outputs)"""
 
-    def __init__(self, api_key: str, model_name: str = "gpt-4o"):
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = "gpt-4o",
+        http_client=None,
+        base_url: Optional[str] = None,
+    ):
         self.api_key = api_key
         self.model_name = model_name
         self.logger = logger
-        self.client = AsyncOpenAI(api_key=api_key)
+        # http_client: pool del SDK (DefaultAsyncHttpxClient) con keep-alive/TLS reutilizados entre llamadas
+        # max_retries=0: los reintentos los gestiona resilient_call (con plazo y rate limiter)
+        self.client = AsyncOpenAI(
+            api_key=api_key, base_url=base_url or None, http_client=http_client, max_retries=0
+        )
+
+    async def aclose(self) -> None:
+        """Cierra el cliente y su pool de conexiones."""
+        await self.client.close()
+
+    async def _create_completion(self, **kwargs):
+        """Único punto de salida hacia la API de OpenAI (rate limiter + reintentos)."""
+        estimated_prompt = estimate_tokens(kwargs.get("messages"), "openai")
+        return await resilient_call(
+            "openai",
+            self.model_name,
+            estimated_prompt + kwargs.get("max_tokens", 0),
+            lambda: self.client.chat.completions.create(model=self.model_name, **kwargs),
+            self._extract_token_usage,
+            prompt_chars=prompt_chars(kwargs.get("messages")),
+            estimated_prompt_tokens=estimated_prompt,
+        )
+
+    async def _stream_completion(self, token_usage: Dict, **kwargs) -> AsyncIterator[str]:
+        """Versión streaming de _create_completion: fragmentos de texto (uso acumulado en `token_usage`)."""
+        estimated_prompt = estimate_tokens(kwargs.get("messages"), "openai")
+
+        async def open_stream():
+            stream = await self.client.chat.completions.create(
+                model=self.model_name, stream=True, stream_options={"include_usage": True}, **kwargs
+            )
+            return self._stream_chunks(stream)
+
+        async for text in resilient_stream(
+            "openai",
+            self.model_name,
+            estimated_prompt + kwargs.get("max_tokens", 0),
+            open_stream,
+            token_usage,
+            prompt_chars=prompt_chars(kwargs.get("messages")),
+            estimated_prompt_tokens=estimated_prompt,
+        ):
+            yield text
+
+    @classmethod
+    async def _stream_chunks(cls, stream):
+        # Con include_usage, el último chunk trae usage y choices vacío
+        try:
+            async for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                usage = cls._extract_token_usage(chunk) if getattr(chunk, "usage", None) else None
+                yield text or "", usage
+        finally:
+            await stream.close()
+
+    @staticmethod
+    def _extract_token_usage(response) -> dict:
+        """Extrae conteo de tokens del campo usage de la respuesta de OpenAI."""
+        try:
+            usage = getattr(response, "usage", None)
+            if usage:
+                return {
+                    "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+                    "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+                    "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+                }
+        except Exception:
+            pass
+        return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+    @staticmethod
+    def _tdr_prompt(context: str) -> str:
+        return f"""
+Analiza el siguiente TDR del SEACE y responde solo con JSON siguiendo la estructura requerida (resumen_ejecutivo, requisitos_tecnicos, reglas_de_negocio, politicas_y_penalidades, presupuesto_referencial). Si algún bloque no tiene datos, utiliza [] o null.
+
+TDR:
+{context}
+"""
+
+    def _tdr_request(self, user_prompt: str) -> Dict:
+        """Parámetros de analyze_tdr (compartidos con la variante streaming)."""
+        return {
+            "messages": [
+                {"role": "system", "content": self.SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt}
+            ],
+            "temperature": 0.2,
+            "max_tokens": 2048,
+            "response_format": {"type": "json_object"},  # Fuerza JSON
+        }
 
     async def analyze_tdr(self, context: str) -> Dict:
         """
@@ -32,24 +130,10 @@ class OpenAIClient(BaseLLMClient):
             self.logger.info(f"Analizando TDR con OpenAI ({self.model_name})")
 
             # Prompt del usuario
-            user_prompt = f"""
-Analiza el siguiente TDR del SEACE y responde solo con JSON siguiendo la estructura requerida (resumen_ejecutivo, requisitos_tecnicos, reglas_de_negocio, politicas_y_penalidades, presupuesto_referencial). Si algún bloque no tiene datos, utiliza [] o null.
-
-TDR:
-{context}
-"""
+            user_prompt = self._tdr_prompt(context)
 
             # Llamada a la API con Structured Outputs (response_format)
-            response = await self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": self.SYSTEM_PROMPT},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.2,
-                max_tokens=2048,
-                response_format={"type": "json_object"}  # Fuerza JSON
-            )
+            response = await self._create_completion(**self._tdr_request(user_prompt))
 
             # Extraer contenido
             response_text = response.choices[0].message.content
@@ -58,15 +142,32 @@ TDR:
 
             # Parsear JSON
             result = self._parse_json_response(response_text)
+            result["_token_usage"] = self._extract_token_usage(response)
 
             self.logger.info("Análisis completado exitosamente con OpenAI")
 
             return result
 
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"Error al analizar con OpenAI: {str(e)}")
             raise ValueError(f"Error en OpenAI API: {str(e)}")
 
+    async def analyze_tdr_stream(self, context: str) -> AsyncIterator[Dict]:
+        """Variante streaming de analyze_tdr (ver BaseLLMClient.analyze_tdr_stream)."""
+        self.logger.info(f"Analizando TDR en streaming con OpenAI ({self.model_name})")
+        token_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        try:
+            fragments = self._stream_completion(token_usage, **self._tdr_request(self._tdr_prompt(context)))
+            async for event in self._stream_json(fragments, token_usage):
+                yield event
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Error en streaming con OpenAI: {str(e)}")
+            raise ValueError(f"Error en OpenAI API: {str(e)}")
+
     async def evaluate_compatibility(
         self,
         company_copy: str,
@@ -76,8 +177,7 @@ TDR:
     ) -> Dict:
         try:
             prompt = self._build_compatibility_prompt(company_copy, analisis_tdr, contrato_contexto, keywords)
-            response = await self.client.chat.completions.create(
-                model=self.model_name,
+            response = await self._create_completion(
                 messages=[
                     {"role": "system", "content": "Asesor especializado en compatibilidad de contratos SEACE."},
                     {"role": "user", "content": prompt},
@@ -89,7 +189,9 @@ TDR:
 
             response_text = response.choices[0].message.content
             self.logger.debug(f"Compatibilidad OpenAI (primeros 400 chars): {response_text[:400]}")
-            return self._parse_json_response(response_text)
+            return self._with_token_usage(self._parse_json_response(response_text), response)
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"Error en compatibilidad OpenAI: {str(e)}")
             raise ValueError(f"Error al evaluar compatibilidad: {str(e)}")
@@ -115,8 +217,7 @@ Reglas ESTRICTAS:
 TDR:
 {context}
 """
-            response = await self.client.chat.completions.create(
-                model=self.model_name,
+            response = await self._create_completion(
                 messages=[
                     {"role": "system", "content": self.FORENSIC_SYSTEM_PROMPT},
                     {"role": "user", "content": user_prompt},
@@ -127,7 +228,9 @@ TDR:
             )
 
             response_text = response.choices[0].message.content
-            return self._parse_json_response(response_text)
+            return self._with_token_usage(self._parse_json_response(response_text), response)
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"❌ Error en direccionamiento OpenAI: {str(e)}")
             raise ValueError(f"Error al analizar direccionamiento: {str(e)}")
@@ -168,8 +271,7 @@ Devuelve ÚNICAMENTE este JSON:
 
 TDR:\n{context}"""
 
-            response = await self.client.chat.completions.create(
-                model=self.model_name,
+            response = await self._create_completion(
                 messages=[
                     {"role": "system", "content": self.SYSTEM_PROMPT},
                     {"role": "user", "content": user_prompt},
@@ -178,7 +280,36 @@ TDR:\n{context}"""
                 max_tokens=4096,
                 response_format={"type": "json_object"},
             )
-            return self._parse_json_response(response.choices[0].message.content)
+            return self._with_token_usage(self._parse_json_response(response.choices[0].message.content), response)
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             self.logger.error(f"❌ Error en proforma OpenAI: {str(e)}")
             raise ValueError(f"Error al generar proforma: {str(e)}")
+
+    async def analyze_full(
+        self,
+        context: str,
+        company_name: str,
+        company_copy: str,
+        contrato_contexto=None,
+    ) -> Dict:
+        """Resumen, análisis forense y proforma en una sola llamada a OpenAI."""
+        try:
+            self.logger.info(f"🧩 Análisis completo con OpenAI ({self.model_name})")
+            user_prompt = self._build_full_analysis_prompt(company_name, company_copy, contrato_contexto, context)
+            response = await self._create_completion(
+                messages=[
+                    {"role": "system", "content": f"{self.SYSTEM_PROMPT.strip()}\n\n{self.FORENSIC_SYSTEM_PROMPT.strip()}"},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=0.2,
+                max_tokens=8192,
+                response_format={"type": "json_object"},
+            )
+            return self._with_token_usage(self._parse_json_response(response.choices[0].message.content), response)
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            self.logger.error(f"❌ Error en análisis completo OpenAI: {str(e)}")
+            raise ValueError(f"Error en análisis completo: {str(e)}")
@@ -0,0 +1,259 @@
+"""
+Planificador de llamadas salientes a los LLM (rate limiting por proveedor/modelo).
+
+Cada par proveedor/modelo tiene buckets de peticiones por minuto (RPM),
+tokens por minuto (TPM) y peticiones por día (RPD). Antes de cada llamada el
+cliente reserva 1 petición + los tokens estimados del prompt; al terminar, la
+reserva se ajusta con el uso real que devuelve `_extract_token_usage`.
+
+Si no hay capacidad, la llamada espera en cola (no falla). La cola respeta
+prioridades: las peticiones interactivas (/analyze-tdr) pasan antes que el
+tráfico de lotes del scraper. La prioridad se toma de un contextvar, de modo
+que no hay que pasarla por todo el pipeline:
+
+    with llm_priority(PRIORITY_BATCH):
+        await analyzer_service.analyze_tdr_document(...)
+"""
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from config import settings
+from .token_budget import token_estimator
+
+logger = logging.getLogger(__name__)
+
+# Prioridades (menor = antes)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_JOB = 5
+PRIORITY_BATCH = 10
+
+_current_priority: ContextVar[int] = ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+# Estimación por documento adjunto (multimodal) antes de conocer el uso real:
+# Gemini cobra ~258 tokens/página; 8k cubre un TDR típico de ~30 páginas.
+DOCUMENT_PART_TOKENS = 8_000
+
+
+@contextmanager
+def llm_priority(priority: int):
+    """Fija la prioridad de las llamadas LLM hechas dentro del bloque."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def estimate_tokens(contents, provider: Optional[str] = None) -> int:
+    """Estimación local de tokens de un prompt o lista de partes (ver token_budget)."""
+    if contents is None:
+        return 0
+    if isinstance(contents, str):
+        return token_estimator.estimate(contents, provider)
+    if isinstance(contents, (bytes, bytearray)):
+        return DOCUMENT_PART_TOKENS
+    if isinstance(contents, dict):
+        return (
+            estimate_tokens(contents.get("content"), provider)
+            + estimate_tokens(contents.get("text"), provider)
+        )
+    if isinstance(contents, (list, tuple)):
+        return sum(estimate_tokens(part, provider) for part in contents)
+    text = getattr(contents, "text", None)
+    if isinstance(text, str):
+        return token_estimator.estimate(text, provider)
+    # Partes binarias (types.Part.from_bytes, etc.)
+    return DOCUMENT_PART_TOKENS
+
+
+class TokenBucket:
+    """Bucket clásico: capacidad `capacity`, se rellena `capacity` unidades por `period` segundos."""
+
+    def __init__(self, capacity: float, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.available = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Segundos hasta que haya `amount` disponibles (0 si ya los hay)."""
+        self._refill()
+        # Una petición mayor que la capacidad no debe bloquear para siempre
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.available -= amount
+
+    def adjust(self, delta: float) -> None:
+        """Corrige una reserva (delta > 0 consume más, < 0 devuelve). Puede quedar en negativo."""
+        self._refill()
+        self.available = min(self.capacity, self.available - delta)
+
+
+@dataclass
+class Reservation:
+    """Reserva concedida por el limitador; `record()` la ajusta con el uso real."""
+    limiter: "ProviderRateLimiter"
+    estimated_tokens: int
+
+    def record(self, token_usage: Optional[Dict]) -> None:
+        actual = (token_usage or {}).get("total_tokens") or 0
+        if actual:
+            self.limiter.adjust_tokens(actual - self.estimated_tokens)
+
+
+class ProviderRateLimiter:
+    """Buckets RPM/TPM/RPD de un proveedor/modelo + cola de espera con prioridad."""
+
+    def __init__(self, name: str, rpm: int, tpm: int, rpd: int):
+        self.name = name
+        self._buckets: List[Tuple[str, TokenBucket]] = []
+        if rpm > 0:
+            self._buckets.append(("rpm", TokenBucket(rpm, 60.0)))
+        if rpd > 0:
+            self._buckets.append(("rpd", TokenBucket(rpd, 86_400.0)))
+        self._tpm = TokenBucket(tpm, 60.0) if tpm > 0 else None
+        self._waiters: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._cond = asyncio.Condition()
+        self.granted = 0
+        self.queued_seconds = 0.0
+
+    def _wait_time(self, tokens: int) -> float:
+        waits = [bucket.wait_time(1) for _, bucket in self._buckets]
+        if self._tpm is not None:
+            waits.append(self._tpm.wait_time(tokens))
+        return max(waits, default=0.0)
+
+    def _consume(self, tokens: int) -> None:
+        for _, bucket in self._buckets:
+            bucket.consume(1)
+        if self._tpm is not None:
+            self._tpm.consume(tokens)
+
+    def adjust_tokens(self, delta: int) -> None:
+        if self._tpm is not None and delta:
+            self._tpm.adjust(delta)
+
+    async def acquire(self, tokens: int, priority: int) -> Reservation:
+        """Espera (en orden de prioridad, FIFO dentro de la misma) hasta tener capacidad."""
+        entry = (priority, next(self._seq))
+        start = time.monotonic()
+        async with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    if self._waiters[0] == entry:
+                        wait = self._wait_time(tokens)
+                        if wait <= 0:
+                            heapq.heappop(self._waiters)
+                            self._consume(tokens)
+                            break
+                        # Esperar el relleno del bucket (o a que llegue alguien con más prioridad)
+                        try:
+                            await asyncio.wait_for(self._cond.wait(), timeout=wait)
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        await self._cond.wait()
+            except BaseException:
+                # Cancelado mientras esperaba: salir de la cola sin consumir
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                raise
+            finally:
+                self._cond.notify_all()
+
+        waited = time.monotonic() - start
+        self.granted += 1
+        self.queued_seconds += waited
+        if waited > 1:
+            logger.info(f"⏳ {self.name}: llamada en cola {waited:.1f}s (prioridad {priority})")
+        return Reservation(limiter=self, estimated_tokens=tokens)
+
+    def stats(self) -> Dict:
+        limits = {name: int(bucket.capacity) for name, bucket in self._buckets}
+        available = {name: round(max(bucket.available, 0), 1) for name, bucket in self._buckets}
+        if self._tpm is not None:
+            self._tpm.wait_time(0)
+            limits["tpm"] = int(self._tpm.capacity)
+            available["tpm"] = round(max(self._tpm.available, 0))
+        return {
+            "limits": limits,
+            "available": available,
+            "queued": len(self._waiters),
+            "granted": self.granted,
+            "avg_queue_seconds": round(self.queued_seconds / self.granted, 3) if self.granted else 0.0,
+        }
+
+
+class LLMRateLimiter:
+    """Registro de limitadores por proveedor/modelo (uno por proceso)."""
+
+    def __init__(self):
+        self._limiters: Dict[Tuple[str, str], ProviderRateLimiter] = {}
+
+    @staticmethod
+    def _limits_for(provider: str) -> Tuple[int, int, int]:
+        return (
+            getattr(settings, f"{provider}_rpm", 0),
+            getattr(settings, f"{provider}_tpm", 0),
+            getattr(settings, f"{provider}_rpd", 0),
+        )
+
+    def get(self, provider: str, model: str) -> ProviderRateLimiter:
+        key = (provider, model)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            rpm, tpm, rpd = self._limits_for(provider)
+            limiter = ProviderRateLimiter(f"{provider}/{model}", rpm=rpm, tpm=tpm, rpd=rpd)
+            self._limiters[key] = limiter
+        return limiter
+
+    @asynccontextmanager
+    async def slot(self, provider: str, model: str, estimated_tokens: int):
+        """
+        Reserva capacidad para una llamada y la ajusta al salir.
+
+        Uso en el punto de salida de cada cliente:
+            async with rate_limiter.slot("gemini", model, tokens) as reservation:
+                response = await ...
+                reservation.record(self._extract_token_usage(response))
+        """
+        if not settings.llm_rate_limit_enabled:
+            yield Reservation(limiter=_NOOP_LIMITER, estimated_tokens=estimated_tokens)
+            return
+        limiter = self.get(provider, model)
+        reservation = await limiter.acquire(estimated_tokens, _current_priority.get())
+        yield reservation
+
+    def stats(self) -> Dict[str, Dict]:
+        return {limiter.name: limiter.stats() for limiter in self._limiters.values()}
+
+
+class _NoopLimiter:
+    def adjust_tokens(self, delta: int) -> None:
+        pass
+
+
+_NOOP_LIMITER = _NoopLimiter()
+
+# Instancia global
+rate_limiter = LLMRateLimiter()
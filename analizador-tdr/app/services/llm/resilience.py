@@ -0,0 +1,367 @@
+"""
+Capa de resiliencia para las llamadas a los LLM.
+
+1. Reintentos (tenacity) en el punto de salida de cada cliente:
+   - Solo errores transitorios: 429, 5xx/529, timeouts y errores de conexión.
+     Un 400/401/403 o una respuesta mal formada fallan de inmediato.
+   - Backoff exponencial con jitter completo; si el proveedor envía
+     `Retry-After`, se respeta.
+   - Plazo (deadline) por llamada: intentos + esperas no superan
+     `llm_call_deadline_seconds` (por defecto `request_timeout_seconds`).
+     Cada intento recibe como timeout el tiempo que queda.
+
+2. Hedging entre proveedores (opcional, `llm_hedge_provider`):
+   si el proveedor principal no responde dentro del percentil p de sus
+   latencias recientes, se lanza la misma operación en el proveedor
+   secundario y gana la primera respuesta válida. Si el principal falla por
+   un error transitorio (no disponible), el secundario actúa como fallback
+   inmediato; un error definitivo (400, JSON o esquema inválido) se propaga
+   sin pagarlo dos veces. Una respuesta del secundario lleva su proveedor en
+   `ANSWERED_BY_KEY` (ver AnalysisEnvelope.consume_token_usage).
+
+3. Streaming (`resilient_stream`): mismas reglas, pero un intento solo se
+   reintenta mientras no haya emitido texto (lo ya entregado al usuario no
+   se puede retirar); el plazo se aplica a la espera de cada fragmento.
+
+4. Un error transitorio que agota reintentos o plazo se propaga como
+   `LLMUnavailableError` (la API responde 503 con Retry-After), no como el
+   ValueError de validación (400) con que los clientes envuelven el resto.
+
+    analysis = await hedged_call(llm_client, "analyze_tdr", context)
+"""
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple
+import asyncio
+import logging
+import random
+import time
+
+import anthropic
+import httpx
+import openai
+from tenacity import AsyncRetrying, RetryCallState, retry_if_exception, stop_after_attempt
+
+from config import settings
+from .rate_limiter import rate_limiter
+from .token_budget import token_estimator
+
+logger = logging.getLogger(__name__)
+
+# 408 Request Timeout, 429 Too Many Requests, 5xx, 529 Overloaded (Anthropic)
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504, 529})
+
+_CONNECTION_ERRORS = (
+    openai.APIConnectionError,      # incluye APITimeoutError
+    anthropic.APIConnectionError,   # incluye APITimeoutError
+    httpx.TransportError,           # Gemini (google-genai usa httpx directamente)
+    ConnectionError,
+)
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """True si el error es transitorio y vale la pena reintentar."""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    # openai/anthropic: status_code; google-genai (errors.APIError): code
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS_CODES
+    return isinstance(exc, _CONNECTION_ERRORS)
+
+
+def _retry_after_seconds(exc: Optional[BaseException]) -> float:
+    """Segundos indicados por la cabecera Retry-After (0 si no hay)."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return 0.0
+    try:
+        return max(float(headers.get("retry-after", 0) or 0), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class LLMUnavailableError(Exception):
+    """El proveedor LLM no respondió (429, 5xx, timeout o conexión) tras agotar reintentos."""
+
+    def __init__(self, provider: str, model: str, cause: BaseException):
+        self.provider = provider
+        self.model = model
+        # Segundos sugeridos antes de reintentar (Retry-After del proveedor; 0 si no lo envió)
+        self.retry_after = _retry_after_seconds(cause)
+        detail = str(cause)[:200] or type(cause).__name__
+        super().__init__(f"{provider}/{model} no disponible temporalmente: {detail}")
+
+
+class Deadline:
+    """Plazo absoluto de una llamada (reloj monotónico)."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self._expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self._expires - time.monotonic(), 0.0)
+
+
+def call_deadline_seconds() -> float:
+    return settings.llm_call_deadline_seconds or float(settings.request_timeout_seconds)
+
+
+def _backoff_seconds(attempt_number: int, exc: Optional[BaseException]) -> float:
+    """Backoff exponencial con jitter completo; Retry-After del proveedor si es mayor."""
+    backoff = random.uniform(
+        0,
+        min(settings.llm_retry_max_wait_seconds,
+            settings.llm_retry_base_seconds * 2 ** (attempt_number - 1)),
+    )
+    return max(backoff, _retry_after_seconds(exc))
+
+
+async def resilient_call(
+    provider: str,
+    model: str,
+    estimated_tokens: int,
+    send: Callable[[], Awaitable],
+    extract_usage: Callable[[object], Dict],
+    prompt_chars: Optional[int] = None,
+    estimated_prompt_tokens: int = 0,
+):
+    """
+    Ejecuta `send()` con rate limiting, reintentos y plazo.
+
+    Cada intento reserva su propio cupo en el rate limiter (un reintento es
+    otra petición para el proveedor). El plazo empieza a correr cuando se
+    concede el primer cupo: la espera en la cola de prioridad no lo consume.
+
+    Con `prompt_chars` (prompts de solo texto), la estimación del prompt se
+    compara con el `prompt_tokens` real para calibrar el estimador.
+
+    Raises:
+        LLMUnavailableError si el último error era transitorio (o se agotó el plazo);
+        en otro caso, la excepción del proveedor.
+    """
+    deadline: Optional[Deadline] = None
+
+    def wait(retry_state: RetryCallState) -> float:
+        return _backoff_seconds(retry_state.attempt_number, retry_state.outcome.exception())
+
+    def stop_at_deadline(retry_state: RetryCallState) -> bool:
+        # Se evalúa después de calcular la espera: no dormir si no queda plazo para otro intento
+        return deadline is not None and deadline.remaining() <= (retry_state.upcoming_sleep or 0) + 1.0
+
+    def log_retry(retry_state: RetryCallState) -> None:
+        exc = retry_state.outcome.exception()
+        logger.warning(
+            f"🔁 {provider}/{model}: intento {retry_state.attempt_number} falló "
+            f"({type(exc).__name__}: {str(exc)[:120]}); reintento en {retry_state.upcoming_sleep:.1f}s"
+        )
+
+    retrying = AsyncRetrying(
+        retry=retry_if_exception(is_retryable_error),
+        wait=wait,
+        stop=stop_after_attempt(settings.llm_max_retries + 1) | stop_at_deadline,
+        before_sleep=log_retry,
+        reraise=True,
+    )
+    try:
+        async for attempt in retrying:
+            with attempt:
+                async with rate_limiter.slot(provider, model, estimated_tokens) as reservation:
+                    if deadline is None:
+                        deadline = Deadline(call_deadline_seconds())
+                    response = await asyncio.wait_for(send(), timeout=deadline.remaining())
+                    usage = extract_usage(response)
+                    reservation.record(usage)
+    except Exception as exc:
+        if is_retryable_error(exc):
+            raise LLMUnavailableError(provider, model, exc) from exc
+        raise
+    if prompt_chars:
+        token_estimator.observe(provider, prompt_chars, estimated_prompt_tokens, usage.get("prompt_tokens") or 0)
+    return response
+
+
+async def resilient_stream(
+    provider: str,
+    model: str,
+    estimated_tokens: int,
+    open_stream: Callable[[], Awaitable[AsyncIterator[Tuple[str, Optional[Dict]]]]],
+    usage: Dict,
+    prompt_chars: Optional[int] = None,
+    estimated_prompt_tokens: int = 0,
+) -> AsyncIterator[str]:
+    """
+    Versión streaming de `resilient_call`: produce los fragmentos de texto.
+
+    `open_stream()` abre la petición y devuelve un iterador asíncrono de
+    (texto, usage | None); el uso que informe el proveedor se acumula en
+    `usage` (dict del llamador) y al terminar ajusta la reserva del rate
+    limiter. El cupo se mantiene durante todo el stream.
+
+    Raises:
+        Como `resilient_call`. Si ya se emitió texto, sin reintentar.
+    """
+    deadline: Optional[Deadline] = None
+    attempt = 0
+    while True:
+        attempt += 1
+        emitted = False
+        try:
+            async with rate_limiter.slot(provider, model, estimated_tokens) as reservation:
+                if deadline is None:
+                    deadline = Deadline(call_deadline_seconds())
+                stream = await asyncio.wait_for(open_stream(), timeout=deadline.remaining())
+                try:
+                    while True:
+                        try:
+                            text, chunk_usage = await asyncio.wait_for(
+                                stream.__anext__(), timeout=deadline.remaining()
+                            )
+                        except StopAsyncIteration:
+                            break
+                        if chunk_usage:
+                            usage.update(chunk_usage)
+                        if text:
+                            emitted = True
+                            yield text
+                finally:
+                    aclose = getattr(stream, "aclose", None)
+                    if aclose is not None:
+                        await aclose()
+                reservation.record(usage)
+            break
+        except Exception as exc:
+            if not is_retryable_error(exc):
+                raise
+            if emitted or attempt > settings.llm_max_retries:
+                raise LLMUnavailableError(provider, model, exc) from exc
+            sleep = _backoff_seconds(attempt, exc)
+            if deadline is not None and deadline.remaining() <= sleep + 1.0:
+                raise LLMUnavailableError(provider, model, exc) from exc
+            logger.warning(
+                f"🔁 {provider}/{model}: stream {attempt} falló antes del primer fragmento "
+                f"({type(exc).__name__}: {str(exc)[:120]}); reintento en {sleep:.1f}s"
+            )
+            await asyncio.sleep(sleep)
+    if prompt_chars:
+        token_estimator.observe(provider, prompt_chars, estimated_prompt_tokens, usage.get("prompt_tokens") or 0)
+
+
+# Clave que marca en el dict de respuesta qué proveedor secundario respondió
+ANSWERED_BY_KEY = "_answered_by"
+
+
+def _warrants_fallback(exc: BaseException) -> bool:
+    """True si el fallo del principal justifica pedir lo mismo al secundario."""
+    return isinstance(exc, LLMUnavailableError) or is_retryable_error(exc)
+
+
+class LatencyTracker:
+    """Latencias recientes (ventana deslizante) por proveedor/operación."""
+
+    def __init__(self, window: int = 200):
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+        self._window = window
+
+    def record(self, provider: str, operation: str, seconds: float) -> None:
+        key = (provider, operation)
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self._window)
+        samples.append(seconds)
+
+    def percentile(self, provider: str, operation: str, pct: float) -> Optional[float]:
+        """Percentil `pct` (0-100) o None si aún no hay suficientes muestras."""
+        samples = self._samples.get((provider, operation))
+        if not samples or len(samples) < settings.llm_hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[index]
+
+
+latency_tracker = LatencyTracker()
+
+
+def _provider_of(client) -> str:
+    return type(client).__name__.replace("Client", "").lower()
+
+
+def _hedge_client(primary, operation: str):
+    """Cliente del proveedor secundario, o None si el hedging no aplica."""
+    hedge_provider = settings.llm_hedge_provider
+    if not hedge_provider or hedge_provider == _provider_of(primary):
+        return None
+    from .factory import LLMFactory  # import diferido: factory importa los clientes
+    try:
+        secondary = LLMFactory.create_client(hedge_provider)
+    except ValueError as e:
+        logger.warning(f"Hedging desactivado para {hedge_provider}: {e}")
+        return None
+    # Las operaciones multimodales (…_from_pdf) solo existen en algunos clientes
+    return secondary if hasattr(secondary, operation) else None
+
+
+async def _timed(client, operation: str, *args, **kwargs):
+    start = time.perf_counter()
+    result = await getattr(client, operation)(*args, **kwargs)
+    latency_tracker.record(_provider_of(client), operation, time.perf_counter() - start)
+    return result
+
+
+async def hedged_call(client, operation: str, *args, **kwargs):
+    """
+    Llama `client.<operation>(*args)`; con hedging configurado, acota la cola de latencia.
+
+    La espera antes de lanzar el secundario es el percentil
+    `llm_hedge_percentile` de las latencias recientes de esa operación en el
+    principal (o `llm_hedge_initial_delay_seconds` mientras no haya muestras).
+
+    Si responde el secundario, el dict de respuesta lleva `ANSWERED_BY_KEY`.
+    """
+    secondary = _hedge_client(client, operation)
+    if secondary is None:
+        return await _timed(client, operation, *args, **kwargs)
+
+    provider = _provider_of(client)
+    delay = latency_tracker.percentile(provider, operation, settings.llm_hedge_percentile)
+    if delay is None:
+        delay = settings.llm_hedge_initial_delay_seconds
+
+    primary_task = asyncio.create_task(_timed(client, operation, *args, **kwargs))
+    pending = {primary_task}
+    errors = []
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done:
+            if primary_task.exception() is None:
+                return primary_task.result()
+            if not _warrants_fallback(primary_task.exception()):
+                raise primary_task.exception()
+            errors.append(primary_task.exception())
+            logger.warning(
+                f"🛟 {provider}.{operation} falló ({errors[0]}); fallback a {_provider_of(secondary)}"
+            )
+        else:
+            logger.info(
+                f"🏁 {provider}.{operation} supera p{settings.llm_hedge_percentile:.0f} "
+                f"({delay:.1f}s); petición de cobertura a {_provider_of(secondary)}"
+            )
+        secondary_task = asyncio.create_task(_timed(secondary, operation, *args, **kwargs))
+        pending.add(secondary_task)
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    result = task.result()
+                    if task is secondary_task and isinstance(result, dict):
+                        result[ANSWERED_BY_KEY] = _provider_of(secondary)
+                    return result
+                errors.append(task.exception())
+    finally:
+        # La respuesta perdedora se descarta (sus tokens ya se consumieron en el proveedor)
+        for task in pending:
+            task.cancel()
+    raise errors[0]
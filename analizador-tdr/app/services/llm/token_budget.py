@@ -0,0 +1,137 @@
+"""
+Estimación local de tokens y presupuesto de contexto por proveedor/modelo.
+
+El contexto que se envía al LLM se mide en tokens (no en caracteres): cada
+proveedor tokeniza distinto y un mismo TDR en español puede costar un 20-30%
+más en un modelo que en otro. El estimador es una heurística rápida
+(caracteres / caracteres-por-token del proveedor) que se calibra sola: tras
+cada llamada de solo texto se compara la estimación con el `prompt_tokens`
+real que devuelve la API y se ajusta la razón con una media móvil.
+
+    budget = context_token_budget("anthropic")
+    tokens = token_estimator.estimate(context, "anthropic")
+"""
+from typing import Dict, Optional
+import logging
+import threading
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Razón inicial caracteres/token para texto en español (antes de calibrar)
+DEFAULT_CHARS_PER_TOKEN = {
+    "gemini": 4.0,
+    "openai": 3.6,
+    "anthropic": 3.3,
+}
+FALLBACK_CHARS_PER_TOKEN = 3.6
+
+# Peso de cada observación en la media móvil y tamaño mínimo para observar
+_EMA_ALPHA = 0.1
+_MIN_OBSERVED_CHARS = 500
+
+
+def prompt_chars(contents) -> Optional[int]:
+    """
+    Caracteres de texto de un prompt (str, mensajes, partes) o None si
+    incluye partes binarias (PDF adjunto): esos prompts no sirven para calibrar.
+    """
+    if contents is None:
+        return 0
+    if isinstance(contents, str):
+        return len(contents)
+    if isinstance(contents, (bytes, bytearray)):
+        return None
+    if isinstance(contents, dict):
+        parts = [contents.get("content"), contents.get("text")]
+        if contents.get("type") not in (None, "text"):
+            return None
+        return _sum_chars(parts)
+    if isinstance(contents, (list, tuple)):
+        return _sum_chars(contents)
+    text = getattr(contents, "text", None)
+    if isinstance(text, str):
+        return len(text)
+    return None
+
+
+def _sum_chars(parts) -> Optional[int]:
+    total = 0
+    for part in parts:
+        chars = prompt_chars(part)
+        if chars is None:
+            return None
+        total += chars
+    return total
+
+
+class TokenEstimator:
+    """Heurística caracteres/token por proveedor, calibrada con el uso real."""
+
+    def __init__(self):
+        self._chars_per_token: Dict[str, float] = dict(DEFAULT_CHARS_PER_TOKEN)
+        self._samples: Dict[str, int] = {}
+        self._error_sum: Dict[str, float] = {}
+        self._abs_error_sum: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def chars_per_token(self, provider: Optional[str] = None) -> float:
+        return self._chars_per_token.get(provider or "", FALLBACK_CHARS_PER_TOKEN)
+
+    def estimate(self, text: str, provider: Optional[str] = None) -> int:
+        """Tokens estimados de `text` para el proveedor (redondeo hacia arriba)."""
+        if not text:
+            return 0
+        return int(len(text) / self.chars_per_token(provider)) + 1
+
+    def observe(self, provider: str, chars: int, estimated_tokens: int, actual_tokens: int) -> None:
+        """
+        Registra una llamada de solo texto: estimación vs `prompt_tokens` real.
+
+        Actualiza la razón caracteres/token del proveedor (media móvil) y el
+        error acumulado que se expone en `stats()`.
+        """
+        if not actual_tokens or chars < _MIN_OBSERVED_CHARS:
+            return
+        error = (estimated_tokens - actual_tokens) / actual_tokens
+        with self._lock:
+            current = self.chars_per_token(provider)
+            self._chars_per_token[provider] = (1 - _EMA_ALPHA) * current + _EMA_ALPHA * (chars / actual_tokens)
+            self._samples[provider] = self._samples.get(provider, 0) + 1
+            self._error_sum[provider] = self._error_sum.get(provider, 0.0) + error
+            self._abs_error_sum[provider] = self._abs_error_sum.get(provider, 0.0) + abs(error)
+        if abs(error) > 0.25:
+            logger.info(
+                f"📐 {provider}: estimación de prompt {estimated_tokens} vs real {actual_tokens} "
+                f"({error:+.0%}); razón recalibrada a {self.chars_per_token(provider):.2f} chars/token"
+            )
+
+    def stats(self) -> Dict[str, Dict]:
+        """Razón actual y error medio de estimación (positivo = sobreestima) por proveedor."""
+        with self._lock:
+            return {
+                provider: {
+                    "chars_per_token": round(ratio, 3),
+                    "samples": self._samples.get(provider, 0),
+                    "mean_error_pct": round(100 * self._error_sum.get(provider, 0.0) / self._samples[provider], 1)
+                    if self._samples.get(provider) else None,
+                    "mean_abs_error_pct": round(100 * self._abs_error_sum.get(provider, 0.0) / self._samples[provider], 1)
+                    if self._samples.get(provider) else None,
+                }
+                for provider, ratio in self._chars_per_token.items()
+            }
+
+
+def context_token_budget(provider: Optional[str] = None) -> int:
+    """
+    Presupuesto de tokens del contexto RAG para el proveedor.
+
+    `<PROVEEDOR>_CONTEXT_TOKENS` si está configurado; si no,
+    `RAG_CONTEXT_MAX_TOKENS` (0 = sin límite).
+    """
+    return getattr(settings, f"{provider}_context_tokens", 0) or settings.rag_context_max_tokens
+
+
+# Instancia global
+token_estimator = TokenEstimator()
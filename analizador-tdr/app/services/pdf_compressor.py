@@ -0,0 +1,335 @@
+"""
+Compresión de PDFs que exceden el límite de tamaño del servicio.
+
+Las tareas son funciones de módulo (sin estado) para poder ejecutarse en el
+pool de procesos; `comprimir_documento` las orquesta desde el event loop:
+
+1. Limpieza + recompresión de streams (garbage=4, deflate).
+2. Muestreo: unas pocas páginas repartidas por el documento se rasterizan en
+   cada escalón (dpi, calidad JPEG); su tamaño medio estima el del documento
+   completo y se elige directamente el escalón más alto que cabe (antes se
+   reconstruía el documento entero a 150, 120, 100 y 80 dpi en serie).
+3. Rasterización del escalón elegido por rangos de páginas en paralelo y
+   ensamblado. Si la estimación se quedó corta, se baja al siguiente escalón.
+
+El resultado se cachea por SHA-256 + límite: el scraper re-envía el mismo
+TDR pesado varias veces al día. El "no cabe" solo se cachea si es definitivo
+(todos los pasos corrieron y dieron un resultado mayor al límite); un fallo
+(pool roto, memoria) no se recuerda y el siguiente envío lo reintenta.
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import io
+import logging
+import threading
+import time
+
+from config import settings
+
+try:
+    import fitz  # PyMuPDF
+    _HAS_FITZ = True
+except ImportError:
+    _HAS_FITZ = False
+
+logger = logging.getLogger(__name__)
+
+# Escalones (dpi, calidad JPEG) de mayor a menor calidad
+RASTER_STEPS: Tuple[Tuple[int, int], ...] = ((150, 70), (120, 70), (100, 70), (80, 70), (80, 50))
+# Páginas muestreadas para estimar el tamaño de cada escalón
+_SAMPLE_PAGES = 6
+# Bytes por página del PDF ensamblado además del JPEG (objetos, xref) + cabecera/trailer
+_PAGE_OVERHEAD_BYTES = 400
+_DOCUMENT_OVERHEAD_BYTES = 4096
+# Se elige el escalón cuya estimación deja este margen bajo el límite
+_ESTIMATE_MARGIN = 0.9
+# Páginas mínimas por rango al rasterizar en paralelo
+_MIN_PAGES_PER_SHARD = 4
+
+# (ancho_pt, alto_pt, jpeg) de una página rasterizada
+PaginaRasterizada = Tuple[float, float, bytes]
+
+
+# ============================================================================
+# TAREAS (se ejecutan dentro de los procesos del pool)
+# ============================================================================
+
+def comprimir_streams(pdf_bytes: bytes) -> Optional[bytes]:
+    """Limpieza y recompresión de streams; None si no reduce el tamaño (los fallos se propagan)."""
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        out = io.BytesIO()
+        doc.save(out, garbage=4, deflate=True)
+    finally:
+        doc.close()
+    comprimido = out.getvalue()
+    return comprimido if len(comprimido) < len(pdf_bytes) else None
+
+
+def muestrear_escalones(pdf_bytes: bytes) -> Tuple[int, List[int]]:
+    """
+    Rasteriza una muestra de páginas en cada escalón de RASTER_STEPS.
+
+    Returns:
+        (páginas del documento, tamaño estimado en bytes del PDF rasterizado
+        completo por escalón, en el orden de RASTER_STEPS).
+    """
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        page_count = doc.page_count
+        if page_count == 0:
+            return 0, [0] * len(RASTER_STEPS)
+        sample = min(page_count, _SAMPLE_PAGES)
+        indexes = sorted({round(i * (page_count - 1) / max(1, sample - 1)) for i in range(sample)})
+
+        max_dpi = max(dpi for dpi, _ in RASTER_STEPS)
+        sampled = [0] * len(RASTER_STEPS)
+        for index in indexes:
+            # Una sola rasterización por página; los dpi menores se obtienen
+            # escalando el pixmap (decodificar de nuevo un escaneo es lo caro)
+            full = doc[index].get_pixmap(dpi=max_dpi, colorspace=fitz.csRGB)
+            pixmaps: Dict[int, "fitz.Pixmap"] = {max_dpi: full}
+            for step, (dpi, calidad) in enumerate(RASTER_STEPS):
+                if dpi not in pixmaps:
+                    scale = dpi / max_dpi
+                    pixmaps[dpi] = fitz.Pixmap(full, round(full.width * scale), round(full.height * scale), None)
+                sampled[step] += len(pixmaps[dpi].tobytes("jpeg", jpg_quality=calidad))
+    finally:
+        doc.close()
+
+    estimaciones = [
+        int(total / len(indexes) * page_count) + page_count * _PAGE_OVERHEAD_BYTES + _DOCUMENT_OVERHEAD_BYTES
+        for total in sampled
+    ]
+    return page_count, estimaciones
+
+
+def rasterizar_paginas(pdf_bytes: bytes, start: int, stop: int, dpi: int, calidad: int) -> List[PaginaRasterizada]:
+    """Rasteriza las páginas [start, stop) a JPEG abriendo un documento propio."""
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        paginas = []
+        for index in range(start, min(stop, doc.page_count)):
+            page = doc[index]
+            pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB)
+            # Tamaño original de la página (en puntos): el JPEG conserva la resolución
+            paginas.append((page.rect.width, page.rect.height, pix.tobytes("jpeg", jpg_quality=calidad)))
+        return paginas
+    finally:
+        doc.close()
+
+
+def ensamblar_pdf(paginas: List[PaginaRasterizada]) -> bytes:
+    """PDF con una imagen JPEG por página (sin recodificar)."""
+    nuevo = fitz.open()
+    try:
+        for width, height, jpeg in paginas:
+            npage = nuevo.new_page(width=width, height=height)
+            npage.insert_image(npage.rect, stream=jpeg)
+        out = io.BytesIO()
+        nuevo.save(out, garbage=4, deflate=True)
+        return out.getvalue()
+    finally:
+        nuevo.close()
+
+
+def _plan_escalones(estimaciones: List[int], limite_bytes: float) -> List[int]:
+    """
+    Índices de RASTER_STEPS a intentar, en orden: desde el más alto cuya
+    estimación cabe con margen. Si ninguno cabe con margen, solo el último si
+    queda cerca del límite; si no, ninguno (no vale la pena rasterizar).
+    """
+    for step, estimado in enumerate(estimaciones):
+        if estimado <= limite_bytes * _ESTIMATE_MARGIN:
+            return list(range(step, len(estimaciones)))
+    if estimaciones and estimaciones[-1] <= limite_bytes / _ESTIMATE_MARGIN:
+        return [len(estimaciones) - 1]
+    return []
+
+
+def comprimir_pdf(pdf_bytes: bytes, limite_mb: float) -> bytes | None:
+    """
+    Comprime un PDF que excede el límite permitido (en un solo proceso).
+
+    Misma estrategia que `comprimir_documento`, sin paralelismo ni caché.
+    Devuelve los bytes comprimidos o None si no se pudo reducir al límite.
+    """
+    return _comprimir_pdf(pdf_bytes, limite_mb)[0]
+
+
+def _comprimir_pdf(pdf_bytes: bytes, limite_mb: float) -> Tuple[Optional[bytes], bool]:
+    """
+    `comprimir_pdf` que además informa si un None es definitivo.
+
+    Returns:
+        (bytes comprimidos o None, definitivo): definitivo es False si algún
+        paso falló con una excepción (el "no cabe" no debe cachearse).
+    """
+    limite_bytes = limite_mb * 1024 * 1024
+    if len(pdf_bytes) <= limite_bytes or not _HAS_FITZ:
+        return pdf_bytes, True
+
+    definitivo = True
+    try:
+        comprimido = comprimir_streams(pdf_bytes)
+    except Exception as e:
+        logger.warning(f"Compresión por streams falló: {e}")
+        comprimido, definitivo = None, False
+    if comprimido is not None and len(comprimido) <= limite_bytes:
+        _log_streams(pdf_bytes, comprimido)
+        return comprimido, True
+
+    try:
+        page_count, estimaciones = muestrear_escalones(pdf_bytes)
+    except Exception as e:
+        logger.warning(f"Muestreo de rasterización falló: {e}")
+        return None, False
+
+    for step in _plan_escalones(estimaciones, limite_bytes):
+        dpi, calidad = RASTER_STEPS[step]
+        try:
+            comprimido = ensamblar_pdf(rasterizar_paginas(pdf_bytes, 0, page_count, dpi, calidad))
+        except Exception as e:
+            logger.warning(f"Rasterización a {dpi}dpi falló: {e}")
+            definitivo = False
+            continue
+        if len(comprimido) <= limite_bytes:
+            _log_raster(pdf_bytes, comprimido, dpi, calidad, estimaciones[step])
+            return comprimido, True
+    return None, definitivo
+
+
+def _log_streams(pdf_bytes: bytes, comprimido: bytes) -> None:
+    logger.info(f"📦 PDF comprimido (streams): {len(pdf_bytes)/1048576:.1f}MB → {len(comprimido)/1048576:.1f}MB")
+
+
+def _log_raster(pdf_bytes: bytes, comprimido: bytes, dpi: int, calidad: int, estimado: int) -> None:
+    logger.info(
+        f"📦 PDF rasterizado a {dpi}dpi (JPEG q{calidad}): {len(pdf_bytes)/1048576:.1f}MB → "
+        f"{len(comprimido)/1048576:.1f}MB (estimado {estimado/1048576:.1f}MB)"
+    )
+
+
+# ============================================================================
+# ORQUESTACIÓN (se ejecuta en el event loop)
+# ============================================================================
+
+class CompressionCache:
+    """LRU de resultados de compresión por (SHA-256, límite). None = no cabe. Thread-safe."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Tuple[str, float], Optional[bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, float]) -> Tuple[bool, Optional[bytes]]:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return True, self._data[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: Tuple[str, float], value: Optional[bytes]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+compression_cache = CompressionCache(settings.compression_cache_entries)
+
+
+async def comprimir_documento(pdf_bytes: bytes, limite_mb: float) -> Optional[bytes]:
+    """
+    Comprime un PDF que excede el límite, repartiendo la rasterización entre
+    los procesos del pool y cacheando el resultado por SHA-256 + límite.
+
+    Devuelve los bytes comprimidos o None si no se pudo reducir al límite.
+    """
+    from app.services.document_executor import run_document_task
+    from app.services.document_spool import document_sha256
+
+    limite_bytes = limite_mb * 1024 * 1024
+    if len(pdf_bytes) <= limite_bytes or not _HAS_FITZ:
+        return pdf_bytes
+
+    key = (document_sha256(pdf_bytes), float(limite_mb))
+    found, cached = compression_cache.get(key)
+    if found:
+        logger.info(f"♻️  Compresión reutilizada ({key[0][:12]}…) — sin re-rasterizar")
+        return cached
+
+    start = time.perf_counter()
+    if settings.document_pool_size <= 1:
+        # Sin procesos en paralelo (PyMuPDF no paraleliza en hilos): una sola tarea
+        comprimido, definitivo = await run_document_task(_comprimir_pdf, pdf_bytes, limite_mb)
+    else:
+        comprimido, definitivo = await _comprimir_en_paralelo(pdf_bytes, limite_bytes)
+    logger.info(
+        f"📦 Compresión {'OK' if comprimido is not None else 'sin éxito'} en "
+        f"{time.perf_counter() - start:.1f}s ({len(pdf_bytes)/1048576:.1f}MB, límite {limite_mb}MB)"
+    )
+    if comprimido is not None or definitivo:
+        compression_cache.put(key, comprimido)
+    return comprimido
+
+
+async def _comprimir_en_paralelo(pdf_bytes: bytes, limite_bytes: float) -> Tuple[Optional[bytes], bool]:
+    """
+    Streams y muestreo en paralelo; luego el escalón elegido por rangos de páginas.
+
+    Returns:
+        Como `_comprimir_pdf`: (bytes comprimidos o None, definitivo).
+    """
+    from app.services.document_executor import run_document_task
+    from app.services.pdf_reader import DocumentParser
+
+    streams, muestreo = await asyncio.gather(
+        run_document_task(comprimir_streams, pdf_bytes),
+        run_document_task(muestrear_escalones, pdf_bytes),
+        return_exceptions=True,
+    )
+    if isinstance(streams, bytes) and len(streams) <= limite_bytes:
+        _log_streams(pdf_bytes, streams)
+        return streams, True
+    definitivo = not isinstance(streams, BaseException)
+    if not definitivo:
+        logger.warning(f"Compresión por streams falló: {streams}")
+    if isinstance(muestreo, BaseException):
+        logger.warning(f"Muestreo de rasterización falló: {muestreo}")
+        return None, False
+
+    page_count, estimaciones = muestreo
+    ranges = DocumentParser.plan_shards(
+        page_count,
+        max_shards=settings.document_pool_size,
+        min_pages_per_shard=_MIN_PAGES_PER_SHARD,
+    )
+    for step in _plan_escalones(estimaciones, limite_bytes):
+        dpi, calidad = RASTER_STEPS[step]
+        try:
+            shards = await asyncio.gather(*(
+                run_document_task(rasterizar_paginas, pdf_bytes, shard_start, shard_stop, dpi, calidad)
+                for shard_start, shard_stop in ranges
+            ))
+            comprimido = await run_document_task(ensamblar_pdf, [pagina for shard in shards for pagina in shard])
+        except Exception as e:
+            logger.warning(f"Rasterización a {dpi}dpi falló: {e}")
+            definitivo = False
+            continue
+        if len(comprimido) <= limite_bytes:
+            _log_raster(pdf_bytes, comprimido, dpi, calidad, estimaciones[step])
+            return comprimido, True
+    return None, definitivo
@@ -3,13 +3,10 @@ Servicio de procesamiento de PDF.
 Delega la extracción al pipeline SmartPDFReader (texto + tablas + OCR de imágenes).
 Mantiene la interfaz pública original para no romper el pipeline existente.
 """
-import fitz  # PyMuPDF
-import io
-from typing import Optional
 import logging
 
 from config import settings
-from app.services.pdf_reader import SmartPDFReaderPipeline
+from app.services.pdf_reader import SmartPDFReaderPipeline, DocumentProbe, DocumentContent, MergedDocument
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +29,9 @@ class PDFProcessorService:
             ocr_enabled=getattr(settings, "ocr_enabled", True),
             table_extraction_enabled=getattr(settings, "table_extraction_enabled", True),
             min_image_size=getattr(settings, "min_image_size_bytes", 5_000),
+            scanned_page_dpi=getattr(settings, "scanned_page_ocr_dpi", 200),
+            ocr_workers=getattr(settings, "ocr_workers", 0),
+            ocr_deadline_seconds=getattr(settings, "ocr_deadline_seconds", 0),
         )
 
     def extract_text_from_pdf(self, pdf_bytes: bytes) -> str:
@@ -60,6 +60,55 @@ class PDFProcessorService:
             self.logger.error(f"Error inesperado al procesar PDF: {str(e)}")
             raise ValueError(f"Error al procesar PDF: {str(e)}")
 
+    def extract_text_from_document(self, doc) -> str:
+        """
+        Igual que `extract_text_from_pdf()` pero sobre un documento fitz ya
+        abierto (reutiliza el handle de DocumentProbe). No cierra el documento.
+
+        Raises:
+            ValueError: Si el PDF no contiene contenido extraíble
+        """
+        return self.extract_merged_from_document(doc).text
+
+    def extract_merged_from_document(self, doc) -> MergedDocument:
+        """
+        Como `extract_text_from_document()`, con la procedencia de cada bloque.
+
+        Returns:
+            MergedDocument: texto fusionado + spans de bloques (página, bbox)
+
+        Raises:
+            ValueError: Si el PDF no contiene contenido extraíble
+        """
+        try:
+            self.logger.info("Extrayendo contenido con SmartPDFReaderPipeline (documento abierto)...")
+            return self._pipeline.extract_merged_from_document(doc)
+
+        except ValueError:
+            raise
+
+        except Exception as e:
+            self.logger.error(f"Error inesperado al procesar PDF: {str(e)}")
+            raise ValueError(f"Error al procesar PDF: {str(e)}")
+
+    def parse_page_range(self, pdf_bytes: bytes, start: int, stop: int) -> DocumentContent:
+        """
+        Parsea solo las páginas [start, stop) (0-indexed) — modo fragmentado.
+
+        Returns:
+            DocumentContent parcial (datos planos, picklables).
+        """
+        return self._pipeline.extract_range(pdf_bytes, start, stop)
+
+    def merge_document(self, document: DocumentContent) -> MergedDocument:
+        """
+        Fusiona un DocumentContent (unión de fragmentos) en el texto final + spans.
+
+        Raises:
+            ValueError: Si el documento no contiene contenido extraíble
+        """
+        return self._pipeline.merge_structured_document(document)
+
     def extract_metadata(self, pdf_bytes: bytes) -> dict:
         """
         Extrae metadatos del PDF (opcional para futuros análisis).
@@ -71,24 +120,8 @@ class PDFProcessorService:
         Returns:
             dict: Metadatos del PDF
         """
-        try:
-            # Crear stream en memoria
-            pdf_stream = io.BytesIO(pdf_bytes)
-            doc = fitz.open(stream=pdf_stream, filetype="pdf")
-
-            metadata = {
-                "num_pages": len(doc),
-                "title": doc.metadata.get("title", ""),
-                "author": doc.metadata.get("author", ""),
-                "subject": doc.metadata.get("subject", ""),
-                "creator": doc.metadata.get("creator", ""),
-                "producer": doc.metadata.get("producer", ""),
-            }
-
-            doc.close()
-            pdf_stream.close()
-            return metadata
-
-        except Exception as e:
-            self.logger.warning(f"No se pudieron extraer metadatos: {str(e)}")
+        probe = DocumentProbe().probe_bytes(pdf_bytes)
+        if not probe.opened:
+            self.logger.warning("No se pudieron extraer metadatos: PDF ilegible")
             return {}
+        return probe.metadata
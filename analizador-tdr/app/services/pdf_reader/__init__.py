@@ -22,15 +22,28 @@ from .contracts import (
     ContentBlock,
     PageContent,
     DocumentContent,
+    BlockSpan,
+    MergedDocument,
     BlockExtractorContract,
     OCRProcessorContract,
 )
 from .document_parser import DocumentParser
 from .text_extractor import TextBlockExtractor
 from .image_extractor import ImageBlockExtractor
+from .scanned_page_extractor import ScannedPageOCRExtractor
 from .table_extractor import TableBlockExtractor
-from .ocr_processor import TesseractOCRProcessor, NullOCRProcessor
+from .ocr_processor import TesseractOCRProcessor, PooledTesseractOCRProcessor, NullOCRProcessor, wait_for_ocr
 from .content_merger import ContentMerger
+from .document_probe import (
+    DocumentProbe,
+    ProbeResult,
+    PageProbe,
+    ImageInfo,
+    ROUTE_NATIVE,
+    ROUTE_MULTIMODAL,
+    ROUTE_HYBRID,
+)
+from .page_selector import PageSelector, PageSelection, PageScore, GEMINI_TOKENS_PER_PAGE
 
 logger = logging.getLogger(__name__)
 
@@ -48,34 +61,51 @@ class SmartPDFReaderPipeline:
         ocr_enabled: bool = True,
         table_extraction_enabled: bool = True,
         min_image_size: int = 5_000,
+        scanned_page_dpi: int = ScannedPageOCRExtractor.DEFAULT_DPI,
+        ocr_workers: int = 0,
+        ocr_deadline_seconds: float = 0,
     ):
         """
         Args:
-            ocr_enabled: Si True, intenta usar Tesseract OCR para imágenes.
+            ocr_enabled: Si True, intenta usar Tesseract OCR para imágenes y
+                para las páginas escaneadas de documentos mixtos.
             table_extraction_enabled: Si True, detecta y extrae tablas.
             min_image_size: Bytes mínimos para considerar una imagen relevante.
+            scanned_page_dpi: Resolución del render de páginas escaneadas para OCR.
+            ocr_workers: Workers de Tesseract de larga vida (imágenes en paralelo);
+                0 = pytesseract, un proceso por imagen y en serie.
+            ocr_deadline_seconds: Plazo por documento para el OCR; 0 = sin plazo.
         """
-        ocr_processor: OCRProcessorContract = (
-            TesseractOCRProcessor() if ocr_enabled else NullOCRProcessor()
-        )
+        ocr_processor: OCRProcessorContract
+        if not ocr_enabled:
+            ocr_processor = NullOCRProcessor()
+        elif ocr_workers > 0:
+            ocr_processor = PooledTesseractOCRProcessor(workers=ocr_workers)
+        else:
+            ocr_processor = TesseractOCRProcessor()
 
         extractors = [TextBlockExtractor()]
 
         if table_extraction_enabled:
             extractors.append(TableBlockExtractor())
 
+        # Páginas escaneadas completas: OCR de la página entera (no de cada imagen)
+        page_ocr = ScannedPageOCRExtractor(ocr_processor, dpi=scanned_page_dpi)
+        extractors.append(page_ocr)
+
         extractors.append(ImageBlockExtractor(
             ocr_processor=ocr_processor,
             min_image_size=min_image_size,
+            skip_page=page_ocr.handles,
         ))
 
-        self._parser = DocumentParser(extractors)
+        self._parser = DocumentParser(extractors, deadline_seconds=ocr_deadline_seconds)
         self._merger = ContentMerger()
 
         logger.info(
             f"SmartPDFReaderPipeline inicializado: "
             f"{len(extractors)} extractores, "
-            f"OCR={'ON' if ocr_enabled else 'OFF'}, "
+            f"OCR={'OFF' if not ocr_enabled else f'{ocr_workers} workers' if ocr_workers > 0 else 'ON'}, "
             f"Tablas={'ON' if table_extraction_enabled else 'OFF'}"
         )
 
@@ -92,16 +122,62 @@ class SmartPDFReaderPipeline:
         Raises:
             ValueError: Si el PDF no contiene contenido extraíble.
         """
-        document = self._parser.parse(pdf_bytes)
-        merged_text = self._merger.merge(document)
+        doc = DocumentProbe.open(pdf_bytes)
+        try:
+            return self.extract_from_document(doc)
+        finally:
+            doc.close()
+
+    def extract_from_document(self, doc) -> str:
+        """
+        Igual que `extract()` pero sobre un documento fitz ya abierto
+        (p. ej. el handle usado por DocumentProbe). No cierra el documento.
+
+        Raises:
+            ValueError: Si el PDF no contiene contenido extraíble.
+        """
+        return self.merge_structured(self._parser.parse_document(doc))
+
+    def extract_merged_from_document(self, doc) -> MergedDocument:
+        """
+        Igual que `extract_from_document()`, con la procedencia de cada bloque
+        (ver `ContentMerger.merge_with_spans`).
+
+        Raises:
+            ValueError: Si el PDF no contiene contenido extraíble.
+        """
+        return self.merge_structured_document(self._parser.parse_document(doc))
+
+    def extract_range(self, pdf_bytes: bytes, start: int, stop: int) -> DocumentContent:
+        """
+        Parsea solo las páginas [start, stop) (modo fragmentado).
+        El texto final se obtiene con `merge_structured()` tras unir los fragmentos.
+        """
+        return self._parser.parse_range(pdf_bytes, start, stop)
+
+    def merge_structured(self, document: DocumentContent) -> str:
+        """
+        Fusiona un DocumentContent (p. ej. la unión de fragmentos) en texto.
+
+        Raises:
+            ValueError: Si el documento no contiene contenido extraíble.
+        """
+        return self.merge_structured_document(document).text
+
+    def merge_structured_document(self, document: DocumentContent) -> MergedDocument:
+        """
+        Fusiona un DocumentContent en texto + spans de bloques.
 
-        if not merged_text.strip():
+        Raises:
+            ValueError: Si el documento no contiene contenido extraíble.
+        """
+        merged = self._merger.merge_with_spans(document)
+        if not merged.text.strip():
             raise ValueError(
                 "El PDF no contiene contenido extraíble "
                 "(puede ser un PDF escaneado sin OCR disponible)"
             )
-
-        return merged_text
+        return merged
 
     def extract_structured(self, pdf_bytes: bytes) -> DocumentContent:
         """
@@ -124,15 +200,33 @@ __all__ = [
     "ContentBlock",
     "PageContent",
     "DocumentContent",
+    "BlockSpan",
+    "MergedDocument",
     "BlockExtractorContract",
     "OCRProcessorContract",
     # Extractores (por si se necesitan individualmente)
     "TextBlockExtractor",
     "ImageBlockExtractor",
+    "ScannedPageOCRExtractor",
     "TableBlockExtractor",
     "TesseractOCRProcessor",
+    "PooledTesseractOCRProcessor",
     "NullOCRProcessor",
+    "wait_for_ocr",
     # Parser y Merger
     "DocumentParser",
     "ContentMerger",
+    # Sondeo de una sola apertura
+    "DocumentProbe",
+    "ProbeResult",
+    "PageProbe",
+    "ImageInfo",
+    "ROUTE_NATIVE",
+    "ROUTE_MULTIMODAL",
+    "ROUTE_HYBRID",
+    # Selección de páginas para el envío multimodal
+    "PageSelector",
+    "PageSelection",
+    "PageScore",
+    "GEMINI_TOKENS_PER_PAGE",
 ]
@@ -5,7 +5,7 @@ Ensambla los bloques de texto, imágenes y tablas en un documento final unificad
 from typing import List
 import logging
 
-from .contracts import DocumentContent, ContentBlock, BlockType
+from .contracts import DocumentContent, ContentBlock, BlockType, BlockSpan, MergedDocument
 
 logger = logging.getLogger(__name__)
 
@@ -35,14 +35,31 @@ class ContentMerger:
         Returns:
             Texto unificado del documento completo.
         """
+        return self.merge_with_spans(document).text
+
+    def merge_with_spans(self, document: DocumentContent) -> MergedDocument:
+        """
+        Igual que `merge()`, pero además registra dónde quedó cada bloque en el
+        texto fusionado (offsets, página, bbox). El chunker del RAG usa estos
+        spans para cortar por bloques y citar páginas sin volver a copiar texto.
+        """
         parts: List[str] = []
+        spans: List[BlockSpan] = []
+        position = 0   # offset del siguiente part en "\n".join(parts)
         total_chars = 0
 
+        def append(part: str) -> int:
+            nonlocal position
+            start = position
+            parts.append(part)
+            position += len(part) + 1  # + "\n" del join
+            return start
+
         for page in document.pages:
             if not page.blocks:
                 continue
 
-            parts.append(f"\n--- Página {page.page_number} ---\n")
+            append(f"\n--- Página {page.page_number} ---\n")
 
             # Ordenar bloques por posición vertical (y0) para lectura natural
             sorted_blocks = self._sort_blocks_by_position(page.blocks)
@@ -50,11 +67,25 @@ class ContentMerger:
             for block in sorted_blocks:
                 separator = self._BLOCK_SEPARATORS.get(block.block_type, "")
                 if separator:
-                    parts.append(separator)
-                parts.append(block.content)
+                    append(separator)
+                start = append(block.content)
+                spans.append(BlockSpan(
+                    start=start,
+                    end=start + len(block.content),
+                    page_number=block.page_number,
+                    block_type=block.block_type,
+                    bbox=block.bbox,
+                ))
                 total_chars += len(block.content)
 
-        merged = "\n".join(parts).strip()
+        joined = "\n".join(parts)
+        merged = joined.strip()
+        # strip() solo recorta el inicio: desplazar los offsets
+        shift = len(joined) - len(joined.lstrip())
+        if shift:
+            for span in spans:
+                span.start = max(span.start - shift, 0)
+                span.end = min(max(span.end - shift, 0), len(merged))
 
         # Estadísticas
         text_blocks = sum(
@@ -76,7 +107,7 @@ class ContentMerger:
             f"texto: {text_blocks}, imágenes: {image_blocks}, tablas: {table_blocks}"
         )
 
-        return merged
+        return MergedDocument(text=merged, spans=spans)
 
     @staticmethod
     def _sort_blocks_by_position(blocks: List[ContentBlock]) -> List[ContentBlock]:
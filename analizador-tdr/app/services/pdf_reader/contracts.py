@@ -3,6 +3,7 @@ Contratos e interfaces para el módulo PDF Reader.
 Define las abstracciones que cumplan SRP, ISP y DIP (SOLID).
 """
 from abc import ABC, abstractmethod
+from concurrent.futures import Future
 from dataclasses import dataclass, field
 from typing import List, Optional
 from enum import Enum
@@ -40,6 +41,23 @@ class DocumentContent:
     total_pages: int = 0
 
 
+@dataclass
+class BlockSpan:
+    """Posición de un ContentBlock dentro del texto fusionado: text[start:end]."""
+    start: int
+    end: int
+    page_number: int
+    block_type: BlockType
+    bbox: Optional[tuple] = None
+
+
+@dataclass
+class MergedDocument:
+    """Texto fusionado + procedencia (página, bbox, tipo) de cada bloque."""
+    text: str
+    spans: List[BlockSpan] = field(default_factory=list)
+
+
 class BlockExtractorContract(ABC):
     """
     Interfaz para extractores de bloques de contenido (ISP).
@@ -60,6 +78,17 @@ class BlockExtractorContract(ABC):
         """
         pass
 
+    def finalize(self, document: "DocumentContent", deadline: Optional[float]) -> None:
+        """
+        Completa los bloques diferidos de este extractor (p. ej. OCR enviado a
+        un pool) una vez recorridas todas las páginas del documento.
+
+        Args:
+            document: Contenido ya extraído (se modifica en sitio).
+            deadline: Instante (time.monotonic()) límite del documento; None = sin límite.
+        """
+        return None
+
 
 class OCRProcessorContract(ABC):
     """
@@ -84,3 +113,17 @@ class OCRProcessorContract(ABC):
             Texto extraído o None si falla.
         """
         pass
+
+    def submit(self, image_bytes: bytes) -> "Future[Optional[str]]":
+        """
+        OCR asíncrono: retorna un Future con el texto (o None).
+
+        Por defecto se resuelve en el acto con extract_text(); los motores con
+        workers propios lo sobrescriben para procesar imágenes en paralelo.
+        """
+        future: "Future[Optional[str]]" = Future()
+        try:
+            future.set_result(self.extract_text(image_bytes))
+        except Exception as e:
+            future.set_exception(e)
+        return future
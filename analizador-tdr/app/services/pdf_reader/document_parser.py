@@ -2,16 +2,16 @@
 Parser principal de documentos PDF.
 Abre el PDF y delega la extracción a los extractores registrados (OCP).
 """
-import fitz  # PyMuPDF
-import io
 import logging
-from typing import List
+import time
+from typing import List, Optional, Tuple
 
 from .contracts import (
     BlockExtractorContract,
     DocumentContent,
     PageContent,
 )
+from .document_probe import DocumentProbe
 
 logger = logging.getLogger(__name__)
 
@@ -25,12 +25,15 @@ class DocumentParser:
 
     Args:
         extractors: Lista de extractores de bloques (inyectados por DIP).
+        deadline_seconds: Plazo por documento para completar los bloques
+            diferidos (OCR en paralelo); 0 = sin plazo.
     """
 
-    def __init__(self, extractors: List[BlockExtractorContract]):
+    def __init__(self, extractors: List[BlockExtractorContract], deadline_seconds: float = 0):
         if not extractors:
             raise ValueError("Se requiere al menos un extractor de bloques")
         self._extractors = extractors
+        self._deadline_seconds = deadline_seconds
 
     def parse(self, pdf_bytes: bytes) -> DocumentContent:
         """
@@ -45,20 +48,53 @@ class DocumentParser:
         Raises:
             ValueError: Si el PDF está corrupto o no se puede abrir.
         """
+        doc = DocumentProbe.open(pdf_bytes)
         try:
-            pdf_stream = io.BytesIO(pdf_bytes)
-            doc = fitz.open(stream=pdf_stream, filetype="pdf")
-        except fitz.FileDataError as e:
-            raise ValueError(f"El archivo no es un PDF válido o está corrupto: {e}")
-        except Exception as e:
-            raise ValueError(f"Error al abrir el PDF: {e}")
+            return self.parse_document(doc)
+        finally:
+            doc.close()
 
+    def parse_range(self, pdf_bytes: bytes, start: int, stop: int) -> DocumentContent:
+        """
+        Parsea solo las páginas [start, stop) (0-indexed) de un PDF.
+
+        Usado por el modo fragmentado (sharding): cada worker abre su propio
+        documento a partir de los mismos bytes y parsea un rango de páginas.
+
+        Raises:
+            ValueError: Si el PDF está corrupto o no se puede abrir.
+        """
+        doc = DocumentProbe.open(pdf_bytes)
+        try:
+            return self.parse_document(doc, range(start, min(stop, len(doc))))
+        finally:
+            doc.close()
+
+    def parse_document(self, doc, page_range: Optional[range] = None) -> DocumentContent:
+        """
+        Parsea un documento fitz ya abierto (no lo cierra).
+
+        Permite reutilizar el handle abierto por DocumentProbe y evitar
+        abrir los mismos bytes dos veces.
+
+        Args:
+            doc: Documento fitz.Document abierto.
+            page_range: Páginas a parsear (0-indexed). None = todas.
+
+        Returns:
+            DocumentContent con bloques extraídos de las páginas indicadas.
+        """
         num_pages = len(doc)
         document = DocumentContent(total_pages=num_pages)
+        deadline = time.monotonic() + self._deadline_seconds if self._deadline_seconds > 0 else None
+        pages_to_parse = page_range if page_range is not None else range(num_pages)
 
-        logger.info(f"Parseando PDF: {num_pages} páginas, {len(self._extractors)} extractores")
+        logger.info(
+            f"Parseando PDF: {len(pages_to_parse)}/{num_pages} páginas, "
+            f"{len(self._extractors)} extractores"
+        )
 
-        for page_num in range(num_pages):
+        for page_num in pages_to_parse:
             page = doc.load_page(page_num)
             page_content = PageContent(page_number=page_num + 1)
 
@@ -74,6 +110,13 @@ class DocumentParser:
 
             document.pages.append(page_content)
 
+        # Bloques diferidos (OCR enviado a los workers mientras se recorrían las páginas)
+        for extractor in self._extractors:
+            try:
+                extractor.finalize(document, deadline)
+            except Exception as e:
+                logger.warning(f"Error completando {type(extractor).__name__}: {e}")
+
         # Metadatos del documento
         try:
             document.metadata = {
@@ -85,10 +128,49 @@ class DocumentParser:
         except Exception:
             pass
 
-        doc.close()
-        pdf_stream.close()
-
         total_blocks = sum(len(p.blocks) for p in document.pages)
-        logger.info(f"PDF parseado: {num_pages} páginas, {total_blocks} bloques totales")
+        logger.info(f"PDF parseado: {len(pages_to_parse)} páginas, {total_blocks} bloques totales")
 
         return document
+
+    @staticmethod
+    def plan_shards(num_pages: int, max_shards: int, min_pages_per_shard: int = 1) -> List[Tuple[int, int]]:
+        """
+        Divide [0, num_pages) en rangos contiguos y balanceados.
+
+        Args:
+            num_pages: Total de páginas del documento.
+            max_shards: Máximo de fragmentos a generar.
+            min_pages_per_shard: Mínimo de páginas por fragmento.
+
+        Returns:
+            Lista de tuplas (start, stop) en orden de página.
+        """
+        if num_pages <= 0:
+            return []
+        shards = max(1, min(max_shards, num_pages // max(1, min_pages_per_shard)))
+        base, extra = divmod(num_pages, shards)
+        ranges, start = [], 0
+        for i in range(shards):
+            stop = start + base + (1 if i < extra else 0)
+            ranges.append((start, stop))
+            start = stop
+        return ranges
+
+    @staticmethod
+    def merge_shards(shards: List[DocumentContent]) -> DocumentContent:
+        """
+        Une los DocumentContent parciales del modo fragmentado.
+
+        Conserva el contrato de `parse()`: páginas en orden, total_pages y metadatos.
+        """
+        if not shards:
+            return DocumentContent()
+        merged = DocumentContent(
+            total_pages=shards[0].total_pages,
+            metadata=shards[0].metadata,
+        )
+        for shard in shards:
+            merged.pages.extend(shard.pages)
+        merged.pages.sort(key=lambda p: p.page_number)
+        return merged
@@ -0,0 +1,228 @@
+"""
+Sondeo de un PDF en una sola apertura.
+
+Calcula en una pasada todo lo que el analizador necesita para decidir la ruta
+(multimodal, texto nativo o híbrida): número de páginas, densidad de
+caracteres por página, clasificación escaneado/nativo por página, metadatos e
+inventario de imágenes.
+El documento abierto puede reutilizarse después por el DocumentParser, de modo
+que los bytes se abren con fitz una sola vez por petición.
+"""
+from dataclasses import dataclass, field
+from typing import List
+import logging
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+# Umbral de caracteres nativos por página por debajo del cual se considera escaneado
+MIN_CHARS_PER_PAGE = 200
+# Fracción del área de la página que deben cubrir sus imágenes para ser un escaneo
+# (un logo en la carátula o una firma escaneada no convierten la página en escaneo)
+SCANNED_MIN_IMAGE_COVERAGE = 0.6
+# PDFs con más páginas que esto van directo a multimodal (si el proveedor lo soporta)
+MAX_NATIVE_PAGES = 20
+# Con al menos esta proporción de páginas escaneadas el documento va entero a multimodal;
+# por debajo, las páginas nativas van por texto y solo las escaneadas se cubren aparte
+HYBRID_MAX_SCANNED_RATIO = 0.5
+
+# Rutas por documento (ProbeResult.route)
+ROUTE_NATIVE = "native"
+ROUTE_MULTIMODAL = "multimodal"
+ROUTE_HYBRID = "hybrid"
+
+
+@dataclass
+class PageProbe:
+    """Resultado del sondeo de una página."""
+    page_number: int
+    char_count: int
+    image_count: int
+    # Fracción del área de la página cubierta por imágenes (0-1)
+    image_coverage: float = 0.0
+
+    @property
+    def is_scanned(self) -> bool:
+        """Página sin texto nativo suficiente cubierta casi entera por imágenes (escaneo)."""
+        return (
+            self.char_count < MIN_CHARS_PER_PAGE
+            and self.image_count > 0
+            and self.image_coverage >= SCANNED_MIN_IMAGE_COVERAGE
+        )
+
+
+def page_image_coverage(page, page_images=None) -> float:
+    """
+    Fracción del área de la página cubierta por sus imágenes (0-1).
+
+    Suma las áreas visibles (recortadas a la página) de cada aparición de cada
+    imagen; los solapamientos se cuentan dos veces, por eso se satura en 1.
+    """
+    page_rect = page.rect
+    page_area = abs(page_rect)
+    if not page_area:
+        return 0.0
+    if page_images is None:
+        page_images = page.get_images(full=True)
+    covered = 0.0
+    for xref in {img[0] for img in page_images}:
+        try:
+            rects = page.get_image_rects(xref)
+        except Exception:
+            continue
+        covered += sum(abs(rect & page_rect) for rect in rects)
+    return min(covered / page_area, 1.0)
+
+
+@dataclass
+class ImageInfo:
+    """Entrada del inventario de imágenes del documento."""
+    page_number: int
+    xref: int
+    width: int
+    height: int
+
+
+@dataclass
+class ProbeResult:
+    """Datos planos (picklables) obtenidos del sondeo del documento."""
+    page_count: int = 0
+    total_chars: int = 0
+    pages: List[PageProbe] = field(default_factory=list)
+    images: List[ImageInfo] = field(default_factory=list)
+    metadata: dict = field(default_factory=dict)
+    opened: bool = True
+
+    @property
+    def chars_per_page(self) -> float:
+        return self.total_chars / max(self.page_count, 1)
+
+    @property
+    def is_scanned(self) -> bool:
+        """Clasificación global: promedio de caracteres por página bajo el umbral."""
+        return self.chars_per_page < MIN_CHARS_PER_PAGE
+
+    @property
+    def scanned_pages(self) -> List[int]:
+        """Páginas (1-based) clasificadas como escaneadas."""
+        return [page.page_number for page in self.pages if page.is_scanned]
+
+    def route(self) -> str:
+        """
+        Ruta por páginas en lugar de una clasificación global:
+
+        - Sin páginas escaneadas: texto nativo, o multimodal si el documento es
+          muy grande o casi no tiene texto (criterio original).
+        - Mayoría de páginas escaneadas: multimodal (el documento es un escaneo).
+        - Mezcla: híbrida — las páginas nativas por texto, las escaneadas por
+          OCR local o una transcripción multimodal solo de esas páginas.
+        """
+        scanned = len(self.scanned_pages)
+        if not scanned:
+            if self.is_scanned or self.page_count > MAX_NATIVE_PAGES:
+                return ROUTE_MULTIMODAL
+            return ROUTE_NATIVE
+        if scanned / max(self.page_count, 1) >= HYBRID_MAX_SCANNED_RATIO:
+            return ROUTE_MULTIMODAL
+        return ROUTE_HYBRID
+
+    def prefers_multimodal(self) -> bool:
+        """True si el documento debe ir directo a multimodal (ver route())."""
+        return self.route() == ROUTE_MULTIMODAL
+
+
+class DocumentProbe:
+    """
+    Abre un PDF una sola vez y lo sondea en una pasada (SRP).
+
+    Uso:
+        doc = DocumentProbe.open(pdf_bytes)
+        probe = DocumentProbe().probe(doc)
+        ...  # reutilizar `doc` en DocumentParser.parse_document(doc)
+        doc.close()
+    """
+
+    @staticmethod
+    def open(pdf_bytes: bytes):
+        """
+        Abre los bytes como PDF.
+
+        Raises:
+            ValueError: Si el archivo no es un PDF válido.
+        """
+        try:
+            return fitz.open(stream=pdf_bytes, filetype="pdf")
+        except fitz.FileDataError as e:
+            raise ValueError(f"El archivo no es un PDF válido o está corrupto: {e}")
+        except Exception as e:
+            raise ValueError(f"Error al abrir el PDF: {e}")
+
+    def probe(self, doc) -> ProbeResult:
+        """Sondea un documento ya abierto (no lo cierra)."""
+        result = ProbeResult(page_count=len(doc))
+
+        for page_index in range(result.page_count):
+            page = doc.load_page(page_index)
+            page_number = page_index + 1
+
+            try:
+                char_count = len(page.get_text())
+            except Exception as e:
+                logger.debug(f"Sondeo: texto ilegible en página {page_number}: {e}")
+                char_count = 0
+
+            try:
+                page_images = page.get_images(full=True)
+            except Exception:
+                page_images = []
+
+            for img in page_images:
+                result.images.append(ImageInfo(
+                    page_number=page_number,
+                    xref=img[0],
+                    width=img[2],
+                    height=img[3],
+                ))
+
+            # La cobertura solo decide en páginas con poco texto: las demás no la calculan
+            image_coverage = 0.0
+            if page_images and char_count < MIN_CHARS_PER_PAGE:
+                try:
+                    image_coverage = page_image_coverage(page, page_images)
+                except Exception as e:
+                    logger.debug(f"Sondeo: cobertura de imágenes no medible en página {page_number}: {e}")
+
+            result.total_chars += char_count
+            result.pages.append(PageProbe(
+                page_number=page_number,
+                char_count=char_count,
+                image_count=len(page_images),
+                image_coverage=image_coverage,
+            ))
+
+        try:
+            meta = doc.metadata or {}
+            result.metadata = {
+                "num_pages": result.page_count,
+                "title": meta.get("title", ""),
+                "author": meta.get("author", ""),
+                "subject": meta.get("subject", ""),
+                "creator": meta.get("creator", ""),
+                "producer": meta.get("producer", ""),
+            }
+        except Exception:
+            result.metadata = {"num_pages": result.page_count}
+
+        return result
+
+    def probe_bytes(self, pdf_bytes: bytes) -> ProbeResult:
+        """Abre, sondea y cierra. Si el PDF no abre, retorna un resultado vacío (opened=False)."""
+        try:
+            doc = self.open(pdf_bytes)
+        except ValueError:
+            return ProbeResult(opened=False)
+        try:
+            return self.probe(doc)
+        finally:
+            doc.close()
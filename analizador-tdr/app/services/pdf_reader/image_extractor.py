@@ -2,15 +2,17 @@
 Extractor de imágenes de páginas PDF.
 Detecta imágenes, clasifica si contienen texto, y aplica OCR cuando corresponde.
 """
-from typing import List, Optional
+from typing import Callable, List, Optional
 import logging
 
 from .contracts import (
     BlockExtractorContract,
     ContentBlock,
     BlockType,
+    DocumentContent,
     OCRProcessorContract,
 )
+from .ocr_processor import wait_for_ocr
 
 logger = logging.getLogger(__name__)
 
@@ -22,10 +24,13 @@ class ImageBlockExtractor(BlockExtractorContract):
     Flujo por imagen:
     1. Detectar imagen en la página
     2. Filtrar imágenes decorativas (íconos, bullets < min_size)
-    3. Clasificar: ¿tiene texto extraíble?
-       - Sí → OCR → extraer texto
+    3. Enviar la imagen al OCR (submit) sin esperar el resultado
+    4. Al terminar el documento (finalize), clasificar: ¿tiene texto extraíble?
+       - Sí → ContentBlock con el texto OCR
        - No → reportar como imagen sin texto
-    4. Retornar ContentBlock con el resultado
+
+    Con un OCR con workers (PooledTesseractOCRProcessor) las imágenes de todas
+    las páginas se reconocen en paralelo mientras se recorre el documento.
 
     La dependencia de OCR se inyecta (DIP) para poder
     intercambiar implementaciones o desactivarlo.
@@ -37,27 +42,36 @@ class ImageBlockExtractor(BlockExtractorContract):
     DEFAULT_MAX_IMAGE_SIZE = 500_000       # ~500 KB
     # Mínimo de caracteres OCR para considerar que la imagen tiene texto útil
     MIN_OCR_CHARS = 20
+    # Clave del Future de OCR pendiente en ContentBlock.metadata (se retira en finalize)
+    _PENDING_OCR = "_pending_ocr"
 
     def __init__(
         self,
         ocr_processor: Optional[OCRProcessorContract] = None,
         min_image_size: int = DEFAULT_MIN_IMAGE_SIZE,
         max_image_size: int = DEFAULT_MAX_IMAGE_SIZE,
+        skip_page: Optional[Callable[[object], bool]] = None,
     ):
         """
         Args:
             ocr_processor: Procesador OCR inyectado (puede ser None/NullOCR).
             min_image_size: Bytes mínimos para considerar una imagen relevante.
             max_image_size: Bytes máximos — imágenes más grandes se omiten del OCR.
+            skip_page: Predicado de páginas que cubre otro extractor (p. ej. el OCR
+                de página completa), para no hacer OCR dos veces de la misma imagen.
         """
         self._ocr = ocr_processor
         self._min_image_size = min_image_size
         self._max_image_size = max_image_size
+        self._skip_page = skip_page
 
     def extract(self, page, page_number: int) -> List[ContentBlock]:
         """Detecta y procesa imágenes de una página PDF."""
         blocks: List[ContentBlock] = []
 
+        if self._skip_page is not None and self._skip_page(page):
+            return blocks
+
         try:
             images = page.get_images(full=True)
         except Exception as e:
@@ -97,26 +111,9 @@ class ImageBlockExtractor(BlockExtractorContract):
                 )
                 return None
 
-            # Intentar OCR si el procesador está disponible
-            if self._ocr and self._ocr.is_available():
-                ocr_text = self._ocr.extract_text(image_bytes)
-
-                if ocr_text and len(ocr_text.strip()) >= self.MIN_OCR_CHARS:
-                    # Imagen CON texto extraíble → retornar texto OCR
-                    return ContentBlock(
-                        block_type=BlockType.IMAGE,
-                        page_number=page_number,
-                        content=f"[Texto extraído de imagen por OCR]:\n{ocr_text.strip()}",
-                        metadata={
-                            "source": "ocr",
-                            "image_format": image_ext,
-                            "image_size_bytes": image_size,
-                            "image_index": img_index,
-                        },
-                    )
-
-            # Imagen SIN texto extraíble (o OCR no disponible)
-            return ContentBlock(
+            # Imagen SIN texto extraíble (o OCR no disponible); finalize() la
+            # reemplaza por el texto OCR si el reconocimiento encuentra texto
+            block = ContentBlock(
                 block_type=BlockType.IMAGE,
                 page_number=page_number,
                 content=(
@@ -130,9 +127,29 @@ class ImageBlockExtractor(BlockExtractorContract):
                     "image_index": img_index,
                 },
             )
+            if self._ocr and self._ocr.is_available():
+                block.metadata[self._PENDING_OCR] = self._ocr.submit(image_bytes)
+            return block
 
         except Exception as e:
             logger.warning(
                 f"Error procesando imagen xref={xref} en página {page_number}: {e}"
             )
             return None
+
+    def finalize(self, document: DocumentContent, deadline: Optional[float]) -> None:
+        """Espera el OCR de las imágenes enviadas (plazo del documento) y completa sus bloques."""
+        expired = 0
+        for page in document.pages:
+            for block in page.blocks:
+                future = block.metadata.pop(self._PENDING_OCR, None)
+                if future is None:
+                    continue
+                ocr_text = wait_for_ocr(future, deadline)
+                expired += future.cancelled() or not future.done()
+                if ocr_text and len(ocr_text.strip()) >= self.MIN_OCR_CHARS:
+                    # Imagen CON texto extraíble → texto OCR
+                    block.content = f"[Texto extraído de imagen por OCR]:\n{ocr_text.strip()}"
+                    block.metadata["source"] = "ocr"
+        if expired:
+            logger.warning(f"⏱️ Plazo de OCR agotado: {expired} imágenes sin OCR")
@@ -2,15 +2,46 @@
 Procesador OCR con degradación elegante.
 Si Tesseract no está instalado, el sistema sigue funcionando sin OCR.
 """
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import List, Optional, Tuple
 import io
 import logging
-from typing import Optional
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+import time
 
 from .contracts import OCRProcessorContract
 
 logger = logging.getLogger(__name__)
 
 
+def wait_for_ocr(future: "Future[Optional[str]]", deadline: Optional[float] = None) -> Optional[str]:
+    """
+    Texto de un OCR enviado con submit().
+
+    Args:
+        future: Resultado de OCRProcessorContract.submit().
+        deadline: Instante (time.monotonic()) límite; None = sin límite.
+
+    Returns:
+        Texto extraído o None si falló o venció el plazo (si aún no había
+        empezado, el trabajo se cancela y no ocupa un worker).
+    """
+    try:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        logger.debug("OCR: plazo del documento agotado — imagen omitida")
+        return None
+    except Exception as e:
+        logger.warning(f"Error en OCR: {e}")
+        return None
+
+
 class TesseractOCRProcessor(OCRProcessorContract):
     """
     Implementación OCR usando pytesseract + Tesseract (SRP).
@@ -84,6 +115,199 @@ class TesseractOCRProcessor(OCRProcessorContract):
             return None
 
 
+class PooledTesseractOCRProcessor(TesseractOCRProcessor):
+    """
+    OCR con workers de Tesseract de larga vida (SRP).
+
+    pytesseract lanza un proceso tesseract por imagen, escribe archivos
+    temporales y recarga los datos del idioma cada vez. Aquí `workers` hilos
+    (creados en el primer uso, uno por proceso del pool de documentos) atienden
+    una cola de imágenes:
+
+    - Con tesserocr (binding de la API de Tesseract): cada hilo conserva su
+      PyTessBaseAPI con el idioma cargado una sola vez; el reconocimiento
+      corre en proceso y libera el GIL.
+    - Sin tesserocr: cada hilo toma de la cola un lote de hasta `batch_size`
+      imágenes y las reconoce en una sola ejecución de tesseract (lista de
+      archivos), con lo que el idioma se carga una vez por lote.
+
+    submit() encola la imagen y retorna un Future, de modo que los extractores
+    envían todas las imágenes del documento y esperan al final (ver
+    BlockExtractorContract.finalize).
+    """
+
+    DEFAULT_WORKERS = 2
+    DEFAULT_BATCH_SIZE = 8
+
+    def __init__(
+        self,
+        lang: str = "spa",
+        timeout: int = TesseractOCRProcessor.DEFAULT_TIMEOUT,
+        workers: int = DEFAULT_WORKERS,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        """
+        Args:
+            lang: Idioma para OCR (default: español).
+            timeout: Segundos máximos por imagen (default: 10).
+            workers: Hilos con un Tesseract propio cada uno.
+            batch_size: Imágenes máximas por ejecución de tesseract (sin tesserocr).
+        """
+        super().__init__(lang=lang, timeout=timeout)
+        self._workers = max(1, workers)
+        self._batch_size = max(1, batch_size)
+        self._queue: "queue.SimpleQueue[Tuple[bytes, Future]]" = queue.SimpleQueue()
+        self._threads: List[threading.Thread] = []
+        self._threads_lock = threading.Lock()
+        self._local = threading.local()
+        self._tesserocr = None
+
+    def is_available(self) -> bool:
+        """Disponible con tesserocr (y los datos del idioma) o con el binario tesseract."""
+        if self._available is None and self._load_tesserocr() is not None:
+            self._available = True
+            logger.info(f"✅ Tesseract OCR disponible (tesserocr en proceso, {self._workers} workers)")
+        return super().is_available()
+
+    def _load_tesserocr(self):
+        """Módulo tesserocr si está instalado y tiene el idioma; None si no."""
+        if self._tesserocr is None:
+            try:
+                import tesserocr
+
+                _, languages = tesserocr.get_languages()
+                self._tesserocr = tesserocr if all(
+                    lang in languages for lang in self._lang.split("+")
+                ) else False
+            except Exception:
+                self._tesserocr = False
+        return self._tesserocr or None
+
+    def submit(self, image_bytes: bytes) -> "Future[Optional[str]]":
+        """Encola la imagen para los workers y retorna su Future."""
+        future: "Future[Optional[str]]" = Future()
+        if not self.is_available():
+            future.set_result(None)
+            return future
+        self._ensure_workers()
+        self._queue.put((image_bytes, future))
+        return future
+
+    def extract_text(self, image_bytes: bytes) -> Optional[str]:
+        """Versión síncrona (una imagen): submit() + espera."""
+        return wait_for_ocr(self.submit(image_bytes))
+
+    def _ensure_workers(self) -> None:
+        if len(self._threads) >= self._workers:
+            return
+        with self._threads_lock:
+            while len(self._threads) < self._workers:
+                thread = threading.Thread(
+                    target=self._work, name=f"tesseract-{len(self._threads)}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self) -> None:
+        """Bucle de un worker: toma un lote de la cola y resuelve sus Futures."""
+        while True:
+            batch = [self._queue.get()]
+            # Lote repartido entre los workers (sin tesserocr una ejecución de tesseract por lote)
+            limit = 1 if self._tesserocr else min(
+                self._batch_size, -(-(self._queue.qsize() + 1) // self._workers)
+            )
+            while len(batch) < limit:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # Descarta los trabajos cancelados por el plazo del documento
+            batch = [(image, future) for image, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            images = [image for image, _ in batch]
+            try:
+                texts = self._recognize_api(images) if self._tesserocr else self._recognize_cli(images)
+            except Exception as e:
+                logger.warning(f"Error en OCR: {e}")
+                texts = [None] * len(batch)
+            for (_, future), text in zip(batch, texts):
+                future.set_result(text)
+
+    def _recognize_api(self, images: List[bytes]) -> List[Optional[str]]:
+        """tesserocr: API del hilo (creada una vez, idioma ya cargado)."""
+        api = getattr(self._local, "api", None)
+        if api is None:
+            api = self._local.api = self._tesserocr.PyTessBaseAPI(lang=self._lang)
+        texts = []
+        for image_bytes in images:
+            api.SetImage(_open_image(image_bytes))
+            if not api.Recognize(self._timeout * 1000):
+                logger.warning(f"OCR timeout ({self._timeout}s) — imagen omitida")
+                texts.append(None)
+                continue
+            texts.append(api.GetUTF8Text().strip() or None)
+        return texts
+
+    def _recognize_cli(self, images: List[bytes]) -> List[Optional[str]]:
+        """Binario tesseract: una ejecución para todo el lote (lista de archivos)."""
+        import pytesseract
+
+        with tempfile.TemporaryDirectory(prefix="tdr-ocr-") as tmp:
+            paths = []
+            for index, image_bytes in enumerate(images):
+                path = os.path.join(tmp, f"{index:04d}.png")
+                if _readable_by_tesseract(image_bytes):
+                    # Tesseract lee el archivo directo: sin recodificar
+                    with open(path, "wb") as out:
+                        out.write(image_bytes)
+                else:
+                    _open_image(image_bytes).save(path, format="PNG")
+                paths.append(path)
+            list_path = os.path.join(tmp, "images.txt")
+            with open(list_path, "w") as listing:
+                listing.write("\n".join(paths) + "\n")
+
+            try:
+                completed = subprocess.run(
+                    [pytesseract.pytesseract.tesseract_cmd, list_path, "stdout", "-l", self._lang],
+                    capture_output=True,
+                    timeout=self._timeout * len(images),
+                    # Un hilo de OpenMP por proceso: el paralelismo lo dan los workers
+                    env={**os.environ, "OMP_THREAD_LIMIT": "1"},
+                    check=True,
+                )
+            except subprocess.TimeoutExpired:
+                logger.warning(f"OCR timeout ({self._timeout}s/imagen) — lote de {len(images)} imágenes omitido")
+                return [None] * len(images)
+
+        # El renderer de texto separa las páginas con un salto de página (\f)
+        pages = completed.stdout.decode("utf-8", errors="replace").split("\f")
+        if len(pages) < len(images):
+            logger.warning("OCR: salida del lote incompleta — reintentando imagen por imagen")
+            return [TesseractOCRProcessor.extract_text(self, image) for image in images]
+        return [page.strip() or None for page in pages[:len(images)]]
+
+
+def _open_image(image_bytes: bytes):
+    """Imagen PIL en un modo que Tesseract acepta (RGB o escala de grises)."""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_bytes))
+    # Convertir a RGB si es necesario (CMYK, paleta, etc.)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    return image
+
+
+def _readable_by_tesseract(image_bytes: bytes) -> bool:
+    """True si el archivo puede pasarse tal cual al binario (PNG/JPEG/TIFF en RGB o gris)."""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_bytes))
+    return image.format in ("PNG", "JPEG", "TIFF") and image.mode in ("RGB", "L", "1")
+
+
 class NullOCRProcessor(OCRProcessorContract):
     """
     Implementación nula de OCR (Null Object Pattern).
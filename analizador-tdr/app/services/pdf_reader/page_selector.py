@@ -0,0 +1,195 @@
+"""
+Selección de páginas informativas para el envío multimodal.
+
+Cuando el documento va directo a Gemini (escaneado o > MAX_NATIVE_PAGES), el
+PDF completo viaja inline: anexos, formatos de declaración jurada, páginas en
+blanco. Gemini cobra ~258 tokens por página, así que los tokens de prompt y la
+latencia crecen con el número de páginas. El selector puntúa cada página de
+forma barata y arma un sub-PDF solo con las informativas:
+
+- Texto nativo (si lo hay): términos de las secciones clave del TDR
+  (requisitos, penalidades, pago, plazos, presupuesto) suman; los de
+  formatos/anexos (declaración jurada, "firma y sello", modelo de carta) restan
+  poco (penalización acotada). Solo se descarta como formato una página poco
+  densa con marcas de formulario (líneas para rellenar, "firma y sello"): un
+  cuerpo del TDR que cita "Anexo N° 1" se conserva.
+- Sin texto (escaneo): miniatura en gris a baja resolución → proporción de
+  "tinta". Una página casi sin tinta se descarta como en blanco.
+- La primera página (carátula: entidad, objeto, número de proceso) se conserva
+  siempre; las siguientes reciben un pequeño bono por posición (el cuerpo del
+  TDR precede a los anexos).
+
+Con presupuesto de páginas se conservan las mejores en su orden original.
+
+    selector = PageSelector(relevance_patterns, max_pages=30)
+    selection = selector.select(doc, probe)
+    sub_pdf = selector.build_subset(doc, selection.pages)
+"""
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+import logging
+import re
+
+import fitz  # PyMuPDF
+
+from .document_probe import MIN_CHARS_PER_PAGE, ProbeResult
+
+logger = logging.getLogger(__name__)
+
+# Tokens que Gemini cobra por página de un PDF
+GEMINI_TOKENS_PER_PAGE = 258
+
+# Formatos y anexos que no aportan al análisis (se rellenan al postular)
+BOILERPLATE_PATTERNS = (
+    r"declaraci[oó]n\s+jurada",
+    r"firma\s+y\s+sello",
+    r"modelo\s+de\s+carta",
+    r"formato\s+n[°º.]?\s*\d+",
+    r"anexo\s+n[°º.]?\s*\d+",
+    r"carta\s+de\s+presentaci[oó]n",
+    r"nombres?\s+y\s+apellidos\s*:?\s*_{3,}",
+)
+
+# Marcas de un formulario para rellenar: líneas en blanco, espacio de firma
+FORM_MARKER_PATTERNS = (
+    r"_{3,}",
+    r"\.{6,}",
+    r"firma\s+y\s+sello",
+    r"huella\s+digital",
+)
+# Una página con más caracteres que esto es cuerpo del TDR aunque cite formatos
+_FORM_MAX_CHARS = 1500
+# Coincidencias de formato que penalizan como máximo (una página no se hunde por citar anexos)
+_MAX_BOILERPLATE_HITS = 2
+
+# Resolución de la miniatura para medir tinta en páginas sin texto
+_THUMBNAIL_DPI = 18
+# Píxel "con tinta" en la miniatura gris (0 = negro)
+_INK_LEVEL = 160
+_INK_TABLE = bytes(1 if level < _INK_LEVEL else 0 for level in range(256))
+# Proporción de tinta por debajo de la cual la página se considera en blanco
+_BLANK_INK_RATIO = 0.004
+# Caracteres nativos por debajo de los cuales la página se considera sin texto
+_MIN_TEXT_CHARS = MIN_CHARS_PER_PAGE // 4
+
+
+@dataclass
+class PageScore:
+    """Puntuación de una página (1-based) y por qué."""
+    page_number: int
+    score: float
+    blank: bool = False
+    boilerplate: bool = False
+
+
+@dataclass
+class PageSelection:
+    """Páginas elegidas (1-based, en orden) y las puntuaciones de todas."""
+    page_count: int
+    pages: List[int]
+    scores: List[PageScore] = field(default_factory=list)
+
+    @property
+    def dropped(self) -> int:
+        return self.page_count - len(self.pages)
+
+    @property
+    def is_subset(self) -> bool:
+        return 0 < len(self.pages) < self.page_count
+
+
+class PageSelector:
+    """Puntúa páginas y arma el sub-PDF de las informativas (SRP: no decide la ruta)."""
+
+    def __init__(
+        self,
+        relevance_patterns: Iterable[str],
+        max_pages: int = 0,
+        boilerplate_patterns: Iterable[str] = BOILERPLATE_PATTERNS,
+    ):
+        self._relevance = re.compile("|".join(f"(?:{p})" for p in relevance_patterns), re.IGNORECASE)
+        self._boilerplate = re.compile("|".join(f"(?:{p})" for p in boilerplate_patterns), re.IGNORECASE)
+        self._form_markers = re.compile("|".join(f"(?:{p})" for p in FORM_MARKER_PATTERNS), re.IGNORECASE)
+        self.max_pages = max_pages
+
+    def score_page(self, page, char_count: int) -> PageScore:
+        """Puntuación de una página ya cargada (char_count del sondeo)."""
+        page_number = page.number + 1
+        if char_count >= _MIN_TEXT_CHARS:
+            text = page.get_text()
+            relevance = len(self._relevance.findall(text))
+            boilerplate = len(self._boilerplate.findall(text))
+            # Densidad de texto + términos clave (ambos saturados, para competir con
+            # las páginas escaneadas con un presupuesto de páginas) − formatos (acotado)
+            score = (min(char_count / 2000, 1.0) + 0.25 * min(relevance, 6)
+                     - 0.25 * min(boilerplate, _MAX_BOILERPLATE_HITS))
+            return PageScore(page_number, score, boilerplate=self._is_form(text, char_count, relevance, boilerplate))
+
+        ink = self._ink_ratio(page)
+        if ink < _BLANK_INK_RATIO:
+            return PageScore(page_number, 0.0, blank=True)
+        # Escaneo: sin texto que leer, la cantidad de tinta aproxima la densidad de contenido
+        return PageScore(page_number, min(ink * 8, 1.5))
+
+    def _is_form(self, text: str, char_count: int, relevance: int, boilerplate: int) -> bool:
+        """Formato para rellenar: poco texto, términos de formato y marcas de formulario."""
+        return (
+            char_count < _FORM_MAX_CHARS
+            and boilerplate > 0
+            and boilerplate >= relevance
+            and self._form_markers.search(text) is not None
+        )
+
+    @staticmethod
+    def _ink_ratio(page) -> float:
+        pix = page.get_pixmap(dpi=_THUMBNAIL_DPI, colorspace=fitz.csGRAY)
+        samples = pix.samples
+        if not samples:
+            return 0.0
+        return samples.translate(_INK_TABLE).count(1) / len(samples)
+
+    def select(self, doc, probe: Optional[ProbeResult] = None) -> PageSelection:
+        """Puntúa todas las páginas y elige las informativas dentro del presupuesto."""
+        page_count = len(doc)
+        char_counts = {p.page_number: p.char_count for p in probe.pages} if probe is not None else {}
+        scores: List[PageScore] = []
+        for page_index in range(page_count):
+            page = doc.load_page(page_index)
+            char_count = char_counts.get(page_index + 1)
+            if char_count is None:
+                char_count = len(page.get_text())
+            try:
+                score = self.score_page(page, char_count)
+            except Exception as e:
+                logger.debug(f"Selección: página {page_index + 1} no puntuable ({e}); se conserva")
+                score = PageScore(page_index + 1, 1.0)
+            # Bono por posición: el cuerpo del TDR va antes que los anexos
+            score.score += 0.3 * (1 - page_index / max(page_count, 1))
+            scores.append(score)
+
+        candidates = [s for s in scores if s.page_number == 1 or not (s.blank or s.boilerplate)]
+        if self.max_pages and len(candidates) > self.max_pages:
+            first, rest = candidates[:1], candidates[1:]
+            if first[0].page_number != 1:
+                first, rest = [], candidates
+            best = sorted(rest, key=lambda s: s.score, reverse=True)[:self.max_pages - len(first)]
+            candidates = first + best
+        pages = sorted(s.page_number for s in candidates)
+        return PageSelection(page_count=page_count, pages=pages, scores=scores)
+
+    @staticmethod
+    def build_subset(doc, pages: List[int]) -> bytes:
+        """Sub-PDF con las páginas indicadas (1-based, en orden), copiando rangos contiguos."""
+        subset = fitz.open()
+        try:
+            start = previous = None
+            for page_number in pages + [None]:
+                if start is not None and (page_number is None or page_number != previous + 1):
+                    subset.insert_pdf(doc, from_page=start - 1, to_page=previous - 1)
+                    start = None
+                if page_number is not None and start is None:
+                    start = page_number
+                previous = page_number
+            return subset.tobytes(garbage=3, deflate=True)
+        finally:
+            subset.close()
@@ -0,0 +1,104 @@
+"""
+Extractor de páginas escaneadas completas.
+Renderiza la página y aplica OCR sobre la imagen completa (no por imagen incrustada).
+"""
+from typing import List, Optional
+import logging
+
+import fitz  # PyMuPDF
+
+from .contracts import (
+    BlockExtractorContract,
+    ContentBlock,
+    BlockType,
+    DocumentContent,
+    OCRProcessorContract,
+)
+from .document_probe import MIN_CHARS_PER_PAGE, PageProbe, page_image_coverage
+from .ocr_processor import wait_for_ocr
+
+logger = logging.getLogger(__name__)
+
+
+class ScannedPageOCRExtractor(BlockExtractorContract):
+    """
+    OCR de páginas escaneadas dentro de un documento mayormente nativo (SRP).
+
+    Un escaneo de página completa suele ser una imagen de cientos de KB que
+    ImageBlockExtractor omite (> max_image_size). Aquí la página se renderiza
+    en gris a `dpi` y se pasa entera al OCR, de modo que su texto queda en la
+    posición de la página dentro del texto fusionado. Las páginas nativas no
+    se tocan (el texto lo aporta TextBlockExtractor).
+
+    El render se envía al OCR sin esperar: mientras los workers reconocen una
+    página, el parser ya renderiza la siguiente; finalize() recoge los textos.
+    """
+
+    # Resolución de render para OCR (Tesseract rinde mejor entre 200 y 300 dpi)
+    DEFAULT_DPI = 200
+    # Mínimo de caracteres OCR para considerar que la página tiene texto útil
+    MIN_OCR_CHARS = 20
+    # Clave del Future de OCR pendiente en ContentBlock.metadata (se retira en finalize)
+    _PENDING_OCR = "_pending_page_ocr"
+
+    def __init__(self, ocr_processor: Optional[OCRProcessorContract] = None, dpi: int = DEFAULT_DPI):
+        """
+        Args:
+            ocr_processor: Procesador OCR inyectado (puede ser None/NullOCR).
+            dpi: Resolución del render de la página.
+        """
+        self._ocr = ocr_processor
+        self._dpi = dpi
+
+    @staticmethod
+    def is_scanned_page(page) -> bool:
+        """Mismo criterio que el sondeo (PageProbe.is_scanned) sobre una página cargada."""
+        char_count = len(page.get_text())
+        page_images = page.get_images(full=True)
+        if not page_images or char_count >= MIN_CHARS_PER_PAGE:
+            return False
+        return PageProbe(
+            page_number=page.number + 1,
+            char_count=char_count,
+            image_count=len(page_images),
+            image_coverage=page_image_coverage(page, page_images),
+        ).is_scanned
+
+    def handles(self, page) -> bool:
+        """True si esta página se cubre con OCR de página completa."""
+        return bool(self._ocr and self._ocr.is_available()) and self.is_scanned_page(page)
+
+    def extract(self, page, page_number: int) -> List[ContentBlock]:
+        """Envía al OCR el render de la página si es un escaneo; [] en cualquier otro caso."""
+        if not self.handles(page):
+            return []
+
+        pix = page.get_pixmap(dpi=self._dpi, colorspace=fitz.csGRAY)
+        return [ContentBlock(
+            block_type=BlockType.IMAGE,
+            page_number=page_number,
+            content="",
+            bbox=tuple(page.rect),
+            metadata={
+                "source": "page_ocr",
+                "dpi": self._dpi,
+                self._PENDING_OCR: self._ocr.submit(pix.tobytes("png")),
+            },
+        )]
+
+    def finalize(self, document: DocumentContent, deadline: Optional[float]) -> None:
+        """Completa las páginas con su texto OCR; las que no dieron texto útil se retiran."""
+        expired = 0
+        for page in document.pages:
+            pending = [block for block in page.blocks if self._PENDING_OCR in block.metadata]
+            for block in pending:
+                future = block.metadata.pop(self._PENDING_OCR)
+                ocr_text = wait_for_ocr(future, deadline)
+                expired += future.cancelled() or not future.done()
+                if not ocr_text or len(ocr_text.strip()) < self.MIN_OCR_CHARS:
+                    logger.debug(f"Página {page.page_number} escaneada sin texto OCR útil")
+                    page.blocks.remove(block)
+                    continue
+                block.content = f"[Página escaneada — texto extraído por OCR]:\n{ocr_text.strip()}"
+        if expired:
+            logger.warning(f"⏱️ Plazo de OCR agotado: {expired} páginas escaneadas sin OCR")
@@ -0,0 +1,216 @@
+"""
+Chunker estructural para el RAG de TDRs.
+
+En lugar de ventanas de N palabras sobre `text.split()`, arma los chunks a
+partir de los bloques que produjo el pipeline de lectura (ContentBlock →
+BlockSpan en el texto fusionado):
+
+- Los cortes caen en límites de bloque y, de preferencia, antes de un
+  encabezado o cláusula numerada ("5. PENALIDADES", "CAPÍTULO III", "ANEXO 2").
+- Una tabla ([TABLA]...[/TABLA]) nunca se parte: si no cabe, va sola.
+- Los marcadores "--- Página N ---" no se envían: la página queda como
+  procedencia del chunk (citable), igual que los bbox de sus bloques.
+- Los chunks son offsets (start, end) sobre el texto fusionado; el texto se
+  obtiene con un slice solo cuando se necesita.
+
+Sin spans (DOCX, texto plano) los bloques se reconstruyen a partir de las
+líneas del texto, reconociendo igualmente marcadores de página y tablas.
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+import re
+
+from app.services.pdf_reader import BlockSpan, BlockType
+
+# Encabezados de sección/cláusula (primera línea de un bloque)
+HEADING_PATTERN = re.compile(
+    r"^\s*(?:"
+    r"\d{1,2}(?:\.\d{1,2}){0,3}[.)]?\s+[A-ZÁÉÍÓÚÑ]"            # 5. / 5.1 / 5.1.2) Título
+    r"|[IVXL]{1,6}[.)]\s+\S"                                    # III. Título
+    r"|(?:CAP[IÍ]TULO|ANEXO|SECCI[OÓ]N|T[IÍ]TULO|ART[IÍ]CULO|NUMERAL)\b"
+    r"|[A-ZÁÉÍÓÚÑ][A-ZÁÉÍÓÚÑ0-9 ,.;:()/°º-]{7,}$"              # LÍNEA EN MAYÚSCULAS
+    r")"
+)
+_PAGE_MARKER = re.compile(r"^--- Página (\d+) ---$")
+_WORD = re.compile(r"\S+")
+
+
+@dataclass
+class TextChunk:
+    """
+    Chunk = rango [start, end) del texto fusionado, con su procedencia.
+
+    `source` es una referencia al texto completo (no una copia); `text`
+    hace el slice bajo demanda.
+    """
+    start: int
+    end: int
+    words: int
+    first_page: int = 0                  # 0 = página desconocida (DOCX / texto plano)
+    last_page: int = 0
+    kind: str = "text"                   # "text" | "table"
+    heading: Optional[str] = None
+    bboxes: Tuple[Tuple[int, tuple], ...] = ()   # (página, bbox) de cada bloque
+    source: str = field(default="", repr=False, compare=False)
+
+    @property
+    def text(self) -> str:
+        return self.source[self.start:self.end]
+
+    @property
+    def pages_label(self) -> str:
+        if not self.first_page:
+            return ""
+        if self.first_page == self.last_page:
+            return f"pág. {self.first_page}"
+        return f"págs. {self.first_page}-{self.last_page}"
+
+
+@dataclass
+class _Unit:
+    start: int
+    end: int
+    words: int
+    page: int
+    is_table: bool
+    heading: Optional[str]
+    bbox: Optional[tuple] = None
+
+
+class StructuredChunker:
+    """
+    Agrupa bloques consecutivos en chunks de hasta `max_words` palabras.
+
+    Args:
+        max_words: Tamaño máximo de un chunk (salvo una tabla que no cabe: va sola).
+        min_words: Un encabezado solo abre chunk nuevo si el actual ya tiene
+            al menos este tamaño (evita un chunk por cada inciso numerado).
+    """
+
+    def __init__(self, max_words: int = 1000, min_words: Optional[int] = None):
+        self.max_words = max_words
+        self.min_words = max_words // 4 if min_words is None else min_words
+
+    def chunk(self, text: str, spans: Optional[Sequence[BlockSpan]] = None) -> List[TextChunk]:
+        units = self._units_from_spans(text, spans) if spans else self._units_from_lines(text)
+        chunks: List[TextChunk] = []
+        current: List[_Unit] = []
+        current_words = 0
+
+        def flush():
+            nonlocal current, current_words
+            if current:
+                chunks.append(self._make_chunk(text, current))
+            current, current_words = [], 0
+
+        for unit in units:
+            if unit.words > self.max_words and not unit.is_table:
+                # Bloque de texto enorme: se parte por líneas/palabras (las tablas no)
+                flush()
+                for piece in self._split_unit(text, unit):
+                    current, current_words = [piece], piece.words
+                    flush()
+                continue
+
+            starts_section = unit.heading is not None and current_words >= self.min_words
+            overflows = current_words + unit.words > self.max_words
+            if current and (starts_section or overflows):
+                flush()
+            current.append(unit)
+            current_words += unit.words
+            if unit.is_table and current_words > self.max_words:
+                flush()  # tabla más grande que un chunk: va sola
+        flush()
+
+        for chunk in chunks:
+            chunk.source = text
+        return chunks
+
+    # ── Construcción de unidades ──────────────────────────────────────
+
+    def _units_from_spans(self, text: str, spans: Sequence[BlockSpan]) -> List[_Unit]:
+        units = []
+        for span in spans:
+            if span.end <= span.start:
+                continue
+            content = text[span.start:span.end]
+            units.append(_Unit(
+                start=span.start,
+                end=span.end,
+                words=len(content.split()),
+                page=span.page_number,
+                is_table=span.block_type == BlockType.TABLE,
+                heading=self._heading_of(content),
+                bbox=span.bbox,
+            ))
+        return units
+
+    def _units_from_lines(self, text: str) -> List[_Unit]:
+        """Bloques a partir de líneas: marcadores de página, tablas y párrafos."""
+        units = []
+        page = 0
+        table_start = None
+        position = 0
+        for line in text.split("\n"):
+            start, end = position, position + len(line)
+            position = end + 1
+            stripped = line.strip()
+            if table_start is not None:
+                if stripped == "[/TABLA]":
+                    content = text[table_start:end]
+                    units.append(_Unit(table_start, end, len(content.split()), page, True, None))
+                    table_start = None
+                continue
+            if not stripped:
+                continue
+            marker = _PAGE_MARKER.match(stripped)
+            if marker:
+                page = int(marker.group(1))
+                continue
+            if stripped == "[TABLA]":
+                table_start = start
+                continue
+            units.append(_Unit(start, end, len(line.split()), page, False, self._heading_of(line)))
+        if table_start is not None:  # tabla sin cierre
+            content = text[table_start:]
+            units.append(_Unit(table_start, len(text), len(content.split()), page, True, None))
+        return units
+
+    @staticmethod
+    def _heading_of(content: str) -> Optional[str]:
+        first_line = content.lstrip().split("\n", 1)[0].strip()
+        if first_line and HEADING_PATTERN.match(first_line):
+            return first_line[:120]
+        return None
+
+    def _split_unit(self, text: str, unit: _Unit) -> List[_Unit]:
+        """Parte un bloque de texto en piezas de ≤ max_words, cortando entre palabras."""
+        pieces = []
+        words = list(_WORD.finditer(text, unit.start, unit.end))
+        for i in range(0, len(words), self.max_words):
+            group = words[i:i + self.max_words]
+            pieces.append(_Unit(
+                start=group[0].start(),
+                end=group[-1].end(),
+                words=len(group),
+                page=unit.page,
+                is_table=False,
+                heading=unit.heading if i == 0 else None,
+                bbox=unit.bbox,
+            ))
+        return pieces
+
+    @staticmethod
+    def _make_chunk(text: str, units: List[_Unit]) -> TextChunk:
+        pages = [unit.page for unit in units if unit.page]
+        heading = next((unit.heading for unit in units if unit.heading), None)
+        return TextChunk(
+            start=units[0].start,
+            end=units[-1].end,
+            words=sum(unit.words for unit in units),
+            first_page=min(pages) if pages else 0,
+            last_page=max(pages) if pages else 0,
+            kind="table" if all(unit.is_table for unit in units) else "text",
+            heading=heading,
+            bboxes=tuple((unit.page, unit.bbox) for unit in units if unit.bbox),
+        )
@@ -1,10 +1,30 @@
 """
 Servicio RAG de Extracción para TDRs.
 Recupera fragmentos específicos del documento relacionados con secciones clave.
+
+Los chunks siguen la estructura del TDR (StructuredChunker: secciones,
+cláusulas numeradas y tablas completas, con página y bbox de procedencia) y
+se puntúan con BM25 por categoría (cada patrón de SECTION_PATTERNS es un
+término de la consulta). Se envían los mejores dentro de un presupuesto
+global de tokens.
+
+Con el retriever semántico activado (RAG_SEMANTIC_ENABLED), el ranking BM25
+se fusiona con la similitud de embeddings (Reciprocal Rank Fusion): los TDRs
+redactados con otras palabras ya no caen al fallback de "primeros 10 chunks".
 """
-import re
-from typing import List, Dict
+from bisect import bisect_right
+from collections import Counter
+from typing import TYPE_CHECKING, List, Dict, Optional, Sequence, Tuple, Union
 import logging
+import math
+import re
+
+from app.services.llm.token_budget import token_estimator
+from app.services.pdf_reader import BlockSpan
+from app.services.rag_chunker import StructuredChunker, TextChunk
+
+if TYPE_CHECKING:
+    from app.services.semantic_retriever import SemanticRetriever
 
 logger = logging.getLogger(__name__)
 
@@ -57,51 +77,111 @@ class RAGExtractionService:
         ]
     }
 
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    # Todas las categorías en un solo patrón compilado (alternación con grupos
+    # con nombre): el texto se recorre una vez en lugar de categorías × chunks × patrones.
+    # - Las categorías no se solapan entre sí, así que la alternación (leftmost-first)
+    #   no pierde coincidencias de otra categoría.
+    # - Se aplica sobre el texto ya en minúsculas (sin re.IGNORECASE, que es ~3x más lento)
+    #   y anclado a inicio de palabra: "descalificaciones" ya no cuenta como "calificaciones".
+    # - Solo hay un grupo por categoría: un grupo por patrón vuelve el escaneo ~4x más lento.
+    #   El patrón concreto (término para BM25) se identifica después, solo en las coincidencias.
+    COMBINED_PATTERN = re.compile(
+        r"\b(?:"
+        + "|".join(
+            f"(?P<{category}>{'|'.join(f'(?:{p})' for p in patterns)})"
+            for category, patterns in SECTION_PATTERNS.items()
+        )
+        + ")"
+    )
+    TERM_PATTERNS = {
+        category: [re.compile(pattern) for pattern in patterns]
+        for category, patterns in SECTION_PATTERNS.items()
+    }
+    # Variante para textos cuyo lower() cambia de longitud (offsets ya no coincidirían)
+    FOLDED_PATTERN = re.compile(COMBINED_PATTERN.pattern, re.IGNORECASE)
+    FOLDED_TERM_PATTERNS = {
+        category: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+        for category, patterns in SECTION_PATTERNS.items()
+    }
+
+    # Orden en que las categorías consumen el presupuesto de contexto (dentro de cada rango)
+    CONTEXT_PRIORITY = ("requisitos", "penalidades", "plazos", "presupuesto", "forma_pago")
+    CONTEXT_HEADER = "=== CONTEXTO EXTRAÍDO DEL TDR ===\n"
+    CONTEXT_FOOTER = "\n\n=== FIN DEL CONTEXTO ==="
+
+    # Parámetros estándar de BM25
+    BM25_K1 = 1.2
+    BM25_B = 0.75
+    # Constante de Reciprocal Rank Fusion (valor habitual en la literatura)
+    RRF_K = 60
+
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        top_k: int = 5,
+        max_context_tokens: int = 0,
+        semantic: Optional["SemanticRetriever"] = None,
+    ):
         self.chunk_size = chunk_size
-        self.chunk_overlap = chunk_overlap
+        self.top_k = top_k
+        # Presupuesto por defecto de build_context_for_llm (tokens estimados; 0 = sin límite)
+        self.max_context_tokens = max_context_tokens
+        # Retriever semántico opcional (app.services.semantic_retriever)
+        self.semantic = semantic
+        self.chunker = StructuredChunker(max_words=chunk_size)
         self.logger = logger
 
-    def extract_relevant_fragments(self, full_text: str) -> Dict[str, List[str]]:
+    @staticmethod
+    def term_category(term: str) -> str:
+        """Categoría de un término del índice ("plazos__2" → "plazos")."""
+        return term.split("__", 1)[0]
+
+    def extract_relevant_fragments(
+        self,
+        full_text: str,
+        layout: Optional[Sequence[BlockSpan]] = None,
+    ) -> Dict[str, List[TextChunk]]:
         """
         Recupera fragmentos del texto relacionados con las secciones clave del TDR.
         NOTA: Método síncrono - no hay operaciones async necesarias.
 
+        Cada categoría recibe hasta `top_k` chunks, ordenados por puntaje BM25
+        (el más relevante primero). Un chunk se asigna a una sola categoría.
+
         Args:
-            full_text: Texto completo extraído del PDF
+            full_text: Texto completo extraído del PDF (texto fusionado)
+            layout: Spans de los bloques en `full_text` (MergedDocument.spans).
+                Sin layout (DOCX), la estructura se deduce de las líneas.
 
         Returns:
-            Dict con fragmentos recuperados por categoría
+            Dict con fragmentos (TextChunk) por categoría (mejor primero)
         """
-        fragments = {
-            "requisitos": [],
-            "penalidades": [],
-            "forma_pago": [],
-            "plazos": [],
-            "presupuesto": []
-        }
+        fragments: Dict[str, List[TextChunk]] = {category: [] for category in self.SECTION_PATTERNS}
 
-        # Crear chunks del documento
-        chunks = self._create_chunks(full_text)
+        # Crear chunks del documento y etiquetarlos en una sola pasada
+        chunks, chunk_terms = self.index_chunks(full_text, layout)
         self.logger.info(f"Documento dividido en {len(chunks)} chunks")
 
-        # Para cada categoría, buscar chunks relevantes
-        for category, patterns in self.SECTION_PATTERNS.items():
-            relevant_chunks = []
-
-            for chunk in chunks:
-                chunk_lower = chunk.lower()
+        ranking = self._rank_chunks(chunk_terms, chunks)
+        if self.semantic is not None and chunks:
+            semantic_ranking = self.semantic.rank(
+                [chunk.text for chunk in chunks],
+                limit=self.top_k * 2,
+            )
+            ranking = self._fuse_rankings(ranking, semantic_ranking)
 
-                # Verificar si algún patrón coincide
-                for pattern in patterns:
-                    if re.search(pattern, chunk_lower, re.IGNORECASE):
-                        relevant_chunks.append(chunk)
-                        break  # Una coincidencia por chunk es suficiente
+        # Selección round-robin por rango: el mejor de cada categoría, luego el segundo...
+        selected = set()
+        for rank in range(self.top_k):
+            for category, ranked in ranking.items():
+                while len(ranked) > rank and ranked[rank] in selected:
+                    ranked.pop(rank)  # ya asignado a otra categoría
+                if len(ranked) > rank:
+                    index = ranked[rank]
+                    selected.add(index)
+                    fragments[category].append(chunks[index])
 
-            # Limitar a los top K chunks más relevantes por categoría
-            fragments[category] = relevant_chunks[:5]  # Top 5 por categoría
-
-        total_found = sum(len(chunks) for chunks in fragments.values())
+        total_found = sum(len(found) for found in fragments.values())
 
         self.logger.info(f"Fragmentos extraídos - Requisitos: {len(fragments['requisitos'])}, "
                         f"Penalidades: {len(fragments['penalidades'])}, "
@@ -112,56 +192,219 @@ class RAGExtractionService:
         # FALLBACK: Si no se encontraron fragmentos específicos, usar los primeros chunks del documento
         if total_found == 0:
             self.logger.warning("⚠️ No se encontraron patrones específicos, usando primeros 10 chunks del documento")
+            first_chunks = chunks[:10]
             # Distribuir chunks entre categorías principales
-            chunks_per_category = min(10, len(chunks)) // 2
-            fragments["requisitos"] = chunks[:chunks_per_category]
-            fragments["plazos"] = chunks[chunks_per_category:chunks_per_category*2]
+            chunks_per_category = len(first_chunks) // 2
+            fragments["requisitos"] = first_chunks[:chunks_per_category]
+            fragments["plazos"] = first_chunks[chunks_per_category:chunks_per_category*2]
 
         return fragments
 
-    def _create_chunks(self, text: str) -> List[str]:
+    def index_chunks(
+        self,
+        full_text: str,
+        layout: Optional[Sequence[BlockSpan]] = None,
+    ) -> Tuple[List[TextChunk], List[Counter]]:
         """
-        Divide el texto en chunks con overlap.
-
-        Args:
-            text: Texto completo
+        Divide el texto en chunks estructurales y cuenta las coincidencias de cada patrón en cada uno.
 
         Returns:
-            Lista de chunks
+            (chunks, tags): tags[i] es un Counter {término "<categoría>__<n>": coincidencias}
+        """
+        chunks = self.chunker.chunk(full_text, layout)
+        return chunks, self._index_terms(full_text, chunks)
+
+    def _index_terms(self, full_text: str, chunks: List[TextChunk]) -> List[Counter]:
         """
-        words = text.split()
-        chunks = []
+        El patrón combinado recorre el texto completo una sola vez; cada
+        coincidencia se asigna al chunk que la contiene (los chunks son rangos
+        disjuntos y ordenados del texto). Las coincidencias fuera de todo chunk
+        (marcadores de página) o que cruzan un límite se ignoran.
+        """
+        tags: List[Counter] = [Counter() for _ in chunks]
+        if not chunks:
+            return tags
+
+        lowered = full_text.lower()
+        if len(lowered) == len(full_text):
+            text, pattern, term_patterns = lowered, self.COMBINED_PATTERN, self.TERM_PATTERNS
+        else:
+            text, pattern, term_patterns = full_text, self.FOLDED_PATTERN, self.FOLDED_TERM_PATTERNS
+
+        starts = [chunk.start for chunk in chunks]
+        for match in pattern.finditer(text):
+            index = bisect_right(starts, match.start()) - 1
+            if index < 0 or match.end() > chunks[index].end:
+                continue
+            tags[index][self._match_term(match, text, term_patterns)] += 1
+
+        return tags
+
+    @staticmethod
+    def _match_term(match: re.Match, text: str, term_patterns: Dict[str, List[re.Pattern]]) -> str:
+        """Término "<categoría>__<n>": el primer patrón de la categoría que coincide ahí (como la alternación)."""
+        category = match.lastgroup
+        for index, pattern in enumerate(term_patterns[category]):
+            if pattern.match(text, match.start()):
+                return f"{category}__{index}"
+        return f"{category}__0"
+
+    def _rank_chunks(
+        self,
+        chunk_terms: List[Counter],
+        chunks: List[TextChunk],
+    ) -> Dict[str, List[int]]:
+        """
+        Índices de chunks por categoría, ordenados por BM25 descendente.
+
+        La consulta de cada categoría son sus patrones: un patrón raro en el
+        documento (p. ej. "responsabilidad contractual") pesa más que uno que
+        aparece en todos los chunks (p. ej. "garantía").
+        """
+        num_chunks = len(chunk_terms)
+        if not num_chunks:
+            return {category: [] for category in self.SECTION_PATTERNS}
+
+        document_frequency = Counter(term for terms in chunk_terms for term in terms)
+        idf = {
+            term: math.log((num_chunks - df + 0.5) / (df + 0.5) + 1)
+            for term, df in document_frequency.items()
+        }
+        lengths = [max(chunk.words, 1) for chunk in chunks]
+        avg_length = sum(lengths) / num_chunks
+
+        scores: Dict[str, List[Tuple[float, int]]] = {category: [] for category in self.SECTION_PATTERNS}
+        for index, terms in enumerate(chunk_terms):
+            norm = self.BM25_K1 * (1 - self.BM25_B + self.BM25_B * lengths[index] / avg_length)
+            per_category: Dict[str, float] = {}
+            for term, tf in terms.items():
+                category = self.term_category(term)
+                per_category[category] = (
+                    per_category.get(category, 0.0)
+                    + idf[term] * tf * (self.BM25_K1 + 1) / (tf + norm)
+                )
+            for category, score in per_category.items():
+                scores[category].append((score, index))
 
-        for i in range(0, len(words), self.chunk_size - self.chunk_overlap):
-            chunk = ' '.join(words[i:i + self.chunk_size])
-            chunks.append(chunk)
+        # Empates: el chunk que aparece antes en el documento
+        return {
+            category: [index for _, index in sorted(ranked, key=lambda item: (-item[0], item[1]))]
+            for category, ranked in scores.items()
+        }
 
-        return chunks
+    def _fuse_rankings(self, *rankings: Dict[str, List[int]]) -> Dict[str, List[int]]:
+        """Reciprocal Rank Fusion por categoría: score = Σ 1 / (RRF_K + rango)."""
+        fused: Dict[str, List[int]] = {}
+        for category in self.SECTION_PATTERNS:
+            scores: Dict[int, float] = {}
+            for ranking in rankings:
+                for rank, index in enumerate(ranking.get(category, [])):
+                    scores[index] = scores.get(index, 0.0) + 1.0 / (self.RRF_K + rank + 1)
+            fused[category] = sorted(scores, key=lambda index: (-scores[index], index))
+        return fused
 
-    def build_context_for_llm(self, fragments: Dict[str, List[str]]) -> str:
+    def build_context_for_llm(
+        self,
+        fragments: Dict[str, List[Union[TextChunk, str]]],
+        max_tokens: Optional[int] = None,
+        provider: Optional[str] = None,
+    ) -> str:
         """
         Construye el contexto completo para enviar al LLM.
         Combina todos los fragmentos recuperados en un solo texto estructurado.
         NOTA: Método síncrono - solo formatea strings.
 
+        Con presupuesto de tokens, los fragmentos entran por rango (el mejor de
+        cada categoría, luego el segundo...) y, dentro de un mismo rango, por
+        CONTEXT_PRIORITY, hasta agotarlo; los que no caben se omiten. Los
+        tokens se estiman con la razón caracteres/token del proveedor
+        (calibrada con el uso real) e incluyen rótulos y encabezados.
+        Cada fragmento se rotula con su página y encabezado de sección para
+        que el LLM pueda citarlos.
+
         Args:
-            fragments: Diccionario de fragmentos por categoría
+            fragments: Diccionario de fragmentos por categoría (mejor primero)
+            max_tokens: Presupuesto de tokens estimados.
+                Por defecto, `max_context_tokens` del servicio; 0 = sin límite.
+            provider: Proveedor LLM destino (para la estimación de tokens).
 
         Returns:
             Contexto formateado para el LLM
         """
+        budget = self.max_context_tokens if max_tokens is None else max_tokens
+        if budget:
+            fragments = self._fit_budget(fragments, budget, provider)
+
         context_parts = []
 
-        context_parts.append("=== CONTEXTO EXTRAÍDO DEL TDR ===\n")
+        context_parts.append(self.CONTEXT_HEADER)
 
         for category, chunks in fragments.items():
             if chunks:
-                category_label = category.upper().replace("_", " ")
-                context_parts.append(f"\n## {category_label}:")
+                context_parts.append(self._category_header(category))
                 for idx, chunk in enumerate(chunks, 1):
-                    context_parts.append(f"\n[Fragmento {idx}]")
-                    context_parts.append(chunk)
+                    context_parts.append(f"\n[{self._fragment_label(idx, chunk)}]")
+                    context_parts.append(self._fragment_text(chunk))
 
-        context_parts.append("\n\n=== FIN DEL CONTEXTO ===")
+        context_parts.append(self.CONTEXT_FOOTER)
 
         return "\n".join(context_parts)
+
+    def _fit_budget(
+        self,
+        fragments: Dict[str, List[Union[TextChunk, str]]],
+        budget: int,
+        provider: Optional[str],
+    ) -> Dict[str, List[Union[TextChunk, str]]]:
+        """Fragmentos que caben en `budget` tokens estimados (rango, luego prioridad de categoría)."""
+        estimate = token_estimator.estimate
+        remaining = budget - estimate(self.CONTEXT_HEADER + self.CONTEXT_FOOTER, provider)
+        accepted: Dict[str, List[Union[TextChunk, str]]] = {category: [] for category in fragments}
+        ordered = sorted(
+            fragments,
+            key=lambda category: (
+                self.CONTEXT_PRIORITY.index(category) if category in self.CONTEXT_PRIORITY else len(self.CONTEXT_PRIORITY)
+            ),
+        )
+        for rank in range(max((len(chunks) for chunks in fragments.values()), default=0)):
+            for category in ordered:
+                chunks = fragments[category]
+                if rank >= len(chunks):
+                    continue
+                chunk = chunks[rank]
+                cost = estimate(
+                    f"\n[{self._fragment_label(len(accepted[category]) + 1, chunk)}]\n"
+                    + self._fragment_text(chunk),
+                    provider,
+                )
+                if not accepted[category]:
+                    cost += estimate(self._category_header(category), provider)
+                if cost <= remaining:
+                    accepted[category].append(chunk)
+                    remaining -= cost
+
+        dropped = sum(len(chunks) for chunks in fragments.values()) - sum(
+            len(chunks) for chunks in accepted.values()
+        )
+        if dropped:
+            self.logger.info(f"✂️ Presupuesto de {budget} tokens: {dropped} fragmento(s) omitidos")
+        return accepted
+
+    @staticmethod
+    def _category_header(category: str) -> str:
+        return f"\n## {category.upper().replace('_', ' ')}:"
+
+    @staticmethod
+    def _fragment_text(chunk: Union[TextChunk, str]) -> str:
+        return chunk.text if isinstance(chunk, TextChunk) else chunk
+
+    @staticmethod
+    def _fragment_label(idx: int, chunk: Union[TextChunk, str]) -> str:
+        """Rótulo del fragmento: "Fragmento 2 — pág. 14 — 7. PENALIDADES" (solo lo que se conoce)."""
+        parts = [f"Fragmento {idx}"]
+        if isinstance(chunk, TextChunk):
+            if chunk.pages_label:
+                parts.append(chunk.pages_label)
+            if chunk.heading:
+                parts.append(chunk.heading)
+        return " — ".join(parts)
@@ -0,0 +1,262 @@
+"""
+Caché de resultados de análisis direccionada por contenido.
+
+La clave combina el SHA-256 de los bytes del documento con el proveedor LLM,
+el tipo de contrato, el modelo y la versión de los prompts. Si el scraper
+re-envía el mismo TDR, el resultado se devuelve sin volver a parsear el PDF
+ni llamar al LLM.
+
+Backends intercambiables (DIP):
+- MemoryLRUBackend: LRU en proceso con TTL.
+- SQLiteBackend: tier en disco que sobrevive reinicios.
+- TieredBackend: memoria delante de SQLite (promueve hits de disco a memoria).
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from app.services.document_spool import document_sha256
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackendContract(ABC):
+    """Interfaz para backends de caché clave → payload JSON serializable."""
+
+    name: str = "abstract"
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Retorna el payload almacenado o None si no existe o expiró."""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: int) -> None:
+        """Almacena el payload con un tiempo de vida en segundos."""
+        pass
+
+    @abstractmethod
+    def size(self) -> int:
+        """Número de entradas actualmente almacenadas."""
+        pass
+
+
+class MemoryLRUBackend(CacheBackendContract):
+    """LRU en memoria con expiración por entrada. Thread-safe."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 256):
+        self._max_entries = max(1, max_entries)
+        self._data: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: int) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self._max_entries:
+                self._data.popitem(last=False)
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class SQLiteBackend(CacheBackendContract):
+    """Tier persistente en SQLite (WAL). Las entradas expiradas se purgan al escribir."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.get_with_expiry(key)
+        return entry[0] if entry is not None else None
+
+    def get_with_expiry(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """(valor, expires_at) de una entrada vigente, o None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM analysis_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at < time.time():
+            return None
+        try:
+            return json.loads(value), expires_at
+        except json.JSONDecodeError:
+            return None
+
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: int) -> None:
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, payload, now + ttl_seconds),
+            )
+            self._conn.execute("DELETE FROM analysis_cache WHERE expires_at < ?", (now,))
+            self._conn.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()
+        return int(row[0]) if row else 0
+
+
+class TieredBackend(CacheBackendContract):
+    """Memoria (L1) delante de disco (L2). Un hit en L2 se promueve a L1."""
+
+    name = "tiered"
+
+    def __init__(self, memory: MemoryLRUBackend, disk: SQLiteBackend):
+        self._memory = memory
+        self._disk = disk
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._memory.get(key)
+        if value is not None:
+            return value
+        entry = self._disk.get_with_expiry(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        # En L1 solo por la vida restante de la entrada en disco (no se extiende)
+        self._memory.set(key, value, ttl_seconds=max(0.0, expires_at - time.time()))
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: int) -> None:
+        self._memory.set(key, value, ttl_seconds)
+        self._disk.set(key, value, ttl_seconds)
+
+    def size(self) -> int:
+        return self._disk.size()
+
+
+class AnalysisResultCache:
+    """
+    Fachada de caché de resultados con contadores de hit/miss.
+
+    Los errores del backend nunca interrumpen el análisis: se registran y
+    se tratan como miss.
+    """
+
+    def __init__(self, backend: CacheBackendContract, ttl_seconds: int, enabled: bool = True):
+        self._backend = backend
+        self._ttl = ttl_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def document_hash(document_bytes: bytes) -> str:
+        """SHA-256 hexadecimal de los bytes del documento (el calculado al recibirlo, si viene adjunto)."""
+        return document_sha256(document_bytes)
+
+    @staticmethod
+    def build_key(
+        document_hash: str,
+        llm_provider: str,
+        tipo_contrato: str,
+        model_name: str,
+        prompt_version: str,
+        namespace: str = "tdr",
+    ) -> str:
+        """Clave compuesta: namespace:sha256:proveedor:modelo:tipo:versión_prompt."""
+        return ":".join((namespace, document_hash, llm_provider, model_name, tipo_contrato, prompt_version))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        try:
+            value = self._backend.get(key)
+        except Exception as e:
+            logger.warning(f"Caché de resultados no disponible (get): {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        try:
+            self._backend.set(key, value, self._ttl)
+        except Exception as e:
+            logger.warning(f"Caché de resultados no disponible (set): {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores expuestos en /health."""
+        total = self.hits + self.misses
+        try:
+            entries = self._backend.size() if self.enabled else 0
+        except Exception:
+            entries = -1
+        return {
+            "enabled": self.enabled,
+            "backend": self._backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            "entries": entries,
+        }
+
+
+def _build_backend() -> CacheBackendContract:
+    memory = MemoryLRUBackend(max_entries=settings.result_cache_max_entries)
+    if settings.result_cache_backend == "memory":
+        return memory
+    try:
+        disk = SQLiteBackend(settings.result_cache_path)
+    except Exception as e:
+        logger.warning(f"No se pudo abrir la caché SQLite ({settings.result_cache_path}): {e} — usando solo memoria")
+        return memory
+    if settings.result_cache_backend == "sqlite":
+        return disk
+    return TieredBackend(memory, disk)
+
+
+# Instancia global (compartida por main.py y el router de batch)
+analysis_cache = AnalysisResultCache(
+    backend=_build_backend(),
+    ttl_seconds=settings.result_cache_ttl_seconds,
+    enabled=settings.result_cache_enabled,
+)
@@ -0,0 +1,198 @@
+"""
+Recuperación semántica (opcional) para el RAG de TDRs.
+
+Complementa a los patrones regex de RAGExtractionService: un TDR redactado
+con otras palabras ("sanción económica por atraso" en lugar de "penalidad")
+no coincide con ningún patrón, pero sí se parece a la consulta de la categoría.
+
+Dos backends de embeddings, ambos solo CPU:
+- fastembed (ONNX) con un modelo local pequeño (`rag_embedding_model`).
+- Sin modelo: vectorizador de n-gramas de caracteres hasheados, calculado
+  con NumPy para todos los chunks a la vez (sin bucles por n-grama en Python).
+
+Los vectores de las consultas por categoría se calculan una sola vez al crear
+el retriever (arranque del servicio) y las matrices de chunks se cachean por
+SHA-256 del texto: los tres endpoints sobre el mismo documento no re-embeben.
+
+Dependencia opcional: si NumPy (o fastembed, cuando se configura un modelo)
+no está instalado, `SemanticRetriever.from_settings()` retorna None y el RAG
+sigue funcionando solo con BM25.
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import hashlib
+import logging
+import threading
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depende del entorno
+    np = None
+
+
+# Consultas en lenguaje natural por categoría (mismas claves que SECTION_PATTERNS)
+CATEGORY_QUERIES = {
+    "requisitos": (
+        "requisitos del postor proveedor o contratista, experiencia mínima requerida, "
+        "perfil del personal clave, certificaciones, calificaciones, especificaciones técnicas, "
+        "equipamiento y condiciones técnicas del servicio"
+    ),
+    "penalidades": (
+        "penalidades por mora o retraso, multas, sanciones económicas, descuentos por incumplimiento, "
+        "garantía de fiel cumplimiento, responsabilidad del contratista, resolución del contrato"
+    ),
+    "forma_pago": (
+        "forma y modalidad de pago, pagos parciales, cronograma de pagos, conformidad del área usuaria, "
+        "facturación, comprobante de pago, desembolsos, adelantos"
+    ),
+    "plazos": (
+        "plazo de ejecución o de entrega, días calendario, cronograma de actividades, duración del servicio, "
+        "vigencia del contrato, fecha de inicio y término, lugar de prestación"
+    ),
+    "presupuesto": (
+        "presupuesto o valor referencial, monto total estimado, costo del servicio en soles S/, "
+        "precio incluido IGV, estructura de costos"
+    ),
+}
+
+
+class HashingVectorizer:
+    """
+    Bolsa de n-gramas de caracteres (3-5) hasheados a `dim` dimensiones.
+
+    Todo el lote se procesa con operaciones vectorizadas: hash rodante de
+    n-gramas sobre el texto concatenado y un único bincount por
+    (chunk, bucket). Pesos log(1 + tf) y normalización L2.
+    """
+
+    NGRAM_SIZES = (3, 4, 5)
+    _PRIME = 1_000_003
+
+    def __init__(self, dim: int = 4096):
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        encoded = [(" " + text.lower() + " ").encode("utf-8") for text in texts]
+        lengths = np.fromiter((len(item) for item in encoded), dtype=np.int64, count=len(encoded))
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+        # chunk al que pertenece cada byte del texto concatenado
+        owner = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+        starts = np.concatenate(([0], np.cumsum(lengths)))
+
+        counts = np.zeros(len(texts) * self.dim, dtype=np.float32)
+        for n in self.NGRAM_SIZES:
+            if len(data) < n:
+                continue
+            hashes = np.zeros(len(data) - n + 1, dtype=np.uint64)
+            for offset in range(n):
+                hashes = hashes * np.uint64(self._PRIME) + data[offset:len(data) - n + 1 + offset]
+            # Descartar n-gramas que cruzan el límite entre dos chunks
+            positions = np.arange(len(hashes), dtype=np.int64)
+            chunk_ids = owner[: len(hashes)]
+            valid = positions + n <= starts[chunk_ids + 1]
+            buckets = chunk_ids[valid] * self.dim + (hashes[valid] % np.uint64(self.dim)).astype(np.int64)
+            counts += np.bincount(buckets, minlength=counts.size).astype(np.float32)
+
+        matrix = np.log1p(counts.reshape(len(texts), self.dim))
+        return _l2_normalize(matrix)
+
+
+class FastEmbedVectorizer:
+    """Modelo de embeddings local (ONNX, CPU) vía fastembed."""
+
+    def __init__(self, model_name: str, batch_size: int = 32):
+        from fastembed import TextEmbedding
+
+        self.model = TextEmbedding(model_name=model_name)
+        self.batch_size = batch_size
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        vectors = np.asarray(list(self.model.embed(texts, batch_size=self.batch_size)), dtype=np.float32)
+        return _l2_normalize(vectors)
+
+
+def _l2_normalize(matrix: "np.ndarray") -> "np.ndarray":
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class SemanticRetriever:
+    """Similitud coseno chunk × consulta de categoría, con caché por documento."""
+
+    def __init__(self, vectorizer, cache_entries: int = 64):
+        self.vectorizer = vectorizer
+        self.categories = list(CATEGORY_QUERIES)
+        # Consultas embebidas una sola vez (arranque)
+        self.query_matrix = vectorizer.embed([CATEGORY_QUERIES[c] for c in self.categories])
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._cache_entries = cache_entries
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> Optional["SemanticRetriever"]:
+        """Crea el retriever configurado, o None si está desactivado o faltan dependencias."""
+        if not settings.rag_semantic_enabled:
+            return None
+        if np is None:
+            logger.warning("ℹ️  NumPy no instalado — RAG semántico desactivado (solo BM25)")
+            return None
+        if settings.rag_embedding_model:
+            try:
+                vectorizer = FastEmbedVectorizer(settings.rag_embedding_model)
+                logger.info(f"✅ RAG semántico con modelo local {settings.rag_embedding_model}")
+            except Exception as e:
+                logger.warning(
+                    f"⚠️ No se pudo cargar el modelo de embeddings ({e}); "
+                    "usando n-gramas hasheados"
+                )
+                vectorizer = HashingVectorizer()
+        else:
+            vectorizer = HashingVectorizer()
+            logger.info("✅ RAG semántico con n-gramas hasheados (sin modelo)")
+        return cls(vectorizer, cache_entries=settings.rag_embedding_cache_entries)
+
+    def _chunk_matrix(self, chunks: List[str], document_key: str) -> "np.ndarray":
+        with self._lock:
+            matrix = self._cache.get(document_key)
+            if matrix is not None:
+                self._cache.move_to_end(document_key)
+                return matrix
+
+        matrix = self.vectorizer.embed(chunks)
+
+        with self._lock:
+            self._cache[document_key] = matrix
+            while len(self._cache) > self._cache_entries:
+                self._cache.popitem(last=False)
+        return matrix
+
+    def rank(self, chunks: List[str], limit: int) -> Dict[str, List[int]]:
+        """
+        Índices de los `limit` chunks más similares a cada categoría (mejor primero).
+
+        La clave de caché es el SHA-256 de los chunks: mismo documento y mismos
+        parámetros de chunking → mismas filas.
+        """
+        if not chunks:
+            return {category: [] for category in self.categories}
+
+        digest = hashlib.sha256()
+        for chunk in chunks:
+            digest.update(chunk.encode("utf-8"))
+            digest.update(b"\0")
+        matrix = self._chunk_matrix(chunks, digest.hexdigest())
+
+        similarity = matrix @ self.query_matrix.T  # (chunks, categorías)
+        limit = min(limit, len(chunks))
+        ranking = {}
+        for column, category in enumerate(self.categories):
+            scores = similarity[:, column]
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            ranking[category] = [int(index) for index in top if scores[index] > 0]
+        return ranking
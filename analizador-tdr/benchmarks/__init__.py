@@ -0,0 +1 @@
+"""Benchmarks reproducibles del microservicio (se ejecutan como scripts, no en CI)."""
@@ -0,0 +1,97 @@
+"""
+Generador de TDRs sintéticos para benchmarks.
+Produce PDFs con texto de cláusulas, numeración y tablas (como los del SEACE),
+o directamente el texto extraído equivalente.
+"""
+import random
+
+import fitz  # PyMuPDF
+
+_VOCABULARIO = (
+    "requisitos del postor experiencia mínima penalidades multa forma de pago "
+    "plazo de ejecución presupuesto referencial entrega servicio contratista "
+    "garantía certificaciones especificaciones técnicas vigencia del contrato "
+    "conformidad área usuaria entidad proveedor documentación obligaciones "
+    "personal clave equipamiento lugar de prestación cronograma"
+).split()
+
+# Texto de relleno (la mayor parte de un TDR real no contiene términos clave)
+_RELLENO = (
+    "el la los las de del para con por que se su sus en un una al como será "
+    "deberá según mediante dentro cada caso establecido presente documento "
+    "acuerdo normativa vigente correspondiente indicado anexo numeral literal "
+    "realizar brindar atención oficina sede central horario días hábiles"
+).split()
+
+
+def build_tdr_text(
+    num_pages: int,
+    seed: int = 42,
+    words_per_page: int = 450,
+    keyword_ratio: float = 0.05,
+) -> str:
+    """
+    Texto plano de un TDR de `num_pages` páginas (~450 palabras por página):
+    cláusulas numeradas, `keyword_ratio` de términos clave y montos en soles.
+    """
+    rng = random.Random(seed)
+    pages = []
+    for i in range(num_pages):
+        words = [f"{i + 1}.", "CLÁUSULA", str(i + 1), "—", "CONDICIONES", "DEL", "SERVICIO"]
+        for _ in range(words_per_page):
+            words.append(rng.choice(_VOCABULARIO) if rng.random() < keyword_ratio else rng.choice(_RELLENO))
+        if rng.random() < 0.2:
+            words += ["S/", f"{rng.randint(1, 999)},{rng.randint(0, 999):03d}.00"]
+        pages.append(" ".join(words))
+    return "\n\n".join(pages)
+
+
+def build_tdr_pdf(num_pages: int, seed: int = 42, with_tables: bool = True) -> bytes:
+    """
+    Construye un PDF nativo de `num_pages` páginas con ~35 líneas de texto y
+    una tabla de 5x4 por página.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for i in range(num_pages):
+        page = doc.new_page()
+        page.insert_text((50, 40), f"{i + 1}. CLÁUSULA {i + 1} — CONDICIONES DEL SERVICIO", fontsize=11)
+        y = 60
+        for _ in range(35):
+            linea = " ".join(rng.choice(_VOCABULARIO) for _ in range(12))
+            page.insert_text((50, y), linea, fontsize=9)
+            y += 14
+        if with_tables:
+            x0, y0 = 50, y + 10
+            for r in range(5):
+                for c in range(4):
+                    rect = fitz.Rect(x0 + c * 120, y0 + r * 18, x0 + (c + 1) * 120, y0 + (r + 1) * 18)
+                    page.draw_rect(rect, color=(0, 0, 0), width=0.5)
+                    page.insert_text((rect.x0 + 3, rect.y0 + 12), f"Ítem {r}.{c}", fontsize=8)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def build_scanned_pdf(num_pages: int, seed: int = 42, dpi: int = 200, quality: int = 90) -> bytes:
+    """
+    PDF "escaneado": cada página de `build_tdr_pdf` rasterizada a `dpi` con
+    ruido de escáner y guardada como JPEG (sin capa de texto), como los TDR
+    pesados que llegan del SEACE.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    native = fitz.open(stream=build_tdr_pdf(num_pages, seed=seed), filetype="pdf")
+    doc = fitz.open()
+    for page in native:
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+        noisy = np.clip(pixels.astype(np.int16) - rng.integers(0, 40, pixels.shape, dtype=np.int16), 0, 255)
+        scan = fitz.Pixmap(fitz.csGRAY, pix.width, pix.height, noisy.astype(np.uint8).tobytes(), False)
+        new_page = doc.new_page(width=page.rect.width, height=page.rect.height)
+        new_page.insert_image(new_page.rect, stream=scan.tobytes("jpeg", jpg_quality=quality))
+    native.close()
+    data = doc.tobytes()
+    doc.close()
+    return data
@@ -0,0 +1,68 @@
+"""
+Benchmark: parseo serial vs fragmentado (sharding por rangos de páginas).
+
+Mide DocumentParser.parse (serial, un proceso) contra extract_text_sharded
+(rangos de páginas repartidos entre N procesos del pool) sobre TDRs sintéticos
+de 50 a 200 páginas con texto y tablas.
+
+Uso (desde analizador-tdr/):
+    python -m benchmarks.bench_document_parser
+    python -m benchmarks.bench_document_parser --pages 50 100 200 --workers 1 2 4
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks._synthetic import build_tdr_pdf
+from config import settings
+from app.services import document_executor
+from app.services.pdf_processor import PDFProcessorService
+
+
+def _time_serial(pdf_bytes: bytes) -> float:
+    service = PDFProcessorService()
+    start = time.perf_counter()
+    service.extract_text_from_pdf(pdf_bytes)
+    return time.perf_counter() - start
+
+
+async def _time_sharded(pdf_bytes: bytes, num_pages: int, workers: int) -> float:
+    settings.document_pool_size = workers
+    document_executor.shutdown_document_executor()
+    # Calentar el pool (arranque de procesos spawn) fuera de la medición
+    await asyncio.gather(*(
+        document_executor.run_document_task(document_executor.parse_page_range, pdf_bytes, 0, 1)
+        for _ in range(workers)
+    ))
+    start = time.perf_counter()
+    await document_executor.extract_text_sharded(pdf_bytes, num_pages)
+    elapsed = time.perf_counter() - start
+    document_executor.shutdown_document_executor()
+    return elapsed
+
+
+async def main(pages: list[int], workers: list[int]) -> None:
+    print("📊 Parseo serial vs fragmentado (texto + tablas, sin OCR)\n")
+    settings.ocr_enabled = False
+    header = f"{'págs':>5} | {'serial':>8} | " + " | ".join(f"{w} proc.".rjust(8) for w in workers)
+    print(header)
+    print("─" * len(header))
+    for num_pages in pages:
+        pdf_bytes = build_tdr_pdf(num_pages)
+        serial = _time_serial(pdf_bytes)
+        row = [f"{num_pages:>5}", f"{serial:>7.2f}s"]
+        for w in workers:
+            sharded = await _time_sharded(pdf_bytes, num_pages, w)
+            row.append(f"{sharded:>5.2f}s x{serial / sharded:.1f}")
+        print(" | ".join(row))
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.INFO)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    args = parser.parse_args()
+    asyncio.run(main(args.pages, args.workers))
@@ -0,0 +1,246 @@
+"""
+Benchmark: documento multimodal inline vs Files API vs caché de contexto (Gemini).
+
+Simula el flujo típico de Laravel sobre un TDR escaneado: /analyze-tdr,
+/analyze-direccionamiento y /generate-proforma sobre el mismo documento, varias
+rondas. Un servidor HTTP local imita los endpoints de Gemini que usa el SDK
+(subida resumable a la Files API, files.get, cachedContents y generateContent)
+y mide:
+
+- bytes recibidos por el servidor (lo que se sube por la red en cada modo),
+- tokens de prompt facturados a tarifa completa vs a tarifa de caché,
+- tiempo total con un ancho de banda de subida simulado (--upload-mbps).
+
+Al final verifica el reenvío inline cuando el servidor "olvida" el archivo
+(404 por expiración/borrado).
+
+Uso (desde analizador-tdr/):
+    python -m benchmarks.bench_gemini_files
+    python -m benchmarks.bench_gemini_files --pages 40 --rounds 3 --upload-mbps 10
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from config import settings
+from app.services.llm import GeminiClient, LLMFactory
+from app.services.llm.gemini_files import gemini_documents
+from benchmarks.bench_llm_clients import ANALYSIS_JSON
+
+# Tokens que Gemini cobra por página de un PDF
+TOKENS_PER_PAGE = 258
+
+
+class FakeGeminiServer:
+    """Servidor HTTP/1.1 mínimo con los endpoints de Gemini que usan los `*_from_pdf`."""
+
+    def __init__(self, document_pages: int, upload_mbps: float):
+        self.document_tokens = document_pages * TOKENS_PER_PAGE
+        self.upload_mbps = upload_mbps
+        self.base_url = ""
+        self.bytes_received = 0
+        self.billed_prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.files = {}
+        self.caches = set()
+        self.requests = {"upload": 0, "files.get": 0, "cachedContents": 0, "generateContent": 0, "404": 0}
+        self._uploads = {}
+        self._server = None
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.base_url = f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    def reset_counters(self) -> None:
+        self.bytes_received = self.billed_prompt_tokens = self.cached_prompt_tokens = 0
+        self.requests = {key: 0 for key in self.requests}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, path = request_line.split(" ")[:2]
+                headers = {
+                    k.strip().lower(): v.strip()
+                    for k, _, v in (line.partition(":") for line in header_lines if line)
+                }
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.bytes_received += len(head) + len(body)
+                # Subida por un enlace de `upload_mbps` megabits/s
+                await asyncio.sleep(len(body) * 8 / (self.upload_mbps * 1_000_000))
+
+                try:
+                    status, extra_headers, payload = self._route(method, path, headers, body)
+                except Exception as e:  # petición inesperada: responder 500 en vez de cortar la conexión
+                    status, extra_headers, payload = 500, {}, {"error": {"code": 500, "message": repr(e), "status": "INTERNAL"}}
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n".encode()
+                    + "".join(f"{k}: {v}\r\n" for k, v in extra_headers.items()).encode()
+                    + f"Content-Length: {len(data)}\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    def _route(self, method: str, path: str, headers: dict, body: bytes):
+        expire = (datetime.now(timezone.utc) + timedelta(hours=48)).isoformat().replace("+00:00", "Z")
+
+        if path.startswith("/upload/") and headers.get("x-goog-upload-command") == "start":
+            upload_id = str(len(self._uploads) + 1)
+            self._uploads[upload_id] = {"mime": headers.get("x-goog-upload-header-content-type"), "size": 0}
+            return 200, {"x-goog-upload-url": f"{self.base_url}/upload/v1beta/files?upload_id={upload_id}"}, {}
+
+        if path.startswith("/upload/"):
+            upload = self._uploads[path.rsplit("=", 1)[-1]]
+            upload["size"] += len(body)
+            if "finalize" not in headers.get("x-goog-upload-command", ""):
+                return 200, {"x-goog-upload-status": "active"}, {}
+            self.requests["upload"] += 1
+            name = f"files/doc{len(self.files) + 1}"
+            self.files[name] = {
+                "name": name, "uri": f"{self.base_url}/v1beta/{name}", "mimeType": upload["mime"],
+                "sizeBytes": str(upload["size"]), "state": "ACTIVE", "expirationTime": expire,
+            }
+            return 200, {"x-goog-upload-status": "final"}, {"file": self.files[name]}
+
+        if method == "GET" and "/files/" in path:
+            self.requests["files.get"] += 1
+            name = "files/" + path.rsplit("/files/", 1)[-1].split("?")[0]
+            return (200, {}, self.files[name]) if name in self.files else self._not_found(name)
+
+        if path.split("?")[0].endswith("/cachedContents"):
+            self.requests["cachedContents"] += 1
+            name = f"cachedContents/c{len(self.caches) + 1}"
+            self.caches.add(name)
+            return 200, {}, {"name": name, "expireTime": expire, "usageMetadata": {"totalTokenCount": self.document_tokens}}
+
+        if "generateContent" in path:
+            self.requests["generateContent"] += 1
+            return self._generate(json.loads(body))
+
+        return self._not_found(path)
+
+    def _generate(self, request: dict):
+        text_chars = 0
+        document_tokens = cached_tokens = 0
+        for content in request.get("contents", []):
+            for part in content.get("parts", []):
+                text_chars += len(part.get("text", ""))
+                if "inlineData" in part:
+                    document_tokens += self.document_tokens
+                if "fileData" in part:
+                    # proto JSON: el SDK puede serializar en camelCase o snake_case
+                    file_data = part["fileData"]
+                    uri = file_data.get("fileUri") or file_data.get("file_uri")
+                    name = "files/" + uri.rsplit("/files/", 1)[-1]
+                    if name not in self.files:
+                        return self._not_found(name, code=403)
+                    document_tokens += self.document_tokens
+        cached = request.get("cachedContent")
+        if cached:
+            if cached not in self.caches:
+                return self._not_found(cached)
+            cached_tokens = self.document_tokens
+
+        prompt_tokens = text_chars // 4 + document_tokens + cached_tokens
+        self.billed_prompt_tokens += prompt_tokens - cached_tokens
+        self.cached_prompt_tokens += cached_tokens
+        return 200, {}, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": ANALYSIS_JSON}]}}],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "cachedContentTokenCount": cached_tokens,
+                "candidatesTokenCount": 100,
+                "totalTokenCount": prompt_tokens + 100,
+            },
+        }
+
+    def _not_found(self, name: str, code: int = 404):
+        self.requests["404"] += 1
+        status = "NOT_FOUND" if code == 404 else "PERMISSION_DENIED"
+        return code, {}, {"error": {"code": code, "message": f"{name} not found", "status": status}}
+
+
+def _scanned_document(pages: int) -> bytes:
+    """PDF de `pages` páginas, cada una con una imagen de ruido (incompresible, como un escaneo)."""
+    import os
+    import fitz
+
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        noise = fitz.Pixmap(fitz.csGRAY, 300, 400, os.urandom(300 * 400), False)
+        page.insert_image(page.rect, stream=noise.tobytes("png"))
+    return doc.tobytes()
+
+
+async def _run_rounds(client: GeminiClient, document: bytes, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await client.analyze_tdr_from_pdf(document, "tdr.pdf")
+        await client.analyze_direccionamiento_from_pdf(document, "tdr.pdf")
+        await client.generate_proforma_from_pdf(document, "tdr.pdf", "ACME", "Servicios generales")
+    return time.perf_counter() - start
+
+
+async def main(pages: int, rounds: int, upload_mbps: float) -> None:
+    settings.llm_rate_limit_enabled = False
+    document = _scanned_document(pages)
+    server = FakeGeminiServer(pages, upload_mbps)
+    base_url = await server.start()
+    client = GeminiClient("bench", "gemini-2.5-flash", LLMFactory.build_http_client(httpx.AsyncClient), base_url)
+    gemini_documents.min_bytes = 0
+
+    print(
+        f"📊 Documento escaneado de {pages} págs ({len(document) / 1024:.0f} KB), {rounds} rondas × 3 análisis, "
+        f"subida simulada {upload_mbps:.0f} Mbps\n"
+    )
+    print(f"{'modo':>16} | {'subido':>9} | {'tokens tarifa completa':>22} | {'tokens en caché':>15} | {'tiempo':>8} | llamadas")
+    print("─" * 105)
+    for mode, files, context_cache in (("inline", False, False), ("files api", True, False), ("files + caché", True, True)):
+        gemini_documents.files_enabled = files
+        gemini_documents.context_cache_enabled = context_cache
+        gemini_documents.clear()
+        server.reset_counters()
+        elapsed = await _run_rounds(client, document, rounds)
+        calls = ", ".join(f"{name}={count}" for name, count in server.requests.items() if count)
+        print(
+            f"{mode:>16} | {server.bytes_received / 1024 / 1024:6.2f} MB | {server.billed_prompt_tokens:>22,} | "
+            f"{server.cached_prompt_tokens:>15,} | {elapsed:6.2f} s | {calls}"
+        )
+
+    # El servidor olvida el archivo (expiró o se borró): la llamada se reenvía inline
+    gemini_documents.context_cache_enabled = False
+    server.files.clear()
+    server.reset_counters()
+    result = await client.analyze_tdr_from_pdf(document, "tdr.pdf")
+    stats = gemini_documents.stats()
+    print(
+        f"\n🔁 Archivo olvidado por el servidor: {server.requests['404']} rechazo(s) → reenvío inline "
+        f"({'OK' if result.get('resumen_ejecutivo') else 'FALLÓ'}); invalidaciones={stats['invalidations']}"
+    )
+    await client.aclose()
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--upload-mbps", type=float, default=20.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.pages, args.rounds, args.upload_mbps))
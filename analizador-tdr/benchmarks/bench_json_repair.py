@@ -0,0 +1,199 @@
+"""
+Benchmark + fuzz: extracción/reparación del JSON de las respuestas del LLM.
+
+Compara la versión original de `_parse_json_response` (reparación contando
+llaves sin distinguir strings + regex de llaves anidadas con backtracking +
+segunda reparación) con la pasada lineal actual (json_repair) sobre
+respuestas sintéticas de análisis de hasta 64 KB:
+
+- truncadas en posiciones aleatorias (max_output_tokens),
+- con ruido: texto antes/después, bloques ```json sin cerrar, llaves dentro
+  de strings, escapes y unicode,
+- un caso patológico: una "{" dentro de un string descuadra el conteo de
+  llaves de la reparación original y la regex termina devolviendo un objeto
+  interno cualquiera.
+
+Para cada caso verifica que el resultado sea un dict cuyos campos ya
+completos coinciden con el original (solo el último puede venir recortado).
+
+Uso (desde analizador-tdr/):
+    python -m benchmarks.bench_json_repair
+    python -m benchmarks.bench_json_repair --cases 500 --max-kb 64
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import time
+
+from app.services.llm.base_client import BaseLLMClient
+
+_FRASES = (
+    "El contratista deberá acreditar experiencia mínima de 2 años",
+    "Penalidad: 0.10 × monto / (F × plazo) {según art. 162}",
+    'Entrega en "Sede Central" — Av. Arequipa 1234, Lima',
+    "Garantía de fiel cumplimiento [10%] del monto contractual",
+    "Certificación ISO 9001:2015 vigente \\ copia simple",
+    "Plazo de ejecución: 30 días calendario; conformidad en 5 días",
+)
+
+
+def _analysis(rng: random.Random, target_bytes: int) -> dict:
+    """Análisis con la forma de TDRAnalysisResponse que ocupa ~target_bytes en JSON."""
+    data = {
+        "resumen_ejecutivo": " ".join(rng.choice(_FRASES) for _ in range(6)),
+        "requisitos_tecnicos": [],
+        "reglas_de_negocio": [],
+        "politicas_y_penalidades": [],
+        "presupuesto_referencial": f"S/ {rng.randint(10, 900)},000.00",
+    }
+    keys = ("requisitos_tecnicos", "reglas_de_negocio", "politicas_y_penalidades")
+    size = len(json.dumps(data, ensure_ascii=False))
+    while size < target_bytes:
+        item = {"detalle": rng.choice(_FRASES), "monto": rng.randint(1, 99999) / 100, "obligatorio": rng.random() < 0.5}
+        value = item if rng.random() < 0.3 else rng.choice(_FRASES)
+        data[rng.choice(keys)].append(value)
+        size += len(json.dumps(value, ensure_ascii=False)) + 2
+    return data
+
+
+def _noisy(rng: random.Random, text: str) -> str:
+    prefix = rng.choice(["", "```json\n", "Aquí está el análisis solicitado:\n", "Nota {interna}: ver anexo.\n```json\n"])
+    suffix = rng.choice(["", "\n```", "\nEspero que sea útil.", "\n```\n¿Algo más? {fin}"])
+    return prefix + text + suffix
+
+
+def _cases(count: int, max_kb: int, seed: int):
+    rng = random.Random(seed)
+    for i in range(count):
+        original = _analysis(rng, rng.randint(1, max_kb) * 1024)
+        text = json.dumps(original, ensure_ascii=False, indent=rng.choice([None, 2]))
+        kind = ("completo+ruido", "truncado", "truncado+ruido")[i % 3]
+        if kind != "completo+ruido":
+            text = text[:rng.randint(len(text) // 10, len(text) - 1)]
+            if kind == "truncado+ruido":
+                text = rng.choice(["", "```json\n", "Resultado:\n"]) + text
+        else:
+            text = _noisy(rng, text)
+        yield kind, original, text
+
+
+def _consistent(result, original: dict) -> bool:
+    """Todos los campos salvo el último presente coinciden con el original."""
+    if not isinstance(result, dict) or not result:
+        return False
+    keys = [key for key in result if not key.startswith("_")]
+    if any(key not in original for key in keys):
+        return False
+    for key in keys[:-1]:
+        if result[key] != original[key]:
+            return False
+    return True
+
+
+def _legacy_repair(text: str) -> str:
+    """_repair_truncated_json original: cuenta llaves/corchetes sin mirar strings."""
+    repaired = text.rstrip()
+    in_string = False
+    escape_next = False
+    for ch in repaired:
+        if escape_next:
+            escape_next = False
+            continue
+        if ch == '\\':
+            escape_next = True
+            continue
+        if ch == '"':
+            in_string = not in_string
+    if in_string:
+        repaired = repaired.rstrip() + '"'
+    repaired = re.sub(r',\s*$', '', repaired)
+    open_braces = repaired.count('{') - repaired.count('}')
+    open_brackets = repaired.count('[') - repaired.count(']')
+    return repaired + ']' * max(0, open_brackets) + '}' * max(0, open_braces)
+
+
+def _legacy_parse(response_text: str):
+    """_parse_json_response original (4 estrategias)."""
+    cleaned = response_text.strip()
+    if cleaned.startswith("```"):
+        lines = cleaned.split("\n")
+        cleaned = "\n".join(lines[1:-1]) if len(lines) > 2 else cleaned
+        cleaned = cleaned.replace("```json", "").replace("```", "").strip()
+    try:
+        return json.loads(cleaned)
+    except json.JSONDecodeError as first_error:
+        if 'Unterminated' in str(first_error) or 'Expecting' in str(first_error):
+            try:
+                return json.loads(_legacy_repair(cleaned))
+            except json.JSONDecodeError:
+                pass
+        for match in re.finditer(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', cleaned, re.DOTALL):
+            try:
+                return json.loads(match.group(0))
+            except json.JSONDecodeError:
+                continue
+        try:
+            return json.loads(_legacy_repair(cleaned))
+        except json.JSONDecodeError:
+            pass
+        raise ValueError("La respuesta del LLM no es un JSON válido")
+
+
+def _current_parse(text: str):
+    return BaseLLMClient._parse_json_response(None, text)
+
+
+def _run(parse, text: str):
+    start = time.perf_counter()
+    try:
+        result = parse(text)
+    except ValueError:
+        result = None
+    return result, time.perf_counter() - start
+
+
+def main(count: int, max_kb: int, seed: int) -> None:
+    logging.getLogger("app.services.llm.base_client").setLevel(logging.ERROR)
+    stats = {}
+    for kind, original, text in _cases(count, max_kb, seed):
+        for name, parse in (("original", _legacy_parse), ("lineal", _current_parse)):
+            result, seconds = _run(parse, text)
+            entry = stats.setdefault((kind, name), {"ok": 0, "total": 0, "times": []})
+            entry["total"] += 1
+            entry["ok"] += _consistent(result, original)
+            entry["times"].append(seconds)
+
+    print(f"📊 {count} respuestas sintéticas de 1-{max_kb} KB (semilla {seed})\n")
+    print(f"{'caso':>16} | {'versión':>8} | {'dict consistente':>16} | {'p50':>8} | {'p99':>8} | {'máx':>8}")
+    print("─" * 80)
+    for (kind, name), entry in stats.items():
+        times = sorted(entry["times"])
+        p50 = times[len(times) // 2]
+        p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+        print(
+            f"{kind:>16} | {name:>8} | {entry['ok']:>7}/{entry['total']:<8} | "
+            f"{p50 * 1000:6.2f}ms | {p99 * 1000:6.2f}ms | {times[-1] * 1000:6.2f}ms"
+        )
+
+    # Patológico: llave dentro de un string (descuadra el conteo original) + lista
+    # truncada de miles de objetos pequeños (el peor caso en tokens por KB)
+    print()
+    for items in (1_000, 2_000, 6_000):
+        text = '{"nota": "usar { como separador", "items": [' + '{"x": 1}, ' * items
+        expected = {"nota": "usar { como separador", "items": [{"x": 1}] * items}
+        row = []
+        for name, parse in (("original", _legacy_parse), ("lineal", _current_parse)):
+            result, seconds = _run(parse, text)
+            row.append(f"{name} {seconds * 1000:6.1f} ms ({'correcto' if result == expected else 'incorrecto'})")
+        print(f"🧨 {items:>5} objetos, truncado ({len(text) / 1024:5.1f} KB): " + " | ".join(row))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=300)
+    parser.add_argument("--max-kb", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    main(args.cases, args.max_kb, args.seed)
@@ -0,0 +1,163 @@
+"""
+Benchmark: cliente LLM por petición vs cliente de larga vida (LLMFactory).
+
+Levanta un servidor HTTP/1.1 local que imita las APIs de Gemini, OpenAI y
+Anthropic, y hace N llamadas consecutivas a `analyze_tdr` con cada proveedor:
+
+- por petición: se construye un cliente nuevo en cada llamada (comportamiento
+  anterior de LLMFactory.create_client) → una conexión TCP nueva por llamada.
+- pool:         un único cliente con el pool httpx de LLMFactory → keep-alive.
+
+El servidor cuenta las conexiones aceptadas y puede simular el costo de
+establecer una conexión (handshake TCP+TLS contra la API real, ~50-150 ms
+desde Lima) con --handshake-ms.
+
+Uso (desde analizador-tdr/):
+    python -m benchmarks.bench_llm_clients
+    python -m benchmarks.bench_llm_clients --calls 50 --handshake-ms 80
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import anthropic
+import httpx
+import openai
+
+from config import settings
+from app.services.llm import AnthropicClient, GeminiClient, LLMFactory, OpenAIClient
+
+ANALYSIS_JSON = json.dumps({
+    "resumen_ejecutivo": "Servicio de mantenimiento preventivo de equipos de cómputo.",
+    "requisitos_tecnicos": ["Técnico certificado"],
+    "reglas_de_negocio": ["Plazo: 30 días"],
+    "politicas_y_penalidades": [],
+    "presupuesto_referencial": "S/ 25,000.00",
+})
+
+
+class MockLLMServer:
+    """Servidor HTTP/1.1 mínimo con keep-alive que responde como los tres proveedores."""
+
+    def __init__(self, handshake_ms: float):
+        self.handshake_ms = handshake_ms
+        self.connections = 0
+        self._server = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        # Costo de una conexión nueva (handshake TCP + TLS contra la API real)
+        await asyncio.sleep(self.handshake_ms / 1000)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                headers = {
+                    k.strip().lower(): v.strip()
+                    for k, _, v in (line.partition(":") for line in header_lines if line)
+                }
+                await reader.readexactly(int(headers.get("content-length", 0)))
+                body = json.dumps(self._response_for(request_line.split(" ")[1])).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _response_for(path: str) -> dict:
+        if "generateContent" in path:
+            return {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": ANALYSIS_JSON}]}}],
+                "usageMetadata": {"promptTokenCount": 900, "candidatesTokenCount": 100, "totalTokenCount": 1000},
+            }
+        if path.endswith("/messages"):
+            return {
+                "id": "msg_bench", "type": "message", "role": "assistant", "model": "bench",
+                "content": [{"type": "text", "text": ANALYSIS_JSON}],
+                "stop_reason": "end_turn",
+                "usage": {"input_tokens": 900, "output_tokens": 100},
+            }
+        return {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": "bench",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": ANALYSIS_JSON}}],
+            "usage": {"prompt_tokens": 900, "completion_tokens": 100, "total_tokens": 1000},
+        }
+
+
+def _client_factory(provider: str, base_url: str):
+    """(constructor del cliente, clase del pool HTTP que espera su SDK)."""
+    if provider == "gemini":
+        return (
+            lambda http_client=None: GeminiClient("bench", "gemini-2.5-flash", http_client, base_url),
+            httpx.AsyncClient,
+        )
+    if provider == "openai":
+        return (
+            lambda http_client=None: OpenAIClient("bench", "gpt-4o-mini", http_client, base_url + "/v1"),
+            openai.DefaultAsyncHttpxClient,
+        )
+    return (
+        lambda http_client=None: AnthropicClient("bench", "claude-3-5-haiku", http_client, base_url),
+        anthropic.DefaultAsyncHttpxClient,
+    )
+
+
+async def _run(server: MockLLMServer, provider: str, base_url: str, calls: int, pooled: bool) -> tuple:
+    make_client, pool_cls = _client_factory(provider, base_url)
+    server.connections = 0
+    start = time.perf_counter()
+    if pooled:
+        client = make_client(LLMFactory.build_http_client(pool_cls))
+        for _ in range(calls):
+            await client.analyze_tdr("TDR de prueba")
+        await client.aclose()
+    else:
+        for _ in range(calls):
+            client = make_client()
+            await client.analyze_tdr("TDR de prueba")
+            await client.aclose()
+    return time.perf_counter() - start, server.connections
+
+
+async def main(calls: int, handshake_ms: float, providers: list) -> None:
+    server = MockLLMServer(handshake_ms)
+    base_url = f"http://127.0.0.1:{await server.start()}"
+    settings.llm_timeout_seconds = 30
+
+    print(f"📊 {calls} llamadas consecutivas a analyze_tdr — handshake simulado: {handshake_ms:.0f} ms\n")
+    print(f"{'proveedor':>10} | {'por petición':>22} | {'pool (LLMFactory)':>22} | ahorro")
+    print("─" * 75)
+    for provider in providers:
+        await _run(server, provider, base_url, 2, pooled=True)  # calentar imports/parsers
+        fresh, fresh_conns = await _run(server, provider, base_url, calls, pooled=False)
+        pooled, pooled_conns = await _run(server, provider, base_url, calls, pooled=True)
+        print(
+            f"{provider:>10} | {fresh * 1000 / calls:7.1f} ms/llam. {fresh_conns:4d} conn | "
+            f"{pooled * 1000 / calls:7.1f} ms/llam. {pooled_conns:4d} conn | x{fresh / pooled:.1f}"
+        )
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=30)
+    parser.add_argument("--handshake-ms", type=float, default=60.0)
+    parser.add_argument("--providers", nargs="+", default=["gemini", "openai", "anthropic"])
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.handshake_ms, args.providers))
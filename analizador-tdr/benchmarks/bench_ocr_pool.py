@@ -0,0 +1,104 @@
+"""
+Benchmark: OCR de un TDR escaneado de 30 imágenes.
+
+Compara `TesseractOCRProcessor` (pytesseract: un proceso tesseract por imagen,
+archivos temporales y datos del idioma recargados cada vez, en serie) con
+`PooledTesseractOCRProcessor` (workers de larga vida: tesserocr en proceso si
+está instalado, o lotes de imágenes por ejecución de tesseract), con todas las
+imágenes enviadas a la vez y un plazo por documento.
+
+- motor:  las imágenes embebidas del PDF, directo al procesador OCR.
+- parser: SmartPDFReaderPipeline completo (render de página a 200 dpi + OCR).
+
+Requiere Tesseract con el idioma español (apt install tesseract-ocr tesseract-ocr-spa).
+
+Uso (desde analizador-tdr/):
+    python -m benchmarks.bench_ocr_pool
+    python -m benchmarks.bench_ocr_pool --images 30 --workers 1 2 4 --batch 8
+"""
+import argparse
+import time
+
+import fitz
+
+from app.services.pdf_reader import (
+    PooledTesseractOCRProcessor,
+    SmartPDFReaderPipeline,
+    TesseractOCRProcessor,
+    wait_for_ocr,
+)
+from benchmarks._synthetic import build_scanned_pdf
+
+
+def _page_images(pdf_bytes: bytes):
+    """Bytes de la imagen (escaneo) de cada página."""
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        return [doc.extract_image(page.get_images()[0][0])["image"] for page in doc]
+    finally:
+        doc.close()
+
+
+def _ocr_serial(processor, images):
+    return [processor.extract_text(image) for image in images]
+
+
+def _ocr_pooled(processor, images, deadline_seconds: float):
+    deadline = time.monotonic() + deadline_seconds
+    futures = [processor.submit(image) for image in images]
+    return [wait_for_ocr(future, deadline) for future in futures]
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def _cell(seconds: float, texts, count: int) -> str:
+    chars = sum(len(text or "") for text in texts)
+    return f"{seconds:6.1f}s {seconds / count * 1000:6.0f}ms/img {chars:>7,} chars"
+
+
+def main(images: int, workers, batch: int, deadline: float) -> None:
+    legacy = TesseractOCRProcessor()
+    if not legacy.is_available():
+        print("❌ Tesseract no disponible (instalar tesseract-ocr y tesseract-ocr-spa, o TESSERACT_CMD)")
+        return
+
+    print(f"🖨️  Generando TDR escaneado de {images} imágenes…")
+    document = build_scanned_pdf(images)
+    page_images = _page_images(document)
+    print(f"📊 {len(page_images)} imágenes, {sum(map(len, page_images)) / 1048576:.1f}MB\n")
+
+    print(f"{'motor':>22} | {'1ª pasada':>36} | {'2ª pasada (workers ya cargados)':>36}")
+    print("─" * 102)
+    seconds, texts = _timed(_ocr_serial, legacy, page_images)
+    print(f"{'pytesseract (serie)':>22} | {_cell(seconds, texts, images):>36} | {'—':>36}")
+    for count in workers:
+        pooled = PooledTesseractOCRProcessor(workers=count, batch_size=batch)
+        backend = "tesserocr" if pooled.is_available() and pooled._load_tesserocr() else "lotes"
+        row = []
+        for _ in range(2):
+            seconds, texts = _timed(_ocr_pooled, pooled, page_images, deadline)
+            row.append(_cell(seconds, texts, images))
+        print(f"{f'pool ×{count} ({backend})':>22} | {row[0]:>36} | {row[1]:>36}")
+
+    print(f"\n{'parser':>22} | {'extracción completa':>36}")
+    print("─" * 63)
+    for count in [0] + list(workers):
+        pipeline = SmartPDFReaderPipeline(ocr_workers=count, ocr_deadline_seconds=deadline)
+        seconds, content = _timed(pipeline.extract_structured, document)
+        texts = [block.content for page in content.pages for block in page.blocks]
+        label = "pytesseract (serie)" if count == 0 else f"pool ×{count}"
+        print(f"{label:>22} | {_cell(seconds, texts, images):>36}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=30)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--batch", type=int, default=PooledTesseractOCRProcessor.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--deadline", type=float, default=300)
+    args = parser.parse_args()
+    main(args.images, args.workers, args.batch, args.deadline)
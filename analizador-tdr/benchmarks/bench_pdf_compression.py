@@ -0,0 +1,110 @@
+"""
+Benchmark: compresión de PDFs escaneados que exceden MAX_FILE_SIZE_MB.
+
+Compara la versión original de `comprimir_pdf` (streams + documento completo
+rasterizado a 150, 120, 100 y 80 dpi en serie hasta que cabe) con
+`comprimir_documento` (escalón elegido por muestreo, rasterización por rangos
+de páginas en el pool de procesos, caché por SHA-256) para varios límites:
+cuanto más bajo el límite, más escalones recorría la versión original.
+
+Uso (desde analizador-tdr/):
+    python -m benchmarks.bench_pdf_compression
+    python -m benchmarks.bench_pdf_compression --pages 40 --limits 10 4 2.5 --pool 4
+"""
+import argparse
+import asyncio
+import io
+import time
+
+import fitz
+
+from config import settings
+from app.services import document_executor
+from app.services.pdf_compressor import comprimir_documento, compression_cache
+from benchmarks._synthetic import build_scanned_pdf
+
+
+def _legacy_comprimir_pdf(pdf_bytes: bytes, limite_mb: float):
+    """comprimir_pdf original: streams y luego 150→120→100→80 dpi sobre el documento completo."""
+    limite_bytes = limite_mb * 1024 * 1024
+    try:
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        out = io.BytesIO()
+        doc.save(out, garbage=4, deflate=True)
+        doc.close()
+        comprimido = out.getvalue()
+        if len(comprimido) < len(pdf_bytes) and len(comprimido) <= limite_bytes:
+            return comprimido, "streams"
+    except Exception:
+        pass
+
+    for dpi in (150, 120, 100, 80):
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        nuevo = fitz.open()
+        for page in doc:
+            pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB)
+            img_bytes = pix.tobytes("jpeg", jpg_quality=70)
+            rect = fitz.Rect(0, 0, pix.width / 72, pix.height / 72)
+            npage = nuevo.new_page(width=rect.width, height=rect.height)
+            npage.insert_image(rect, stream=img_bytes)
+        out = io.BytesIO()
+        nuevo.save(out, garbage=4, deflate=True)
+        nuevo.close()
+        doc.close()
+        comprimido = out.getvalue()
+        if len(comprimido) <= limite_bytes:
+            return comprimido, f"{dpi}dpi"
+    return None, "no cabe"
+
+
+def _describe(result) -> str:
+    if result is None:
+        return "no cabe"
+    doc = fitz.open(stream=result, filetype="pdf")
+    page = doc[0]
+    images = page.get_images()
+    dpi = round(doc.extract_image(images[0][0])["width"] / page.rect.width * 72) if images else 0
+    doc.close()
+    return f"{len(result) / 1048576:5.2f}MB ~{dpi}dpi"
+
+
+async def main(pages: int, limits, pool: int) -> None:
+    print(f"🖨️  Generando PDF escaneado de {pages} páginas…")
+    document = build_scanned_pdf(pages)
+    print(f"📊 Documento: {len(document) / 1048576:.1f}MB; pool de {pool} procesos\n")
+    print(f"{'límite':>7} | {'original':>28} | {'1 proceso':>28} | {f'pool ×{pool}':>28} | {'caché':>8}")
+    print("─" * 112)
+
+    for limit in limits:
+        start = time.perf_counter()
+        legacy, legacy_step = _legacy_comprimir_pdf(document, limit)
+        legacy_seconds = time.perf_counter() - start
+        legacy_cell = f"{legacy_seconds:6.1f}s {legacy_step:>7} {(len(legacy) / 1048576 if legacy else 0):5.2f}MB"
+
+        row = []
+        for pool_size in (0, pool):
+            settings.document_pool_size = pool_size
+            document_executor.shutdown_document_executor()
+            if pool_size:
+                # Arrancar los procesos fuera de la medición
+                await asyncio.gather(*(document_executor.run_document_task(len, b"") for _ in range(pool_size)))
+            compression_cache.clear()
+            start = time.perf_counter()
+            result = await comprimir_documento(document, limit)
+            row.append(f"{time.perf_counter() - start:6.1f}s {_describe(result):>20}")
+
+        start = time.perf_counter()
+        await comprimir_documento(document, limit)
+        cached_seconds = time.perf_counter() - start
+        print(f"{limit:>5}MB | {legacy_cell:>28} | {row[0]:>28} | {row[1]:>28} | {cached_seconds * 1000:5.1f}ms")
+
+    document_executor.shutdown_document_executor()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--limits", type=float, nargs="+", default=[10, 4, 2.5])
+    parser.add_argument("--pool", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(main(args.pages, args.limits, args.pool))
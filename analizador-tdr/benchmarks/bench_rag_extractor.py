@@ -0,0 +1,104 @@
+"""
+Benchmark: etiquetado de chunks de RAGExtractionService.
+
+Compara la versión original (ventanas de 1000 palabras con 200 de solape y,
+por cada categoría × chunk × patrón, lower() del chunk + re.search sin
+compilar) con el índice actual: chunks estructurales (StructuredChunker) y
+una sola pasada de COMBINED_PATTERN sobre el texto. Los chunks ya no son los
+mismos, así que se informa cuántos genera cada versión y cuántos quedan
+etiquetados. También mide extract_relevant_fragments completo (índice +
+ranking BM25).
+
+Uso (desde analizador-tdr/):
+    python -m benchmarks.bench_rag_extractor
+    python -m benchmarks.bench_rag_extractor --pages 50 200 500 --keyword-ratio 0.15
+"""
+import argparse
+import re
+import time
+
+from benchmarks._synthetic import build_tdr_text
+from app.services.rag_extractor import RAGExtractionService
+
+
+def _legacy_chunks(full_text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> list:
+    """Chunking original: ventanas de palabras con solape."""
+    words = full_text.split()
+    step = chunk_size - chunk_overlap
+    return [" ".join(words[i:i + chunk_size]) for i in range(0, len(words), step)]
+
+
+def _legacy_tags(service: RAGExtractionService, full_text: str) -> dict:
+    """Etiquetado original: chunks que coinciden con cada categoría."""
+    fragments = {category: [] for category in service.SECTION_PATTERNS}
+    chunks = _legacy_chunks(full_text)
+    for category, patterns in service.SECTION_PATTERNS.items():
+        relevant_chunks = []
+        for chunk in chunks:
+            chunk_lower = chunk.lower()
+            for pattern in patterns:
+                if re.search(pattern, chunk_lower, re.IGNORECASE):
+                    relevant_chunks.append(chunk)
+                    break
+        fragments[category] = relevant_chunks
+    return fragments
+
+
+def _tagged(fragments: dict) -> int:
+    return sum(len(chunks) for chunks in fragments.values())
+
+
+def _index_tags(service: RAGExtractionService, full_text: str) -> dict:
+    chunks, tags = service.index_chunks(full_text)
+    fragments = {category: [] for category in service.SECTION_PATTERNS}
+    for chunk, terms in zip(chunks, tags):
+        for category in dict.fromkeys(service.term_category(term) for term in terms):
+            fragments[category].append(chunk)
+    return fragments
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(pages: list[int], repeat: int, keyword_ratio: float) -> None:
+    service = RAGExtractionService()
+    print(
+        "📊 Etiquetado de chunks: ventanas × categorías × patrones vs chunks estructurales + una pasada "
+        f"({keyword_ratio:.0%} de términos clave)\n"
+    )
+    print(
+        f"{'págs':>5} | {'chunks ant/est':>14} | {'etiquetas ant/est':>17} | {'anterior':>10} | "
+        f"{'estructural':>11} | {'mejora':>6} | {'+ BM25':>9}"
+    )
+    print("─" * 96)
+    for num_pages in pages:
+        text = build_tdr_text(num_pages, keyword_ratio=keyword_ratio)
+        legacy_chunks = len(_legacy_chunks(text))
+        chunks, _ = service.index_chunks(text)
+        legacy = _best_of(lambda: _legacy_tags(service, text), repeat)
+        single = _best_of(lambda: service.index_chunks(text), repeat)
+        ranked = _best_of(lambda: service.extract_relevant_fragments(text), repeat)
+        tagged = f"{_tagged(_legacy_tags(service, text))}/{_tagged(_index_tags(service, text))}"
+        print(
+            f"{num_pages:>5} | {f'{legacy_chunks}/{len(chunks)}':>14} | {tagged:>17} | "
+            f"{legacy * 1000:>8.1f}ms | {single * 1000:>9.1f}ms | x{legacy / single:>5.1f} | "
+            f"{ranked * 1000:>7.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.INFO)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--keyword-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+    main(args.pages, args.repeat, args.keyword_ratio)
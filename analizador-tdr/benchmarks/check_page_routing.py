@@ -0,0 +1,62 @@
+"""
+Comprobación: ruta del sondeo (nativo / híbrido / multimodal) por página.
+
+- TDR nativo con logo en la carátula y una firma escaneada en la última
+  página (ambas con poco texto): ninguna página es escaneada → ruta nativa,
+  sin transcripción extra.
+- El mismo TDR con 2 páginas escaneadas de página completa al final: solo
+  esas son escaneadas → ruta híbrida.
+
+Uso (desde analizador-tdr/):
+    python -m benchmarks.check_page_routing
+"""
+import fitz
+
+from app.services.pdf_reader import ROUTE_HYBRID, ROUTE_NATIVE, DocumentProbe
+from app.services.pdf_reader.scanned_page_extractor import ScannedPageOCRExtractor
+from benchmarks._synthetic import build_scanned_pdf, build_tdr_pdf
+
+
+def _stamp(width: int, height: int) -> bytes:
+    """PNG gris de un logo o firma."""
+    pix = fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, width, height), False)
+    pix.set_rect(pix.irect, (90,))
+    return pix.tobytes("png")
+
+
+def _native_tdr() -> fitz.Document:
+    doc = fitz.open()
+    cover = doc.new_page()
+    cover.insert_image(fitz.Rect(250, 60, 345, 140), stream=_stamp(190, 160))
+    cover.insert_text((180, 200), "TÉRMINOS DE REFERENCIA", fontsize=16)
+    cover.insert_text((160, 230), "Servicio de mantenimiento preventivo", fontsize=11)
+    doc.insert_pdf(fitz.open(stream=build_tdr_pdf(4), filetype="pdf"))
+    signature = doc.new_page()
+    signature.insert_text((60, 80), "Lima, 10 de marzo de 2026", fontsize=10)
+    signature.insert_image(fitz.Rect(220, 600, 380, 680), stream=_stamp(320, 160))
+    signature.insert_text((230, 700), "Jefe del Área Usuaria", fontsize=10)
+    return doc
+
+
+def main() -> None:
+    doc = _native_tdr()
+    probe = DocumentProbe().probe(doc)
+    for page in probe.pages:
+        print(f"  página {page.page_number}: {page.char_count} chars, "
+              f"{page.image_count} imágenes, cobertura {page.image_coverage:.0%}")
+    assert probe.scanned_pages == [], probe.scanned_pages
+    assert probe.route() == ROUTE_NATIVE, probe.route()
+    assert not any(ScannedPageOCRExtractor.is_scanned_page(page) for page in doc)
+
+    doc.insert_pdf(fitz.open(stream=build_scanned_pdf(2, dpi=100), filetype="pdf"))
+    probe = DocumentProbe().probe(doc)
+    assert probe.scanned_pages == [7, 8], probe.scanned_pages
+    assert probe.route() == ROUTE_HYBRID, probe.route()
+    assert [ScannedPageOCRExtractor.is_scanned_page(page) for page in doc] == [False] * 6 + [True] * 2
+    doc.close()
+
+    print("✅ Rutas correctas (logo y firma: nativo; escaneos de página completa: híbrido)")
+
+
+if __name__ == "__main__":
+    main()
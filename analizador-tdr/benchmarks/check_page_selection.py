@@ -0,0 +1,84 @@
+"""
+Comprobación: qué páginas descarta PageSelector como formato o en blanco.
+
+Un TDR de 5 páginas:
+  1. carátula
+  2. "ALCANCE Y DESCRIPCIÓN DEL SERVICIO": página densa que cita varios anexos
+  3. requisitos y penalidades
+  4. declaración jurada para rellenar (líneas en blanco, firma y sello)
+  5. página en blanco
+
+Sin presupuesto se conservan 1-3 (la 2 no debe caer por citar anexos) y se
+descartan 4 y 5. Con presupuesto de 2 páginas, la carátula y la mejor del cuerpo.
+
+Uso (desde analizador-tdr/):
+    python -m benchmarks.check_page_selection
+"""
+import fitz
+
+from app.services.pdf_reader import PageSelector
+from app.services.rag_extractor import RAGExtractionService
+
+_ALCANCE = (
+    "ALCANCE Y DESCRIPCIÓN DEL SERVICIO\n"
+    + " ".join(
+        f"{i}. El contratista brindará el servicio de mantenimiento de los equipos de la sede "
+        f"central conforme a las especificaciones del Anexo N° {i}, en los plazos establecidos "
+        "por el área usuaria, con personal propio y equipamiento adecuado para cada actividad."
+        for i in range(1, 10)
+    )
+)
+_REQUISITOS = (
+    "REQUISITOS DEL POSTOR Y PENALIDADES\n"
+    "Experiencia mínima del postor de dos años en servicios similares. "
+    "Forma de pago: mensual, previa conformidad del área usuaria. "
+    "Penalidad por mora: 0.10 del monto del contrato por día de retraso. "
+    "Plazo de ejecución: 365 días calendario. Presupuesto referencial: S/ 120,000.00."
+)
+_DECLARACION = (
+    "ANEXO N° 3\nDECLARACIÓN JURADA\n"
+    "Yo, ______________________________, identificado con DNI N° ____________,\n"
+    "declaro bajo juramento no tener impedimento para contratar con el Estado.\n\n"
+    "Lima, ____ de ____________ de 2026\n\n"
+    "______________________\nFirma y sello del postor"
+)
+
+
+def _build_pdf() -> bytes:
+    doc = fitz.open()
+    for text in ("TÉRMINOS DE REFERENCIA\nServicio de mantenimiento\nEntidad contratante", _ALCANCE,
+                 _REQUISITOS, _DECLARACION, None):
+        page = doc.new_page()
+        if text:
+            page.insert_textbox(fitz.Rect(50, 50, 545, 790), text, fontsize=10)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _select(pdf: bytes, max_pages: int):
+    patterns = [p for group in RAGExtractionService.SECTION_PATTERNS.values() for p in group]
+    doc = fitz.open(stream=pdf, filetype="pdf")
+    try:
+        return PageSelector(patterns, max_pages=max_pages).select(doc)
+    finally:
+        doc.close()
+
+
+def main() -> None:
+    pdf = _build_pdf()
+
+    selection = _select(pdf, max_pages=0)
+    for score in selection.scores:
+        flags = " en blanco" if score.blank else " formato" if score.boilerplate else ""
+        print(f"  página {score.page_number}: {score.score:+.2f}{flags}")
+    assert selection.pages == [1, 2, 3], selection.pages
+
+    selection = _select(pdf, max_pages=2)
+    assert selection.pages[0] == 1 and len(selection.pages) == 2, selection.pages
+
+    print(f"✅ Selección correcta (sin presupuesto: 1-3; con 2 páginas: {selection.pages})")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ Configuración centralizada del microservicio usando Pydantic Settings.
 Lee automáticamente desde el archivo .env
 """
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Literal
+from typing import Literal, Optional
 
 
 class Settings(BaseSettings):
@@ -43,25 +43,120 @@ class Settings(BaseSettings):
     anthropic_api_key: str = ""
     anthropic_model: str = "claude-3-5-haiku-20250122"
 
+    # Endpoints alternativos (proxy corporativo, mock local). Vacío = endpoint oficial
+    gemini_base_url: str = ""
+    openai_base_url: str = ""
+    anthropic_base_url: str = ""
+
+    # Gemini multimodal: documento subido una vez a la Files API y referenciado por URI
+    gemini_files_enabled: bool = False
+    gemini_files_min_kb: int = 256                # Documentos más chicos van inline (subir cuesta un round-trip)
+    gemini_context_cache_enabled: bool = False    # CachedContent por documento + operación (cobra almacenamiento/hora)
+    gemini_context_cache_ttl_seconds: int = 900   # 15 min: los endpoints sobre un mismo TDR se llaman seguidos
+
+    # Pool HTTP de los clientes LLM (clientes de larga vida, uno por proveedor/modelo)
+    llm_max_connections: int = 20                 # Conexiones simultáneas por cliente
+    llm_max_keepalive_connections: int = 10       # Conexiones ociosas que se mantienen abiertas
+    llm_keepalive_expiry_seconds: float = 60.0
+    llm_timeout_seconds: float = 600.0            # Multimodal con PDFs grandes puede tardar minutos
+
+    # Rate limiting saliente por proveedor/modelo (las llamadas esperan en cola, no fallan).
+    # 0 = sin límite en ese bucket. Valores por defecto: free tier de Gemini 2.5 Flash
+    llm_rate_limit_enabled: bool = True
+    gemini_rpm: int = 15
+    gemini_tpm: int = 250_000
+    gemini_rpd: int = 1_500
+    openai_rpm: int = 500
+    openai_tpm: int = 200_000
+    openai_rpd: int = 0
+    anthropic_rpm: int = 50
+    anthropic_tpm: int = 40_000
+    anthropic_rpd: int = 0
+
+    # Resiliencia: reintentos de errores transitorios (429/5xx/timeouts) con backoff + jitter
+    llm_max_retries: int = 3
+    llm_retry_base_seconds: float = 1.0
+    llm_retry_max_wait_seconds: float = 20.0
+    llm_call_deadline_seconds: float = 0.0        # Plazo total por llamada (intentos + esperas); 0 = request_timeout_seconds
+    # Hedging: si el proveedor principal supera su p-ésimo percentil de latencia, se lanza
+    # la misma operación en el secundario y gana la primera respuesta ("" = desactivado)
+    llm_hedge_provider: Literal["", "gemini", "openai", "anthropic"] = ""
+    llm_hedge_percentile: float = 95.0
+    llm_hedge_min_samples: int = 20               # Muestras mínimas antes de usar el percentil
+    llm_hedge_initial_delay_seconds: float = 60.0 # Espera antes de cubrir mientras no hay muestras
+
     # RAG Configuration
-    chunk_size: int = 1000
-    chunk_overlap: int = 200
-    top_k_chunks: int = 5
+    chunk_size: int = 1000                        # Máx. palabras por chunk (los cortes siguen secciones y tablas)
+    chunk_overlap: Optional[int] = None           # Obsoleto e ignorado (los chunks estructurales no se solapan); se acepta para no romper .env antiguos
+    top_k_chunks: int = 5                         # Máx. chunks por categoría (los de mayor puntaje BM25)
+    rag_context_max_tokens: int = 16_000          # Presupuesto del contexto RAG enviado al LLM (0 = sin límite)
+    gemini_context_tokens: int = 0                # Presupuesto por proveedor (0 = rag_context_max_tokens)
+    openai_context_tokens: int = 0
+    anthropic_context_tokens: int = 0
+    rag_full_document_max_tokens: int = 1_500     # Documentos de hasta N tokens estimados se envían completos (sin RAG)
+    rag_semantic_enabled: bool = False            # Fusiona BM25 con similitud de embeddings (requiere numpy)
+    rag_embedding_model: str = ""                 # Modelo fastembed local (ej. "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"); "" = n-gramas hasheados
+    rag_embedding_cache_entries: int = 64         # Documentos con embeddings cacheados (LRU por SHA-256)
 
     # Límites
     max_file_size_mb: int = 10
-    request_timeout_seconds: int = 60
+    max_upload_size_mb: int = 100                 # Tamaño bruto máximo de un archivo subido (por encima de max_file_size_mb se intenta comprimir)
+    upload_chunk_kb: int = 1024                   # Bloque de lectura de los uploads (SHA-256 y límite se calculan por bloque)
+    upload_spool_memory_kb: int = 1024            # Uploads de hasta N KB quedan en memoria; los mayores se vuelcan a un archivo temporal
+    request_timeout_seconds: int = 180            # Un análisis multimodal de un PDF grande puede tardar 1-2 min
 
     # PDF Reader Pipeline (Extracción inteligente)
     ocr_enabled: bool = True                   # Usa Tesseract OCR para imágenes (si está instalado)
     table_extraction_enabled: bool = True      # Detecta y extrae tablas con PyMuPDF
     min_image_size_bytes: int = 5000           # Bytes mínimos para procesar una imagen (filtra íconos)
     tesseract_cmd: str = ""                    # Ruta completa a tesseract (si no está en PATH)
+    scanned_page_ocr_dpi: int = 200            # Render de páginas escaneadas (documentos mixtos) para OCR
+    ocr_workers: int = 2                       # Workers de Tesseract de larga vida por proceso del pool (0 = pytesseract en serie)
+    ocr_deadline_seconds: int = 120            # Plazo de OCR por documento; lo que no terminó se omite (0 = sin plazo)
 
     # Procesamiento Asíncrono (para scraper: 3-10 docs/40min = 360 docs/día)
     max_concurrent_requests: int = 3
     enable_batch_processing: bool = True
 
+    # Pool de procesos para trabajo CPU-bound (PyMuPDF, Tesseract, compresión, DOCX)
+    document_pool_size: int = 2                   # 0 = ejecutar en hilos (sin procesos)
+    document_pool_max_tasks_per_child: int = 50   # Recicla workers para acotar fugas de memoria de MuPDF
+    parse_shard_min_pages: int = 30               # PDFs nativos con ≥N págs se parsean en fragmentos paralelos (0 = off)
+    parse_shard_pages: int = 10                   # Mínimo de páginas por fragmento
+    compression_cache_entries: int = 4            # PDFs comprimidos cacheados por SHA-256 + límite (0 = sin caché)
+
+    # Selección de páginas para el envío multimodal (escaneados o > 20 págs): se descartan
+    # páginas en blanco y formatos/anexos, y con presupuesto se conservan las más informativas
+    multimodal_page_selection_enabled: bool = True
+    multimodal_max_pages: int = 0                 # 0 = sin tope (solo se retiran páginas en blanco y formatos)
+    multimodal_max_tokens: int = 0                # Tope en tokens (~258 por página en Gemini); 0 = sin tope
+    # Documentos mixtos (ruta híbrida): páginas nativas por texto; las escaneadas sin OCR local
+    # se transcriben en una sola llamada multimodal con solo esas páginas
+    hybrid_transcription_enabled: bool = True
+
+    # Caché de resultados (SHA-256 del documento + proveedor + tipo + modelo + versión de prompt)
+    result_cache_enabled: bool = True
+    result_cache_backend: Literal["memory", "sqlite", "tiered"] = "tiered"
+    result_cache_ttl_seconds: int = 86_400        # 24h: el scraper re-envía el mismo TDR varias veces al día
+    result_cache_max_entries: int = 256           # Entradas en el LRU en memoria
+    result_cache_path: str = ".cache/result_cache.sqlite3"
+
+    # Comprensión del documento compartida entre /analyze-tdr, /analyze-direccionamiento y /generate-proforma
+    # (sondeo, texto fusionado, chunks, fragmentos y contexto por SHA-256; en memoria)
+    understanding_cache_enabled: bool = True
+    understanding_cache_ttl_seconds: int = 1_800  # 30 min: los tres endpoints se llaman seguidos
+    understanding_cache_max_entries: int = 32
+
+    # Cola de trabajos asíncrona (POST /jobs + GET /jobs/{id}), persistida en SQLite
+    jobs_db_path: str = ".cache/jobs.sqlite3"
+    job_concurrency_tdr: int = 2                  # Workers por tipo de trabajo (0 = no procesar ese tipo)
+    job_concurrency_direccionamiento: int = 1
+    job_concurrency_proforma: int = 1
+    job_retention_hours: int = 72                 # Trabajos finalizados se purgan al arrancar tras N horas
+    job_lease_seconds: int = 60                   # Lease de un trabajo en running (se renueva cada N/3 s mientras corre)
+    job_max_attempts: int = 3                     # Intentos por trabajo antes de marcarlo como error
+    job_retry_delay_seconds: float = 30.0         # Retraso base (×2 por intento) al re-encolar por proveedor no disponible
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
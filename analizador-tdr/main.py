@@ -5,18 +5,14 @@ Optimizado para Gemini 2.5/3 Flash con procesamiento asíncrono.
 """
 from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from datetime import datetime
-import io
+import asyncio
+import json
 import logging
+import math
 from contextlib import asynccontextmanager
 
-try:
-    import fitz  # PyMuPDF
-    _HAS_FITZ = True
-except ImportError:
-    _HAS_FITZ = False
-
 from config import settings
 from app.models.schemas import (
     TDRAnalysisResponse,
@@ -29,10 +25,18 @@ from app.models.schemas import (
     ProformaResponse,
 )
 from app.services.analyzer_service import TDRAnalyzerService
+from app.services.llm import LLMFactory, LLMUnavailableError
+from app.services.result_cache import analysis_cache
+from app.services.document_understanding import document_understanding
+from app.services.document_executor import get_document_executor, shutdown_document_executor
+from app.routes.uploads import leer_documento
 from app.middleware import require_auth, AuthContext
+from app.middleware.upload_limit import UploadSizeLimitMiddleware
 
 # Importar router de batch processing
 from app.routes.batch import router as batch_router
+from app.routes.jobs import router as jobs_router
+from app.services.job_queue import job_queue
 
 # Configuración de logging
 logging.basicConfig(
@@ -43,80 +47,6 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def _comprimir_pdf(pdf_bytes: bytes, limite_mb: float) -> bytes | None:
-    """
-    Comprime un PDF que excede el límite permitido.
-
-    Estrategia escalonada:
-      1. Limpieza + recompresión de streams (garbage=4, deflate).
-      2. Rasterización de páginas a JPEG (dpi escalonado 150→80) y reensamblado
-         — reduce 5-10x el peso de PDFs escaneados (caso típico de TDR pesados).
-
-    Devuelve los bytes comprimidos o None si no se pudo reducir al límite.
-    """
-    limite_bytes = limite_mb * 1024 * 1024
-    if len(pdf_bytes) <= limite_bytes or not _HAS_FITZ:
-        return pdf_bytes
-
-    # ── Intento 1: limpieza y recompresión de streams ──
-    try:
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        out = io.BytesIO()
-        doc.save(out, garbage=4, deflate=True)
-        doc.close()
-        comprimido = out.getvalue()
-        if len(comprimido) < len(pdf_bytes) and len(comprimido) <= limite_bytes:
-            logger.info(f"📦 PDF comprimido (streams): {len(pdf_bytes)/1048576:.1f}MB → {len(comprimido)/1048576:.1f}MB")
-            return comprimido
-    except Exception as e:
-        logger.warning(f"Compresión por streams falló: {e}")
-
-    # ── Intento 2: rasterizar páginas a JPEG con dpi escalonado ──
-    for dpi in (150, 120, 100, 80):
-        try:
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            nuevo = fitz.open()
-            for page in doc:
-                pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB)
-                img_bytes = pix.tobytes("jpeg", jpg_quality=70)
-                rect = fitz.Rect(0, 0, pix.width / 72, pix.height / 72)
-                npage = nuevo.new_page(width=rect.width, height=rect.height)
-                npage.insert_image(rect, stream=img_bytes)
-            out = io.BytesIO()
-            nuevo.save(out, garbage=4, deflate=True)
-            nuevo.close()
-            doc.close()
-            comprimido = out.getvalue()
-            if len(comprimido) <= limite_bytes:
-                logger.info(f"📦 PDF rasterizado a {dpi}dpi: {len(pdf_bytes)/1048576:.1f}MB → {len(comprimido)/1048576:.1f}MB")
-                return comprimido
-        except Exception as e:
-            logger.warning(f"Rasterización a {dpi}dpi falló: {e}")
-
-    return None
-
-
-async def _leer_documento(file: UploadFile, limite_mb: float) -> bytes:
-    """
-    Lee el archivo subido y lo comprime si excede el límite del servicio.
-
-    Lanza 413 si el archivo no puede reducirse al tamaño permitido.
-    """
-    pdf_bytes = await file.read()
-    file_size_mb = len(pdf_bytes) / (1024 * 1024)
-
-    if file_size_mb > limite_mb:
-        comprimido = _comprimir_pdf(pdf_bytes, limite_mb)
-        if comprimido is None:
-            raise HTTPException(
-                status_code=413,
-                detail=f"El archivo excede el tamaño máximo permitido ({settings.max_file_size_mb}MB) y no pudo comprimirse"
-            )
-        pdf_bytes = comprimido
-
-    return pdf_bytes
-
-
 # Lifespan context manager para startup/shutdown
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -126,8 +56,15 @@ async def lifespan(app: FastAPI):
     logger.info(f"LLM Provider: {settings.default_llm_provider} ({settings.gemini_model})")
     logger.info(f"Batch processing: {'Habilitado' if settings.enable_batch_processing else 'Deshabilitado'}")
     logger.info(f"Concurrencia máxima: {settings.max_concurrent_requests}")
+    if settings.chunk_overlap is not None:
+        logger.warning("⚠️ CHUNK_OVERLAP está obsoleto y se ignora (los chunks estructurales no se solapan); quitarlo del .env")
+    get_document_executor()
+    await job_queue.start()
     yield
     logger.info("🛑 Deteniendo microservicio")
+    await job_queue.stop()
+    await LLMFactory.close_clients()
+    shutdown_document_executor()
 
 
 # Crear aplicación FastAPI
@@ -140,6 +77,11 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+# Rechaza con 413 los uploads que superan MAX_UPLOAD_SIZE_MB mientras se reciben.
+# Se registra antes que CORS (el último registrado es el más externo) para que
+# el 413 también lleve las cabeceras CORS y el navegador pueda leerlo.
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # Middleware CORS — orígenes restringidos por configuración
 _allowed_origins = [o.strip() for o in settings.allowed_origins.split(",") if o.strip()]
 app.add_middleware(
@@ -152,11 +94,27 @@ app.add_middleware(
 
 # Incluir router de batch processing
 app.include_router(batch_router)
+app.include_router(jobs_router)
 
 # Instancia del servicio de análisis (singleton)
 analyzer_service = TDRAnalyzerService()
 
 
+def _retry_after(e: LLMUnavailableError) -> int:
+    """Segundos de Retry-After: los del proveedor o, si no los envió, la espera máxima de reintento."""
+    return max(1, math.ceil(e.retry_after or settings.llm_retry_max_wait_seconds))
+
+
+def _llm_unavailable(e: LLMUnavailableError) -> HTTPException:
+    """503 con Retry-After: el proveedor LLM no respondió tras agotar reintentos."""
+    logger.error(f"⏳ LLM no disponible: {str(e)}")
+    return HTTPException(
+        status_code=503,
+        detail=f"{str(e)}. Reintente más tarde",
+        headers={"Retry-After": str(_retry_after(e))},
+    )
+
+
 # ============================================================================
 # ENDPOINTS
 # ============================================================================
@@ -177,14 +135,16 @@ async def root():
 async def health_check():
     """
     Health check del microservicio.
-    Verifica que el servicio esté operativo.
+    Verifica que el servicio esté operativo e informa hits/misses de la caché de resultados.
     """
     return HealthCheckResponse(
         status="healthy",
         app_name=settings.app_name,
         version="1.0.0",
         timestamp=datetime.now(),
-        llm_provider=settings.default_llm_provider
+        llm_provider=settings.default_llm_provider,
+        result_cache=analysis_cache.stats(),
+        understanding_cache=document_understanding.stats(),
     )
 
 
@@ -228,7 +188,7 @@ async def analyze_tdr(
             )
 
         # Leer contenido del archivo (comprime si excede el límite; 413 si no es posible)
-        pdf_bytes = await _leer_documento(file, settings.max_file_size_mb)
+        pdf_bytes = await leer_documento(file, settings.max_file_size_mb)
 
         logger.info(f"📄 Recibido: {file.filename} — tipo: {tipo_contrato}")
 
@@ -240,7 +200,7 @@ async def analyze_tdr(
             )
 
         # Ejecutar análisis
-        result = await analyzer_service.analyze_tdr_document(
+        envelope = await analyzer_service.analyze_tdr_document(
             pdf_bytes=pdf_bytes,
             llm_provider=llm_provider,
             tipo_contrato=tipo_contrato or "menores",
@@ -252,12 +212,16 @@ async def analyze_tdr(
         # Envolver respuesta para Laravel
         return {
             "success": True,
-            "data": result.model_dump() if hasattr(result, 'model_dump') else result,
-            "token_usage": analyzer_service.last_token_usage,
+            "data": envelope.data(),
+            "token_usage": envelope.token_usage,
+            "metrics": envelope.metrics(),
             "timestamp": datetime.now().isoformat(),
             "filename": file.filename
         }
 
+    except LLMUnavailableError as e:
+        raise _llm_unavailable(e)
+
     except ValueError as e:
         logger.error(f"Error de validación: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -270,6 +234,107 @@ async def analyze_tdr(
         )
 
 
+def _sse(evento: str, payload: dict) -> str:
+    """Serializa un evento Server-Sent Events."""
+    return f"event: {evento}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+
+@app.post(
+    "/analyze-tdr/stream",
+    tags=["Analysis"],
+    summary="Analiza un TDR y emite cada campo apenas el LLM lo genera (SSE)"
+)
+async def analyze_tdr_stream(
+    file: UploadFile = File(..., description="Archivo del TDR (PDF, DOCX, DOC)"),
+    llm_provider: str = Form(None),
+    tipo_contrato: str = Form("menores"),
+    auth: AuthContext = Depends(require_auth),
+):
+    """
+    **Variante streaming (Server-Sent Events) de /analyze-tdr.**
+
+    Mismos parámetros y mismo pipeline; la respuesta del LLM se recibe en
+    streaming y cada campo se envía en cuanto se cierra, sin esperar la
+    generación completa.
+
+    **Eventos:**
+    - `item`: `{field, index, value}` — elemento de una lista (p. ej. un requisito técnico)
+    - `field`: `{field, value}` — valor completo de un campo (p. ej. `resumen_ejecutivo`)
+    - `reset`: `{path}` — el análisis se repite por otra ruta (fallback multimodal):
+      descartar los campos recibidos
+    - `result`: mismo cuerpo que /analyze-tdr (`success`, `data` validado,
+      `token_usage`, `metrics` con `first_event_ms`)
+    - `error`: `{status_code, detail}`
+
+    Los campos intermedios son un avance: el valor definitivo es `result.data`
+    (validado y con la reparación de JSON truncado aplicada).
+    """
+    ext = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+    if ext not in ('pdf', 'docx', 'doc'):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Formato no soportado: .{ext}. Use PDF, DOCX o DOC"
+        )
+    if llm_provider and llm_provider not in ["gemini", "openai", "anthropic"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Proveedor LLM no válido: {llm_provider}"
+        )
+
+    # Leer antes de iniciar la respuesta: el UploadFile no debe usarse
+    # una vez que el handler retornó el StreamingResponse.
+    pdf_bytes = await leer_documento(file, settings.max_file_size_mb)
+    filename = file.filename
+    logger.info(f"📄 Recibido (streaming): {filename} — tipo: {tipo_contrato}")
+
+    async def event_stream():
+        events: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(analyzer_service.analyze_tdr_document(
+            pdf_bytes=pdf_bytes,
+            llm_provider=llm_provider,
+            tipo_contrato=tipo_contrato or "menores",
+            filename=filename,
+            on_event=events.put,
+        ))
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while (event := await events.get()) is not None:
+                yield _sse(event.pop("type"), event)
+
+            envelope = task.result()
+            logger.info(f"✅ Análisis (streaming) completado para: {filename} — {envelope.metrics()}")
+            yield _sse("result", {
+                "success": True,
+                "data": envelope.data(),
+                "token_usage": envelope.token_usage,
+                "metrics": envelope.metrics(),
+                "timestamp": datetime.now().isoformat(),
+                "filename": filename,
+            })
+        except LLMUnavailableError as e:
+            error = _llm_unavailable(e)
+            yield _sse("error", {
+                "status_code": error.status_code,
+                "detail": error.detail,
+                "retry_after": _retry_after(e),
+            })
+        except ValueError as e:
+            logger.error(f"Error de validación: {str(e)}")
+            yield _sse("error", {"status_code": 400, "detail": str(e)})
+        except Exception as e:
+            logger.error(f"Error inesperado: {str(e)}", exc_info=True)
+            yield _sse("error", {"status_code": 500, "detail": f"Error interno al procesar el TDR: {str(e)}"})
+        finally:
+            # Cliente desconectado: no seguir gastando cuota del LLM
+            task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post(
     "/analyze-direccionamiento",
     tags=["Analysis"],
@@ -295,29 +360,34 @@ async def analyze_direccionamiento(
         if ext not in ('pdf', 'docx', 'doc'):
             raise HTTPException(status_code=400, detail=f"Formato no soportado: .{ext}")
 
-        pdf_bytes = await _leer_documento(file, settings.max_file_size_mb)
+        pdf_bytes = await leer_documento(file, settings.max_file_size_mb)
 
         logger.info(f"🔍 Direccionamiento: {file.filename} — tipo: {tipo_contrato}")
 
         if llm_provider and llm_provider not in ["gemini", "openai", "anthropic"]:
             raise HTTPException(status_code=400, detail=f"Proveedor LLM no válido: {llm_provider}")
 
-        result = await analyzer_service.analyze_direccionamiento_document(
+        envelope = await analyzer_service.analyze_direccionamiento_document(
             pdf_bytes=pdf_bytes,
             llm_provider=llm_provider,
             tipo_contrato=tipo_contrato or "menores",
         )
 
-        logger.info(f"✅ Direccionamiento completado: {file.filename} — Score: {result.score_riesgo_corrupcion}")
+        score = getattr(envelope.result, "score_riesgo_corrupcion", "-")
+        logger.info(f"✅ Direccionamiento completado: {file.filename} — Score: {score}")
 
         return {
             "success": True,
-            "data": result.model_dump(),
-            "token_usage": analyzer_service.last_token_usage,
+            "data": envelope.data(),
+            "token_usage": envelope.token_usage,
+            "metrics": envelope.metrics(),
             "timestamp": datetime.now().isoformat(),
             "filename": file.filename
         }
 
+    except LLMUnavailableError as e:
+        raise _llm_unavailable(e)
+
     except ValueError as e:
         logger.error(f"Error de validación en direccionamiento: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -336,13 +406,17 @@ async def compatibility_score(
     auth: AuthContext = Depends(require_auth),
 ):
     try:
-        result = await analyzer_service.evaluate_compatibility(request)
+        envelope = await analyzer_service.evaluate_compatibility(request)
         return {
             "success": True,
-            "data": result.model_dump(),
-            "token_usage": analyzer_service.last_token_usage,
+            "data": envelope.data(),
+            "token_usage": envelope.token_usage,
+            "metrics": envelope.metrics(),
             "timestamp": datetime.now().isoformat(),
         }
+    except LLMUnavailableError as e:
+        raise _llm_unavailable(e)
+
     except ValueError as e:
         logger.error(f"Error de compatibilidad: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -391,27 +465,32 @@ async def generate_proforma(
         if ext not in ('pdf', 'docx', 'doc'):
             raise HTTPException(status_code=400, detail=f"Formato no soportado: .{ext}")
 
-        pdf_bytes = await _leer_documento(file, settings.max_file_size_mb)
+        pdf_bytes = await leer_documento(file, settings.max_file_size_mb)
 
         logger.info(f"📋 Proforma: {file.filename} — empresa: {company_name or '(sin nombre)'} — tipo: {tipo_contrato}")
 
-        result = await analyzer_service.generate_proforma_document(
+        envelope = await analyzer_service.generate_proforma_document(
             pdf_bytes=pdf_bytes,
             company_name=company_name.strip(),
             company_copy=company_copy.strip(),
             tipo_contrato=tipo_contrato or "menores",
         )
 
-        logger.info(f"✅ Proforma generada: {len(result.items)} ítems — {result.total_estimado}")
+        items = getattr(envelope.result, "items", None) or []
+        logger.info(f"✅ Proforma generada: {len(items)} ítems — {getattr(envelope.result, 'total_estimado', '-')}")
 
         return {
             "success": True,
-            "data": result.model_dump(),
-            "token_usage": analyzer_service.last_token_usage,
+            "data": envelope.data(),
+            "token_usage": envelope.token_usage,
+            "metrics": envelope.metrics(),
             "timestamp": datetime.now().isoformat(),
             "filename": file.filename,
         }
 
+    except LLMUnavailableError as e:
+        raise _llm_unavailable(e)
+
     except ValueError as e:
         logger.error(f"Error de validación en proforma: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -422,6 +501,98 @@ async def generate_proforma(
         raise HTTPException(status_code=500, detail=f"Error interno al generar proforma: {str(e)}")
 
 
+@app.post(
+    "/analyze-full",
+    tags=["Analysis"],
+    summary="Resumen del TDR, análisis forense y proforma en una sola llamada al LLM"
+)
+async def analyze_full(
+    file: UploadFile = File(..., description="Archivo del TDR (PDF, DOCX, DOC)"),
+    company_name: str = Form(""),
+    company_copy: str = Form(""),
+    llm_provider: str = Form(None),
+    tipo_contrato: str = Form("menores"),
+    auth: AuthContext = Depends(require_auth),
+):
+    """
+    **Análisis completo de un TDR en un solo envío.**
+
+    Equivale a /analyze-tdr + /analyze-direccionamiento + /generate-proforma,
+    pero el documento (o su contexto RAG) se envía al LLM una sola vez y la
+    respuesta trae las tres secciones. Cada sección se valida con el mismo
+    esquema que su endpoint; las que no cumplen se regeneran por separado y se
+    listan en `secciones_reintentadas`.
+
+    **Parámetros (form data):**
+    - `file`: Archivo del TDR (PDF, DOCX, DOC)
+    - `company_name`: Nombre de la empresa proveedora
+    - `company_copy`: Descripción del rubro/experiencia de la empresa (mín. 20 caracteres)
+    - `llm_provider`: (Opcional) "gemini", "openai", "anthropic"
+    - `tipo_contrato`: "menores" (≤8 UIT) o "mayores" (>8 UIT)
+
+    **Respuesta:**
+    - {success: true, data: {analisis_tdr, direccionamiento, proforma, secciones_reintentadas}}
+    """
+    try:
+        if not company_copy or len(company_copy.strip()) < 20:
+            raise HTTPException(
+                status_code=400,
+                detail="El campo company_copy es obligatorio (mínimo 20 caracteres)"
+            )
+
+        ext = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+        if ext not in ('pdf', 'docx', 'doc'):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Formato no soportado: .{ext}. Use PDF, DOCX o DOC"
+            )
+
+        if llm_provider and llm_provider not in ["gemini", "openai", "anthropic"]:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Proveedor LLM no válido: {llm_provider}"
+            )
+
+        pdf_bytes = await leer_documento(file, settings.max_file_size_mb)
+
+        logger.info(f"🧩 Análisis completo: {file.filename} — empresa: {company_name or '(sin nombre)'} — tipo: {tipo_contrato}")
+
+        envelope = await analyzer_service.analyze_full_document(
+            pdf_bytes=pdf_bytes,
+            company_name=company_name.strip(),
+            company_copy=company_copy.strip(),
+            llm_provider=llm_provider,
+            tipo_contrato=tipo_contrato or "menores",
+            filename=file.filename,
+        )
+
+        logger.info(
+            f"✅ Análisis completo para: {file.filename} — "
+            f"reintentadas: {envelope.result.secciones_reintentadas or 'ninguna'}"
+        )
+
+        return {
+            "success": True,
+            "data": envelope.data(),
+            "token_usage": envelope.token_usage,
+            "metrics": envelope.metrics(),
+            "timestamp": datetime.now().isoformat(),
+            "filename": file.filename,
+        }
+
+    except LLMUnavailableError as e:
+        raise _llm_unavailable(e)
+
+    except ValueError as e:
+        logger.error(f"Error de validación en análisis completo: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error inesperado en análisis completo: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error interno en el análisis completo: {str(e)}")
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Handler global de excepciones"""
@@ -43,10 +43,11 @@ async def test_analysis():
 
         # Crear servicio y analizar
         analyzer = TDRAnalyzerService()
-        result = await analyzer.analyze_tdr_document(
+        envelope = await analyzer.analyze_tdr_document(
             pdf_bytes=pdf_bytes,
             llm_provider=None  # Usa el configurado por defecto
         )
+        result = envelope.result
 
         # Mostrar resultados
         print("=" * 80)